@@ -25,7 +25,7 @@ try:
 
     # Import components
     from components.sidebar import display_sidebar
-    from components.chat import display_chat_message, process_prompt
+    from components.chat import display_history, process_prompt, resume_active_job, get_session_history
 
     # Import CSS utilities
     from css import init_styles
@@ -34,6 +34,10 @@ try:
     import config
     from services.retriever import init_retriever
     from services.openai_service import init_openai_client
+    from utils import metrics
+    from utils.metrics import start_metrics_server
+    from pipeline.warmup import start as start_warmup
+    import pipeline.search  # Registers /api/search on the metrics server
 
     logger.info("App: Imports successful.")
 except ImportError as e:
@@ -92,11 +96,20 @@ def setup_static_resources():
 
 def main():
     """Main application function."""
+    # Full script runs only: fragment reruns are timed by the fragments themselves
+    with metrics.timed("rag_ui_run_seconds", buckets=metrics.UI_BUCKETS, scope="app"):
+        _run_app()
+
+def _run_app():
+    """Render the page: services, styling, sidebar, chat history and the active answer."""
     # --- Initialize Required Services ---
     logger.info("App: Initializing services...")
     try:
         retriever_ready_init, retriever_msg_init = init_retriever()
         openai_ready_init, openai_msg_init = init_openai_client()
+        start_metrics_server()
+        if retriever_ready_init and openai_ready_init:
+            start_warmup()
         logger.info("App: Service initialization calls complete.")
     except Exception as init_err:
         st.error(f"Error during service initialization: {init_err}", icon="🔥")
@@ -123,8 +136,7 @@ def main():
     if "hebrew_font" not in st.session_state:
         st.session_state.hebrew_font = "David Libre"  # Default font
 
-    if "messages" not in st.session_state:
-        st.session_state.messages = []
+    get_session_history()
 
     if "prompt_input" not in st.session_state:
         st.session_state.prompt_input = ""
@@ -150,15 +162,15 @@ def main():
     # Display sidebar and get RAG parameters
     rag_params = display_sidebar()
 
-    # Render chat history
-    for msg in st.session_state.messages:
-        display_chat_message(msg)
+    # Render chat history (a fragment: sidebar changes don't re-render it)
+    display_history()
 
     # Get prompt gallery result from sidebar
     prompt_gallery_result = rag_params.get("prompt_gallery_result")
 
     # Initialize prompt variable to avoid potential uninitialized usage
     prompt = None
+    prompt_submitted = False
 
     # If we have a stored prompt to use
     if st.session_state.prompt_input:
@@ -189,6 +201,7 @@ def main():
 
         # Process the prompt
         process_prompt(prompt, rag_params)
+        prompt_submitted = True
     # If we have a selected template or a stored prompt from prompt gallery
     elif prompt_gallery_result:
         selected_prompt, template_data = prompt_gallery_result
@@ -200,6 +213,11 @@ def main():
         else:
             # For regular example questions, process immediately
             process_prompt(selected_prompt, rag_params)
+            prompt_submitted = True
+
+    if not prompt_submitted:
+        # Pick up an answer still streaming from an earlier run of this script or a reloaded tab
+        resume_active_job()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,6 @@
+# Benchmarks package
+"""
+Offline benchmarks:
+- fakes.py: Simulated OpenAI and Pinecone backends
+- pipeline_bench.py: End-to-end pipeline benchmark
+"""
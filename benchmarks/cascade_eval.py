@@ -0,0 +1,199 @@
+# benchmarks/cascade_eval.py
+"""
+Evaluates the cascade validator against the single-model baseline.
+
+Runs `run_gpt4o_validation_filter_step` over a fixed evaluation set (questions with
+their retrieved paragraphs) once with the "single" strategy and once with "cascade",
+and reports how often the cascade's verdict agrees with the baseline, what it
+passes that the baseline rejects (and the reverse), how many paragraphs the screen
+settled on its own, and the cost and latency per question of both strategies.
+
+The evaluation set is built from retrieval on first use and saved to `--evalset`,
+so later runs validate exactly the same paragraphs. With `--backend record` the
+validation calls are also written to a cassette; `--backend replay` answers them
+from it offline, so the comparison can be repeated (e.g. with other thresholds,
+which only change how the recorded screen scores are acted on) without API calls.
+
+Usage:
+    python -m benchmarks.cascade_eval --backend fake
+    python -m benchmarks.cascade_eval --backend record --evalset .cassettes/cascade_evalset.json \\
+        --cassette .cassettes/cascade.jsonl.gz
+    python -m benchmarks.cascade_eval --backend replay --evalset .cassettes/cascade_evalset.json \\
+        --cassette .cassettes/cascade.jsonl.gz --accept 0.95 --reject 0.05
+"""
+import io
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import contextlib
+import logging
+from typing import Any, Dict, List
+
+from benchmarks.fakes import FakeBackends, get_profile
+from benchmarks.pipeline_bench import QUESTIONS, percentiles, _git_revision
+
+STRATEGIES = ("single", "cascade")
+_PARAGRAPH_FIELDS = ("vector_id", "original_id", "source_name", "hebrew_text", "english_text")
+
+
+async def build_evalset(questions: List[str], n_paragraphs: int) -> List[Dict[str, Any]]:
+    from services import retriever
+
+    evalset = []
+    for question in questions:
+        docs = await retriever.retrieve_documents(question, n_paragraphs)
+        evalset.append({"question": question,
+                        "paragraphs": [{key: doc.get(key, "") for key in _PARAGRAPH_FIELDS} for doc in docs]})
+    return evalset
+
+
+async def run_strategy(strategy: str, evalset: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Validates every evaluation question with one strategy; returns per-paragraph verdicts, cost and latency."""
+    import rag_processor
+    from services import cost_accounting
+    from utils import metrics
+
+    decisions_before = {d: metrics.registry.counter_value("rag_cascade_decisions_total", decision=d)
+                        for d in ("accepted", "rejected", "escalated")}
+    verdicts: List[List[bool]] = []
+    latencies: List[float] = []
+    costs: List[float] = []
+    for item in evalset:
+        docs = [dict(paragraph, _position=i) for i, paragraph in enumerate(item["paragraphs"])]
+        async with cost_accounting.track_request() as ledger:
+            start = time.perf_counter()
+            passed = await rag_processor.run_gpt4o_validation_filter_step(
+                docs, item["question"], len(docs), lambda _m: None, strategy=strategy
+            )
+            latencies.append(time.perf_counter() - start)
+        costs.append(ledger.cost)
+        passed_positions = {doc["_position"] for doc in passed}
+        verdicts.append([i in passed_positions for i in range(len(docs))])
+    return {
+        "verdicts": verdicts,
+        "latency_s": percentiles(latencies),
+        "cost_usd_per_question": round(sum(costs) / len(costs), 6) if costs else 0.0,
+        "decisions": {d: int(metrics.registry.counter_value("rag_cascade_decisions_total", decision=d) - before)
+                      for d, before in decisions_before.items()},
+    }
+
+
+def compare(baseline: List[List[bool]], candidate: List[List[bool]]) -> Dict[str, Any]:
+    """Agreement of the candidate's verdicts with the baseline's, paragraph by paragraph."""
+    pairs = [(b, c) for b_row, c_row in zip(baseline, candidate) for b, c in zip(b_row, c_row)]
+    both = sum(1 for b, c in pairs if b and c)
+    baseline_passed = sum(1 for b, _c in pairs if b)
+    candidate_passed = sum(1 for _b, c in pairs if c)
+    return {
+        "paragraphs": len(pairs),
+        "agreement": round(sum(1 for b, c in pairs if b == c) / len(pairs), 4) if pairs else 0.0,
+        "baseline_passed": baseline_passed,
+        "cascade_passed": candidate_passed,
+        "missed": baseline_passed - both,        # Passed by the baseline, dropped by the cascade
+        "extra": candidate_passed - both,        # Dropped by the baseline, passed by the cascade
+        "recall": round(both / baseline_passed, 4) if baseline_passed else 1.0,
+        "precision": round(both / candidate_passed, 4) if candidate_passed else 1.0,
+    }
+
+
+def _relative(new: float, old: float) -> float:
+    return round((new - old) / old, 4) if old else 0.0
+
+
+def main(argv: List[str] = None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=["fake", "live", "record", "replay"], default="fake")
+    parser.add_argument("--evalset", help="Evaluation set JSON; built from retrieval and saved here if missing")
+    parser.add_argument("--questions", help="Text file with one question per line (default: the benchmark questions)")
+    parser.add_argument("--paragraphs", type=int, default=40, help="Paragraphs per question when building the set")
+    parser.add_argument("--cassette", help="Cassette for --backend record/replay (default: config.CASSETTE_PATH)")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay: multiply recorded latencies (0 = instant)")
+    parser.add_argument("--screen-model", help="Override config.CASCADE_SCREEN_MODEL")
+    parser.add_argument("--accept", type=float, help="Override config.CASCADE_ACCEPT_SCORE")
+    parser.add_argument("--reject", type=float, help="Override config.CASCADE_REJECT_SCORE")
+    parser.add_argument("--profile", default="default", help="Fake backend profile")
+    parser.add_argument("--time-scale", type=float, default=0.2, help="Fake backend time scale")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--verbose", action="store_true", help="Show pipeline log output")
+    args = parser.parse_args(argv)
+
+    os.environ["LANGSMITH_TRACING"] = "false"
+    log_sink = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with log_sink:
+        from streamlit import logger as streamlit_logger
+        streamlit_logger.set_log_level(logging.ERROR)
+        import config
+        config.LANGSMITH_TRACING = "false"
+        config.HEDGE_VALIDATION = False  # Duplicate requests would make the recorded traffic ambiguous
+        config.CASCADE_SCREEN_MODEL = args.screen_model or config.CASCADE_SCREEN_MODEL
+        config.CASCADE_ACCEPT_SCORE = config.CASCADE_ACCEPT_SCORE if args.accept is None else args.accept
+        config.CASCADE_REJECT_SCORE = config.CASCADE_REJECT_SCORE if args.reject is None else args.reject
+        if args.backend in ("fake", "replay"):
+            # Simulated and replayed usage stays out of the real cost aggregates
+            config.COST_DB_PATH = os.path.join(tempfile.mkdtemp(prefix="cascade_eval_"), "costs.sqlite3")
+        if args.backend in ("record", "replay"):
+            config.CASSETTE_MODE = args.backend
+            config.CASSETTE_PATH = args.cassette or config.CASSETTE_PATH
+            config.CASSETTE_REPLAY_SPEED = args.speed
+        from services import retriever, openai_service
+
+        if args.backend == "fake":
+            profile = get_profile(args.profile)
+            profile.time_scale = args.time_scale
+            FakeBackends(profile).install()
+        else:
+            retriever.init_retriever()
+            openai_service.init_openai_client()
+
+        if args.evalset and os.path.exists(args.evalset):
+            with open(args.evalset, "r", encoding="utf-8") as f:
+                evalset = json.load(f)
+        else:
+            questions = QUESTIONS
+            if args.questions:
+                with open(args.questions, "r", encoding="utf-8") as f:
+                    questions = [line.strip() for line in f if line.strip()]
+            evalset = asyncio.run(build_evalset(questions, args.paragraphs))
+            if args.evalset:
+                os.makedirs(os.path.dirname(args.evalset) or ".", exist_ok=True)
+                with open(args.evalset, "w", encoding="utf-8") as f:
+                    json.dump(evalset, f, ensure_ascii=False, indent=1)
+
+        results = {strategy: asyncio.run(run_strategy(strategy, evalset)) for strategy in STRATEGIES}
+
+    single, cascade = results["single"], results["cascade"]
+    screened = sum(cascade["decisions"].values())
+    report = {
+        "benchmark": "validation_cascade",
+        "git_revision": _git_revision(),
+        "backend": args.backend,
+        "evalset": args.evalset,
+        "questions": len(evalset),
+        "models": {"screen": config.CASCADE_SCREEN_MODEL, "validation": config.OPENAI_VALIDATION_MODEL},
+        "thresholds": {"accept": config.CASCADE_ACCEPT_SCORE, "reject": config.CASCADE_REJECT_SCORE},
+        "agreement": compare(single["verdicts"], cascade["verdicts"]),
+        "cascade_decisions": cascade["decisions"],
+        "escalation_rate": round(cascade["decisions"]["escalated"] / screened, 4) if screened else 0.0,
+        "strategies": {name: {key: value for key, value in result.items() if key not in ("verdicts", "decisions")}
+                       for name, result in results.items()},
+        "cascade_vs_single": {
+            "cost": _relative(cascade["cost_usd_per_question"], single["cost_usd_per_question"]),
+            "latency_p50": _relative(cascade["latency_s"].get("p50", 0), single["latency_s"].get("p50", 0)),
+            "latency_p95": _relative(cascade["latency_s"].get("p95", 0), single["latency_s"].get("p95", 0)),
+        },
+    }
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        sys.stdout.write(output + "\n")
+    return report
+
+
+if __name__ == "__main__":
+    main()
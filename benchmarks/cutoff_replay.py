@@ -0,0 +1,154 @@
+# benchmarks/cutoff_replay.py
+"""
+Replays recorded questions to measure what the similarity-score cutoff would save and lose.
+
+For every pipeline request in a cassette recorded with `CASSETTE_MODE=record`, the
+retrieval and the full validation (no cutoff) are answered from the cassette. Each
+cutoff method in `pipeline.score_cutoff.METHODS` is then applied to the retrieved
+scores with the current `SCORE_CUTOFF_*` settings, and the report gives per method
+the validations it would have saved and the paragraphs that passed validation but
+lie beyond its cutoff (the passing paragraphs it would have lost).
+
+Only validation calls with an exact recording give real verdicts, so replay against
+a cassette recorded with the current validation prompt; `cassette_misses` in the
+report counts the calls that had none.
+
+Usage:
+    python -m benchmarks.cutoff_replay --cassette .cassettes/traffic.jsonl.gz
+    SCORE_CUTOFF_MIN=10 python -m benchmarks.cutoff_replay --methods gap,elbow
+    python -m benchmarks.cutoff_replay --backend fake
+"""
+import io
+import os
+import sys
+import json
+import asyncio
+import argparse
+import tempfile
+import contextlib
+import logging
+from typing import Any, Dict, List
+
+from benchmarks.fakes import FakeBackends, get_profile
+from benchmarks.pipeline_bench import QUESTIONS, _git_revision
+
+
+async def replay_request(query: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    """Retrieves and fully validates one question; returns the retrieved docs and the positions that passed."""
+    import config
+    import rag_processor
+
+    ignore = lambda _m: None
+    n_validate = int(params.get("n_validate") or config.DEFAULT_N_VALIDATE)
+    docs = await rag_processor.run_retrieval_step(
+        query, int(params.get("n_retrieve") or config.DEFAULT_N_RETRIEVE), ignore, params.get("original_query")
+    )
+    positions = {id(doc): i for i, doc in enumerate(docs)}
+    passed = await rag_processor.run_gpt4o_validation_filter_step(docs, query, n_validate, ignore, cutoff="off")
+    return {"docs": docs, "n_validate": n_validate, "passed": sorted(positions[id(doc)] for doc in passed)}
+
+
+def evaluate(runs: List[Dict[str, Any]], methods: List[str]) -> Dict[str, Any]:
+    """Applies each cutoff method to the replayed requests."""
+    from pipeline import score_cutoff
+
+    report = {}
+    for method in methods:
+        saved = lost = passed_total = validated_total = requests_losing = 0
+        kept_counts = []
+        for run in runs:
+            full = min(len(run["docs"]), run["n_validate"])
+            keep, _used = score_cutoff.choose_validation_count(run["docs"], run["n_validate"], method)
+            lost_here = sum(1 for position in run["passed"] if position >= keep)
+            saved += full - keep
+            validated_total += full
+            lost += lost_here
+            passed_total += len(run["passed"])
+            requests_losing += 1 if lost_here else 0
+            kept_counts.append(keep)
+        report[method] = {
+            "validations_saved": saved,
+            "saved_share": round(saved / validated_total, 4) if validated_total else 0.0,
+            "mean_validated": round(sum(kept_counts) / len(kept_counts), 1) if kept_counts else 0.0,
+            "passing_docs_lost": lost,
+            "lost_share": round(lost / passed_total, 4) if passed_total else 0.0,
+            "requests_losing_docs": requests_losing,
+        }
+    return report
+
+
+def main(argv: List[str] = None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=["replay", "fake"], default="replay")
+    parser.add_argument("--cassette", help="Cassette to replay (default: config.CASSETTE_PATH)")
+    parser.add_argument("--miss", choices=["error", "nearest"], default="error",
+                        help="What to do with calls the cassette has no exact recording for")
+    parser.add_argument("--methods", help="Comma-separated cutoff methods (default: all but off)")
+    parser.add_argument("--limit", type=int, default=0, help="Replay only the first N requests")
+    parser.add_argument("--profile", default="fast", help="Fake backend profile")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--verbose", action="store_true", help="Show pipeline log output")
+    args = parser.parse_args(argv)
+
+    log_sink = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with log_sink:
+        os.environ["LANGSMITH_TRACING"] = "false"
+        from streamlit import logger as streamlit_logger
+        streamlit_logger.set_log_level(logging.ERROR)
+        import config
+        config.LANGSMITH_TRACING = "false"
+        config.HEDGE_VALIDATION = False
+        config.COST_BUDGET_REQUEST_USD = config.COST_BUDGET_SESSION_USD = 0.0  # Validate everything requested
+        config.COST_DB_PATH = os.path.join(tempfile.mkdtemp(prefix="cutoff_replay_"), "costs.sqlite3")
+        from pipeline import score_cutoff
+
+        tape = None
+        if args.backend == "replay":
+            config.CASSETTE_MODE = "replay"
+            config.CASSETTE_PATH = args.cassette or config.CASSETTE_PATH
+            config.CASSETTE_REPLAY_SPEED = 0.0
+            config.CASSETTE_REPLAY_MISS = args.miss
+            from services import cassette, retriever, openai_service
+
+            tape = cassette.get_cassette()
+            retriever.init_retriever()
+            openai_service.init_openai_client()
+            requests = [(e["query"], e.get("params") or {}) for e in tape.entries("request") if e.get("query")]
+        else:
+            FakeBackends(get_profile(args.profile)).install()
+            requests = [(question, {}) for question in QUESTIONS]
+        if args.limit:
+            requests = requests[:args.limit]
+
+        async def replay_all() -> List[Dict[str, Any]]:
+            return [await replay_request(query, params) for query, params in requests]
+
+        runs = asyncio.run(replay_all())
+        methods = args.methods.split(",") if args.methods else [m for m in score_cutoff.METHODS if m != "off"]
+
+    report = {
+        "benchmark": "score_cutoff",
+        "git_revision": _git_revision(),
+        "backend": args.backend,
+        "cassette": config.CASSETTE_PATH if tape else None,
+        "cassette_misses": tape.misses if tape else 0,
+        "requests": len(runs),
+        "passing_docs": sum(len(run["passed"]) for run in runs),
+        "settings": {
+            "min": config.SCORE_CUTOFF_MIN, "max": config.SCORE_CUTOFF_MAX, "floor": config.SCORE_CUTOFF_FLOOR,
+            "gap_ratio": config.SCORE_CUTOFF_GAP_RATIO, "elbow_min": config.SCORE_CUTOFF_ELBOW_MIN,
+            "zscore": config.SCORE_CUTOFF_ZSCORE,
+        },
+        "methods": evaluate(runs, methods),
+    }
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        sys.stdout.write(output + "\n")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,410 @@
+# benchmarks/fakes.py
+"""
+In-process fakes for the OpenAI and Pinecone clients used by the pipeline.
+
+The fakes mimic the response shapes the services read (`choices[0].message.content`,
+streamed `delta.content` chunks, `usage`, `data[0].embedding`, `matches`) and
+simulate latency distributions, random failures, 429 rate limiting and token
+throughput, so `execute_validate_generate_pipeline` can be driven offline.
+"""
+import re
+import json
+import math
+import time
+import zlib
+import random
+import asyncio
+import threading
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+
+# --- Behaviour models ---
+@dataclass
+class LatencyModel:
+    """Log-normal latency in seconds, clamped to [minimum, maximum]."""
+    median: float = 0.5
+    sigma: float = 0.4
+    minimum: float = 0.0
+    maximum: float = 60.0
+
+    def sample(self, rng: random.Random) -> float:
+        if self.median <= 0:
+            return 0.0
+        value = rng.lognormvariate(math.log(self.median), self.sigma)
+        return min(self.maximum, max(self.minimum, value))
+
+
+@dataclass
+class FaultModel:
+    """Failure behaviour of a fake endpoint."""
+    error_rate: float = 0.0           # Probability of a generic server error
+    rate_limit_rate: float = 0.0      # Probability of a 429 regardless of load
+    concurrency_limit: int = 0        # In-flight calls above this get a 429 (0 = unlimited)
+    rate_limit_latency: float = 0.05  # Time before a 429 is returned
+
+
+@dataclass
+class EndpointProfile:
+    latency: LatencyModel = field(default_factory=LatencyModel)
+    faults: FaultModel = field(default_factory=FaultModel)
+
+
+@dataclass
+class BackendProfile:
+    """Complete behaviour of the simulated backends."""
+    embedding: EndpointProfile = field(default_factory=lambda: EndpointProfile(LatencyModel(0.25, 0.3)))
+    pinecone: EndpointProfile = field(default_factory=lambda: EndpointProfile(LatencyModel(0.35, 0.3)))
+    validation: EndpointProfile = field(default_factory=lambda: EndpointProfile(LatencyModel(1.0, 0.6)))
+    generation: EndpointProfile = field(default_factory=lambda: EndpointProfile(LatencyModel(0.8, 0.4)))
+    citations: EndpointProfile = field(default_factory=lambda: EndpointProfile(LatencyModel(0.7, 0.3)))
+    validation_pass_rate: float = 0.3
+    generation_tokens: int = 400
+    generation_tokens_per_second: float = 60.0
+    validation_completion_tokens: int = 40  # Output tokens of a JSON verdict with its justification
+    validation_tokens_per_second: float = 0.0  # Decode speed of validation output (0 = part of the latency model)
+    # Per validation model: share of verdicts it gets wrong (with low confidence) and its latency multiplier
+    validation_model_error_rates: Dict[str, float] = field(default_factory=lambda: {"gpt-4o-mini": 0.12})
+    validation_model_latency: Dict[str, float] = field(default_factory=lambda: {"gpt-4o-mini": 0.4})
+    embedding_dimension: int = 256
+    corpus_size: int = 2000
+    corpus_id_prefix: str = "doc"     # Paragraph ids are "<prefix>-<n>" (distinct prefixes for federated shards)
+    time_scale: float = 1.0           # Multiplies every simulated delay
+    seed: int = 1234
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "BackendProfile":
+        """Builds a profile from nested plain dicts (e.g. loaded from a JSON file)."""
+        profile = cls()
+        for key, value in data.items():
+            current = getattr(profile, key)
+            if isinstance(current, EndpointProfile):
+                setattr(profile, key, EndpointProfile(
+                    LatencyModel(**value.get("latency", {})) if "latency" in value else current.latency,
+                    FaultModel(**value.get("faults", {})) if "faults" in value else current.faults,
+                ))
+            else:
+                setattr(profile, key, type(current)(value))
+        return profile
+
+
+PROFILES: Dict[str, Dict[str, Any]] = {
+    "default": {},
+    "fast": {
+        "validation": {"latency": {"median": 0.3, "sigma": 0.3}},
+        "generation_tokens_per_second": 150.0,
+    },
+    "long_tail": {
+        "validation": {"latency": {"median": 1.0, "sigma": 1.1, "maximum": 30.0}},
+    },
+    "flaky": {
+        "embedding": {"faults": {"error_rate": 0.05}},
+        "validation": {"faults": {"error_rate": 0.05, "rate_limit_rate": 0.05}},
+        "generation": {"faults": {"error_rate": 0.05}},
+    },
+    "rate_limited": {
+        "validation": {"faults": {"concurrency_limit": 200}},
+    },
+}
+
+
+def get_profile(name_or_path: str) -> BackendProfile:
+    """Returns a named preset from PROFILES or loads a JSON profile file."""
+    if name_or_path in PROFILES:
+        return BackendProfile.from_dict(PROFILES[name_or_path])
+    with open(name_or_path, "r", encoding="utf-8") as f:
+        return BackendProfile.from_dict(json.load(f))
+
+
+# --- Errors ---
+class FakeAPIError(Exception):
+    """Server-side failure raised by a fake endpoint."""
+    status_code = 500
+
+
+class FakeRateLimitError(FakeAPIError):
+    """429 raised by a fake endpoint."""
+    status_code = 429
+
+
+class _Endpoint:
+    """Latency and fault injection shared by all fake endpoints."""
+
+    def __init__(self, name: str, profile: EndpointProfile, backend: "FakeBackends"):
+        self.name = name
+        self.profile = profile
+        self.backend = backend
+        self.in_flight = 0
+        self.calls = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self._lock = threading.Lock()
+
+    def _enter(self) -> Optional[Exception]:
+        faults = self.profile.faults
+        with self._lock:
+            self.calls += 1
+            self.in_flight += 1
+            roll = self.backend.rng.random()
+            overloaded = faults.concurrency_limit and self.in_flight > faults.concurrency_limit
+            if overloaded or roll < faults.rate_limit_rate:
+                self.rate_limited += 1
+                return FakeRateLimitError(f"{self.name}: rate limit exceeded")
+            if roll < faults.rate_limit_rate + faults.error_rate:
+                self.errors += 1
+                return FakeAPIError(f"{self.name}: simulated server error")
+        return None
+
+    def _exit(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    def delay(self, scale: float = 1.0) -> float:
+        with self._lock:
+            return self.profile.latency.sample(self.backend.rng) * self.backend.profile.time_scale * scale
+
+    async def run_async(self, scale: float = 1.0) -> None:
+        """Waits out the simulated latency (times `scale`); raises the simulated failure, if any."""
+        failure = self._enter()
+        try:
+            if failure is not None:
+                await asyncio.sleep(self.profile.faults.rate_limit_latency * self.backend.profile.time_scale)
+                raise failure
+            await asyncio.sleep(self.delay(scale))
+        finally:
+            self._exit()
+
+    def run_sync(self) -> None:
+        failure = self._enter()
+        try:
+            if failure is not None:
+                time.sleep(self.profile.faults.rate_limit_latency * self.backend.profile.time_scale)
+                raise failure
+            time.sleep(self.delay())
+        finally:
+            self._exit()
+
+    def stats(self) -> Dict[str, int]:
+        return {"calls": self.calls, "errors": self.errors, "rate_limited": self.rate_limited}
+
+
+def _usage(prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> SimpleNamespace:
+    return SimpleNamespace(
+        prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+        total_tokens=prompt_tokens + completion_tokens,
+        prompt_tokens_details=SimpleNamespace(cached_tokens=cached_tokens),
+    )
+
+
+def _estimate_tokens(messages: List[Dict[str, Any]]) -> int:
+    # Hebrew averages roughly 2.5 characters per token with the GPT-4o tokenizer
+    return max(1, int(sum(len(str(m.get("content", ""))) for m in messages) / 2.5))
+
+
+# --- OpenAI ---
+class _FakeStream:
+    def __init__(self, backend: "FakeBackends", text_tokens: List[str], prompt_tokens: int, include_usage: bool,
+                 cached_tokens: int = 0):
+        self._backend = backend
+        self._tokens = text_tokens
+        self._prompt_tokens = prompt_tokens
+        self._include_usage = include_usage
+        self._cached_tokens = cached_tokens
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        per_token = self._backend.profile.time_scale / max(self._backend.profile.generation_tokens_per_second, 1e-6)
+        for token in self._tokens:
+            await asyncio.sleep(per_token)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=token))], usage=None)
+        if self._include_usage:
+            yield SimpleNamespace(choices=[], usage=_usage(self._prompt_tokens, len(self._tokens), self._cached_tokens))
+
+
+class _FakeChatCompletions:
+    def __init__(self, backend: "FakeBackends"):
+        self._backend = backend
+        self._seen_prefixes = set()
+        self._prefix_lock = threading.Lock()
+
+    def _cached_tokens(self, messages: List[Dict[str, Any]]) -> int:
+        # Like the provider's prompt cache: a repeated system-message prefix of at least
+        # 1024 tokens is served from cache in 128-token increments
+        if not messages or messages[0].get("role") != "system":
+            return 0
+        prefix = str(messages[0].get("content", ""))
+        with self._prefix_lock:
+            seen = prefix in self._seen_prefixes
+            self._seen_prefixes.add(prefix)
+        tokens = _estimate_tokens(messages[:1])
+        return tokens // 128 * 128 if seen and tokens >= 1024 else 0
+
+    def _kind(self, messages: List[Dict[str, Any]], response_format: Optional[Dict[str, Any]],
+              logprobs: bool = False) -> str:
+        if logprobs:
+            return "validation"  # Single-token yes/no validation
+        if not response_format:
+            return "generation"
+        text = " ".join(str(m.get("content", "")) for m in messages)
+        return "validation" if "contains_relevant_info" in text else "citations"
+
+    async def create(self, model: str, messages: List[Dict[str, Any]], stream: bool = False, **kwargs):
+        backend = self._backend
+        kind = self._kind(messages, kwargs.get("response_format"), bool(kwargs.get("logprobs")))
+        endpoint = backend.endpoints[kind]
+        latency_scale = backend.profile.validation_model_latency.get(model, 1.0) if kind == "validation" else 1.0
+        await endpoint.run_async(latency_scale)
+        prompt_tokens = _estimate_tokens(messages)
+        cached_tokens = self._cached_tokens(messages)
+
+        if kind == "validation":
+            # The paragraph decides the true verdict, so models and modes can be compared;
+            # a weaker model gets some of them wrong, and is unsure when it does
+            paragraph = str(messages[-1].get("content", ""))
+            truth = random.Random(zlib.crc32(paragraph.encode("utf-8")))
+            rank = re.search(r"Paragraph (\d+)", paragraph)
+            # Relevant paragraphs thin out down the retrieval ranking, averaging the pass rate over the top 100
+            pass_rate = backend.profile.validation_pass_rate
+            if rank:
+                pass_rate = min(0.95, pass_rate * 4.0 * math.exp(-int(rank.group(1)) / 25))
+            relevant = truth.random() < pass_rate
+            confidence = 0.99 - 0.39 * truth.random() ** 3  # Mostly near-certain, like real yes/no logprobs
+            with endpoint._lock:
+                if backend.rng.random() < backend.profile.validation_model_error_rates.get(model, 0.0):
+                    relevant, confidence = not relevant, backend.rng.uniform(0.5, 0.95)
+            if kwargs.get("logprobs"):
+                # One answer token; the alternatives carry the model's uncertainty
+                p_yes = confidence if relevant else 1 - confidence
+                alternatives = [SimpleNamespace(token="yes", logprob=math.log(p_yes)),
+                                SimpleNamespace(token="no", logprob=math.log(1 - p_yes))]
+                content, completion_tokens = ("yes" if relevant else "no"), 1
+                logprobs = SimpleNamespace(content=[SimpleNamespace(token=content, logprob=math.log(max(p_yes, 1 - p_yes)),
+                                                                    top_logprobs=alternatives)])
+            else:
+                content = json.dumps({"contains_relevant_info": relevant, "justification": "בדיקה"}, ensure_ascii=False)
+                completion_tokens, logprobs = backend.profile.validation_completion_tokens, None
+            await backend.decode_async(completion_tokens, backend.profile.validation_tokens_per_second)
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content), logprobs=logprobs)],
+                                   usage=_usage(prompt_tokens, completion_tokens, cached_tokens), model=model)
+        if kind == "citations":
+            content = json.dumps({"citations": ["1", "2", "3"]})
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+                                   usage=_usage(prompt_tokens, 15), model=model)
+
+        tokens = ["מקור "] * backend.profile.generation_tokens
+        if stream:
+            include_usage = bool((kwargs.get("stream_options") or {}).get("include_usage"))
+            return _FakeStream(backend, tokens, prompt_tokens, include_usage, cached_tokens)
+        await asyncio.sleep(len(tokens) * backend.profile.time_scale
+                            / max(backend.profile.generation_tokens_per_second, 1e-6))
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="".join(tokens)))],
+                               usage=_usage(prompt_tokens, len(tokens), cached_tokens), model=model)
+
+
+class _FakeEmbeddings:
+    def __init__(self, backend: "FakeBackends"):
+        self._backend = backend
+
+    async def create(self, input: List[str], model: str, **kwargs):
+        await self._backend.endpoints["embedding"].run_async()
+        rng = random.Random(zlib.crc32("\n".join(input).encode("utf-8")))
+        dimension = self._backend.profile.embedding_dimension
+        data = [SimpleNamespace(embedding=[rng.uniform(-1, 1) for _ in range(dimension)], index=i)
+                for i, _ in enumerate(input)]
+        tokens = sum(max(1, int(len(text) / 2.5)) for text in input)
+        return SimpleNamespace(data=data, usage=SimpleNamespace(prompt_tokens=tokens, total_tokens=tokens), model=model)
+
+
+class FakeAsyncOpenAI:
+    """Stands in for `openai.AsyncOpenAI` (chat completions and embeddings)."""
+
+    def __init__(self, backend: "FakeBackends"):
+        self.chat = SimpleNamespace(completions=_FakeChatCompletions(backend))
+        self.embeddings = _FakeEmbeddings(backend)
+
+
+# --- Pinecone ---
+class FakePineconeIndex:
+    """Stands in for `pinecone.Index`; `query` blocks like the real client does."""
+
+    def __init__(self, backend: "FakeBackends"):
+        self._backend = backend
+        corpus_rng = random.Random(backend.profile.seed)
+        words = ["אמונה", "תפילה", "ישועה", "גלות", "צדקה", "מדבר", "הים", "נבקע", "השם", "תורה", "מצוה", "בטחון"]
+        self._corpus = [
+            {
+                "original_id": f"{backend.profile.corpus_id_prefix}-{i}",
+                "source_name": f"ספר {i % 12 + 1}",
+                "hebrew_text": " ".join(corpus_rng.choice(words) for _ in range(80)),
+            }
+            for i in range(backend.profile.corpus_size)
+        ]
+
+    def query(self, vector: List[float], top_k: int, include_metadata: bool = True, filter: Optional[Dict] = None,
+              **kwargs):
+        self._backend.endpoints["pinecone"].run_sync()
+        rng = random.Random(sum(vector[:8]))
+        # `{field: {"$in": [...]}, ...}` filters, the only kind retrieval sends (ids and sources)
+        wanted = {field: set(condition["$in"]) for field, condition in (filter or {}).items()}
+        allowed = [i for i, doc in enumerate(self._corpus)
+                   if all(doc.get(field) in values for field, values in wanted.items())]
+        if filter and "original_id" in filter:
+            picks = allowed[:top_k]
+            matches = [
+                SimpleNamespace(id=f"vec-{i}", score=random.Random(f"{sum(vector[:8])}:{i}").uniform(0.3, 0.8),
+                                metadata=dict(self._corpus[i]) if include_metadata else None)
+                for i in picks
+            ]
+            return SimpleNamespace(matches=sorted(matches, key=lambda m: -m.score))
+        picks = rng.sample(allowed, min(top_k, len(allowed)))
+        # A query-dependent head of close matches, then a long tail (the knee real score curves show)
+        head = rng.randint(5, 40)
+        scores = sorted((rng.uniform(0.65, 0.9) if n < head else rng.uniform(0.2, 0.55) for n in range(len(picks))),
+                        reverse=True)
+        matches = [
+            SimpleNamespace(id=f"vec-{i}", score=score, metadata=dict(self._corpus[i]) if include_metadata else None)
+            for i, score in zip(picks, scores)
+        ]
+        return SimpleNamespace(matches=matches)
+
+    def describe_index_stats(self, **kwargs):
+        return SimpleNamespace(total_vector_count=len(self._corpus))
+
+
+# --- Wiring ---
+class FakeBackends:
+    """Owns the fake clients and their per-endpoint counters."""
+
+    def __init__(self, profile: Optional[BackendProfile] = None):
+        self.profile = profile or BackendProfile()
+        self.rng = random.Random(self.profile.seed)
+        self.endpoints = {
+            name: _Endpoint(name, getattr(self.profile, name), self)
+            for name in ("embedding", "pinecone", "validation", "generation", "citations")
+        }
+        self.openai_client = FakeAsyncOpenAI(self)
+        self.pinecone_index = FakePineconeIndex(self)
+
+    def install(self) -> None:
+        """Points the services at the fakes, bypassing their network initialization."""
+        import utils
+        from services import openai_service, retriever
+
+        utils.embedding_client = self.openai_client
+        openai_service.openai_async_client = self.openai_client
+        openai_service.is_openai_ready = True
+        openai_service.openai_status_message = "OpenAI service simulated."
+        retriever.pinecone_index = self.pinecone_index
+        retriever.is_retriever_ready = True
+        retriever.retriever_status_message = "Retriever simulated."
+
+    async def decode_async(self, tokens: int, tokens_per_second: float) -> None:
+        """Simulates the time to generate `tokens` output tokens (nothing when the speed is 0)."""
+        if tokens_per_second > 0:
+            await asyncio.sleep(tokens * self.profile.time_scale / tokens_per_second)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {name: endpoint.stats() for name, endpoint in self.endpoints.items()}
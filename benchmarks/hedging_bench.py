@@ -0,0 +1,80 @@
+# benchmarks/hedging_bench.py
+"""
+Measures the tail-latency effect and extra cost of hedged validation requests.
+
+Runs `benchmarks.pipeline_bench` once with hedging off and once with it on (each
+in a fresh process, against the same simulated long-tailed backend) and reports
+validation call and end-to-end latency percentiles, the change between the two,
+and how many extra validation requests the hedges cost.
+
+Usage:
+    python -m benchmarks.hedging_bench --profile long_tail --time-scale 0.2
+    python -m benchmarks.hedging_bench --quantile 0.9 --budget 0.05
+"""
+import sys
+import json
+import argparse
+from typing import Any, Dict, List
+
+from benchmarks.tracing_bench import run_mode
+
+REPORTED = ("p50", "p90", "p95", "p99", "max")
+
+
+def _summary(level: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "request_latency_s": {k: level["latency_s"].get(k) for k in REPORTED},
+        "validation_call_s": {k: level["per_call"].get("rag_validation_seconds", {}).get(k) for k in REPORTED},
+        "validation_requests": level["backend_calls"]["validation"]["calls"],
+    }
+
+
+def main(argv: List[str] = None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", default="4")
+    parser.add_argument("--requests", type=int, default=24)
+    parser.add_argument("--profile", default="long_tail")
+    parser.add_argument("--time-scale", type=float, default=0.2)
+    parser.add_argument("--quantile", type=float, default=0.95, help="HEDGE_QUANTILE for the hedged run")
+    parser.add_argument("--budget", type=float, default=0.05, help="HEDGE_BUDGET_RATIO for the hedged run")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    bench_args = ["--concurrency", args.concurrency, "--profile", args.profile,
+                  "--time-scale", str(args.time_scale), "--requests", str(args.requests)]
+    base_env = {"LANGSMITH_TRACING": "false"}
+    # Hedging never fires sooner than this; scaled with the simulated latencies
+    min_delay = str(0.5 * args.time_scale)
+    runs = {
+        "off": run_mode("off", {**base_env, "HEDGE_VALIDATION": "false"}, bench_args),
+        "hedged": run_mode("hedged", {**base_env, "HEDGE_VALIDATION": "true", "HEDGE_QUANTILE": str(args.quantile),
+                                      "HEDGE_BUDGET_RATIO": str(args.budget), "HEDGE_MIN_DELAY": min_delay},
+                           bench_args),
+    }
+
+    levels = []
+    for off_level, hedged_level in zip(runs["off"]["levels"], runs["hedged"]["levels"]):
+        off, hedged = _summary(off_level), _summary(hedged_level)
+        change = {
+            section: {k: round(hedged[section][k] - off[section][k], 4)
+                      for k in REPORTED if off[section][k] is not None and hedged[section][k] is not None}
+            for section in ("request_latency_s", "validation_call_s")
+        }
+        extra = hedged["validation_requests"] - off["validation_requests"]
+        change["extra_validation_requests"] = extra
+        change["extra_request_ratio"] = round(extra / off["validation_requests"], 4) if off["validation_requests"] else 0.0
+        levels.append({"concurrency": off_level["concurrency"], "off": off, "hedged": hedged, "change": change})
+
+    report = {"benchmark": "hedging", "profile": args.profile, "time_scale": args.time_scale,
+              "quantile": args.quantile, "budget": args.budget, "levels": levels}
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        sys.stdout.write(output + "\n")
+    return report
+
+
+if __name__ == "__main__":
+    main()
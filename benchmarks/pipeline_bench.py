@@ -0,0 +1,231 @@
+# benchmarks/pipeline_bench.py
+"""
+Offline end-to-end benchmark of `execute_validate_generate_pipeline`.
+
+Runs the real pipeline code against the simulated backends in `benchmarks.fakes`
+at several concurrency levels and prints a JSON report (end-to-end latency
+percentiles, per-stage breakdown, per-call latency and throughput, event-loop
+lag, peak traced memory and fake endpoint call counts) that can be diffed
+between commits.
+
+Usage:
+    python -m benchmarks.pipeline_bench --concurrency 1,8,32,128 --profile default
+    python -m benchmarks.pipeline_bench --time-scale 0.1 --output bench.json
+"""
+import io
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import resource
+import subprocess
+import tracemalloc
+import contextlib
+import logging
+from typing import Any, Dict, List
+
+from benchmarks.fakes import FakeBackends, PROFILES, get_profile
+
+QUESTIONS = [
+    "למה הים לא נבקע מיד כשהיהודים עמדו מולו, ורק נבקע אחרי שזעקו להשם?",
+    "איך היהודים עשו צדקה במדבר, בהנחה שלכולם היה מן?",
+    "יותר קל להוציא את היהודי מן הגלות מאשר להוציא את הגלות מן היהודי",
+    "מה הקשר בין אמונה ובטחון לבין השתדלות?",
+]
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    """Summarizes a list of samples as count/mean/p50/p90/p95/p99/max (rounded)."""
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def pick(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))], 4)
+
+    return {
+        "count": len(ordered),
+        "mean": round(sum(ordered) / len(ordered), 4),
+        "p50": pick(0.50),
+        "p90": pick(0.90),
+        "p95": pick(0.95),
+        "p99": pick(0.99),
+        "max": round(ordered[-1], 4),
+    }
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes up a task that sleeps for `interval` seconds."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task = None
+
+    async def _run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, time.perf_counter() - start - self.interval))
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._task
+
+
+async def _run_one(question: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    from rag_processor import execute_validate_generate_pipeline
+    from utils import metrics
+
+    start = time.perf_counter()
+    with metrics.request_scope() as observations:
+        result = await execute_validate_generate_pipeline(
+            history=[{"role": "user", "content": question}],
+            params=dict(params),
+            status_callback=lambda _m: None,
+            stream_callback=lambda _c: None,
+        )
+    elapsed = time.perf_counter() - start
+    stages: Dict[str, float] = {}
+    calls: Dict[str, List[float]] = {}
+    for name, labels, value in observations:
+        if name == "rag_stage_seconds":
+            stages[labels["stage"]] = stages.get(labels["stage"], 0.0) + value
+        elif name != "rag_request_seconds":
+            calls.setdefault(name, []).append(value)
+    return {"latency": elapsed, "stages": stages, "calls": calls, "error": result.get("error")}
+
+
+async def run_level(concurrency: int, total_requests: int, params: Dict[str, Any],
+                    trace_memory: bool = False) -> Dict[str, Any]:
+    """
+    Runs `total_requests` pipeline calls with at most `concurrency` in flight.
+
+    Peak memory is the process max RSS; with `trace_memory` the (slower) tracemalloc
+    peak of Python allocations made during the level is reported as well.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    monitor = LoopLagMonitor()
+
+    async def bounded(i: int):
+        async with semaphore:
+            return await _run_one(QUESTIONS[i % len(QUESTIONS)], params)
+
+    if trace_memory:
+        tracemalloc.start()
+    monitor.start()
+    wall_start = time.perf_counter()
+    runs = await asyncio.gather(*(bounded(i) for i in range(total_requests)))
+    wall_time = time.perf_counter() - wall_start
+    await monitor.stop()
+    memory = {"peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024}
+    if trace_memory:
+        memory["peak_traced_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    stage_samples: Dict[str, List[float]] = {}
+    call_samples: Dict[str, List[float]] = {}
+    for run in runs:
+        for key, value in run["stages"].items():
+            stage_samples.setdefault(key, []).append(value)
+        for key, values in run["calls"].items():
+            call_samples.setdefault(key, []).extend(values)
+    return {
+        "concurrency": concurrency,
+        "requests": total_requests,
+        "errors": sum(1 for run in runs if run["error"]),
+        "wall_time_s": round(wall_time, 4),
+        "throughput_rps": round(total_requests / wall_time, 4) if wall_time else 0.0,
+        "latency_s": percentiles([run["latency"] for run in runs]),
+        "stages_s": {key: percentiles(values) for key, values in sorted(stage_samples.items())},
+        "per_call": {key: percentiles(values) for key, values in sorted(call_samples.items())},
+        "event_loop_lag_s": percentiles(monitor.samples),
+        "memory": memory,
+    }
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main(argv: List[str] = None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", default="1,8,32,128", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=0,
+                        help="Requests per level (default: max(2 x concurrency, 8))")
+    parser.add_argument("--profile", default="default",
+                        help=f"Backend profile: one of {', '.join(PROFILES)} or a JSON file path")
+    parser.add_argument("--time-scale", type=float, default=None, help="Multiply all simulated delays")
+    parser.add_argument("--n-retrieve", type=int, default=300)
+    parser.add_argument("--n-validate", type=int, default=100)
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Also report the tracemalloc peak (adds noticeable overhead)")
+    parser.add_argument("--tracing", choices=["off", "env"], default="off",
+                        help="'env' keeps the LANGSMITH_TRACING / TRACING_* settings from the environment")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--verbose", action="store_true", help="Show pipeline log output")
+    args = parser.parse_args(argv)
+
+    profile = get_profile(args.profile)
+    if args.time_scale is not None:
+        profile.time_scale = args.time_scale
+    params = {"n_retrieve": args.n_retrieve, "n_validate": args.n_validate}
+    levels = [int(level) for level in args.concurrency.split(",") if level.strip()]
+
+    # The pipeline logs every status update to stdout; keep the report clean unless asked
+    log_sink = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    results = []
+    with log_sink:
+        # Tracing would export every simulated call to LangSmith, and i18n warns on each
+        # session-state access outside `streamlit run`; neither belongs in the measurement
+        if args.tracing == "off":
+            os.environ["LANGSMITH_TRACING"] = "false"
+        from streamlit import logger as streamlit_logger
+        streamlit_logger.set_log_level(logging.ERROR)
+        import config
+        if args.tracing == "off":
+            config.LANGSMITH_TRACING = os.environ["LANGSMITH_TRACING"] = "false"
+        # Repeated questions would otherwise be answered from the answer cache
+        config.ANSWER_CACHE_ENABLED = False
+
+        for level in levels:
+            backends = FakeBackends(profile)
+            backends.install()
+            total = args.requests or max(2 * level, 8)
+            level_result = asyncio.run(run_level(level, total, params, args.trace_memory))
+            level_result["backend_calls"] = backends.stats()
+            results.append(level_result)
+
+    report = {
+        "benchmark": "pipeline",
+        "git_revision": _git_revision(),
+        "python": platform.python_version(),
+        "profile": args.profile,
+        "time_scale": profile.time_scale,
+        "params": params,
+        "tracing": {"enabled": config.LANGSMITH_TRACING, "sample_rate": config.TRACING_SAMPLE_RATE,
+                    "validation_sample_rate": config.TRACING_VALIDATION_SAMPLE_RATE},
+        "levels": results,
+    }
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        sys.stdout.write(output + "\n")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+# benchmarks/quote_bench.py
+"""
+Measures exact-quote lookup: query latency and how often the quoted paragraph is found.
+
+Builds a quote index (from `--corpus`, or a synthetic Hebrew-like corpus of
+`--paragraphs` paragraphs), then cuts `--queries` quotes of `--words` consecutive
+words out of random paragraphs and looks each one up with
+`services.quote_index.find_quotes`, in several variants:
+
+- exact: the words as they are
+- niqqud: vowel points added to the letters
+- spelling: ו / י added or removed inside some words (full vs defective spelling)
+- word_changed: one word replaced
+- in_question: the quote wrapped in a question ("מה המקור של ...?")
+
+The report gives per variant the share of quotes whose paragraph was put first
+(top-1) or among the pinned paragraphs, the share with no match, and the lookup
+latency percentiles in milliseconds; plus the index size and build time.
+
+Usage:
+    python -m benchmarks.quote_bench
+    python -m benchmarks.quote_bench --corpus corpus.jsonl --queries 2000 --words 8
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+from typing import Any, Dict, List
+
+from benchmarks.pipeline_bench import percentiles, _git_revision
+
+VARIANTS = ("exact", "niqqud", "spelling", "word_changed", "in_question")
+_LETTERS = "אבגדהוזחטיכלמנסעפצקרשת"
+_NIQQUD = ["ְ", "ִ", "ֵ", "ֶ", "ַ", "ָ", "ֹ", "ֻ", "ּ"]
+
+
+def synthetic_corpus(paragraphs: int, seed: int) -> List[Dict[str, Any]]:
+    """Paragraphs of random Hebrew-like words with a Zipf-like word frequency (common words repeat a lot)."""
+    rng = random.Random(seed)
+    vocabulary = list(dict.fromkeys("".join(rng.choice(_LETTERS) for _ in range(rng.randint(2, 7))) for _ in range(30000)))
+    weights = [1.0 / (rank + 1) for rank in range(len(vocabulary))]
+    return [
+        {"original_id": f"p-{i}", "hebrew_text": " ".join(rng.choices(vocabulary, weights, k=rng.randint(30, 150)))}
+        for i in range(paragraphs)
+    ]
+
+
+def make_variant(words: List[str], variant: str, rng: random.Random) -> str:
+    words = list(words)
+    if variant == "niqqud":
+        words = ["".join(letter + rng.choice(_NIQQUD) for letter in word) for word in words]
+    elif variant == "spelling":
+        for i in rng.sample(range(len(words)), max(1, len(words) // 3)):
+            word = words[i]
+            if len(word) > 2 and ("ו" in word[1:] or "י" in word[1:]):
+                words[i] = word[0] + word[1:].replace("ו", "", 1).replace("י", "", 1)
+            else:
+                cut = rng.randint(1, len(word))
+                words[i] = word[:cut] + rng.choice("וי") + word[cut:]
+    elif variant == "word_changed":
+        i = rng.randrange(len(words))
+        words[i] = "".join(rng.choice(_LETTERS) for _ in range(len(words[i]) or 3))
+    text = " ".join(words)
+    if variant == "in_question":
+        text = f"מה המקור של \"{text}\"?"
+    return text
+
+
+def main(argv: List[str] = None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="JSON-lines (or JSON array) file of paragraphs (default: synthetic)")
+    parser.add_argument("--paragraphs", type=int, default=50000, help="Synthetic corpus size")
+    parser.add_argument("--queries", type=int, default=500, help="Quotes per variant")
+    parser.add_argument("--words", type=int, default=10, help="Words per quote")
+    parser.add_argument("--variants", help=f"Comma-separated variants (default: {','.join(VARIANTS)})")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    import config
+    from services import quote_index
+    from services.bm25 import read_corpus
+
+    documents = list(read_corpus(args.corpus)) if args.corpus else synthetic_corpus(args.paragraphs, args.seed)
+    config.QUOTE_INDEX_PATH = os.path.join(tempfile.mkdtemp(prefix="quote_bench_"), "quotes")
+    config.QUOTE_LOOKUP = True
+    meta = quote_index.build_index(documents, config.QUOTE_INDEX_PATH)
+    index_bytes = sum(os.path.getsize(os.path.join(config.QUOTE_INDEX_PATH, name))
+                      for name in os.listdir(config.QUOTE_INDEX_PATH))
+    quote_index.get_index()
+
+    rng = random.Random(args.seed)
+    candidates = [doc for doc in documents if len((doc.get("hebrew_text") or "").split()) >= args.words]
+    variants = args.variants.split(",") if args.variants else list(VARIANTS)
+    results = {}
+    for variant in variants:
+        latencies, first, pinned, missed = [], 0, 0, 0
+        for _ in range(args.queries):
+            doc = rng.choice(candidates)
+            words = doc["hebrew_text"].split()
+            start = rng.randrange(len(words) - args.words + 1)
+            text = make_variant(words[start:start + args.words], variant, rng)
+            began = time.perf_counter()
+            matches = quote_index.find_quotes(text)
+            latencies.append((time.perf_counter() - began) * 1000)
+            ids = [doc_id for doc_id, _share in matches]
+            first += 1 if ids[:1] == [str(doc["original_id"])] else 0
+            pinned += 1 if str(doc["original_id"]) in ids else 0
+            missed += 0 if ids else 1
+        results[variant] = {
+            "top1": round(first / args.queries, 4),
+            "pinned": round(pinned / args.queries, 4),
+            "no_match": round(missed / args.queries, 4),
+            "latency_ms": percentiles(latencies),
+        }
+
+    report = {
+        "benchmark": "quote_lookup",
+        "git_revision": _git_revision(),
+        "corpus": args.corpus or f"synthetic ({args.paragraphs} paragraphs)",
+        "index": {**meta, "bytes": index_bytes},
+        "words_per_quote": args.words,
+        "settings": {"min_words": config.QUOTE_MIN_WORDS, "min_shingles": config.QUOTE_MIN_SHINGLES,
+                     "max_pinned": config.QUOTE_MAX_PINNED},
+        "variants": results,
+    }
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        sys.stdout.write(output + "\n")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+# benchmarks/replay_traffic.py
+"""
+Re-runs recorded production traffic against the current pipeline build offline.
+
+Reads a cassette written with `CASSETTE_MODE=record`, replays every recorded
+pipeline request through `execute_validate_generate_pipeline` with the OpenAI and
+Pinecone calls served from the cassette, and prints a JSON report comparing the
+recorded and replayed end-to-end latency and estimated API cost.
+
+Usage:
+    python -m benchmarks.replay_traffic --cassette .cassettes/traffic.jsonl.gz
+    python -m benchmarks.replay_traffic --speed 0 --miss nearest --concurrency 8
+"""
+import io
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import contextlib
+import logging
+from typing import Any, Dict, List
+
+from benchmarks.pipeline_bench import percentiles, _git_revision
+
+
+def _total_cost(snapshot: Dict[str, Any]) -> float:
+    return sum(series["value"] for series in snapshot["counters"].get("rag_cost_usd_total", []))
+
+
+def recorded_cost(entries: List[Dict[str, Any]]) -> float:
+    """Estimates the API cost of the recorded calls from their usage fields."""
+    from utils import metrics
+
+    total = 0.0
+    for entry in entries:
+        usage = (entry.get("response") or {}).get("usage")
+        for _offset, chunk in entry.get("chunks", []):
+            usage = chunk.get("usage") or usage
+        counts = metrics.usage_counts(usage)
+        total += metrics.estimate_cost(entry.get("model", ""), counts["prompt"], counts["completion"], counts["cached"])
+    return total
+
+
+async def replay_requests(requests: List[Dict[str, Any]], concurrency: int) -> List[Dict[str, Any]]:
+    from rag_processor import execute_validate_generate_pipeline
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def replay_one(request: Dict[str, Any]) -> Dict[str, Any]:
+        async with semaphore:
+            start = time.perf_counter()
+            result = await execute_validate_generate_pipeline(
+                history=[{"role": "user", "content": request["query"]}],
+                params=dict(request.get("params") or {}),
+                status_callback=lambda _m: None,
+                stream_callback=lambda _c: None,
+            )
+            return {"latency": time.perf_counter() - start, "error": result.get("error")}
+
+    return await asyncio.gather(*(replay_one(r) for r in requests))
+
+
+def main(argv: List[str] = None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cassette", help="Cassette to replay (default: config.CASSETTE_PATH)")
+    parser.add_argument("--speed", type=float, default=1.0, help="Multiply recorded latencies (0 = instant)")
+    parser.add_argument("--miss", choices=["error", "nearest"], default="nearest",
+                        help="What to do with calls the cassette has no exact recording for")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--limit", type=int, default=0, help="Replay only the first N requests")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--verbose", action="store_true", help="Show pipeline log output")
+    args = parser.parse_args(argv)
+
+    log_sink = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with log_sink:
+        os.environ["LANGSMITH_TRACING"] = "false"
+        from streamlit import logger as streamlit_logger
+        streamlit_logger.set_log_level(logging.ERROR)
+        import config
+        config.LANGSMITH_TRACING = "false"
+        config.ANSWER_CACHE_ENABLED = False
+        config.CASSETTE_MODE = "replay"
+        config.CASSETTE_PATH = args.cassette or config.CASSETTE_PATH
+        config.CASSETTE_REPLAY_SPEED = args.speed
+        config.CASSETTE_REPLAY_MISS = args.miss
+        from services import cassette
+        from utils import metrics
+
+        tape = cassette.get_cassette()
+        requests = [e for e in tape.entries("request") if e.get("query")]
+        if args.limit:
+            requests = requests[:args.limit]
+        metrics.registry.reset()
+        runs = asyncio.run(replay_requests(requests, max(1, args.concurrency)))
+        replayed_cost = _total_cost(metrics.registry.snapshot())
+
+    api_entries = [e for e in tape.entries() if e["kind"] != "request"]
+    report = {
+        "benchmark": "replay",
+        "git_revision": _git_revision(),
+        "cassette": config.CASSETTE_PATH,
+        "speed": args.speed,
+        "requests": len(requests),
+        "cassette_misses": tape.misses,
+        "recorded": {
+            "errors": sum(1 for r in requests if r.get("error")),
+            "latency_s": percentiles([r["latency"] for r in requests]),
+            "cost_usd": round(recorded_cost(api_entries), 6),
+        },
+        "replayed": {
+            "errors": sum(1 for run in runs if run["error"]),
+            "latency_s": percentiles([run["latency"] for run in runs]),
+            "cost_usd": round(replayed_cost, 6),
+        },
+    }
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        sys.stdout.write(output + "\n")
+    return report
+
+
+if __name__ == "__main__":
+    main()
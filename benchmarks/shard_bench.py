@@ -0,0 +1,126 @@
+# benchmarks/shard_bench.py
+"""
+Measures federated retrieval: latency with several shards, one of them slow.
+
+Runs `services.retriever.retrieve_documents` against simulated Pinecone indexes
+from `benchmarks.fakes`: the main index alone, then with `--shards` healthy extra
+shards, then with one more shard whose queries take `--slow-seconds` (longer than
+the per-shard timeout `--timeout`). Per setup it reports the retrieval latency
+percentiles, each shard's query latency and outcomes (ok, timeout, error), and
+how many of the merged paragraphs came from each shard.
+
+Usage:
+    python -m benchmarks.shard_bench
+    python -m benchmarks.shard_bench --shards 3 --timeout 0.5 --slow-seconds 2 --output shards.json
+"""
+import io
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import contextlib
+import logging
+from collections import Counter
+from typing import Any, Dict, List
+
+from benchmarks.fakes import FakeBackends, PROFILES, get_profile
+from benchmarks.pipeline_bench import QUESTIONS, percentiles, _git_revision
+
+
+def _shard_backend(profile_name: str, n: int, pinecone_seconds: float = None) -> FakeBackends:
+    profile = get_profile(profile_name)
+    profile.seed += n
+    profile.corpus_id_prefix = f"shard{n}"
+    if pinecone_seconds is not None:
+        profile.pinecone.latency.median = pinecone_seconds
+        profile.pinecone.latency.sigma = 0.05
+    return FakeBackends(profile)
+
+
+async def _run_setup(requests: int, n_results: int) -> Dict[str, Any]:
+    from services import retriever
+    from utils import metrics
+
+    latencies: List[float] = []
+    shard_seconds: Dict[str, List[float]] = {}
+    outcomes: Dict[str, Counter] = {}
+    kept: Counter = Counter()
+    for i in range(requests):
+        start = time.perf_counter()
+        with metrics.request_scope() as observations:
+            docs = await retriever.retrieve_documents(QUESTIONS[i % len(QUESTIONS)] + f" {i}", n_results)
+        latencies.append(time.perf_counter() - start)
+        for name, labels, value in observations:
+            if name == "rag_shard_query_seconds":
+                shard_seconds.setdefault(labels["shard"], []).append(value)
+                outcomes.setdefault(labels["shard"], Counter())[labels["outcome"]] += 1
+        kept.update(doc.get("shard", retriever.MAIN_SHARD) for doc in docs)
+    return {
+        "latency_s": percentiles(latencies),
+        "shards": {
+            name: {"latency_s": percentiles(values), "outcomes": dict(outcomes[name]),
+                   "kept_per_request": round(kept[name] / requests, 2)}
+            for name, values in shard_seconds.items()
+        },
+    }
+
+
+def main(argv: List[str] = None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profile", default="fast", help=f"Backend profile: one of {', '.join(PROFILES)} or a JSON file path")
+    parser.add_argument("--requests", type=int, default=20, help="Retrievals per setup")
+    parser.add_argument("--n-results", type=int, default=100)
+    parser.add_argument("--shards", type=int, default=2, help="Healthy extra shards")
+    parser.add_argument("--quota", type=int, default=0, help="Most paragraphs kept per extra shard (0 = no quota)")
+    parser.add_argument("--timeout", type=float, default=1.0, help="Per-shard timeout in seconds")
+    parser.add_argument("--slow-seconds", type=float, default=3.0, help="Query latency of the slow shard")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--verbose", action="store_true", help="Show retriever log output")
+    args = parser.parse_args(argv)
+
+    log_sink = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    setups = {}
+    with log_sink:
+        os.environ["LANGSMITH_TRACING"] = "false"
+        from streamlit import logger as streamlit_logger
+        streamlit_logger.set_log_level(logging.ERROR)
+        import config
+        from services import retriever
+        config.LANGSMITH_TRACING = "false"
+        # Only the Pinecone fan-out is measured
+        config.HYBRID_RETRIEVAL = False
+        config.QUOTE_LOOKUP = False
+        config.RETRIEVAL_SHARD_TIMEOUT_SECONDS = args.timeout
+
+        healthy = {f"shard{n}": _shard_backend(args.profile, n) for n in range(1, args.shards + 1)}
+        slow = _shard_backend(args.profile, args.shards + 1, args.slow_seconds)
+        for label, shards in (("main_only", {}), ("healthy_shards", healthy),
+                              ("with_slow_shard", {**healthy, "slow": slow})):
+            FakeBackends(get_profile(args.profile)).install()
+            config.RETRIEVAL_SHARDS = [{"name": name, "index": f"{name}-index", "quota": args.quota or None}
+                                       for name in shards]
+            retriever.shard_indexes = {name: backend.pinecone_index for name, backend in shards.items()}
+            setups[label] = asyncio.run(_run_setup(args.requests, args.n_results))
+
+    report = {
+        "benchmark": "federated_retrieval",
+        "git_revision": _git_revision(),
+        "profile": args.profile,
+        "params": {"n_results": args.n_results, "shards": args.shards, "quota": args.quota,
+                   "timeout_s": args.timeout, "slow_shard_s": args.slow_seconds,
+                   "normalization": config.RETRIEVAL_SCORE_NORMALIZATION},
+        "setups": setups,
+    }
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        sys.stdout.write(output + "\n")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+# benchmarks/startup_bench.py
+"""
+Measures cold-start cost of the Streamlit app.
+
+Each run starts a fresh interpreter, so nothing is shared between runs:
+
+- import: `python -X importtime -c "import app"`; reports the cumulative import
+  time of `app` and the modules that contribute most to it.
+- first paint: runs `app.py` once with Streamlit's `AppTest` (the same script run
+  a browser's first page load triggers) and reports how long the first run took
+  and the interpreter's total time until the page was rendered.
+
+Usage:
+    python -m benchmarks.startup_bench --runs 5
+    python -m benchmarks.startup_bench --runs 3 --top 20 --output startup.json
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+from typing import Any, Dict, List
+
+from benchmarks.pipeline_bench import percentiles, _git_revision
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the child interpreter; prints one JSON line after the first script run
+_FIRST_PAINT_SCRIPT = """
+import json, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file("app.py", default_timeout={timeout})
+run_start = time.perf_counter()
+app.run()
+end = time.perf_counter()
+print(json.dumps({{"first_run_s": end - run_start, "until_paint_s": end - start,
+                   "exceptions": [str(e.value) for e in app.exception]}}))
+"""
+
+
+def _child_env() -> Dict[str, str]:
+    # No metrics server: runs would compete for its port
+    return {**os.environ, "METRICS_PORT": "0", "PYTHONPATH": ROOT}
+
+
+def measure_import() -> Dict[str, Any]:
+    """Imports `app` in a fresh interpreter with `-X importtime` and parses the timings."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=ROOT, capture_output=True, text=True, env=_child_env(), check=True,
+    )
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        fields = [field.strip() for field in line[len("import time:"):].split("|")]
+        if not fields[0].isdigit():
+            continue  # Header line
+        modules.append({"module": fields[2].strip(), "self_us": int(fields[0]), "cumulative_us": int(fields[1])})
+    app_entry = next((m for m in modules if m["module"] == "app"), None)
+    return {"total_s": app_entry["cumulative_us"] / 1e6 if app_entry else None, "modules": modules}
+
+
+def measure_first_paint(timeout: float) -> Dict[str, Any]:
+    """Runs the app script once under `AppTest` in a fresh interpreter."""
+    result = subprocess.run(
+        [sys.executable, "-c", _FIRST_PAINT_SCRIPT.format(timeout=timeout)],
+        cwd=ROOT, capture_output=True, text=True, env=_child_env(), check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def _top_packages(modules: List[Dict[str, Any]], top: int) -> List[Dict[str, Any]]:
+    """Sums self time per top-level package, largest first."""
+    totals: Dict[str, int] = {}
+    for module in modules:
+        package = module["module"].split(".")[0]
+        totals[package] = totals.get(package, 0) + module["self_us"]
+    ordered = sorted(totals.items(), key=lambda item: item[1], reverse=True)[:top]
+    return [{"package": package, "self_s": round(us / 1e6, 4)} for package, us in ordered]
+
+
+def main(argv: List[str] = None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="Packages listed by import time")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Seconds allowed for the first script run")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    imports = [measure_import() for _ in range(args.runs)]
+    paints = [measure_first_paint(args.timeout) for _ in range(args.runs)]
+
+    report = {
+        "benchmark": "startup",
+        "revision": _git_revision(),
+        "runs": args.runs,
+        "import_s": percentiles([i["total_s"] for i in imports if i["total_s"] is not None]),
+        # From the last run, so the list reflects a warm filesystem cache like the other runs
+        "import_top_packages": _top_packages(imports[-1]["modules"], args.top),
+        "first_run_s": percentiles([p["first_run_s"] for p in paints]),
+        "until_paint_s": percentiles([p["until_paint_s"] for p in paints]),
+        "exceptions": sorted({e for p in paints for e in p["exceptions"]}),
+    }
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        sys.stdout.write(output + "\n")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# benchmarks/tracing_bench.py
+"""
+Measures the pipeline overhead of LangSmith tracing.
+
+Runs `benchmarks.pipeline_bench` in a fresh process per tracing mode (the
+decorators pick their mode at import time) against a local sink that accepts
+LangSmith ingestion requests, and reports latency and event-loop lag for each
+mode next to the overhead relative to tracing off.
+
+Usage:
+    python -m benchmarks.tracing_bench --concurrency 8 --time-scale 0.05
+    python -m benchmarks.tracing_bench --sample-rate 0.05 --validation-sample-rate 0.1
+"""
+import os
+import sys
+import json
+import argparse
+import threading
+import subprocess
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+
+
+class _SinkHandler(BaseHTTPRequestHandler):
+    """Accepts every LangSmith API request with an empty JSON body."""
+
+    def _reply(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        self.server.request_count += 1
+        body = b"{}"
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = do_PATCH = _reply
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_sink() -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _SinkHandler)
+    server.request_count = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_mode(mode: str, env: Dict[str, str], bench_args: List[str]) -> Dict[str, Any]:
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.pipeline_bench", "--tracing", "env", *bench_args],
+        capture_output=True, text=True, env={**os.environ, **env}, check=True,
+    ).stdout
+    report = json.loads(output)
+    return {"mode": mode, "tracing": report["tracing"], "levels": report["levels"]}
+
+
+def main(argv: List[str] = None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", default="8")
+    parser.add_argument("--requests", type=int, default=0)
+    parser.add_argument("--profile", default="fast")
+    parser.add_argument("--time-scale", type=float, default=0.05)
+    parser.add_argument("--sample-rate", type=float, default=0.1, help="Head sample rate of the 'sampled' mode")
+    parser.add_argument("--validation-sample-rate", type=float, default=0.1,
+                        help="Validation span sample rate of the 'sampled' mode")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    sink = start_sink()
+    bench_args = ["--concurrency", args.concurrency, "--profile", args.profile,
+                  "--time-scale", str(args.time_scale), "--requests", str(args.requests)]
+    traced_env = {"LANGSMITH_TRACING": "true", "LANGSMITH_API_KEY": "benchmark",
+                  "LANGSMITH_ENDPOINT": f"http://127.0.0.1:{sink.server_address[1]}"}
+    modes = {
+        "off": {"LANGSMITH_TRACING": "false"},
+        "sampled": {**traced_env, "TRACING_SAMPLE_RATE": str(args.sample_rate),
+                    "TRACING_VALIDATION_SAMPLE_RATE": str(args.validation_sample_rate)},
+        "full": {**traced_env, "TRACING_SAMPLE_RATE": "1.0", "TRACING_VALIDATION_SAMPLE_RATE": "1.0"},
+    }
+    results = []
+    for mode, env in modes.items():
+        before = sink.request_count
+        result = run_mode(mode, env, bench_args)
+        result["sink_requests"] = sink.request_count - before
+        results.append(result)
+    sink.shutdown()
+
+    baseline = {level["concurrency"]: level for level in results[0]["levels"]}
+    for result in results:
+        for level in result["levels"]:
+            base = baseline[level["concurrency"]]["latency_s"]
+            level["overhead_vs_off"] = {
+                key: round(level["latency_s"][key] - base[key], 4) for key in ("mean", "p50", "p95")
+            }
+
+    report = {"benchmark": "tracing", "profile": args.profile, "time_scale": args.time_scale, "modes": results}
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        sys.stdout.write(output + "\n")
+    return report
+
+
+if __name__ == "__main__":
+    main()
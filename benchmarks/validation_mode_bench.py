@@ -0,0 +1,138 @@
+# benchmarks/validation_mode_bench.py
+"""
+Compares the JSON and single-token logprob validation modes.
+
+Retrieves paragraphs for a few questions, validates every one of them in each mode
+and reports per-validation latency percentiles, prompt and output tokens, estimated
+cost and pass rate, plus the relative change of the logprob mode. By default the
+simulated backends decode validation output at `--decode-tps` tokens per second, so
+the shorter answer shows up in the latency; `--live` uses the configured OpenAI and
+Pinecone services instead (API keys required, and it is billed).
+
+Usage:
+    python -m benchmarks.validation_mode_bench --paragraphs 50
+    python -m benchmarks.validation_mode_bench --live --paragraphs 20 --output modes.json
+"""
+import io
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import contextlib
+import logging
+from typing import Any, Dict, List
+
+from benchmarks.fakes import FakeBackends, get_profile
+from benchmarks.pipeline_bench import QUESTIONS, percentiles, _git_revision
+
+MODES = ("json", "logprob")
+
+
+async def run_mode(mode: str, paragraphs: Dict[str, List[Dict]], concurrency: int) -> Dict[str, Any]:
+    from services import openai_service, cost_accounting
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    verdicts: List[bool] = []
+
+    async def validate(doc: Dict, question: str, index: int, prompt) -> None:
+        async with semaphore:
+            start = time.perf_counter()
+            result = await openai_service.validate_relevance_openai(dict(doc), question, index, prompt)
+            latencies.append(time.perf_counter() - start)
+            verdicts.append(bool(result and result["validation"].get("contains_relevant_info")))
+
+    async with cost_accounting.track_request() as ledger:
+        for question, docs in paragraphs.items():
+            prompt = openai_service.ValidationPrompt(question, mode=mode)
+            await asyncio.gather(*(validate(doc, question, i, prompt) for i, doc in enumerate(docs)))
+    line = ledger.lines().get(("validation", _validation_model()), {})
+    calls = int(line.get("calls", 0)) or 1
+    return {
+        "validations": len(latencies),
+        "latency_s": percentiles(latencies),
+        "prompt_tokens_per_validation": round(line.get("prompt", 0) / calls, 1),
+        "output_tokens_per_validation": round(line.get("completion", 0) / calls, 1),
+        "cost_usd_per_validation": round(line.get("cost", 0.0) / calls, 7),
+        "pass_rate": round(sum(verdicts) / len(verdicts), 4) if verdicts else 0.0,
+    }
+
+
+def _validation_model() -> str:
+    import config
+    return config.OPENAI_VALIDATION_MODEL
+
+
+def _relative(new: float, old: float) -> float:
+    return round((new - old) / old, 4) if old else 0.0
+
+
+def main(argv: List[str] = None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--paragraphs", type=int, default=50, help="Paragraphs validated per question")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--profile", default="default")
+    parser.add_argument("--time-scale", type=float, default=0.2)
+    parser.add_argument("--decode-tps", type=float, default=50.0,
+                        help="Simulated validation decode speed in tokens per second")
+    parser.add_argument("--live", action="store_true", help="Use the real OpenAI and Pinecone services")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    os.environ["LANGSMITH_TRACING"] = "false"
+    log_sink = contextlib.redirect_stdout(io.StringIO())
+    with log_sink:
+        from streamlit import logger as streamlit_logger
+        streamlit_logger.set_log_level(logging.ERROR)
+        import config
+        config.LANGSMITH_TRACING = "false"
+        if not args.live:
+            # Simulated usage stays out of the real cost aggregates
+            config.COST_DB_PATH = os.path.join(tempfile.mkdtemp(prefix="validation_bench_"), "costs.sqlite3")
+        from services import retriever, openai_service
+
+        if args.live:
+            retriever.init_retriever()
+            openai_service.init_openai_client()
+        else:
+            profile = get_profile(args.profile)
+            profile.time_scale = args.time_scale
+            profile.validation_tokens_per_second = args.decode_tps
+            FakeBackends(profile).install()
+
+        async def collect() -> Dict[str, List[Dict]]:
+            return {question: await retriever.retrieve_documents(question, args.paragraphs) for question in QUESTIONS}
+
+        paragraphs = asyncio.run(collect())
+        results = {mode: asyncio.run(run_mode(mode, paragraphs, args.concurrency)) for mode in MODES}
+
+    json_mode, logprob_mode = results["json"], results["logprob"]
+    report = {
+        "benchmark": "validation_modes",
+        "git_revision": _git_revision(),
+        "backend": "live" if args.live else {"profile": args.profile, "time_scale": args.time_scale,
+                                             "decode_tps": args.decode_tps},
+        "model": config.OPENAI_VALIDATION_MODEL,
+        "modes": results,
+        "logprob_vs_json": {
+            "latency_p50": _relative(logprob_mode["latency_s"].get("p50", 0), json_mode["latency_s"].get("p50", 0)),
+            "latency_p95": _relative(logprob_mode["latency_s"].get("p95", 0), json_mode["latency_s"].get("p95", 0)),
+            "output_tokens": _relative(logprob_mode["output_tokens_per_validation"],
+                                       json_mode["output_tokens_per_validation"]),
+            "cost": _relative(logprob_mode["cost_usd_per_validation"], json_mode["cost_usd_per_validation"]),
+        },
+    }
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        sys.stdout.write(output + "\n")
+    return report
+
+
+if __name__ == "__main__":
+    main()
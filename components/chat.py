@@ -3,10 +3,7 @@ from typing import Dict, Any, List
 import asyncio
 import logging
 import traceback
-import nest_asyncio
-
-# Apply nest_asyncio once during module import
-nest_asyncio.apply()
+import uuid
 
 # Setup logger
 logger = logging.getLogger(__name__)
@@ -14,31 +11,153 @@ logger = logging.getLogger(__name__)
 # Import our refactored modules
 from ui.hebrew import handle_mixed_language_text
 from ui.chat_render import display_chat_message, display_status_updates, format_source_html
-from pipeline.rag import process_rag_request, create_async_execution_context, extract_citations
+from services.history_store import SessionHistory
+from utils import metrics
+
+def get_session_id() -> str:
+    """
+    Get a stable identifier for the current browser session.
+
+    Returns:
+        str: Session identifier stored in session state
+    """
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+    return st.session_state.session_id
+
+def get_session_history() -> SessionHistory:
+    """
+    Get the bounded chat history for the current session, creating it if needed.
+
+    Returns:
+        SessionHistory: The session's chat history store
+    """
+    if not isinstance(st.session_state.get("messages"), SessionHistory):
+        st.session_state.messages = SessionHistory(get_session_id())
+    return st.session_state.messages
+
+@st.fragment
+def display_history():
+    """
+    Render the chat history as a fragment.
+
+    Loading earlier messages reruns only this fragment; sidebar changes (their own
+    fragment) do not re-render the history at all.
+    """
+    # Import here to avoid circular imports
+    from i18n import get_text
+
+    with metrics.timed("rag_ui_run_seconds", buckets=metrics.UI_BUCKETS, scope="history"):
+        history = get_session_history()
+
+        # Older messages live in the session's spill log until the user asks for them
+        earlier_count = history.earlier_count()
+        if earlier_count:
+            if st.button(get_text('load_earlier_messages').format(earlier_count), key="load_earlier_messages"):
+                history.load_earlier()
+                st.rerun(scope="fragment")
+
+        for msg in history.messages():
+            display_chat_message(msg)
 
 def process_prompt(prompt: str, rag_params: Dict[str, Any]):
     """
     Process a user prompt and generate a response.
     
+    The pipeline runs as a background job (see pipeline.jobs); this script run only
+    attaches to it and renders what it produces.
+
     Args:
         prompt (str): User input prompt (may contain template)
         rag_params (Dict[str, Any]): RAG parameters from sidebar
     """
+    from pipeline import jobs
+
+    history = get_session_history()
+    
+    # Add the visible prompt to chat history (what the user sees)
+    user_message = {"role": "user", "content": prompt}
+    history.append(user_message)
+    display_chat_message(user_message)
+
+    job = jobs.submit_job(
+        history=history.as_pipeline_history(),
+        params=rag_params,
+        session_id=get_session_id(),
+        prompt=prompt
+    )
+    st.session_state.active_job_id = job.id
+    # Kept in the URL so a reloaded tab (a new session) can find the job again; the token proves it is this tab's
+    st.query_params["job"] = job.id
+    st.query_params["resume"] = job.resume_token
+    attach_job(job)
+
+def resume_active_job() -> bool:
+    """
+    Reattach to a job that an earlier script run, or a tab that was reloaded,
+    left streaming. The job's log is replayed from the start, so the answer picks
+    up where it is instead of being generated again.
+
+    Only the job's own session, or a tab presenting the job's resume token from the
+    URL, may attach: the log holds the user's question and answer. A reloaded tab
+    takes over the job's session, so its later questions supersede the job and draw
+    on the same session budget.
+
+    Returns:
+        bool: True if a job was attached
+    """
+    from pipeline import jobs
+
+    job_id = st.session_state.get("active_job_id") or st.query_params.get("job")
+    if not job_id:
+        return False
+    job = jobs.get_job(job_id)
+    if job is None:
+        # Purged, or started by an earlier server process
+        _forget_active_job()
+        return False
+    if not jobs.may_resume(job, get_session_id(), st.query_params.get("resume")):
+        logger.warning(f"Refused to attach session {get_session_id()} to job {job_id} of another session")
+        metrics.inc("rag_jobs_resume_refused_total")
+        _forget_active_job()
+        return False
+    if st.session_state.get("active_job_id") != job_id:
+        # A reloaded tab: carry on the job's session, whose history does not have the question yet
+        if job.session_id and job.session_id != get_session_id() and not len(get_session_history()):
+            st.session_state.session_id = job.session_id
+            st.session_state.messages = SessionHistory(job.session_id)
+        user_message = {"role": "user", "content": job.prompt}
+        get_session_history().append(user_message)
+        display_chat_message(user_message)
+        st.session_state.active_job_id = job_id
+    metrics.inc("rag_jobs_reattached_total")
+    attach_job(job)
+    return True
+
+def _forget_active_job():
+    st.session_state.pop("active_job_id", None)
+    for param in ("job", "resume"):
+        if param in st.query_params:
+            del st.query_params[param]
+
+def attach_job(job) -> None:
+    """
+    Render a background job's answer: replay its log, follow it until it finishes,
+    then store the answer in the chat history.
+
+    Args:
+        job (pipeline.jobs.Job): The job to render
+    """
     # Import here to avoid circular imports
     from i18n import get_direction, get_text
     from utils.sanitization import sanitize_html
-    from rag_processor import PIPELINE_VALIDATE_GENERATE_GPT4O
-    
-    # Initialize session state if needed
-    if 'messages' not in st.session_state:
-        st.session_state.messages = []
+    from rag_processor import PIPELINE_VALIDATE_GENERATE_GPT4O, PIPELINE_RETRIEVAL_ONLY
+    import config
+
+    history = get_session_history()
     
     text_direction = get_direction()
     hebrew_font = st.session_state.hebrew_font
-    
-    # Add the visible prompt to chat history (what the user sees)
-    st.session_state.messages.append({"role": "user", "content": prompt})
-    display_chat_message(st.session_state.messages[-1])
 
     with st.chat_message("assistant"):
         msg_placeholder = st.empty()
@@ -46,11 +165,7 @@ def process_prompt(prompt: str, rag_params: Dict[str, Any]):
         chunks: List[str] = []
         try:
             def status_cb(m): status_container.update(label=f"{get_text('processing_step')} {m}")
-            def stream_cb(c):
-                # Sanitize the chunk before appending
-                if isinstance(c, str):
-                    c = sanitize_html(c)
-                chunks.append(c)
+            def render_stream():
                 # Process the entire response with mixed language handler first
                 joined_text = ''.join(chunks) + "▌"  # Add cursor
                 display_html = handle_mixed_language_text(joined_text, "David Libre")
@@ -59,25 +174,25 @@ def process_prompt(prompt: str, rag_params: Dict[str, Any]):
                 msg_placeholder.markdown(safe_html, unsafe_allow_html=True)
 
             try:
-                # Get the current event loop or create a new one
-                loop = create_async_execution_context()
+                # Replay the log, then follow it; a replay renders once per batch, not per chunk
+                offset = 0
+                while True:
+                    events, finished = job.read(offset, timeout=config.JOB_POLL_SECONDS)
+                    offset += len(events)
+                    statuses = [e["data"] for e in events if e["type"] == "status"]
+                    new_chunks = [e["data"] for e in events if e["type"] == "chunk"]
+                    if statuses:
+                        status_cb(statuses[-1])
+                    if new_chunks:
+                        # Sanitize the chunks before appending
+                        chunks.extend(sanitize_html(c) if isinstance(c, str) else c for c in new_chunks)
+                        render_stream()
+                    if finished:
+                        break
+                final_rag = job.result
                 
-                final_rag = loop.run_until_complete(
-                    process_rag_request(
-                        history=st.session_state.messages,
-                        params=rag_params,
-                        status_callback=status_cb,
-                        stream_callback=stream_cb
-                    )
-                )
-                
-                # Extract citations after getting the response
-                cited_ids = []
-                if isinstance(final_rag, dict):
-                    raw = final_rag.get("final_response", "")
-                    # Only attempt to extract citations if we have a valid response
-                    if raw and raw.strip():
-                        cited_ids = extract_citations(raw)
+                # Citations were extracted by the job; a search has none, so all its ranked cards are shown
+                cited_ids = set(final_rag.get("cited_ids") or []) if isinstance(final_rag, dict) else set()
             except (RuntimeError, asyncio.CancelledError, asyncio.TimeoutError) as loop_err:
                 st.error(f"{get_text('error_async')} {loop_err}", icon="⚠️")
                 # Format error message with RTL support
@@ -99,7 +214,7 @@ def process_prompt(prompt: str, rag_params: Dict[str, Any]):
                     "generator_input_documents": [],
                     "pipeline_used": "Error"
                 }
-                cited_ids = []
+                cited_ids = set()
 
             if isinstance(final_rag, dict):
                 # Sanitize raw content
@@ -111,6 +226,8 @@ def process_prompt(prompt: str, rag_params: Dict[str, Any]):
                 log = final_rag.get("status_log", [])
                 docs = final_rag.get("generator_input_documents", [])
                 pipeline = final_rag.get("pipeline_used", PIPELINE_VALIDATE_GENERATE_GPT4O)
+                # Retrieval-only results carry the query terms to highlight
+                search_terms = final_rag.get("search_terms") if pipeline == PIPELINE_RETRIEVAL_ONLY else None
 
                 # Process final content with mixed language handler
                 if not (err and raw.strip().startswith("<div")):
@@ -121,8 +238,10 @@ def process_prompt(prompt: str, rag_params: Dict[str, Any]):
                     final = sanitize_html(raw)
                 
                 msg_placeholder.markdown(final, unsafe_allow_html=True)
+                if final_rag.get("cached") and config.ANSWER_CACHE_LABEL:
+                    warm = final_rag["cached"].get("match") == "warm"
+                    st.caption(get_text('warm_answer_notice' if warm else 'cached_answer_notice'))
 
-                # Use the citations extracted earlier instead of making another async call
                 if cited_ids:
                     enumerated_docs = list(enumerate(docs, start=1))
                     docs_to_show = [(idx, doc) for idx, doc in enumerated_docs if str(idx) in cited_ids]
@@ -130,12 +249,13 @@ def process_prompt(prompt: str, rag_params: Dict[str, Any]):
                     docs_to_show = list(enumerate(docs, start=1))
 
                 if docs_to_show:
-                    # Use a simple text title for the expander
-                    with st.expander(f"{get_text('sources_title')} ({len(docs_to_show)})", expanded=False):
+                    sources_text = get_text('search_sources_text' if search_terms is not None else 'sources_text')
+                    # Use a simple text title for the expander; search results are the answer, so shown open
+                    with st.expander(f"{get_text('sources_title')} ({len(docs_to_show)})", expanded=search_terms is not None):
                         # Add RTL Hebrew wrapper with embed
                         expander_title = f"""
                         <div class='expander-title rtl-text hebrew-font' dir='rtl' lang="he">
-                            {get_text('sources_text').format(len(docs_to_show))}
+                            {sources_text.format(len(docs_to_show))}
                         </div>
                         """
                         st.markdown(expander_title, unsafe_allow_html=True)
@@ -147,7 +267,7 @@ def process_prompt(prompt: str, rag_params: Dict[str, Any]):
                         
                         # Format each source consistently using our helper function
                         for idx, doc in docs_to_show:
-                            source_html, text_html = format_source_html(doc, idx, hebrew_font, get_text)
+                            source_html, text_html = format_source_html(doc, idx, hebrew_font, get_text, search_terms)
                             st.markdown(source_html, unsafe_allow_html=True)
                             st.markdown(text_html, unsafe_allow_html=True)
                         
@@ -162,7 +282,10 @@ def process_prompt(prompt: str, rag_params: Dict[str, Any]):
                     "status_log": log,
                     "error": err
                 }
-                st.session_state.messages.append(assistant_data)
+                if search_terms is not None:
+                    assistant_data["search_terms"] = search_terms
+                history.append(assistant_data)
+                _forget_active_job()
                 display_status_updates(log)
                 if err:
                     status_container.update(label=f"{get_text('error')}!", state="error", expanded=False)
@@ -177,7 +300,7 @@ def process_prompt(prompt: str, rag_params: Dict[str, Any]):
                 """
                 msg_placeholder.markdown(sanitize_html(err_msg), unsafe_allow_html=True)
                 
-                st.session_state.messages.append({
+                history.append({
                     "role": "assistant",
                     "content": get_text('communication_error'),
                     "final_docs": [],
@@ -185,6 +308,7 @@ def process_prompt(prompt: str, rag_params: Dict[str, Any]):
                     "status_log": ["Unexpected result"],
                     "error": "Unexpected"
                 })
+                _forget_active_job()
                 status_container.update(label=f"{get_text('error')}!", state="error", expanded=False)
 
         except Exception as e:
@@ -204,7 +328,7 @@ def process_prompt(prompt: str, rag_params: Dict[str, Any]):
             # Sanitize error HTML
             err_html = sanitize_html(err_html)
             msg_placeholder.error(err_html, icon="🔥")
-            st.session_state.messages.append({
+            history.append({
                 "role": "assistant",
                 "content": err_html,
                 "final_docs": [],
@@ -212,4 +336,8 @@ def process_prompt(prompt: str, rag_params: Dict[str, Any]):
                 "status_log": [f"Critical: {type(e).__name__}"],
                 "error": str(e)
             })
-            status_container.update(label=get_text('processing_error'), state="error", expanded=False) 
\ No newline at end of file
+            _forget_active_job()
+            status_container.update(label=get_text('processing_error'), state="error", expanded=False)
+
+metrics.registry.describe("rag_jobs_reattached_total", "Script runs that reattached to a job started by an earlier run or tab.")
+metrics.registry.describe("rag_jobs_resume_refused_total", "Attempts to attach to a job of another session without its resume token.")
@@ -2,233 +2,334 @@ import streamlit as st
 from typing import Dict, Any, Optional, Tuple
 import logging
 
+from utils import metrics
+
 # Setup logger
 logger = logging.getLogger(__name__)
 
-def display_sidebar() -> Dict[str, Any]:
+@st.fragment
+def _sidebar_fragment() -> None:
     """
-    Display the sidebar with all settings and return the RAG parameters.
-    
-    Returns:
-        Dict[str, Any]: A dictionary containing RAG parameters and prompt gallery selection
+    Render the sidebar contents as an independently rerunnable fragment.
+
+    Widget changes here (sliders, prompt editors) rerun only this function, not the
+    whole app, so they cost the same however long the conversation is. Changes that
+    affect the rest of the page (language, font, choosing a question or template)
+    rerun the app explicitly. The chosen RAG parameters are kept in
+    `st.session_state.rag_params`.
     """
+    with metrics.timed("rag_ui_run_seconds", buckets=metrics.UI_BUCKETS, scope="sidebar"):
+        _render_sidebar()
+
+def _render_sidebar() -> None:
     # Import here to avoid circular imports
     from i18n import get_direction, get_text, get_font_options, LANGUAGES, get_current_user_prompt_starters, get_prompt_templates, get_current_language
     from services.retriever import get_retriever_status
     from services.openai_service import get_openai_status
+    from services.circuit_breaker import get_states as get_circuit_states
+    from services.facets import get_facets as get_source_facets
     from utils.sanitization import escape_html
     import config
     
     text_direction = get_direction()
     current_language = get_current_language()
     
-    # Use Streamlit's native sidebar
-    with st.sidebar:
-        # All sidebar header items
-        st.header(get_text('settings_title'))
-        st.subheader(get_text('display_settings'))
-        
-        # Language selector
-        language_options = {code: name for code, name in LANGUAGES.items()}
-        current_language_index = list(language_options.keys()).index(st.session_state.language) if st.session_state.language in language_options else 0
-        
-        selected_language = st.selectbox(
-            get_text('language_setting'),
-            options=list(language_options.keys()),
-            format_func=lambda x: language_options.get(x, x),
-            index=current_language_index
+    # All sidebar header items
+    st.header(get_text('settings_title'))
+    st.subheader(get_text('display_settings'))
+
+    # Language selector
+    language_options = {code: name for code, name in LANGUAGES.items()}
+    current_language_index = list(language_options.keys()).index(st.session_state.language) if st.session_state.language in language_options else 0
+
+    selected_language = st.selectbox(
+        get_text('language_setting'),
+        options=list(language_options.keys()),
+        format_func=lambda x: language_options.get(x, x),
+        index=current_language_index
+    )
+
+    # Update language if changed
+    if selected_language != st.session_state.language:
+        # Update session state and clear template
+        st.session_state.language = selected_language
+        if "active_template" in st.session_state:
+            st.session_state.active_template = None
+
+        # Notification and rerun (every text on the page changes, not just the sidebar)
+        st.success(f"Language changed to {language_options.get(selected_language, selected_language)}", icon="✅")
+        st.rerun(scope="app")
+
+    # Font selector
+    font_options = get_font_options()
+    font_index = list(font_options.keys()).index(st.session_state.hebrew_font) if st.session_state.hebrew_font in font_options else 0
+
+    selected_font = st.selectbox(
+        get_text('font_setting'),
+        options=list(font_options.keys()),
+        format_func=lambda x: font_options.get(x, x),
+        index=font_index
+    )
+
+    # Update font if changed
+    if selected_font != st.session_state.hebrew_font:
+        st.session_state.hebrew_font = selected_font
+        st.success(f"Font changed to {font_options.get(selected_font, selected_font)}", icon="✅")
+        st.rerun(scope="app")
+
+    # Font preview
+    font_preview_text = get_text('font_preview').format(font_options.get(selected_font, selected_font))
+
+    # Apply David Libre font to all sidebar elements
+    st.markdown("""
+    <style>
+    .stSidebar [data-testid="stVerticalBlock"] {
+        font-family: "David Libre", "David", serif !important;
+    }
+    </style>
+    """, unsafe_allow_html=True)
+
+    # Use streamlit container instead of custom HTML for preview
+    preview = st.container(border=True)
+    with preview:
+        st.markdown(f"<div style='font-family: \"David Libre\", serif !important;direction:{text_direction};text-align:{'right' if text_direction=='rtl' else 'left'}'>{font_preview_text}</div>", unsafe_allow_html=True)
+
+    # Force David Libre for all Hebrew text
+    st.session_state.hebrew_font = "David Libre"
+
+    st.divider()  # Native divider instead of HTML hr
+
+    # Service status with native components
+    retriever_ready, _ = get_retriever_status()
+    openai_ready, _ = get_openai_status()
+
+    status_col1, status_col2 = st.columns(2)
+    with status_col1:
+        st.write(f"**{get_text('retriever_status')}**")
+    with status_col2:
+        st.write("✅" if retriever_ready else "❌")
+
+    if not retriever_ready:
+        st.error(get_text('retriever_error'), icon="🛑")
+        st.stop()
+
+    status_col3, status_col4 = st.columns(2)
+    with status_col3:
+        st.write(f"**{get_text('openai_status')}**")
+    with status_col4:
+        st.write(f"{'✅' if openai_ready else '❌'}")
+
+    if not openai_ready:
+        st.warning(get_text('openai_error'), icon="⚠️")
+
+    # Endpoints whose circuit breaker is open or probing
+    for circuit in get_circuit_states():
+        if circuit["state"] != "closed":
+            st.warning(get_text('circuit_degraded').format(circuit["name"], circuit["state"].replace("_", "-")), icon="🔌")
+
+    # Pipeline mode: validated answers, or ranked passages without LLM calls
+    previous_params = st.session_state.rag_params
+    modes = ["answer", "search"]
+    mode = st.radio(
+        get_text('pipeline_mode'),
+        options=modes,
+        format_func=lambda m: get_text(f'pipeline_mode_{m}'),
+        index=modes.index(previous_params.get("mode", "answer")),
+        horizontal=True,
+        key="radio_pipeline_mode"
+    )
+
+    # Sources to search, pushed down into retrieval as a filter (offered once the facet file is built)
+    source_counts = {facet["name"]: facet["count"] for facet in get_source_facets()}
+    sources = [source for source in previous_params.get("sources", []) if source in source_counts]
+    if source_counts:
+        sources = st.multiselect(
+            get_text('source_filter'),
+            options=list(source_counts),
+            default=sources,
+            format_func=lambda name: f"{name} ({source_counts[name]:,})",
+            placeholder=get_text('source_filter_placeholder'),
+            help=get_text('source_filter_help'),
+            key="multiselect_sources"
         )
-        
-        # Update language if changed
-        if selected_language != st.session_state.language:
-            # Update session state and clear template
-            st.session_state.language = selected_language
-            if "active_template" in st.session_state:
-                st.session_state.active_template = None
-                
-            # Notification and rerun
-            st.success(f"Language changed to {language_options.get(selected_language, selected_language)}", icon="✅")
-            st.rerun()
-        
-        # Font selector
-        font_options = get_font_options()
-        font_index = list(font_options.keys()).index(st.session_state.hebrew_font) if st.session_state.hebrew_font in font_options else 0
-        
-        selected_font = st.selectbox(
-            get_text('font_setting'),
-            options=list(font_options.keys()),
-            format_func=lambda x: font_options.get(x, x),
-            index=font_index
+
+    # RAG parameters
+    if mode == "search":
+        n_results = st.slider(
+            get_text('search_results_count'),
+            1,
+            config.SEARCH_MAX_RESULTS,
+            min(previous_params.get("n_results", config.SEARCH_RESULTS), config.SEARCH_MAX_RESULTS),
+            key="slider_n_results"
         )
-        
-        # Update font if changed
-        if selected_font != st.session_state.hebrew_font:
-            st.session_state.hebrew_font = selected_font
-            st.success(f"Font changed to {font_options.get(selected_font, selected_font)}", icon="✅")
-            st.rerun()
-        
-        # Font preview
-        font_preview_text = get_text('font_preview').format(font_options.get(selected_font, selected_font))
-        
-        # Apply David Libre font to all sidebar elements
-        st.markdown("""
-        <style>
-        .stSidebar [data-testid="stVerticalBlock"] {
-            font-family: "David Libre", "David", serif !important;
+        # Read by the app run that processes the next prompt; moving a slider reruns only this fragment
+        st.session_state.rag_params = {
+            **previous_params,
+            "mode": mode,
+            "sources": sources,
+            "n_results": n_results,
+            "services_ready": (retriever_ready and openai_ready)
         }
-        </style>
-        """, unsafe_allow_html=True)
-        
-        # Use streamlit container instead of custom HTML for preview
-        preview = st.container(border=True)
-        with preview:
-            st.markdown(f"<div style='font-family: \"David Libre\", serif !important;direction:{text_direction};text-align:{'right' if text_direction=='rtl' else 'left'}'>{font_preview_text}</div>", unsafe_allow_html=True)
-            
-        # Force David Libre for all Hebrew text
-        st.session_state.hebrew_font = "David Libre"
-        
-        st.divider()  # Native divider instead of HTML hr
-        
-        # Service status with native components
-        retriever_ready, _ = get_retriever_status()
-        openai_ready, _ = get_openai_status()
-        
-        status_col1, status_col2 = st.columns(2)
-        with status_col1:
-            st.write(f"**{get_text('retriever_status')}**")
-        with status_col2:
-            st.write("✅" if retriever_ready else "❌")
-            
-        if not retriever_ready:
-            st.error(get_text('retriever_error'), icon="🛑")
-            st.stop()
-        
-        status_col3, status_col4 = st.columns(2)
-        with status_col3:
-            st.write(f"**{get_text('openai_status')}**")
-        with status_col4:
-            st.write(f"{'✅' if openai_ready else '❌'}")
-            
-        if not openai_ready:
-            st.warning(get_text('openai_error'), icon="⚠️")
-        
-        # RAG parameters
-        n_retrieve = st.slider(get_text('retrieval_count'), 1, 300, config.DEFAULT_N_RETRIEVE)
+        st.info(get_text('search_info'), icon="ℹ️")
+    else:
+        # Streamlit drops the state of sliders not rendered in search mode, so they start from rag_params
+        n_retrieve = st.slider(
+            get_text('retrieval_count'),
+            1,
+            300,
+            previous_params.get("n_retrieve", config.DEFAULT_N_RETRIEVE),
+            key="slider_n_retrieve"
+        )
         max_validate = min(n_retrieve, 100)
         n_validate = st.slider(
             get_text('validation_count'),
             1,
             max_validate,
-            min(config.DEFAULT_N_VALIDATE, max_validate),
-            disabled=not openai_ready
+            min(previous_params.get("n_validate", config.DEFAULT_N_VALIDATE), max_validate),
+            disabled=not openai_ready,
+            key="slider_n_validate"
         )
+        # Read by the app run that processes the next prompt; moving a slider reruns only this fragment
+        st.session_state.rag_params = {
+            **previous_params,
+            "mode": mode,
+            "sources": sources,
+            "n_retrieve": n_retrieve,
+            "n_validate": n_validate,
+            "services_ready": (retriever_ready and openai_ready)
+        }
         st.info(get_text('validation_info'), icon="ℹ️")
-        
-        # Prompt editors in expander
-        with st.expander(get_text('edit_prompts'), expanded=False):
-            config.OPENAI_SYSTEM_PROMPT = st.text_area(
-                get_text('system_prompt'),
-                value=config.OPENAI_SYSTEM_PROMPT,
-                height=200
-            )
-            config.VALIDATION_PROMPT_TEMPLATE = st.text_area(
-                get_text('validation_prompt'),
-                value=config.VALIDATION_PROMPT_TEMPLATE,
-                height=200
-            )
-            
-        # ----- PROMPT GALLERY SECTION (MOVED FROM MAIN APP) -----
-        st.divider()
-        
-        # Determine text alignment based on text direction
-        text_align = "right" if text_direction == "rtl" else "left"
-        
-        # Style for section headers
-        section_style = f"""
-            direction: {text_direction};
-            text-align: {text_align};
-            font-family: "{st.session_state.hebrew_font}", "Open Sans Hebrew", "Alef Hebrew", "Arial Hebrew", sans-serif;
-        """
-        
-        # Display examples section
+
+    # Prompt editors in expander
+    with st.expander(get_text('edit_prompts'), expanded=False):
+        config.OPENAI_SYSTEM_PROMPT = st.text_area(
+            get_text('system_prompt'),
+            value=config.OPENAI_SYSTEM_PROMPT,
+            height=200
+        )
+        config.VALIDATION_PROMPT_TEMPLATE = st.text_area(
+            get_text('validation_prompt'),
+            value=config.VALIDATION_PROMPT_TEMPLATE,
+            height=200
+        )
+
+    # ----- PROMPT GALLERY SECTION (MOVED FROM MAIN APP) -----
+    st.divider()
+
+    # Determine text alignment based on text direction
+    text_align = "right" if text_direction == "rtl" else "left"
+
+    # Style for section headers
+    section_style = f"""
+        direction: {text_direction};
+        text-align: {text_align};
+        font-family: "{st.session_state.hebrew_font}", "Open Sans Hebrew", "Alef Hebrew", "Arial Hebrew", sans-serif;
+    """
+
+    # Display examples section
+    st.markdown(f"""<h3 dir="{text_direction}" style="{section_style}">
+        {get_text('example_questions')}
+    </h3>""", unsafe_allow_html=True)
+
+    # Initialize session state for storing clicked question or template
+    if "clicked_example_question" not in st.session_state:
+        st.session_state.clicked_example_question = None
+
+    if "clicked_template" not in st.session_state:
+        st.session_state.clicked_template = None
+
+    # Get example questions in the current language
+    starters = get_current_user_prompt_starters()
+
+    # Helper function to create language-aware button labels
+    def create_button_label(text):
+        max_length = 40  # Shorter preview for button labels
+
+        if len(text) > max_length:
+            # Extract the beginning of the text for the preview
+            preview = text[:max_length].strip()
+
+            # Try to find a good breakpoint (end of a word) 
+            last_space = preview.rfind(' ')
+            if last_space > max_length // 2:  # Only use space if it's reasonably far in
+                preview = preview[:last_space]
+
+            preview += "..."
+            return escape_html(preview)
+
+        return escape_html(text)
+
+    # Display example questions as clickable items
+    for i, question in enumerate(starters):
+        # Create clickable button for each question
+        if st.button(
+            create_button_label(question),
+            key=f"question_{i}",
+            use_container_width=True,
+            help=question if len(question) > 40 else None  # Show full text as tooltip for long questions
+        ):
+            st.session_state.clicked_example_question = question
+            st.session_state.clicked_template = None
+            # The click only reran this fragment; the app run answers the question
+            st.rerun(scope="app")
+
+    # Display templates section
+    templates = get_prompt_templates()
+
+    if templates:
+        st.markdown("<hr>", unsafe_allow_html=True)
         st.markdown(f"""<h3 dir="{text_direction}" style="{section_style}">
-            {get_text('example_questions')}
+            {get_text('prompt_templates')}
         </h3>""", unsafe_allow_html=True)
-        
-        # Initialize session state for storing clicked question or template
-        if "clicked_example_question" not in st.session_state:
-            st.session_state.clicked_example_question = None
-        
-        if "clicked_template" not in st.session_state:
-            st.session_state.clicked_template = None
-        
-        # Get example questions in the current language
-        starters = get_current_user_prompt_starters()
-        
-        # Helper function to create language-aware button labels
-        def create_button_label(text):
-            max_length = 40  # Shorter preview for button labels
-            
-            if len(text) > max_length:
-                # Extract the beginning of the text for the preview
-                preview = text[:max_length].strip()
-                
-                # Try to find a good breakpoint (end of a word) 
-                last_space = preview.rfind(' ')
-                if last_space > max_length // 2:  # Only use space if it's reasonably far in
-                    preview = preview[:last_space]
-                    
-                preview += "..."
-                return escape_html(preview)
-            
-            return escape_html(text)
-        
-        # Display example questions as clickable items
-        for i, question in enumerate(starters):
-            # Create clickable button for each question
+
+        # Display templates as clickable items
+        for i, template in enumerate(templates):
+            template_name = template.get('name', f"Template {i+1}")
+            template_desc = template.get('description', '')
+            template_text = template.get('template', '')
+
+            # Create button label 
+            button_label = f"{template_name}"
+            if template_desc:
+                button_label = f"{template_name} - {template_desc}"
+
+            # Tooltip contains a preview of the template
+            tooltip = template_text[:100] + "..." if len(template_text) > 100 else template_text
+
+            # Create clickable button for each template
             if st.button(
-                create_button_label(question),
-                key=f"question_{i}",
+                create_button_label(button_label),
+                key=f"template_{i}",
                 use_container_width=True,
-                help=question if len(question) > 40 else None  # Show full text as tooltip for long questions
+                help=tooltip
             ):
-                st.session_state.clicked_example_question = question
-                st.session_state.clicked_template = None
-        
-        # Display templates section
-        templates = get_prompt_templates()
-        
-        if templates:
-            st.markdown("<hr>", unsafe_allow_html=True)
-            st.markdown(f"""<h3 dir="{text_direction}" style="{section_style}">
-                {get_text('prompt_templates')}
-            </h3>""", unsafe_allow_html=True)
-            
-            # Display templates as clickable items
-            for i, template in enumerate(templates):
-                template_name = template.get('name', f"Template {i+1}")
-                template_desc = template.get('description', '')
-                template_text = template.get('template', '')
-                
-                # Create button label 
-                button_label = f"{template_name}"
-                if template_desc:
-                    button_label = f"{template_name} - {template_desc}"
-                
-                # Tooltip contains a preview of the template
-                tooltip = template_text[:100] + "..." if len(template_text) > 100 else template_text
-                
-                # Create clickable button for each template
-                if st.button(
-                    create_button_label(button_label),
-                    key=f"template_{i}",
-                    use_container_width=True,
-                    help=tooltip
-                ):
-                    # Set the template in session state
-                    st.session_state.clicked_template = template
-                    st.session_state.clicked_example_question = None
-                    st.rerun()  # Rerun to update the UI with the selected template
+                # Set the template in session state
+                st.session_state.clicked_template = template
+                st.session_state.clicked_example_question = None
+                st.rerun(scope="app")  # Rerun the app to update the UI with the selected template
+
+def display_sidebar() -> Dict[str, Any]:
+    """
+    Display the sidebar with all settings and return the RAG parameters.
+    
+    Returns:
+        Dict[str, Any]: A dictionary containing RAG parameters and prompt gallery selection
+    """
+    import config
+
+    if "rag_params" not in st.session_state:
+        st.session_state.rag_params = {
+            "mode": "answer",
+            "n_retrieve": config.DEFAULT_N_RETRIEVE,
+            "n_validate": config.DEFAULT_N_VALIDATE,
+            "n_results": config.SEARCH_RESULTS,
+            "sources": [],
+            "services_ready": False
+        }
+
+    # Use Streamlit's native sidebar
+    with st.sidebar:
+        _sidebar_fragment()
 
     # Process prompt gallery selections
     prompt_gallery_result = None
@@ -246,8 +347,6 @@ def display_sidebar() -> Dict[str, Any]:
         prompt_gallery_result = (template_preview, selected_template)
 
     return {
-        "n_retrieve": n_retrieve, 
-        "n_validate": n_validate, 
-        "services_ready": (retriever_ready and openai_ready),
+        **st.session_state.rag_params,
         "prompt_gallery_result": prompt_gallery_result
     } 
\ No newline at end of file
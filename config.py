@@ -1,5 +1,6 @@
 import os
 import sys
+import json
 from dotenv import load_dotenv
 
 dot_env_path = os.path.join(os.path.dirname(__file__), '.env')
@@ -12,7 +13,7 @@ else:
 
 # Import prompts from the prompts module
 try:
-    from prompts import OPENAI_SYSTEM_PROMPT, VALIDATION_PROMPT_TEMPLATE
+    from prompts import OPENAI_SYSTEM_PROMPT, VALIDATION_PROMPT_TEMPLATE, VALIDATION_LOGPROB_PROMPT_TEMPLATE
 except ImportError:
     print("Warning: Failed to import prompts module. Using default prompts.")
     # Fallback prompts would be defined here if needed
@@ -22,6 +23,11 @@ LANGSMITH_ENDPOINT = os.environ.get("LANGSMITH_ENDPOINT", "https://api.smith.lan
 LANGSMITH_TRACING = os.environ.get("LANGSMITH_TRACING", "true")
 LANGSMITH_API_KEY = os.environ.get("LANGSMITH_API_KEY")
 LANGSMITH_PROJECT = os.environ.get("LANGSMITH_PROJECT", "DivreyYoel-RAG-GPT4-Gen")
+TRACING_SAMPLE_RATE = float(os.environ.get("TRACING_SAMPLE_RATE", "1.0"))  # Share of requests traced end to end
+TRACING_VALIDATION_SAMPLE_RATE = float(os.environ.get("TRACING_VALIDATION_SAMPLE_RATE", "1.0"))  # Share of per-paragraph validation spans kept in a traced request
+TRACING_QUEUE_SIZE = int(os.environ.get("TRACING_QUEUE_SIZE", "10000"))  # Pending run updates before new ones are dropped
+TRACING_BATCH_SIZE = int(os.environ.get("TRACING_BATCH_SIZE", "100"))  # Run updates exported per batch
+TRACING_FLUSH_INTERVAL = float(os.environ.get("TRACING_FLUSH_INTERVAL", "1.0"))  # Seconds to wait while filling a batch
 
 # --- API Keys (Required) ---
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
@@ -31,14 +37,218 @@ PINECONE_API_KEY = os.environ.get("PINECONE_API_KEY")
 EMBEDDING_MODEL = os.environ.get("OPENAI_EMBEDDING_MODEL", "text-embedding-3-large")
 OPENAI_VALIDATION_MODEL = os.environ.get("OPENAI_VALIDATION_MODEL", "gpt-4o")
 OPENAI_GENERATION_MODEL = os.environ.get("OPENAI_GENERATION_MODEL", "o3")
+# Used while the primary model's circuit breaker is open (empty disables the fallback)
+OPENAI_VALIDATION_FALLBACK_MODEL = os.environ.get("OPENAI_VALIDATION_FALLBACK_MODEL", "gpt-4o-mini")
+OPENAI_GENERATION_FALLBACK_MODEL = os.environ.get("OPENAI_GENERATION_FALLBACK_MODEL", "gpt-4o")
+# Send a prompt_cache_key derived from the shared prompt prefix so calls of one query hit the same prompt cache
+OPENAI_PROMPT_CACHE_KEY = os.environ.get("OPENAI_PROMPT_CACHE_KEY", "true").lower() == "true"
+
+# --- Validation Mode ---
+# "json": a verdict and Hebrew justification per paragraph; "logprob": a single yes/no
+# token whose probability becomes a relevance score (justifications only for displayed sources)
+VALIDATION_MODE = os.environ.get("VALIDATION_MODE", "json").lower()
+VALIDATION_LOGPROB_THRESHOLD = float(os.environ.get("VALIDATION_LOGPROB_THRESHOLD", "0.5"))  # Relevance score a paragraph needs to pass
+VALIDATION_TOP_LOGPROBS = int(os.environ.get("VALIDATION_TOP_LOGPROBS", "5"))  # Alternatives requested for the answer token
+# Platt scaling of the yes/no probability: score = sigmoid(a * logit(p) + b); override with VALIDATION_CALIBRATION_JSON
+VALIDATION_CALIBRATION = {"a": 1.0, "b": 0.0}
+VALIDATION_CALIBRATION.update(json.loads(os.environ.get("VALIDATION_CALIBRATION_JSON", "{}")))
+VALIDATION_EXPLAIN_DISPLAYED = os.environ.get("VALIDATION_EXPLAIN_DISPLAYED", "true").lower() == "true"  # Logprob mode and cascade: justify the sources shown with an answer
+
+# --- Validation Strategy ---
+# "single": every paragraph is validated by OPENAI_VALIDATION_MODEL; "cascade": a cheaper
+# model screens every paragraph (logprob mode) and only the uncertain ones are escalated
+VALIDATION_STRATEGY = os.environ.get("VALIDATION_STRATEGY", "single").lower()
+CASCADE_SCREEN_MODEL = os.environ.get("CASCADE_SCREEN_MODEL", "gpt-4o-mini")
+CASCADE_ACCEPT_SCORE = float(os.environ.get("CASCADE_ACCEPT_SCORE", "0.9"))  # Screen score at or above which a paragraph passes
+CASCADE_REJECT_SCORE = float(os.environ.get("CASCADE_REJECT_SCORE", "0.1"))  # Screen score at or below which a paragraph is dropped
+
+# --- Score Cutoff ---
+# Validates only the retrieved paragraphs before their similarity scores fall off:
+# "gap" (the largest drop), "elbow" (the knee of the score curve), "zscore" (relative to the
+# query's own scores), "floor" (SCORE_CUTOFF_FLOOR only) or "off"
+SCORE_CUTOFF_METHOD = os.environ.get("SCORE_CUTOFF_METHOD", "off").lower()
+SCORE_CUTOFF_MIN = int(os.environ.get("SCORE_CUTOFF_MIN", "15"))  # Never validate fewer paragraphs than this
+SCORE_CUTOFF_MAX = int(os.environ.get("SCORE_CUTOFF_MAX", "0"))  # Never validate more than this; 0 = n_validate
+SCORE_CUTOFF_FLOOR = float(os.environ.get("SCORE_CUTOFF_FLOOR", "0"))  # Absolute similarity floor applied with every method; 0 = none
+SCORE_CUTOFF_GAP_RATIO = float(os.environ.get("SCORE_CUTOFF_GAP_RATIO", "4.0"))  # "gap": a drop this many times the median drop
+SCORE_CUTOFF_ELBOW_MIN = float(os.environ.get("SCORE_CUTOFF_ELBOW_MIN", "0.1"))  # "elbow": least normalized depth of the knee
+SCORE_CUTOFF_ZSCORE = float(os.environ.get("SCORE_CUTOFF_ZSCORE", "0.5"))  # "zscore": standard deviations above the mean score
+
+# --- Adaptive Fast Path ---
+# Decides per query, from the retrieval scores and the question's term overlap with the top
+# paragraphs, whether to answer from the top paragraphs without validation ("direct"), validate
+# a sample ("sample") or validate as requested ("full"). "shadow" decides and records the
+# decision but always validates in full, to audit the routes before turning them "on".
+FAST_PATH_MODE = os.environ.get("FAST_PATH_MODE", "off").lower()  # "off", "shadow" or "on"
+FAST_PATH_TOP_K = int(os.environ.get("FAST_PATH_TOP_K", "8"))  # Paragraphs judged, and answered from on the direct route
+FAST_PATH_MAX_TERMS = int(os.environ.get("FAST_PATH_MAX_TERMS", "6"))  # Direct: at most this many question terms (short lookups)
+FAST_PATH_DIRECT_SCORE = float(os.environ.get("FAST_PATH_DIRECT_SCORE", "0.8"))  # Direct: least similarity score in the top-k
+FAST_PATH_DIRECT_MARGIN = float(os.environ.get("FAST_PATH_DIRECT_MARGIN", "0.05"))  # Direct: least lead of the top-k mean over the next paragraphs
+FAST_PATH_DIRECT_COVERAGE = float(os.environ.get("FAST_PATH_DIRECT_COVERAGE", "0.6"))  # Direct: least mean share of question terms in the top-k
+FAST_PATH_SAMPLE_SCORE = float(os.environ.get("FAST_PATH_SAMPLE_SCORE", "0.7"))  # Sample: least mean similarity score of the top-k
+FAST_PATH_SAMPLE_SIZE = int(os.environ.get("FAST_PATH_SAMPLE_SIZE", "20"))  # Sample: paragraphs validated
+FAST_PATH_SAMPLE_MIN_PASS = float(os.environ.get("FAST_PATH_SAMPLE_MIN_PASS", "0.3"))  # Sample: below this pass rate the rest is validated too
+
+# --- Hybrid Retrieval (BM25) ---
+# A local BM25 index over the whole corpus (built with `python -m services.bm25 build`) whose hits
+# are fused with the Pinecone matches by reciprocal rank fusion; without an index retrieval is dense only
+HYBRID_RETRIEVAL = os.environ.get("HYBRID_RETRIEVAL", "true").lower() == "true"  # Use the BM25 index when there is one
+BM25_INDEX_PATH = os.environ.get("BM25_INDEX_PATH", ".bm25")  # Index directory
+BM25_K1 = float(os.environ.get("BM25_K1", "1.2"))  # Term frequency saturation (applied when the index is built)
+BM25_B = float(os.environ.get("BM25_B", "0.75"))  # Document length normalization (applied when the index is built)
+HYBRID_SPARSE_RESULTS = int(os.environ.get("HYBRID_SPARSE_RESULTS", "50"))  # BM25 hits fused with the dense matches
+HYBRID_RRF_K = int(os.environ.get("HYBRID_RRF_K", "60"))  # Reciprocal rank fusion constant
+HYBRID_SPARSE_WEIGHT = float(os.environ.get("HYBRID_SPARSE_WEIGHT", "1.0"))  # Weight of a BM25 rank relative to a dense rank
+
+# --- Exact-Quote Lookup ---
+# A local index of word shingles (built with `python -m services.quote_index build`) that finds the
+# paragraphs a pasted quote comes from and puts them first in the retrieved list
+QUOTE_LOOKUP = os.environ.get("QUOTE_LOOKUP", "true").lower() == "true"  # Use the quote index when there is one
+QUOTE_INDEX_PATH = os.environ.get("QUOTE_INDEX_PATH", ".quotes")  # Index directory
+QUOTE_SHINGLE_WORDS = int(os.environ.get("QUOTE_SHINGLE_WORDS", "3"))  # Words per shingle (applied when the index is built)
+QUOTE_MIN_WORDS = int(os.environ.get("QUOTE_MIN_WORDS", "5"))  # Shorter questions are not looked up
+QUOTE_MIN_SHINGLES = int(os.environ.get("QUOTE_MIN_SHINGLES", "3"))  # Least shingles of the question a quoted paragraph contains
+QUOTE_MAX_PINNED = int(os.environ.get("QUOTE_MAX_PINNED", "3"))  # Most paragraphs put first
+
+# --- Paragraph Neighbour Graph ---
+# Each paragraph's nearest neighbours by embedding similarity, precomputed with
+# `python -m services.neighbors build` and read locally for related passages
+NEIGHBOR_GRAPH_PATH = os.environ.get("NEIGHBOR_GRAPH_PATH", ".neighbors")  # Graph directory
+NEIGHBOR_K = int(os.environ.get("NEIGHBOR_K", "10"))  # Neighbours stored per paragraph (applied when the graph is built)
+NEIGHBOR_MIN_SIMILARITY = float(os.environ.get("NEIGHBOR_MIN_SIMILARITY", "0.5"))  # Less similar neighbours are not shown or added
+RELATED_PASSAGES_SHOWN = int(os.environ.get("RELATED_PASSAGES_SHOWN", "3"))  # Related passages listed under each source; 0 = none
+NEIGHBOR_EXPANSION_HITS = int(os.environ.get("NEIGHBOR_EXPANSION_HITS", "0"))  # Top retrieved paragraphs whose neighbours are added; 0 = off
+NEIGHBOR_EXPANSION_K = int(os.environ.get("NEIGHBOR_EXPANSION_K", "2"))  # Neighbours added per expanded paragraph
+
+# --- Source Filters ---
+# Paragraph counts per source_name (built with `python -m services.facets build`), offered as a
+# sidebar filter that is pushed down into retrieval
+SOURCE_FACETS_PATH = os.environ.get("SOURCE_FACETS_PATH", ".facets.json")  # Facet file; no file = no filter
+
+# --- Retrieval-Only Search ---
+SEARCH_RESULTS = int(os.environ.get("SEARCH_RESULTS", "20"))  # Passages shown per search
+SEARCH_MAX_RESULTS = int(os.environ.get("SEARCH_MAX_RESULTS", "50"))  # Most passages a search may ask for
+SEARCH_CANDIDATES = int(os.environ.get("SEARCH_CANDIDATES", "50"))  # Passages retrieved for re-ranking
+SEARCH_RERANK = os.environ.get("SEARCH_RERANK", "true").lower() == "true"  # Re-rank locally by query-term overlap
+SEARCH_RERANK_WEIGHT = float(os.environ.get("SEARCH_RERANK_WEIGHT", "0.3"))  # Share of the rank score from query-term coverage
+SEARCH_API_TIMEOUT_SECONDS = float(os.environ.get("SEARCH_API_TIMEOUT_SECONDS", "10"))  # Limit of one /api/search request
 
 # --- Pinecone Configuration ---
 PINECONE_INDEX_NAME = os.environ.get("PINECONE_INDEX_NAME", "chassidus-index")
+PINECONE_NAMESPACE = os.environ.get("PINECONE_NAMESPACE", "")  # Namespace of the main index ("" = the default one)
+
+# --- Federated Retrieval ---
+# More Pinecone indexes or namespaces ("shards") queried concurrently with the main index, as a JSON list in
+# RETRIEVAL_SHARDS_JSON, e.g. [{"name": "translations", "index": "translations-index", "namespace": "en",
+# "top_k": 100, "quota": 50, "timeout": 2.0}]. Only "name" is required: "index" defaults to the main index,
+# "top_k" to the requested count, "quota" (most paragraphs kept from the shard) to none and "timeout" to
+# RETRIEVAL_SHARD_TIMEOUT_SECONDS.
+RETRIEVAL_SHARDS = json.loads(os.environ.get("RETRIEVAL_SHARDS_JSON", "[]"))
+RETRIEVAL_SHARD_TIMEOUT_SECONDS = float(os.environ.get("RETRIEVAL_SHARD_TIMEOUT_SECONDS", "5"))  # Per-shard limit while shards are configured
+RETRIEVAL_MAIN_QUOTA = int(os.environ.get("RETRIEVAL_MAIN_QUOTA", "0"))  # Most paragraphs kept from the main index; 0 = no limit
+RETRIEVAL_SCORE_NORMALIZATION = os.environ.get("RETRIEVAL_SCORE_NORMALIZATION", "zscore")  # "zscore", "minmax" or "none": how shard scores are mapped onto the main index's
 
 # --- Default RAG Pipeline Parameters ---
 DEFAULT_N_RETRIEVE = 300  # Default number of paragraphs to retrieve
 DEFAULT_N_VALIDATE = 100  # Default number of paragraphs to validate
 
+# --- Request Deadlines ---
+REQUEST_DEADLINE_SECONDS = float(os.environ.get("REQUEST_DEADLINE_SECONDS", "240"))  # Overall limit per question
+# Seconds each stage may take (never more than what is left of the overall deadline);
+# override with a JSON object in STAGE_BUDGETS_JSON
+STAGE_BUDGETS = {
+    "embedding": 15.0,
+    "retrieval": 30.0,
+    "validation": 90.0,
+    "generation": 150.0,
+}
+STAGE_BUDGETS.update(json.loads(os.environ.get("STAGE_BUDGETS_JSON", "{}")))
+
+# --- Hedged Validation Requests ---
+HEDGE_VALIDATION = os.environ.get("HEDGE_VALIDATION", "false").lower() == "true"
+HEDGE_QUANTILE = float(os.environ.get("HEDGE_QUANTILE", "0.95"))  # Hedge calls slower than this rolling quantile
+HEDGE_WINDOW = int(os.environ.get("HEDGE_WINDOW", "500"))  # Recent latencies the quantile is computed over
+HEDGE_MIN_SAMPLES = int(os.environ.get("HEDGE_MIN_SAMPLES", "50"))  # No hedging until this many calls were seen
+HEDGE_BUDGET_RATIO = float(os.environ.get("HEDGE_BUDGET_RATIO", "0.05"))  # Extra requests allowed per call
+HEDGE_MAX_BURST = float(os.environ.get("HEDGE_MAX_BURST", "10"))  # Unused hedges that can be saved up
+HEDGE_MIN_DELAY = float(os.environ.get("HEDGE_MIN_DELAY", "0.5"))  # Never hedge sooner than this (seconds)
+
+# --- Circuit Breakers ---
+CIRCUIT_BREAKER_ENABLED = os.environ.get("CIRCUIT_BREAKER_ENABLED", "true").lower() == "true"
+CIRCUIT_WINDOW_SECONDS = float(os.environ.get("CIRCUIT_WINDOW_SECONDS", "60"))  # Outcomes considered per breaker
+CIRCUIT_MIN_CALLS = int(os.environ.get("CIRCUIT_MIN_CALLS", "10"))  # Calls in the window before a breaker may open
+CIRCUIT_ERROR_RATE = float(os.environ.get("CIRCUIT_ERROR_RATE", "0.5"))  # Failed share that opens the breaker
+CIRCUIT_SLOW_CALL_RATE = float(os.environ.get("CIRCUIT_SLOW_CALL_RATE", "0.8"))  # Slow share that opens the breaker
+CIRCUIT_OPEN_SECONDS = float(os.environ.get("CIRCUIT_OPEN_SECONDS", "30"))  # Fail fast this long before probing
+CIRCUIT_HALF_OPEN_PROBES = int(os.environ.get("CIRCUIT_HALF_OPEN_PROBES", "2"))  # Successful probes needed to close
+# Calls slower than this count as slow (no entry: latency is not tracked);
+# override with a JSON object in CIRCUIT_SLOW_CALL_SECONDS_JSON
+CIRCUIT_SLOW_CALL_SECONDS = {
+    "embedding": 5.0,
+    "pinecone": 5.0,
+    "validation": 20.0,
+    "citations": 20.0,
+}
+CIRCUIT_SLOW_CALL_SECONDS.update(json.loads(os.environ.get("CIRCUIT_SLOW_CALL_SECONDS_JSON", "{}")))
+
+# --- Metrics ---
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")  # Only local scrapers by default; set 0.0.0.0 to expose it
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")  # When set, every request needs "Authorization: Bearer <token>"
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9464"))  # 0 disables the /metrics endpoint
+METRICS_RESERVOIR_SIZE = int(os.environ.get("METRICS_RESERVOIR_SIZE", "1024"))  # Samples kept per histogram for percentiles
+
+# USD per 1M tokens; override with a JSON object in MODEL_PRICES_JSON
+MODEL_PRICES = {
+    "gpt-4o": {"input": 2.50, "cached_input": 1.25, "output": 10.00},
+    "gpt-4o-mini": {"input": 0.15, "cached_input": 0.075, "output": 0.60},
+    "o3": {"input": 2.00, "cached_input": 0.50, "output": 8.00},
+    "text-embedding-3-large": {"input": 0.13},
+    "text-embedding-3-small": {"input": 0.02},
+}
+MODEL_PRICES.update(json.loads(os.environ.get("MODEL_PRICES_JSON", "{}")))
+
+# --- Cost Budgets ---
+COST_BUDGET_REQUEST_USD = float(os.environ.get("COST_BUDGET_REQUEST_USD", "1.0"))  # Estimated spend per question; 0 = unlimited
+COST_BUDGET_SESSION_USD = float(os.environ.get("COST_BUDGET_SESSION_USD", "0"))  # Estimated spend per browser tab session (a reload starts a new one); 0 = unlimited
+COST_BUDGET_GENERATION_SHARE = float(os.environ.get("COST_BUDGET_GENERATION_SHARE", "0.3"))  # Part of the remaining budget kept for generation when sizing validation
+COST_BUDGET_MIN_VALIDATE = int(os.environ.get("COST_BUDGET_MIN_VALIDATE", "5"))  # Paragraphs validated even when the budget is spent
+COST_DB_PATH = os.environ.get(
+    "COST_DB_PATH", os.path.join(os.path.dirname(__file__), ".costs", "costs.sqlite3")
+)  # Daily token and cost totals per model
+
+# --- Session History ---
+HISTORY_MAX_MESSAGES = int(os.environ.get("HISTORY_MAX_MESSAGES", "20"))  # Messages kept in memory per session
+HISTORY_PAGE_SIZE = int(os.environ.get("HISTORY_PAGE_SIZE", "10"))  # Messages rehydrated per "load earlier" click
+HISTORY_SPILL_DIR = os.environ.get(
+    "HISTORY_SPILL_DIR", os.path.join(os.path.dirname(__file__), ".history")
+)
+
+# --- Background Jobs ---
+JOB_RETENTION_SECONDS = float(os.environ.get("JOB_RETENTION_SECONDS", "900"))  # Finished jobs stay attachable this long
+JOB_MAX_FINISHED = int(os.environ.get("JOB_MAX_FINISHED", "200"))  # Finished jobs kept at most (oldest dropped first)
+JOB_POLL_SECONDS = float(os.environ.get("JOB_POLL_SECONDS", "0.25"))  # Longest wait for new job events before re-checking
+
+# --- Answer Cache ---
+ANSWER_CACHE_ENABLED = os.environ.get("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_SIMILARITY = float(os.environ.get("ANSWER_CACHE_SIMILARITY", "0.95"))  # Cosine similarity at which a cached answer is reused
+ANSWER_CACHE_TTL_SECONDS = float(os.environ.get("ANSWER_CACHE_TTL_SECONDS", "86400"))  # Age after which a cached answer is recomputed
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", "500"))  # Least recently used answers are evicted beyond this
+ANSWER_CACHE_LABEL = os.environ.get("ANSWER_CACHE_LABEL", "true").lower() == "true"  # Mark cached answers in the chat
+
+# --- Warm Example Questions ---
+WARMUP_ENABLED = os.environ.get("WARMUP_ENABLED", "true").lower() == "true"  # Prepare the sidebar's example questions in the background
+WARMUP_ANSWERS = os.environ.get("WARMUP_ANSWERS", "false").lower() == "true"  # Also generate full answers (otherwise retrieval and validation only)
+WARMUP_INTERVAL_SECONDS = float(os.environ.get("WARMUP_INTERVAL_SECONDS", "900"))  # Time between checks for stale entries
+WARMUP_MAX_AGE_SECONDS = float(os.environ.get("WARMUP_MAX_AGE_SECONDS", "86400"))  # Age after which an entry is recomputed
+
+# --- Record / Replay ---
+CASSETTE_MODE = os.environ.get("CASSETTE_MODE", "off").lower()  # off, record or replay
+CASSETTE_PATH = os.environ.get(
+    "CASSETTE_PATH", os.path.join(os.path.dirname(__file__), ".cassettes", "traffic.jsonl.gz")
+)
+CASSETTE_REPLAY_SPEED = float(os.environ.get("CASSETTE_REPLAY_SPEED", "1.0"))  # Latency multiplier; 0 = instant
+CASSETTE_REPLAY_MISS = os.environ.get("CASSETTE_REPLAY_MISS", "error").lower()  # error or nearest
+
 # --- Helper Functions ---
 def check_env_vars():
     missing_keys = []
@@ -52,7 +262,8 @@ def configure_langsmith():
     os.environ["LANGSMITH_TRACING"] = LANGSMITH_TRACING
     if LANGSMITH_API_KEY: os.environ["LANGSMITH_API_KEY"] = LANGSMITH_API_KEY
     if LANGSMITH_PROJECT: os.environ["LANGSMITH_PROJECT"] = LANGSMITH_PROJECT
-    print(f"LangSmith configured: Endpoint={LANGSMITH_ENDPOINT}, Tracing={LANGSMITH_TRACING}, Project={LANGSMITH_PROJECT or 'Default'}")
+    print(f"LangSmith configured: Endpoint={LANGSMITH_ENDPOINT}, Tracing={LANGSMITH_TRACING}, Project={LANGSMITH_PROJECT or 'Default'}, "
+          f"Sample rate={TRACING_SAMPLE_RATE} (validation spans {TRACING_VALIDATION_SAMPLE_RATE})")
 
 missing = check_env_vars()
 if missing:
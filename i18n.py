@@ -3,6 +3,7 @@ Internationalization module for the DivreiYoel app.
 Provides translations and language-specific settings.
 """
 from typing import Dict, Any, Optional, List
+import contextvars
 import streamlit as st
 
 # Constants
@@ -13,6 +14,9 @@ LANGUAGES = {
 
 DEFAULT_LANGUAGE = "he"  # Default language is Hebrew
 
+# Language of work running outside a Streamlit script (background jobs), which has no session state
+language_override: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("language_override", default=None)
+
 # Hebrew font options - Only keeping David Libre
 HEBREW_FONTS = {
     "David Libre": "דוד ליברה"
@@ -59,11 +63,20 @@ TRANSLATIONS = {
         "retriever_error": "Retriever unavailable.",
         "openai_status": "OpenAI:",
         "openai_error": "OpenAI unavailable.",
+        "circuit_degraded": "{} is {}: using a fallback model or failing fast.",
 
         # RAG settings - Always keep in English
         "retrieval_count": "Paragraphs to retrieve",
         "validation_count": "Paragraphs to validate (GPT-4o)",
         "validation_info": "Answers are based only on validated sources.",
+        "pipeline_mode": "Mode",
+        "pipeline_mode_answer": "Answer (validate + generate)",
+        "pipeline_mode_search": "Search passages (no LLM calls)",
+        "search_results_count": "Passages to show",
+        "search_info": "Ranked passages from retrieval only, with the query words highlighted.",
+        "source_filter": "Sources",
+        "source_filter_placeholder": "All sources",
+        "source_filter_help": "Search only the chosen sources; retrieval and validation are spent on them alone.",
         "edit_prompts": "Edit Prompts",
         "system_prompt": "System prompt (generator)",
         "validation_prompt": "Validation prompt (GPT-4o)",
@@ -79,12 +92,19 @@ TRANSLATIONS = {
         "sources_title": "מקורות",
         "sources_text": "מציג {} קטעי מקור שנשלחו ליצירת התשובה",
         "source_label": "מקור {}:",
+        "search_results_found": "נמצאו {} קטעים ב-{} שניות.",
+        "search_sources_text": "{} קטעים מדורגים לפי התאמה לחיפוש",
+        "search_score_label": "התאמה",
+        "quote_match_label": "ציטוט מדויק ({} מהטקסט)",
+        "related_passages_label": "קטעים קשורים ({})",
+        "neighbor_expanded_label": "נוסף כקטע קשור למקור {}",
         "unknown_source": "מקור לא ידוע",
         "processing_details": "פרטי העיבוד",
         "processing_log": "יומן עיבוד מפורט",
         "no_response": "לא התקבלה תשובה מהמחולל.",
         "use_this_question": "השתמש בשאלה זו",
         "use_this_template": "השתמש בתבנית זו",
+        "load_earlier_messages": "הצג הודעות קודמות ({})",
 
         # Errors
         "error": "שגיאה",
@@ -94,15 +114,27 @@ TRANSLATIONS = {
         "reload": "נסה לרענן.",
         "details": "פרטים",
         "error_async": "שגיאה בתהליך הטיפול האסינכרוני:",
+        "answer_incomplete": "התשובה נקטעה עקב מגבלת הזמן.",
+        "request_cancelled": "הבקשה בוטלה.",
+        "request_timeout": "הבקשה חרגה מהזמן המותר.",
+        "cached_answer_notice": "תשובה זו נלקחה מהמטמון של שאלה דומה.",
+        "warm_answer_notice": "תשובה זו הוכנה מראש עבור שאלת הדוגמה.",
+        "relevance_label": "רלוונטיות",
 
         # RAG pipeline status messages - Always in English
+        "quote_matches_found": "1. Exact-quote lookup: {} paragraphs contain the quoted text (best match {} of it); they are put first.",
+        "source_filter_applied": "1. Source filter: retrieving only from {} chosen sources.",
         "retrieving_docs": "1. Retrieving up to {} paragraphs from Pinecone...",
+        "retrieval_shards": "1. Federated retrieval over {} shards: {}",
+        "retrieval_shard": "{} {} in {}s ({} kept)",
         "retrieved_docs": "1. Retrieved {} paragraphs in {} seconds.",
+        "hybrid_retrieved": "1. Hybrid retrieval: {} of the {} paragraphs were found by BM25 only.",
         "no_docs_found": "1. No documents found.",
         "validating_docs": "2. [GPT-4o] Starting parallel validation ({} / {} paragraphs)...",
         "skipping_validation": "2. [GPT-4o] Skipping validation - no paragraphs.",
         "filtering_docs": "3. [GPT-4o] Filtering paragraphs based on validation results...",
         "validation_complete": "2. GPT-4o validation complete ({} passed, {} rejected, {} errors) in {} seconds.",
+        "cascade_summary": "2. Validation cascade: {} accepted and {} rejected by {}, {} escalated to {}.",
         "filtered_docs": "3. Collected {} relevant paragraphs after GPT-4o validation.",
         "generating_response": "4. [{}] Generating final response from {} context passages...",
         "skipping_generation": "4. [{}] Skipping generation - no paragraphs for context.",
@@ -111,6 +143,21 @@ TRANSLATIONS = {
         "generation_critical_error": "4. Critical error in response generation ({}) in {} seconds.",
         "no_relevant_passages": "No relevant passages found.",
         "no_sources_for_response": "No relevant passages were provided to generate the response.",
+        "retrieval_budget_exhausted": "1. Retrieval time budget reached after {} seconds.",
+        "validation_budget_exhausted": "2. Validation time budget reached: continuing with {} of {} paragraphs checked.",
+        "answer_cache_hit": "Answer served from the cache (similarity {}, cached {} minutes ago).",
+        "warm_answer_hit": "Prepared answer for this example question served (prepared {} minutes ago).",
+        "warm_documents_used": "1-3. Using {} paragraphs retrieved and validated ahead of time.",
+        "score_cutoff_applied": "2. Score cutoff ({}): validating the top {} of {} paragraphs ({} validations saved).",
+        "search_complete": "2. Search: {} passages ranked in {} seconds (no validation or generation).",
+        "fast_path_decision": "2. Fast path ({}): {} route ({}).",
+        "fast_path_direct": "2. Validation skipped: answering from the top {} paragraphs.",
+        "fast_path_escalated": "2. Only {} of {} sampled paragraphs passed; validating the other {}.",
+        "fast_path_shadow": "2. Fast path audit: {} of the top {} paragraphs passed validation; {} of {} passing paragraphs are in the top {}.",
+        "budget_validation_reduced": "2. Cost budget: validating {} of {} paragraphs (${} left).",
+        "budget_context_reduced": "4. Cost budget: answering from {} of {} paragraphs (${} left).",
+        "request_cost": "Request cost: ${} ({} prompt tokens, {} cached, {} completion tokens).",
+        "generation_budget_exhausted": "4. Response time budget reached after {} seconds; the answer may be incomplete.",
 
         # Font preview
         "font_preview": "Sample text in {} font",
@@ -130,11 +177,20 @@ TRANSLATIONS = {
         "retriever_error": "Retriever unavailable.",
         "openai_status": "OpenAI:",
         "openai_error": "OpenAI unavailable.",
+        "circuit_degraded": "{} is {}: using a fallback model or failing fast.",
 
         # RAG settings
         "retrieval_count": "Passages to retrieve",
         "validation_count": "Passages to validate (GPT-4o)",
         "validation_info": "Answers are based only on validated sources.",
+        "pipeline_mode": "Mode",
+        "pipeline_mode_answer": "Answer (validate + generate)",
+        "pipeline_mode_search": "Search passages (no LLM calls)",
+        "search_results_count": "Passages to show",
+        "search_info": "Ranked passages from retrieval only, with the query words highlighted.",
+        "source_filter": "Sources",
+        "source_filter_placeholder": "All sources",
+        "source_filter_help": "Search only the chosen sources; retrieval and validation are spent on them alone.",
         "edit_prompts": "Edit Prompts",
         "system_prompt": "System prompt (generator)",
         "validation_prompt": "Validation prompt (GPT-4o)",
@@ -150,12 +206,19 @@ TRANSLATIONS = {
         "sources_title": "Sources",
         "sources_text": "Showing {} source passages sent to the generator",
         "source_label": "Source {}:",
+        "search_results_found": "Found {} passages in {} seconds.",
+        "search_sources_text": "{} passages ranked by match to the search",
+        "search_score_label": "Match",
+        "quote_match_label": "Quote match ({} of the text)",
+        "related_passages_label": "Related passages ({})",
+        "neighbor_expanded_label": "Added as a passage related to {}",
         "unknown_source": "Unknown source",
         "processing_details": "Processing Details",
         "processing_log": "Detailed processing log",
         "no_response": "No response received from the generator.",
         "use_this_question": "Use this question",
         "use_this_template": "Use this template",
+        "load_earlier_messages": "Show earlier messages ({})",
 
         # Errors
         "error": "Error",
@@ -165,15 +228,27 @@ TRANSLATIONS = {
         "reload": "Try refreshing.",
         "details": "Details",
         "error_async": "Error in asynchronous process:",
+        "answer_incomplete": "The answer was cut short by the time limit.",
+        "request_cancelled": "The request was cancelled.",
+        "request_timeout": "The request exceeded the allowed time.",
+        "cached_answer_notice": "This answer was reused from a similar earlier question.",
+        "warm_answer_notice": "This answer was prepared in advance for the example question.",
+        "relevance_label": "Relevance",
 
         # RAG pipeline status messages
+        "quote_matches_found": "1. Exact-quote lookup: {} paragraphs contain the quoted text (best match {} of it); they are put first.",
+        "source_filter_applied": "1. Source filter: retrieving only from {} chosen sources.",
         "retrieving_docs": "1. Retrieving up to {} paragraphs from Pinecone...",
+        "retrieval_shards": "1. Federated retrieval over {} shards: {}",
+        "retrieval_shard": "{} {} in {}s ({} kept)",
         "retrieved_docs": "1. Retrieved {} paragraphs in {} seconds.",
+        "hybrid_retrieved": "1. Hybrid retrieval: {} of the {} paragraphs were found by BM25 only.",
         "no_docs_found": "1. No documents found.",
         "validating_docs": "2. [GPT-4o] Starting parallel validation ({} / {} paragraphs)...",
         "skipping_validation": "2. [GPT-4o] Skipping validation - no paragraphs.",
         "filtering_docs": "3. [GPT-4o] Filtering paragraphs based on validation results...",
         "validation_complete": "2. GPT-4o validation complete ({} passed, {} rejected, {} errors) in {} seconds.",
+        "cascade_summary": "2. Validation cascade: {} accepted and {} rejected by {}, {} escalated to {}.",
         "filtered_docs": "3. Collected {} relevant paragraphs after GPT-4o validation.",
         "generating_response": "4. [{}] Generating final response from {} context passages...",
         "skipping_generation": "4. [{}] Skipping generation - no paragraphs for context.",
@@ -182,6 +257,21 @@ TRANSLATIONS = {
         "generation_critical_error": "4. Critical error in response generation ({}) in {} seconds.",
         "no_relevant_passages": "No relevant passages found.",
         "no_sources_for_response": "No relevant passages were provided to generate the response.",
+        "retrieval_budget_exhausted": "1. Retrieval time budget reached after {} seconds.",
+        "validation_budget_exhausted": "2. Validation time budget reached: continuing with {} of {} paragraphs checked.",
+        "answer_cache_hit": "Answer served from the cache (similarity {}, cached {} minutes ago).",
+        "warm_answer_hit": "Prepared answer for this example question served (prepared {} minutes ago).",
+        "warm_documents_used": "1-3. Using {} paragraphs retrieved and validated ahead of time.",
+        "score_cutoff_applied": "2. Score cutoff ({}): validating the top {} of {} paragraphs ({} validations saved).",
+        "search_complete": "2. Search: {} passages ranked in {} seconds (no validation or generation).",
+        "fast_path_decision": "2. Fast path ({}): {} route ({}).",
+        "fast_path_direct": "2. Validation skipped: answering from the top {} paragraphs.",
+        "fast_path_escalated": "2. Only {} of {} sampled paragraphs passed; validating the other {}.",
+        "fast_path_shadow": "2. Fast path audit: {} of the top {} paragraphs passed validation; {} of {} passing paragraphs are in the top {}.",
+        "budget_validation_reduced": "2. Cost budget: validating {} of {} paragraphs (${} left).",
+        "budget_context_reduced": "4. Cost budget: answering from {} of {} paragraphs (${} left).",
+        "request_cost": "Request cost: ${} ({} prompt tokens, {} cached, {} completion tokens).",
+        "generation_budget_exhausted": "4. Response time budget reached after {} seconds; the answer may be incomplete.",
 
         # Font preview
         "font_preview": "Sample text in {} font",
@@ -191,11 +281,14 @@ TRANSLATIONS = {
 # Get the current language from session state
 def get_current_language() -> str:
     """
-    Get the current language from session state.
+    Get the current language from session state (or `language_override` when set).
 
     Returns:
         str: Current language code
     """
+    override = language_override.get()
+    if override:
+        return override
     return st.session_state.get("language", DEFAULT_LANGUAGE)
 
 # Get text direction (RTL or LTR) based on the current language
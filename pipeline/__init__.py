@@ -2,4 +2,10 @@
 """
 Contains pipeline processing components:
 - rag.py: RAG pipeline wrapper and processing
+- deadline.py: Request deadlines and per-stage time budgets
+- jobs.py: Background pipeline jobs with replayable event logs
+- warmup.py: Warm answers for the example questions
+- score_cutoff.py: Validation set sizing from the retrieval score curve
+- fast_path.py: Per-query choice between skipping, sampling and full validation
+- search.py: Retrieval-only search: local re-ranking, highlighting and /api/search
 """ 
\ No newline at end of file
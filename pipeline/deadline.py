@@ -0,0 +1,70 @@
+import time
+import logging
+from typing import Dict, Optional, List
+
+import config
+from utils import metrics
+
+# Setup logger
+logger = logging.getLogger(__name__)
+
+STAGES = ("embedding", "retrieval", "validation", "generation")
+
+class Deadline:
+    """
+    Overall time limit of one RAG request, split into per-stage budgets.
+
+    A stage may use at most its own budget and never more than what is left of the
+    overall deadline. Stages that run out of time record it in `exceeded` so the
+    pipeline can report a partial result.
+    """
+
+    def __init__(self, total_seconds: float, stage_budgets: Optional[Dict[str, float]] = None):
+        self.total_seconds = total_seconds
+        self.stage_budgets = dict(stage_budgets or {})
+        self.started_at = time.monotonic()
+        self.exceeded: List[str] = []
+
+    @classmethod
+    def from_config(cls, params: Optional[Dict] = None) -> "Deadline":
+        """
+        Build a deadline from config, letting request params override the overall limit.
+
+        Args:
+            params (Optional[Dict]): RAG parameters; `deadline_seconds` overrides config
+
+        Returns:
+            Deadline: A new deadline starting now
+        """
+        total = (params or {}).get("deadline_seconds") or config.REQUEST_DEADLINE_SECONDS
+        return cls(float(total), config.STAGE_BUDGETS)
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def remaining(self) -> float:
+        return max(0.0, self.total_seconds - self.elapsed())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def stage_timeout(self, stage: str) -> float:
+        """
+        Seconds the given stage may run from now.
+
+        Args:
+            stage (str): One of STAGES
+
+        Returns:
+            float: The smaller of the stage budget and the remaining overall time
+        """
+        budget = self.stage_budgets.get(stage)
+        remaining = self.remaining()
+        return remaining if budget is None else min(budget, remaining)
+
+    def mark_exceeded(self, stage: str) -> None:
+        """Record that a stage was cut short by its budget."""
+        if stage not in self.exceeded:
+            self.exceeded.append(stage)
+        metrics.inc("rag_deadline_exceeded_total", stage=stage)
+        logger.warning(f"Stage '{stage}' exceeded its time budget after {self.elapsed():.2f}s")
@@ -0,0 +1,149 @@
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+import config
+from utils import metrics
+from pipeline import search, score_cutoff
+
+# Setup logger
+logger = logging.getLogger(__name__)
+
+MODES = ("off", "shadow", "on")
+ROUTES = ("direct", "sample", "full")
+
+def _mean(values: List[float]) -> float:
+    return sum(values) / len(values) if values else 0.0
+
+def _check(label: str, value: float, threshold: float, at_most: bool = False, digits: int = 2) -> Tuple[bool, str]:
+    """Whether `value` meets `threshold`, with the comparison written out for the status log."""
+    passed = value <= threshold if at_most else value >= threshold
+    sign = ("≤" if passed else ">") if at_most else ("≥" if passed else "<")
+    return passed, f"{label} {value:.{digits}f} {sign} {threshold:.{digits}f}"
+
+def query_features(docs: List[Dict], query: str) -> Optional[Dict[str, Any]]:
+    """
+    The retrieval-confidence signals of one query: how high and how separated the
+    scores of the top config.FAST_PATH_TOP_K paragraphs are, and how much of the
+    question's wording those paragraphs contain.
+
+    Args:
+        docs (List[Dict]): Retrieved documents, best first
+        query (str): The user's question (without template)
+
+    Returns:
+        Optional[Dict[str, Any]]: The features, or None if a dense match has no similarity score
+    """
+    # Scores of the dense matches, highest first: fused, pinned and neighbour documents do not follow them
+    scores = score_cutoff.dense_scores(docs)
+    if not scores:
+        return None
+    top_k = min(config.FAST_PATH_TOP_K, len(docs))
+    top_scores = scores[:top_k]
+    # The next paragraphs down: a flat curve means retrieval does not single out the top ones
+    next_scores = scores[top_k:top_k * 3]
+    terms = search.query_terms(query)
+    coverage = [len(search.matched_terms(f"{doc.get('hebrew_text', '')} {doc.get('english_text', '')}", terms))
+                / len(terms) for doc in docs[:top_k]] if terms else []
+    return {
+        "top_k": top_k,
+        "terms": len(terms),
+        "min_score": round(min(top_scores), 4),
+        "mean_score": round(_mean(top_scores), 4),
+        "margin": round(_mean(top_scores) - _mean(next_scores), 4) if next_scores else 0.0,
+        "coverage": round(_mean(coverage), 4),
+    }
+
+def decide(docs: List[Dict], query: str, n_validate: int, mode: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Choose how much validation a query needs.
+
+    "direct" sends the top config.FAST_PATH_TOP_K paragraphs straight to generation:
+    only for short questions whose top paragraphs all score high, stand out from the
+    ones below them and contain most of the question's terms. "sample" validates the
+    top config.FAST_PATH_SAMPLE_SIZE paragraphs when retrieval looks good but not
+    that good; everything else is validated as requested ("full").
+
+    Args:
+        docs (List[Dict]): Retrieved documents, best first
+        query (str): The user's question (without template)
+        n_validate (int): Requested number of validations
+        mode (Optional[str]): One of MODES; defaults to config.FAST_PATH_MODE
+
+    Returns:
+        Optional[Dict[str, Any]]: The route, the number of paragraphs it validates, the
+        reasons and the features; None when the fast path is off or has nothing to go on
+    """
+    mode = (mode or config.FAST_PATH_MODE or "off").lower()
+    if mode not in MODES:
+        logger.warning(f"Unknown fast path mode '{mode}'; validating as requested")
+        return None
+    if mode == "off" or not docs:
+        return None
+    features = query_features(docs, query)
+    if features is None:
+        logger.warning("Fast path skipped: retrieved documents without a similarity score")
+        return None
+
+    requested = min(len(docs), n_validate)
+    checks = [
+        _check("question terms", features["terms"], config.FAST_PATH_MAX_TERMS, at_most=True, digits=0),
+        _check(f"top-{features['top_k']} min score", features["min_score"], config.FAST_PATH_DIRECT_SCORE),
+        _check("score margin", features["margin"], config.FAST_PATH_DIRECT_MARGIN, digits=3),
+        _check("term coverage", features["coverage"], config.FAST_PATH_DIRECT_COVERAGE),
+    ]
+    if features["terms"] and all(passed for passed, _reason in checks):
+        route, validate, reasons = "direct", 0, [reason for _passed, reason in checks]
+    elif features["mean_score"] >= config.FAST_PATH_SAMPLE_SCORE and config.FAST_PATH_SAMPLE_SIZE < requested:
+        route, validate = "sample", config.FAST_PATH_SAMPLE_SIZE
+        reasons = [f"top-{features['top_k']} mean score {features['mean_score']:.2f} ≥ {config.FAST_PATH_SAMPLE_SCORE:.2f}"]
+        reasons += [reason for passed, reason in checks if not passed] or ["no question terms"]
+    else:
+        route, validate = "full", requested
+        reasons = [f"top-{features['top_k']} mean score {features['mean_score']:.2f} < {config.FAST_PATH_SAMPLE_SCORE:.2f}"
+                   if features["mean_score"] < config.FAST_PATH_SAMPLE_SCORE else f"sample not smaller than {requested}"]
+    metrics.inc("rag_fast_path_decisions_total", route=route, mode=mode)
+    return {"mode": mode, "route": route, "validate": validate, "reasons": reasons, "features": features}
+
+def direct_documents(docs: List[Dict], decision: Dict[str, Any]) -> List[Dict]:
+    """The paragraphs the direct route answers from, unvalidated and in retrieval order."""
+    return [dict(doc) for doc in docs[:decision["features"]["top_k"]]]
+
+def shadow_report(decision: Dict[str, Any], docs: List[Dict], passed_docs: List[Dict]) -> Dict[str, Any]:
+    """
+    Compare a shadow decision with the full validation that ran instead: the share of
+    the direct route's paragraphs that passed, and the share of the passing paragraphs
+    a sample would have found.
+
+    Args:
+        decision (Dict[str, Any]): The decision returned by decide()
+        docs (List[Dict]): Retrieved documents, best first
+        passed_docs (List[Dict]): The documents that passed the full validation
+
+    Returns:
+        Dict[str, Any]: Counts and shares, also observed as metrics by route
+    """
+    positions = {id(doc): i for i, doc in enumerate(docs)}
+    passed_positions = [positions[id(doc)] for doc in passed_docs if id(doc) in positions]
+    top_k = decision["features"]["top_k"]
+    sample = min(config.FAST_PATH_SAMPLE_SIZE, len(docs))
+    report = {
+        "top_k": top_k,
+        "top_k_passed": sum(1 for position in passed_positions if position < top_k),
+        "sample": sample,
+        "sample_passed": sum(1 for position in passed_positions if position < sample),
+        "passed": len(passed_positions),
+    }
+    report["top_k_precision"] = round(report["top_k_passed"] / top_k, 4) if top_k else 0.0
+    report["sample_recall"] = round(report["sample_passed"] / report["passed"], 4) if report["passed"] else 1.0
+    metrics.observe("rag_fast_path_shadow_precision", report["top_k_precision"], buckets=metrics.RATIO_BUCKETS,
+                    route=decision["route"])
+    metrics.observe("rag_fast_path_shadow_recall", report["sample_recall"], buckets=metrics.RATIO_BUCKETS,
+                    route=decision["route"])
+    return report
+
+metrics.registry.describe("rag_fast_path_decisions_total", "Fast path decisions, by route (direct, sample, full) and mode (shadow, on).")
+metrics.registry.describe("rag_fast_path_validations_skipped_total", "Validations the fast path skipped, by route.")
+metrics.registry.describe("rag_fast_path_escalations_total", "Sampled queries whose sample passed too rarely, so the rest was validated too.")
+metrics.registry.describe("rag_fast_path_request_seconds", "Request latency of queries the fast path decided, by route and mode.")
+metrics.registry.describe("rag_fast_path_shadow_precision", "Shadow mode: share of the direct route's paragraphs that passed full validation.")
+metrics.registry.describe("rag_fast_path_shadow_recall", "Shadow mode: share of the passing paragraphs that lie within the sample.")
@@ -0,0 +1,205 @@
+import hmac
+import time
+import uuid
+import secrets
+import asyncio
+import logging
+import threading
+import traceback
+import concurrent.futures
+from typing import Any, Dict, List, Optional, Tuple
+
+import config
+from utils import metrics
+
+# Setup logger
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+class Job:
+    """
+    One RAG pipeline run executing in the background, and the append-only log of
+    the status messages and response chunks it produced.
+
+    Readers keep their own offset into the log, so any number of script runs (or a
+    reloaded tab) can replay the log from the start and then follow it live. The log
+    holds the user's question and answer, so only the owning session, or a tab that
+    presents the job's `resume_token`, may read it (see `may_resume`).
+    """
+
+    def __init__(self, job_id: str, session_id: Optional[str], prompt: str, language: str):
+        self.id = job_id
+        self.session_id = session_id
+        self.prompt = prompt
+        self.language = language
+        self.resume_token = secrets.token_urlsafe(16)
+        self.state = QUEUED
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.future: Optional[concurrent.futures.Future] = None
+        self._events: List[Dict[str, Any]] = []
+        self._changed = threading.Condition()
+
+    @property
+    def finished(self) -> bool:
+        return self.state in FINISHED_STATES
+
+    def append(self, kind: str, data: Any) -> None:
+        """Append an event ("status" or "chunk") to the log and wake up readers."""
+        with self._changed:
+            self._events.append({"seq": len(self._events), "type": kind, "data": data})
+            self._changed.notify_all()
+
+    def finish(self, state: str, result: Dict[str, Any]) -> None:
+        """Store the final result; the log is complete once this returns."""
+        with self._changed:
+            self.state = state
+            self.result = result
+            self.finished_at = time.time()
+            self._changed.notify_all()
+        metrics.inc("rag_jobs_total", state=state)
+        metrics.observe("rag_job_seconds", self.finished_at - self.created_at, state=state)
+
+    def read(self, offset: int = 0, timeout: Optional[float] = None) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Read the events from `offset` on.
+
+        Args:
+            offset (int): Number of events the reader has already seen
+            timeout (Optional[float]): Seconds to wait when there are no new events yet
+
+        Returns:
+            Tuple[List[Dict[str, Any]], bool]: The new events and whether the job has
+                finished (in which case they are the last ones)
+        """
+        with self._changed:
+            if offset >= len(self._events) and not self.finished and timeout:
+                self._changed.wait(timeout)
+            return self._events[offset:], self.finished
+
+
+_jobs: Dict[str, Job] = {}
+_jobs_lock = threading.Lock()
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """Event loop of the worker thread all jobs (and warm-up passes) run on, started on first use."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="rag-jobs", daemon=True).start()
+        return _loop
+
+async def _run_job(job: Job, history: List[Dict[str, Any]], params: Dict[str, Any]) -> None:
+    from pipeline.rag import process_rag_request
+    from i18n import language_override
+
+    # Status messages and notices use the submitting session's language
+    language_override.set(job.language)
+    job.state = RUNNING
+    try:
+        result = await process_rag_request(
+            history=history,
+            params=params,
+            status_callback=lambda message: job.append("status", message),
+            stream_callback=lambda chunk: job.append("chunk", chunk),
+            session_id=job.session_id
+        )
+    except asyncio.CancelledError:
+        # Cancelled before the pipeline task started; process_rag_request handles later cancellation
+        job.finish(CANCELLED, {"final_response": "", "error": "Request cancelled", "status_log": [],
+                               "generator_input_documents": [], "pipeline_used": "Cancelled"})
+        return
+    except Exception as e:
+        logger.exception(f"Job {job.id} failed")
+        job.finish(FAILED, {"final_response": "", "error": str(e),
+                            "status_log": [f"Error: {type(e).__name__}", traceback.format_exc()],
+                            "generator_input_documents": [], "pipeline_used": "Error"})
+        return
+    job.finish(CANCELLED if result.get("pipeline_used") == "Cancelled" else DONE, result)
+
+def submit_job(
+    history: List[Dict[str, Any]],
+    params: Dict[str, Any],
+    session_id: Optional[str] = None,
+    prompt: str = ""
+) -> Job:
+    """
+    Start a RAG pipeline run in the background.
+
+    The run does not depend on the Streamlit script that submitted it: it keeps
+    going when the browser disconnects or the script reruns. A newer job from the
+    same session cancels this one.
+
+    Args:
+        history (List[Dict[str, Any]]): Message history for the pipeline
+        params (Dict[str, Any]): RAG parameters
+        session_id (Optional[str]): Session that owns the job
+        prompt (str): The user's message, shown again when a reloaded tab reattaches
+
+    Returns:
+        Job: The submitted job
+    """
+    from i18n import get_current_language
+
+    purge_jobs()
+    job = Job(uuid.uuid4().hex, session_id, prompt, get_current_language())
+    with _jobs_lock:
+        _jobs[job.id] = job
+    job.future = asyncio.run_coroutine_threadsafe(_run_job(job, history, dict(params)), get_loop())
+    metrics.inc("rag_jobs_total", state="submitted")
+    logger.info(f"Submitted job {job.id} for session {session_id}")
+    return job
+
+def get_job(job_id: str) -> Optional[Job]:
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+def may_resume(job: Job, session_id: Optional[str], resume_token: Optional[str] = None) -> bool:
+    """
+    Whether a session may attach to a job: it owns the job, or it presents the job's
+    resume token (kept in the owning tab's URL, so a reloaded tab can find the job again).
+    The job id alone is not enough; it is not a secret.
+    """
+    if job.session_id is not None and job.session_id == session_id:
+        return True
+    return bool(resume_token) and hmac.compare_digest(resume_token, job.resume_token)
+
+def cancel_job(job_id: str) -> bool:
+    """Cancel a running job. Returns False if it is unknown or already finished."""
+    job = get_job(job_id)
+    if job is None or job.finished or job.future is None:
+        return False
+    return job.future.cancel()
+
+def purge_jobs() -> int:
+    """
+    Drop finished jobs older than config.JOB_RETENTION_SECONDS, and the oldest
+    finished jobs beyond config.JOB_MAX_FINISHED. Returns how many were dropped.
+    """
+    now = time.time()
+    with _jobs_lock:
+        finished = sorted((job for job in _jobs.values() if job.finished), key=lambda job: job.finished_at)
+        expired = [job for job in finished if now - job.finished_at > config.JOB_RETENTION_SECONDS]
+        overflow = finished[len(expired):][:max(0, len(finished) - len(expired) - config.JOB_MAX_FINISHED)]
+        for job in expired + overflow:
+            del _jobs[job.id]
+    return len(expired) + len(overflow)
+
+def _job_gauges() -> Dict[str, float]:
+    with _jobs_lock:
+        return {"rag_jobs_running": sum(1 for job in _jobs.values() if not job.finished)}
+
+metrics.register_gauge_callback(_job_gauges)
+metrics.registry.describe("rag_jobs_total", "Background pipeline jobs submitted and finished, by final state.")
+metrics.registry.describe("rag_job_seconds", "Time from job submission to its final result.")
+metrics.registry.describe("rag_jobs_running", "Background pipeline jobs not yet finished.")
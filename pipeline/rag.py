@@ -1,110 +1,179 @@
 import asyncio
 import logging
+import threading
 import traceback
-from typing import Dict, Any, List, Callable, Optional
-
-import streamlit as st
+from typing import Dict, Any, List, Callable, Optional, Tuple
 
 # Setup logger
 logger = logging.getLogger(__name__)
 
+# Latest in-flight request per session. Streamlit runs every script rerun in its own
+# thread (with its own event loop), so the task is cancelled through its loop.
+_active_requests: Dict[str, Tuple[asyncio.AbstractEventLoop, asyncio.Task]] = {}
+_active_requests_lock = threading.Lock()
+
+def _cancel_task(loop: asyncio.AbstractEventLoop, task: asyncio.Task) -> None:
+    if task.done():
+        return
+    try:
+        if loop is asyncio.get_running_loop():
+            task.cancel()
+        else:
+            loop.call_soon_threadsafe(task.cancel)
+    except RuntimeError:
+        # The owning loop is already closed, so the task can no longer run
+        pass
+
+def supersede_session_request(session_id: str, task: asyncio.Task) -> None:
+    """
+    Register a request as the session's current one, cancelling the request it replaces.
+
+    Args:
+        session_id (str): Session identifier
+        task (asyncio.Task): Task running the new request on the current loop
+    """
+    from utils import metrics
+    with _active_requests_lock:
+        previous = _active_requests.get(session_id)
+        _active_requests[session_id] = (asyncio.get_running_loop(), task)
+    if previous and not previous[1].done():
+        logger.info(f"Cancelling superseded request of session {session_id}")
+        metrics.inc("rag_requests_superseded_total")
+        _cancel_task(*previous)
+
+def release_session_request(session_id: str, task: asyncio.Task) -> None:
+    """Forget a finished request unless a newer one has already replaced it."""
+    with _active_requests_lock:
+        if _active_requests.get(session_id, (None, None))[1] is task:
+            del _active_requests[session_id]
+
 async def process_rag_request(
     history: List[Dict[str, Any]], 
     params: Dict[str, Any], 
     status_callback: Optional[Callable[[str], None]] = None,
-    stream_callback: Optional[Callable[[str], None]] = None
+    stream_callback: Optional[Callable[[str], None]] = None,
+    session_id: Optional[str] = None
 ) -> Dict[str, Any]:
     """
     Process a RAG request asynchronously.
 
     Args:
         history (List[Dict[str, Any]]): Message history
-        params (Dict[str, Any]): RAG parameters
+        params (Dict[str, Any]): RAG parameters; `mode` "search" runs the retrieval-only pipeline
         status_callback (Optional[Callable]): Callback for status updates
         stream_callback (Optional[Callable]): Callback for streaming response chunks
+        session_id (Optional[str]): Session identifier; a newer request from the same
+            session cancels this one
 
     Returns:
         Dict[str, Any]: Response data including final response, documents, and logs
     """
     from i18n import get_text
-    from rag_processor import execute_validate_generate_pipeline
+    from rag_processor import execute_validate_generate_pipeline, execute_retrieval_only_pipeline
+    from pipeline.deadline import Deadline
+    from services import cost_accounting
 
-    try:
-        return await execute_validate_generate_pipeline(
+    # "search" returns ranked passages without validation or generation
+    run_pipeline = execute_retrieval_only_pipeline if params.get("mode") == "search" else execute_validate_generate_pipeline
+    async with cost_accounting.track_request(session_id) as ledger:
+        deadline = Deadline.from_config(params)
+        task = asyncio.ensure_future(run_pipeline(
             history=history,
             params=params,
             status_callback=status_callback,
-            stream_callback=stream_callback
-        )
-    except asyncio.CancelledError:
-        logger.warning("RAG request was cancelled")
-        return {
-            "final_response": get_text('request_cancelled'),
-            "error": "Request cancelled",
-            "status_log": ["Request cancelled by user or system"],
-            "generator_input_documents": [],
-            "pipeline_used": "Cancelled"
-        }
-    except asyncio.TimeoutError:
-        logger.error("RAG request timed out")
-        return {
-            "final_response": get_text('request_timeout'),
-            "error": "Request timed out",
-            "status_log": ["Request exceeded maximum allowed time"],
-            "generator_input_documents": [],
-            "pipeline_used": "Timeout"
-        }
-    except Exception as e:
-        logger.exception("Error in RAG processing")
-        return {
-            "final_response": f"{get_text('processing_error')}: {type(e).__name__}",
-            "error": str(e),
-            "status_log": [f"Error: {type(e).__name__}", traceback.format_exc()],
-            "generator_input_documents": [],
-            "pipeline_used": "Error"
-        }
+            stream_callback=stream_callback,
+            deadline=deadline
+        ))
+        if session_id:
+            supersede_session_request(session_id, task)
+        try:
+            result = await task
+            result["cost"] = ledger.summary()
+            if result["cost"]["by_stage"]:
+                tokens = result["cost"]["tokens"]
+                message = get_text("request_cost").format(f"{result['cost']['cost_usd']:.4f}", tokens["prompt"],
+                                                          tokens["cached"], tokens["completion"])
+                result.setdefault("status_log", []).append(message)
+                if status_callback:
+                    status_callback(message)
+            return result
+        except asyncio.CancelledError:
+            logger.warning("RAG request was cancelled")
+            return {
+                "final_response": get_text('request_cancelled'),
+                "error": "Request cancelled",
+                "status_log": ["Request cancelled by user or system"],
+                "generator_input_documents": [],
+                "pipeline_used": "Cancelled"
+            }
+        except asyncio.TimeoutError:
+            logger.error("RAG request timed out")
+            return {
+                "final_response": get_text('request_timeout'),
+                "error": "Request timed out",
+                "status_log": ["Request exceeded maximum allowed time"],
+                "generator_input_documents": [],
+                "pipeline_used": "Timeout"
+            }
+        except Exception as e:
+            logger.exception("Error in RAG processing")
+            return {
+                "final_response": f"{get_text('processing_error')}: {type(e).__name__}",
+                "error": str(e),
+                "status_log": [f"Error: {type(e).__name__}", traceback.format_exc()],
+                "generator_input_documents": [],
+                "pipeline_used": "Error"
+            }
+        except BaseException:
+            # Streamlit stops or reruns the script by raising from a callback; make sure
+            # nothing of this request keeps running on the loop
+            task.cancel()
+            raise
+        finally:
+            if session_id:
+                release_session_request(session_id, task)
 
-def create_async_execution_context():
+async def annotate_sources(result: Dict[str, Any], question: str) -> None:
     """
-    Create or get the appropriate asyncio execution context.
+    Find the passages an answer cites (`cited_ids`, their 1-based positions in
+    `generator_input_documents`) and fill in the missing justifications of the cited
+    passages (documents validated in logprob mode, or passed by the cascade's screen,
+    carry only a relevance score).
 
-    Returns:
-        asyncio.AbstractEventLoop: The event loop to use
-    """
-    try:
-        # Try to get the current running loop
-        loop = asyncio.get_running_loop()
-    except RuntimeError:
-        # No running loop, create a new one
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-
-    return loop
-
-def extract_citations(response: str) -> List[str]:
-    """
-    Extract citation IDs from a response text.
+    Runs as the last step of the answer pipeline, on its loop, so the calls share the
+    OpenAI client's connections with it, are accounted to the request and are cached
+    with the answer.
 
     Args:
-        response (str): Response text with potential citations
-
-    Returns:
-        List[str]: List of citation IDs
+        result (Dict[str, Any]): Pipeline result; updated in place
+        question (str): The question the documents were validated against
     """
-    # Early return if empty response
-    if not response or not response.strip():
-        return []
+    import config
+    from services.openai_service import extract_citations_with_openai, explain_relevance
 
+    response = result.get("final_response") or ""
+    if result.get("error") or not response.strip():
+        return
     try:
-        from services.openai_service import extract_citations_with_openai
-        loop = create_async_execution_context()
-        return loop.run_until_complete(extract_citations_with_openai(response))
-    except Exception as e:
+        result["cited_ids"] = sorted(await extract_citations_with_openai(response), key=lambda i: (len(i), i))
+    except Exception:
         logger.exception("Failed to extract citations")
-        st.error(f"Citation extraction failed: {e}", icon="⚠️")
-        return []
-# Format the message with proper RTL styling
-    if err:
-        formatted_msg = f"""
-        <div dir='{text_direction}' class='error-message {text_direction}-text' style='font-family: "David Libre", serif;'>
-"""
\ No newline at end of file
+        result["cited_ids"] = []
+
+    if not (config.VALIDATION_MODE == "logprob" or config.VALIDATION_STRATEGY == "cascade") \
+            or not config.VALIDATION_EXPLAIN_DISPLAYED:
+        return
+    # Only the sources shown get a written justification
+    docs = result.get("generator_input_documents") or []
+    shown = [doc for i, doc in enumerate(docs, start=1) if not result["cited_ids"] or str(i) in result["cited_ids"]]
+    pending = [doc for doc in shown
+               if isinstance(doc.get("validation_result"), dict) and not doc["validation_result"].get("justification")]
+    if not pending:
+        return
+    try:
+        justifications = await asyncio.gather(*(explain_relevance(doc, question, i) for i, doc in enumerate(pending)))
+    except Exception:
+        logger.exception("Failed to explain source relevance")
+        return
+    for doc, justification in zip(pending, justifications):
+        doc["validation_result"]["justification"] = justification
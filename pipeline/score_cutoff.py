@@ -0,0 +1,124 @@
+import math
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import config
+
+# Setup logger
+logger = logging.getLogger(__name__)
+
+METHODS = ("off", "gap", "elbow", "zscore", "floor")
+
+def _is_dense(doc: Dict) -> bool:
+    """Whether a document was matched by the dense query; documents without `retrieved_by` predate fusion."""
+    return "dense" in doc.get("retrieved_by", ["dense"])
+
+def dense_scores(docs: List[Dict]) -> Optional[List[float]]:
+    """
+    The similarity scores of the densely retrieved documents, highest first, or None if
+    one is missing.
+
+    Fusion, quote pinning and neighbour expansion put documents in an order their
+    similarity scores do not follow, and BM25-only, pinned and neighbour documents
+    carry scores that are not part of the query's dense score curve, so they are left out.
+    """
+    scores = [doc.get("similarity_score") for doc in docs if _is_dense(doc)]
+    if any(not isinstance(score, (int, float)) for score in scores):
+        return None
+    return sorted((float(score) for score in scores), reverse=True)
+
+def _position_of_dense(docs: List[Dict], count: int) -> int:
+    """How many leading documents (in their given order) it takes to include `count` dense ones."""
+    if count <= 0:
+        return 0
+    seen = 0
+    for position, doc in enumerate(docs, start=1):
+        seen += _is_dense(doc)
+        if seen >= count:
+            return position
+    return len(docs)
+
+def _gap_cut(scores: List[float], low: int, high: int) -> int:
+    """Cut at the largest drop between ranks `low` and `high` if it stands out from the typical drop."""
+    drops = [scores[i - 1] - scores[i] for i in range(1, high)]
+    if not drops or high <= low:
+        return high
+    typical = sorted(drops)[len(drops) // 2]
+    keep, drop = max(((k, drops[k - 1]) for k in range(max(low, 1), high)), key=lambda item: item[1],
+                     default=(high, 0.0))
+    if drop > 0 and drop >= config.SCORE_CUTOFF_GAP_RATIO * max(typical, 1e-6):
+        return keep
+    return high
+
+def _elbow_cut(scores: List[float], low: int, high: int) -> int:
+    """Cut at the knee of the score curve (the point farthest below the chord from first to last score)."""
+    window = scores[:high]
+    if len(window) < 3 or window[0] <= window[-1]:
+        return high
+    span = window[0] - window[-1]
+    distances = [(1 - i / (len(window) - 1)) - (score - window[-1]) / span for i, score in enumerate(window)]
+    knee = max(range(len(window)), key=lambda i: distances[i])
+    if distances[knee] < config.SCORE_CUTOFF_ELBOW_MIN:
+        return high
+    return max(low, knee + 1)
+
+def _zscore_cut(scores: List[float]) -> int:
+    """Keep the leading scores at least config.SCORE_CUTOFF_ZSCORE standard deviations above the query's mean."""
+    mean = sum(scores) / len(scores)
+    std = math.sqrt(sum((score - mean) ** 2 for score in scores) / len(scores))
+    if std <= 0:
+        return len(scores)
+    keep = 0
+    while keep < len(scores) and (scores[keep] - mean) / std >= config.SCORE_CUTOFF_ZSCORE:
+        keep += 1
+    return keep
+
+def choose_validation_count(docs: List[Dict], n_validate: int, method: Optional[str] = None) -> Tuple[int, str]:
+    """
+    How many of the top retrieved documents are worth validating, judged from where
+    their similarity scores fall off.
+
+    The count never goes below config.SCORE_CUTOFF_MIN nor above config.SCORE_CUTOFF_MAX
+    (when set) or the requested `n_validate`. config.SCORE_CUTOFF_FLOOR, when set, also
+    drops documents scoring below it.
+
+    Args:
+        docs (List[Dict]): Retrieved documents in the order they are validated (after
+            fusion, quote pinning and neighbour expansion)
+        n_validate (int): Requested number of validations
+        method (Optional[str]): One of METHODS; defaults to config.SCORE_CUTOFF_METHOD
+
+    Returns:
+        Tuple[int, str]: The number of documents to validate and the method that set it
+    """
+    method = (method or config.SCORE_CUTOFF_METHOD or "off").lower()
+    high = min(len(docs), n_validate)
+    if config.SCORE_CUTOFF_MAX > 0:
+        high = min(high, config.SCORE_CUTOFF_MAX)
+    low = min(config.SCORE_CUTOFF_MIN, high)
+    if method == "off" or high <= low:
+        return high, "off"
+    scores = dense_scores(docs)
+    if not scores:
+        logger.warning("Score cutoff skipped: no dense similarity scores to cut on")
+        return high, "off"
+    low_dense, high_dense = min(low, len(scores)), min(high, len(scores))
+
+    # The cut is found on the dense score curve, then covers the documents ranked among the kept ones
+    if method == "gap":
+        keep = _gap_cut(scores, low_dense, high_dense)
+    elif method == "elbow":
+        keep = _elbow_cut(scores, low_dense, high_dense)
+    elif method == "zscore":
+        keep = _zscore_cut(scores)
+    elif method == "floor":
+        keep = len(scores)
+    else:
+        logger.warning(f"Unknown score cutoff method '{method}'; validating all {high} documents")
+        return high, "off"
+    if config.SCORE_CUTOFF_FLOOR > 0:
+        above_floor = next((i for i, score in enumerate(scores) if score < config.SCORE_CUTOFF_FLOOR), len(scores))
+        if above_floor < keep:
+            keep, method = above_floor, "floor"
+    keep = len(docs) if keep >= len(scores) else _position_of_dense(docs, keep)
+    return max(low, min(keep, high)), method
@@ -0,0 +1,168 @@
+import re
+import json
+import time
+import asyncio
+import logging
+from typing import Any, Dict, List, Set, Tuple
+
+import config
+from utils import metrics
+from utils.hebrew_normalize import tokenize, word_forms
+from utils.sanitization import escape_html
+
+# Setup logger
+logger = logging.getLogger(__name__)
+
+# Question words and particles that say nothing about which passage is wanted
+STOPWORDS = {
+    "מה", "מי", "של", "את", "על", "אל", "עם", "הוא", "היא", "הם", "זה", "זו", "זאת", "לא", "כי", "אם", "או",
+    "גם", "כל", "אין", "יש", "איך", "למה", "מדוע", "האם", "בין", "אשר", "כמו", "רק", "עוד", "אך", "כן",
+    "the", "a", "an", "of", "and", "or", "in", "on", "to", "is", "are", "what", "why", "how", "does", "do",
+}
+
+_WORD = re.compile(r"(\w+)")
+RESULT_FIELDS = ("original_id", "source_name", "hebrew_text", "english_text", "similarity_score", "search_score",
+                 "matched_terms", "quote_match", "expanded_from", "shard")
+
+def query_terms(query: str) -> List[str]:
+    """
+    The content words of a query, normalized for matching.
+
+    Args:
+        query (str): The user's query
+
+    Returns:
+        List[str]: Distinct normalized terms in query order
+    """
+    terms = [word for word in tokenize(query) if word not in STOPWORDS and len(word) > 1]
+    return list(dict.fromkeys(terms))
+
+def _term_forms(terms: List[str]) -> Dict[str, Set[str]]:
+    return {term: word_forms(term) for term in terms}
+
+def matched_terms(text: str, terms: List[str]) -> Set[str]:
+    """The query terms occurring in `text` (ignoring niqqud, final letters and attached prefixes)."""
+    forms = _term_forms(terms)
+    found: Set[str] = set()
+    for word in set(tokenize(text)):
+        candidates = word_forms(word)
+        found.update(term for term, term_forms in forms.items() if candidates & term_forms)
+    return found
+
+def rerank_documents(docs: List[Dict[str, Any]], query: str) -> List[Dict[str, Any]]:
+    """
+    Re-rank retrieved documents locally by their similarity score and the share of
+    the query's terms they contain, weighted by config.SEARCH_RERANK_WEIGHT.
+
+    Each document gets `search_score` and `matched_terms`. With re-ranking disabled
+    (or a query without content words) the retrieval order is kept.
+
+    Args:
+        docs (List[Dict[str, Any]]): Retrieved documents, best first
+        query (str): The user's query
+
+    Returns:
+        List[Dict[str, Any]]: The documents, best first
+    """
+    terms = query_terms(query)
+    scores = [float(doc.get("similarity_score") or 0.0) for doc in docs]
+    low, high = (min(scores), max(scores)) if scores else (0.0, 0.0)
+    weight = config.SEARCH_RERANK_WEIGHT if config.SEARCH_RERANK and terms else 0.0
+    for doc, score in zip(docs, scores):
+        found = matched_terms(f"{doc.get('hebrew_text', '')} {doc.get('english_text', '')}", terms) if terms else set()
+        similarity = (score - low) / (high - low) if high > low else 1.0
+        doc["matched_terms"] = sorted(found)
+        doc["search_score"] = round((1 - weight) * similarity + weight * (len(found) / len(terms) if terms else 0.0), 4)
+    if not weight:
+        return list(docs)
+    return sorted(docs, key=lambda doc: -doc["search_score"])
+
+def highlight_terms(text: str, terms: List[str]) -> str:
+    """
+    Escape `text` for HTML and mark the words matching the query terms.
+
+    Args:
+        text (str): Plain passage text
+        terms (List[str]): Normalized query terms (see query_terms)
+
+    Returns:
+        str: HTML with the matching words wrapped in a `search-hit` span
+    """
+    if not terms:
+        return escape_html(text)
+    forms = set().union(*_term_forms(terms).values())
+    parts = []
+    for piece in _WORD.split(text):
+        normalized = tokenize(piece) if _WORD.fullmatch(piece) else []
+        if len(normalized) == 1 and word_forms(normalized[0]) & forms:
+            parts.append(f"<span class='search-hit' style='background-color: #fff3a3;'>{escape_html(piece)}</span>")
+        else:
+            parts.append(escape_html(piece))
+    return "".join(parts)
+
+# --- API ---
+def _result_json(doc: Dict[str, Any], rank: int) -> Dict[str, Any]:
+    return {"rank": rank, **{key: doc.get(key) for key in RESULT_FIELDS}}
+
+async def _api_search(text: str, params: Dict[str, Any], language: str) -> Dict[str, Any]:
+    from rag_processor import execute_retrieval_only_pipeline
+    from pipeline.deadline import Deadline
+    from services import cost_accounting
+    from i18n import language_override
+
+    # There is no Streamlit session on this thread to read the language from
+    language_override.set(language)
+    async with cost_accounting.track_request():
+        return await execute_retrieval_only_pipeline(
+            history=[{"role": "user", "content": text}], params=params, status_callback=lambda _m: None,
+            deadline=Deadline.from_config(params)
+        )
+
+def _route(query: Dict[str, List[str]]) -> Tuple[int, str, str]:
+    # POST /api/search?q=...&k=20[&source=...][&lang=he] runs the retrieval-only pipeline on the jobs loop.
+    # Every call pays for an embedding: expose it beyond localhost only together with METRICS_TOKEN
+    from pipeline import jobs
+    from services import facets
+    from i18n import LANGUAGES, DEFAULT_LANGUAGE
+
+    text = (query.get("q") or [""])[0].strip()
+    if not text:
+        metrics.inc("rag_search_api_requests_total", status="400")
+        return 400, "application/json", json.dumps({"error": "Missing query parameter 'q'"})
+    try:
+        n_results = max(1, min(int((query.get("k") or [config.SEARCH_RESULTS])[0]), config.SEARCH_MAX_RESULTS))
+    except ValueError:
+        metrics.inc("rag_search_api_requests_total", status="400")
+        return 400, "application/json", json.dumps({"error": "Parameter 'k' must be an integer"})
+
+    language = (query.get("lang") or [DEFAULT_LANGUAGE])[0]
+    if language not in LANGUAGES:
+        metrics.inc("rag_search_api_requests_total", status="400")
+        return 400, "application/json", json.dumps({"error": f"Parameter 'lang' must be one of {', '.join(LANGUAGES)}"})
+
+    start = time.perf_counter()
+    sources = facets.normalize_sources(query.get("source"))
+    params = {"n_results": n_results, "sources": sources, "deadline_seconds": config.SEARCH_API_TIMEOUT_SECONDS}
+    future = asyncio.run_coroutine_threadsafe(_api_search(text, params, language), jobs.get_loop())
+    try:
+        result = future.result(timeout=config.SEARCH_API_TIMEOUT_SECONDS + 1)
+    except Exception as e:
+        future.cancel()
+        logger.error(f"Search API request failed: {type(e).__name__} - {e}")
+        metrics.inc("rag_search_api_requests_total", status="504")
+        return 504, "application/json", json.dumps({"error": f"{type(e).__name__}: {e}"})
+    docs = result.get("generator_input_documents") or []
+    status = 200 if docs or not result.get("error") else 503
+    metrics.inc("rag_search_api_requests_total", status=str(status))
+    body = {
+        "query": text,
+        "terms": result.get("search_terms", []),
+        "sources": sources,
+        "results": [_result_json(doc, rank) for rank, doc in enumerate(docs, start=1)],
+        "error": result.get("error"),
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+    return status, "application/json", json.dumps(body, ensure_ascii=False)
+
+metrics.register_route("/api/search", _route, method="POST")
+metrics.registry.describe("rag_search_api_requests_total", "Requests to the /api/search endpoint, by HTTP status.")
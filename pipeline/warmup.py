@@ -0,0 +1,247 @@
+"""
+Warm answers for the example questions shown in the sidebar.
+
+Every example question of every language is prepared ahead of time with the
+default retrieval and validation counts: its embedding, the retrieved documents
+and the validation verdicts, and with config.WARMUP_ANSWERS the complete answer.
+Passes run on the job loop after the services come up and then every
+config.WARMUP_INTERVAL_SECONDS. Each entry is recomputed on its own when it is
+older than config.WARMUP_MAX_AGE_SECONDS, when the prompts, models or settings it
+was computed with change (its answer-cache fingerprint no longer matches), or when
+the index reports different contents.
+
+A click on an example is then served from its entry: the whole answer, or a live
+answer generated from the stored validated documents.
+"""
+import json
+import time
+import asyncio
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import config
+from utils import metrics
+from services import answer_cache
+
+# Setup logger
+logger = logging.getLogger(__name__)
+
+_entries: Dict[Tuple[str, str], Dict[str, Any]] = {}
+_entries_lock = threading.Lock()
+_index_version: Optional[str] = None
+_last_pass: Dict[str, Any] = {}
+_thread: Optional[threading.Thread] = None
+_thread_lock = threading.Lock()
+_wake = threading.Event()
+
+def _default_params() -> Dict[str, Any]:
+    return {"n_retrieve": config.DEFAULT_N_RETRIEVE, "n_validate": config.DEFAULT_N_VALIDATE}
+
+def _level() -> str:
+    return "answer" if config.WARMUP_ANSWERS else "validation"
+
+def _is_fresh(entry: Dict[str, Any], now: float) -> bool:
+    return (now - entry["created_at"] <= config.WARMUP_MAX_AGE_SECONDS
+            and entry["index_version"] == _index_version
+            and entry["level"] == _level())
+
+def lookup(history: List[Dict], params: Dict[str, Any],
+           dynamic_system_prompt: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Find the fresh warm entry of a request, if it asks an example question with the
+    settings the entry was computed with.
+
+    Args:
+        history (List[Dict]): Message history of the request
+        params (Dict[str, Any]): RAG parameters (`bypass_answer_cache` skips warm entries too)
+        dynamic_system_prompt (Optional[str]): System prompt override of the request
+
+    Returns:
+        Optional[Dict[str, Any]]: The entry; `result` holds the answer when answers are
+            warmed, `validated_documents` the validated documents either way
+    """
+    if not config.WARMUP_ENABLED or params.get("bypass_answer_cache"):
+        return None
+    key = answer_cache.build_key(history, params, dynamic_system_prompt)
+    if key is None:
+        return None
+    with _entries_lock:
+        entry = _entries.get((key["fingerprint"], key["normalized_query"]))
+    if entry is None or not _is_fresh(entry, time.time()):
+        return None
+    metrics.inc("rag_warmup_hits_total", level=entry["level"])
+    return entry
+
+async def _warm_entry(question: str, language: str, key: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Prepare one example question; returns None if it produced no usable documents."""
+    from rag_processor import run_retrieval_step, run_gpt4o_validation_filter_step, execute_validate_generate_pipeline
+    from pipeline.deadline import Deadline
+    from services import cost_accounting
+    from utils import get_embedding
+
+    def ignore(_message: str) -> None:
+        pass
+
+    params = _default_params()
+    deadline = Deadline.from_config(params)
+    start = time.perf_counter()
+    # Accounted like a user request: held to COST_BUDGET_REQUEST_USD and added to the daily totals
+    async with cost_accounting.track_request():
+        with metrics.request_scope() as observations:
+            embedding = await asyncio.wait_for(get_embedding(question), deadline.stage_timeout("embedding"))
+            if not embedding:
+                return None
+            retrieved = await run_retrieval_step(question, params["n_retrieve"], ignore, None, deadline,
+                                                 query_embedding=embedding)
+            validated = await run_gpt4o_validation_filter_step(retrieved, question, params["n_validate"], ignore, deadline)
+            if not validated or deadline.exceeded:
+                # Nothing found, or cut short by the time budget: try again on the next pass
+                return None
+            result = None
+            if config.WARMUP_ANSWERS:
+                result = await execute_validate_generate_pipeline(
+                    [{"role": "user", "content": question}], {**params, "bypass_answer_cache": True}, ignore, ignore,
+                    prefetched_documents=validated
+                )
+                if result.get("error") or result.get("deadline_exceeded") or not (result.get("final_response") or "").strip():
+                    return None
+    entry = {
+        "language": language,
+        "query": question,
+        "fingerprint": key["fingerprint"],
+        "embedding": embedding,
+        "index_version": _index_version,
+        "level": _level(),
+        "retrieved_count": len(retrieved),
+        "validated_documents": validated,
+        "result": {field: result.get(field) for field in answer_cache.CACHED_FIELDS} if result else None,
+        "created_at": time.time(),
+        "latency": time.perf_counter() - start,
+        "cost": metrics.scope_cost(observations),
+    }
+    if result and config.ANSWER_CACHE_ENABLED:
+        # Lets near-duplicates of the example (and a cold answer cache) share the warm answer
+        answer_cache.store({**key, "embedding": embedding}, result, entry["latency"], entry["cost"])
+    return entry
+
+async def warm_pass() -> Dict[str, Any]:
+    """
+    Bring every example question's entry up to date, one question at a time so warm-up
+    never competes with users for more than one request's worth of API calls.
+
+    Returns:
+        Dict[str, Any]: Counts of entries warmed, already fresh and failed, and the pass duration
+    """
+    from i18n import EXAMPLE_QUESTIONS, language_override
+    from services import retriever
+
+    global _index_version, _last_pass
+    start = time.perf_counter()
+    await retriever.wait_until_connected()
+    _index_version = await asyncio.to_thread(retriever.get_index_version)
+    summary = {"warmed": 0, "fresh": 0, "failed": 0}
+    current = set()
+    for language, questions in EXAMPLE_QUESTIONS.items():
+        token = language_override.set(language)
+        try:
+            for question in questions:
+                key = answer_cache.build_key([{"role": "user", "content": question}], _default_params())
+                if key is None:
+                    continue
+                entry_key = (key["fingerprint"], key["normalized_query"])
+                current.add(entry_key)
+                with _entries_lock:
+                    entry = _entries.get(entry_key)
+                if entry is not None and _is_fresh(entry, time.time()):
+                    outcome = "fresh"
+                else:
+                    try:
+                        entry = await _warm_entry(question, language, key)
+                    except Exception as e:
+                        logger.warning(f"Warm-up of '{question[:40]}' failed: {type(e).__name__}: {e}")
+                        entry = None
+                    outcome = "warmed" if entry else "failed"
+                    if entry:
+                        with _entries_lock:
+                            _entries[entry_key] = entry
+                summary[outcome] += 1
+                metrics.inc("rag_warmup_entries_total", outcome=outcome)
+        finally:
+            language_override.reset(token)
+    with _entries_lock:
+        # Entries of questions, prompts or settings that no longer exist
+        for stale_key in [k for k in _entries if k not in current]:
+            del _entries[stale_key]
+    summary["seconds"] = round(time.perf_counter() - start, 3)
+    summary["finished_at"] = time.time()
+    _last_pass = summary
+    metrics.observe("rag_warmup_pass_seconds", summary["seconds"])
+    logger.info(f"Warm-up pass: {summary}")
+    return summary
+
+def _run_forever() -> None:
+    from pipeline.jobs import get_loop
+
+    while True:
+        try:
+            asyncio.run_coroutine_threadsafe(warm_pass(), get_loop()).result()
+        except Exception:
+            logger.exception("Warm-up pass failed")
+        _wake.wait(config.WARMUP_INTERVAL_SECONDS)
+        _wake.clear()
+
+def start() -> bool:
+    """Start the warm-up thread once per process. Returns False if warm-up is disabled."""
+    global _thread
+    if not config.WARMUP_ENABLED:
+        return False
+    with _thread_lock:
+        if _thread is None:
+            _thread = threading.Thread(target=_run_forever, name="rag-warmup", daemon=True)
+            _thread.start()
+            logger.info("Warm-up thread started")
+    return True
+
+def refresh() -> None:
+    """Run the next warm-up pass now instead of at the end of the interval."""
+    _wake.set()
+
+def status() -> Dict[str, Any]:
+    """The last pass and the age and freshness of each entry."""
+    now = time.time()
+    with _entries_lock:
+        entries = [{
+            "language": entry["language"],
+            "query": entry["query"][:80],
+            "level": entry["level"],
+            "age_seconds": round(now - entry["created_at"]),
+            "fresh": _is_fresh(entry, now),
+            "validated_documents": len(entry["validated_documents"]),
+            "seconds": round(entry["latency"], 3),
+            "cost_usd": round(entry["cost"], 6),
+        } for entry in _entries.values()]
+    return {"enabled": config.WARMUP_ENABLED, "level": _level(), "index_version": _index_version,
+            "last_pass": _last_pass, "entries": entries}
+
+def _route(_query: Dict[str, List[str]]) -> Tuple[int, str, str]:
+    # GET /warmup reports the entries
+    return 200, "application/json", json.dumps(status(), ensure_ascii=False)
+
+def _refresh_route(_query: Dict[str, List[str]]) -> Tuple[int, str, str]:
+    # POST /warmup/refresh starts a pass now
+    refresh()
+    return 200, "application/json", json.dumps(status(), ensure_ascii=False)
+
+def _gauges() -> Dict[str, float]:
+    now = time.time()
+    with _entries_lock:
+        return {"rag_warmup_entries_fresh": sum(1 for entry in _entries.values() if _is_fresh(entry, now))}
+
+metrics.register_route("/warmup", _route)
+metrics.register_route("/warmup/refresh", _refresh_route, method="POST")
+metrics.register_gauge_callback(_gauges)
+metrics.registry.describe("rag_warmup_entries_total", "Example questions per warm-up pass, by outcome (warmed, fresh or failed).")
+metrics.registry.describe("rag_warmup_hits_total", "Requests served from a warm entry, by level (answer or validation).")
+metrics.registry.describe("rag_warmup_pass_seconds", "Duration of a warm-up pass over all example questions.")
+metrics.registry.describe("rag_warmup_entries_fresh", "Warm entries currently fresh.")
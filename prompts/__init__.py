@@ -4,5 +4,5 @@ Provides access to system and validation prompts.
 """
 
 from .system_prompt import OPENAI_SYSTEM_PROMPT
-from .validation_prompt import VALIDATION_PROMPT_TEMPLATE
+from .validation_prompt import VALIDATION_PROMPT_TEMPLATE, VALIDATION_LOGPROB_PROMPT_TEMPLATE
 from .templates import get_templates_for_language, get_template_by_id 
\ No newline at end of file
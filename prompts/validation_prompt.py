@@ -1,8 +1,22 @@
 """
 Validation prompt template for filtering documents with GPT-4o.
+
+Everything before the first per-paragraph placeholder ({paragraph_index},
+{hebrew_text} or {english_text}) is the same for every paragraph of a query and is
+sent as a shared prefix the provider can cache, so keep the instructions and the
+question above the paragraph.
 """
 
 VALIDATION_PROMPT_TEMPLATE = """
+Instruction:
+Your job is to help me back up my dvar torah ideas that i come up with and back it up with sources that can support the concept or concepts that im basing my dvar torah on
+
+You have to carefully evaluate each dvar torah to see if and how it can help back up the dvar torah of mine and how , you have to use some creativity and reasoning in order to get to that.
+
+Analyze the Text Paragraph. Determine if it contains information that *directly* answers or significantly contributes to answering the User Question.
+Respond ONLY with valid JSON: {{\"contains_relevant_info\": boolean, \"justification\": \"Brief Hebrew explanation\"}}.
+Output only the JSON object.
+
 User Question (Hebrew):
 \"{user_question}\"
 
@@ -15,13 +29,29 @@ English:
 ---
 {english_text}
 ---
+"""
 
+# Logprob validation mode: the model answers with a single token whose probability
+# becomes the paragraph's relevance score
+VALIDATION_LOGPROB_PROMPT_TEMPLATE = """
 Instruction:
-Your job is to help me back up my dvar torah ideas that i come up with and back it up with sources that can support the concept or concepts that im basing my dvar torah on 
+Your job is to help me back up my dvar torah ideas that i come up with and back it up with sources that can support the concept or concepts that im basing my dvar torah on
 
 You have to carefully evaluate each dvar torah to see if and how it can help back up the dvar torah of mine and how , you have to use some creativity and reasoning in order to get to that.
 
-Analyze the Text Paragraph. Determine if it contains information that *directly* answers or significantly contributes to answering the User Question.
-Respond ONLY with valid JSON: {{\"contains_relevant_info\": boolean, \"justification\": \"Brief Hebrew explanation\"}}.
-Output only the JSON object.
-""" 
\ No newline at end of file
+Analyze the Text Paragraph. Does it contain information that *directly* answers or significantly contributes to answering the User Question?
+Answer with a single word: yes or no.
+
+User Question (Hebrew):
+\"{user_question}\"
+
+Text Paragraph (Paragraph {paragraph_index}):
+Hebrew:
+---
+{hebrew_text}
+---
+English:
+---
+{english_text}
+---
+"""
@@ -1,24 +1,59 @@
 import time
 import asyncio
 import traceback
+from collections import Counter
 from typing import List, Dict, Any, Optional, Callable, Tuple
-from langsmith import traceable
+from utils.tracing import traceable
 
 try:
     import config
     from services import retriever, openai_service
     from i18n import get_text
+    from utils import metrics
+    from services import cassette, answer_cache, cost_accounting, facets, quote_index
+    from pipeline.deadline import Deadline
+    from pipeline import warmup, score_cutoff, search, fast_path
+    from pipeline.rag import annotate_sources
 except ImportError:
     print("Error: Failed to import config, services, or i18n in rag_processor.py")
     raise SystemExit("Failed imports in rag_processor.py")
 
 PIPELINE_VALIDATE_GENERATE_GPT4O = "GPT-4o Validator + GPT-4o Synthesizer"
+PIPELINE_RETRIEVAL_ONLY = "Retrieval Only"
+PIPELINE_FAST_PATH_DIRECT = "Top Paragraphs (validation skipped) + GPT-4o Synthesizer"
 StatusCallback = Callable[[str], None]
 
 # --- Step Functions ---
 
+@traceable(name="rag-step-quote-lookup")
+async def run_quote_lookup_step(query: str, update_status: StatusCallback) -> List[Tuple[str, float]]:
+    """
+    Pre-step of retrieval: find the paragraphs a pasted quote comes from in the local
+    quote index (services.quote_index), so retrieval can put them first.
+
+    Args:
+        query (str): The user's question (without template)
+        update_status (StatusCallback): Status update callback function
+
+    Returns:
+        List[Tuple[str, float]]: (original id, share of the question matched) pairs, best first
+    """
+    if not config.QUOTE_LOOKUP:
+        return []
+    try:
+        matches = await asyncio.to_thread(quote_index.find_quotes, query)
+    except Exception as e:
+        print(f"Quote lookup failed: {type(e).__name__} - {e}")
+        return []
+    if matches:
+        update_status(get_text("quote_matches_found").format(len(matches), f"{matches[0][1]:.0%}"))
+    return matches
+
 @traceable(name="rag-step-retrieve")
-async def run_retrieval_step(query: str, n_retrieve: int, update_status: StatusCallback, original_query: str = None) -> List[Dict]:
+async def run_retrieval_step(query: str, n_retrieve: int, update_status: StatusCallback, original_query: str = None,
+                             deadline: Optional[Deadline] = None,
+                             query_embedding: Optional[List[float]] = None,
+                             sources: Optional[List[str]] = None) -> List[Dict]:
     """
     Retrieve documents from the vector store.
     
@@ -27,6 +62,9 @@ async def run_retrieval_step(query: str, n_retrieve: int, update_status: StatusC
         n_retrieve (int): Number of documents to retrieve
         update_status (StatusCallback): Status update callback function
         original_query (str, optional): The original user query without template
+        deadline (Deadline, optional): Request deadline bounding the embedding and query calls
+        query_embedding (List[float], optional): Embedding of the search query if already computed
+        sources (List[str], optional): Only retrieve paragraphs from these sources
         
     Returns:
         List[Dict]: List of retrieved documents
@@ -38,37 +76,108 @@ async def run_retrieval_step(query: str, n_retrieve: int, update_status: StatusC
     # Use original query for Pinecone search if provided
     search_query = original_query if original_query else query
     
-    update_status(get_text("retrieving_docs").format(n_retrieve))
     start_time = time.time()
-    retrieved_docs = await retrieve_documents(query_text=search_query, n_results=n_retrieve)
+    pinned = await run_quote_lookup_step(search_query, update_status)
+    update_status(get_text("retrieving_docs").format(n_retrieve))
+    if sources:
+        update_status(get_text("source_filter_applied").format(len(sources)))
+    with metrics.request_scope() as retrieval_observations:
+        retrieved_docs = await retrieve_documents(query_text=search_query, n_results=n_retrieve, deadline=deadline,
+                                                  query_embedding=query_embedding, pinned=pinned, sources=sources)
     retrieval_time = time.time() - start_time
+    metrics.observe("rag_retrieval_seconds", retrieval_time, filtered=facets.filter_label(sources))
+    if deadline and {"embedding", "retrieval"} & set(deadline.exceeded):
+        update_status(get_text("retrieval_budget_exhausted").format(f"{retrieval_time:.2f}"))
+    metrics.observe("rag_stage_seconds", retrieval_time, stage="retrieval")
     update_status(get_text("retrieved_docs").format(len(retrieved_docs), f"{retrieval_time:.2f}"))
+    shard_queries = [(labels, value) for name, labels, value in retrieval_observations if name == "rag_shard_query_seconds"]
+    if len(shard_queries) > 1:
+        kept = Counter(doc.get("shard") for doc in retrieved_docs)
+        update_status(get_text("retrieval_shards").format(len(shard_queries), ", ".join(
+            get_text("retrieval_shard").format(labels["shard"], labels["outcome"], f"{value:.2f}", kept[labels["shard"]])
+            for labels, value in shard_queries
+        )))
+    bm25_only = sum(1 for doc in retrieved_docs if doc.get("retrieved_by") == ["bm25"])
+    if bm25_only:
+        update_status(get_text("hybrid_retrieved").format(bm25_only, len(retrieved_docs)))
     if not retrieved_docs:
         update_status(get_text("no_docs_found"))
     return retrieved_docs
 
 @traceable(name="rag-step-gpt4o-filter")
 async def run_gpt4o_validation_filter_step(
-    docs_to_process: List[Dict], query: str, n_validate: int, update_status: StatusCallback
+    docs_to_process: List[Dict], query: str, n_validate: int, update_status: StatusCallback,
+    deadline: Optional[Deadline] = None, strategy: Optional[str] = None, cutoff: Optional[str] = None
 ) -> List[Dict]:
+    """
+    Validate the top retrieved paragraphs and keep those relevant to the query.
+
+    Args:
+        docs_to_process (List[Dict]): Retrieved paragraphs, best first
+        query (str): The user's question
+        n_validate (int): Number of paragraphs to validate
+        update_status (StatusCallback): Status update callback function
+        deadline (Deadline, optional): Request deadline bounding the validation calls
+        strategy (str, optional): "single" or "cascade"; defaults to config.VALIDATION_STRATEGY
+        cutoff (str, optional): Score cutoff method; defaults to config.SCORE_CUTOFF_METHOD
+
+    Returns:
+        List[Dict]: The paragraphs that passed, with their verdict under "validation_result"
+    """
     if not docs_to_process:
         update_status(get_text("skipping_validation"))
         return []
-    validation_count = min(len(docs_to_process), n_validate)
+    strategy = strategy or config.VALIDATION_STRATEGY
+    # One prompt for the whole query keeps its cacheable prefix identical across the calls
+    prompt = openai_service.ValidationPrompt(query)
+    if strategy == "cascade":
+        screen_prompt = openai_service.ValidationPrompt(query, mode="logprob")
+        validate = lambda doc, i: openai_service.validate_relevance_cascade(doc, query, i, screen_prompt, prompt)
+    else:
+        validate = lambda doc, i: openai_service.validate_relevance_openai(doc, query, i, prompt)
+    requested_count = min(len(docs_to_process), n_validate)
+    cutoff_count, cutoff_method = score_cutoff.choose_validation_count(docs_to_process, n_validate, cutoff)
+    if cutoff_count < requested_count:
+        metrics.inc("rag_score_cutoff_saved_total", requested_count - cutoff_count, method=cutoff_method)
+        update_status(get_text("score_cutoff_applied").format(
+            cutoff_method, cutoff_count, requested_count, requested_count - cutoff_count
+        ))
+    validation_count, remaining_budget = cost_accounting.plan_validation(docs_to_process, prompt.prefix, cutoff_count)
+    if validation_count < cutoff_count:
+        metrics.inc("rag_budget_reductions_total", stage="validation")
+        update_status(get_text("budget_validation_reduced").format(
+            validation_count, cutoff_count, f"{remaining_budget:.4f}"
+        ))
     update_status(get_text("validating_docs").format(validation_count, len(docs_to_process)))
     validation_start_time = time.time()
-    tasks = [openai_service.validate_relevance_openai(doc, query, i)
-             for i, doc in enumerate(docs_to_process[:validation_count])]
-    validation_results = await asyncio.gather(*tasks, return_exceptions=True)
+    tasks = [asyncio.ensure_future(validate(doc, i)) for i, doc in enumerate(docs_to_process[:validation_count])]
+    done, pending = set(), set()
+    try:
+        if tasks:
+            done, pending = await asyncio.wait(tasks, timeout=deadline.stage_timeout("validation") if deadline else None)
+    finally:
+        # Out of budget, superseded or rerun: stop paying for validations still in flight
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+    if pending:
+        deadline.mark_exceeded("validation")
+        update_status(get_text("validation_budget_exhausted").format(len(done), len(tasks)))
+    # Only finished validations count; the rest are treated as unchecked
+    validation_results = [(i, task.exception() or task.result()) for i, task in enumerate(tasks)
+                          if task in done and not task.cancelled()]
     passed_docs = []
     passed_count = failed_validation_count = error_count = 0
+    cascade_decisions = {"accepted": 0, "rejected": 0, "escalated": 0}
     update_status(get_text("filtering_docs"))
-    for i, res in enumerate(validation_results):
+    for i, res in validation_results:
         original_doc = docs_to_process[i]
-        if isinstance(res, Exception):
+        if isinstance(res, BaseException):
             print(f"GPT-4o Validation Exception doc {i}: {res}")
             error_count += 1
         elif isinstance(res, dict) and 'validation' in res:
+            if res['validation'].get('cascade') in cascade_decisions:
+                cascade_decisions[res['validation']['cascade']] += 1
             if res['validation'].get('contains_relevant_info'):
                 original_doc['validation_result'] = res['validation']
                 passed_docs.append(original_doc)
@@ -78,18 +187,90 @@ async def run_gpt4o_validation_filter_step(
         else:
             print(f"GPT-4o Validation Unexpected result doc {i}: {type(res)}")
             error_count += 1
+    if passed_docs and all('relevance_score' in doc['validation_result'] for doc in passed_docs):
+        # Logprob mode: most relevant first, so a trimmed generation context loses the weakest passages
+        passed_docs.sort(key=lambda doc: -doc['validation_result'].get('relevance_score', 0.0))
     validation_time = time.time() - validation_start_time
+    metrics.observe("rag_stage_seconds", validation_time, stage="validation")
+    metrics.inc("rag_validation_results_total", passed_count, result="passed")
+    metrics.inc("rag_validation_results_total", failed_validation_count, result="rejected")
+    metrics.inc("rag_validation_results_total", error_count, result="error")
+    if validation_results:
+        metrics.observe("rag_validation_pass_ratio", passed_count / len(validation_results),
+                        buckets=metrics.RATIO_BUCKETS)
     update_status(get_text("validation_complete").format(
         passed_count, failed_validation_count, error_count, f"{validation_time:.2f}"
     ))
+    if strategy == "cascade":
+        update_status(get_text("cascade_summary").format(
+            cascade_decisions["accepted"], cascade_decisions["rejected"], config.CASCADE_SCREEN_MODEL,
+            cascade_decisions["escalated"], config.OPENAI_VALIDATION_MODEL
+        ))
     update_status(get_text("filtered_docs").format(len(passed_docs)))
     return passed_docs
 
+@traceable(name="rag-step-fast-path-validate")
+async def run_fast_path_validation_step(
+    docs_to_process: List[Dict], query: str, n_validate: int, decision: Optional[Dict[str, Any]],
+    update_status: StatusCallback, deadline: Optional[Deadline] = None
+) -> List[Dict]:
+    """
+    Validate as much as the fast path decided for this query (see pipeline.fast_path).
+
+    The direct route returns the top paragraphs unvalidated. The sample route validates
+    the top config.FAST_PATH_SAMPLE_SIZE paragraphs and, when fewer than
+    config.FAST_PATH_SAMPLE_MIN_PASS of them pass, the rest as well. In shadow mode,
+    or without a decision, everything requested is validated.
+
+    Args:
+        docs_to_process (List[Dict]): Retrieved paragraphs, best first
+        query (str): The user's question
+        n_validate (int): Requested number of validations
+        decision (Dict[str, Any], optional): The fast path decision for the query
+        update_status (StatusCallback): Status update callback function
+        deadline (Deadline, optional): Request deadline bounding the validation calls
+
+    Returns:
+        List[Dict]: The paragraphs to answer from
+    """
+    if decision is None:
+        return await run_gpt4o_validation_filter_step(docs_to_process, query, n_validate, update_status, deadline)
+    update_status(get_text("fast_path_decision").format(decision["mode"], decision["route"], "; ".join(decision["reasons"])))
+    requested_count = min(len(docs_to_process), n_validate)
+    if decision["mode"] == "shadow" or decision["route"] == "full":
+        passed_docs = await run_gpt4o_validation_filter_step(docs_to_process, query, n_validate, update_status, deadline)
+        if decision["mode"] == "shadow":
+            report = fast_path.shadow_report(decision, docs_to_process, passed_docs)
+            update_status(get_text("fast_path_shadow").format(
+                report["top_k_passed"], report["top_k"], report["sample_passed"], report["passed"], report["sample"]
+            ))
+        return passed_docs
+    if decision["route"] == "direct":
+        direct_docs = fast_path.direct_documents(docs_to_process, decision)
+        metrics.inc("rag_fast_path_validations_skipped_total", requested_count, route="direct")
+        update_status(get_text("fast_path_direct").format(len(direct_docs)))
+        return direct_docs
+
+    # Sample route: the top paragraphs first, the rest only if too few of them pass
+    sample_size = decision["validate"]
+    passed_docs = await run_gpt4o_validation_filter_step(
+        docs_to_process[:sample_size], query, sample_size, update_status, deadline, cutoff="off"
+    )
+    remaining_count = requested_count - sample_size
+    if len(passed_docs) >= config.FAST_PATH_SAMPLE_MIN_PASS * sample_size or (deadline and deadline.expired()):
+        metrics.inc("rag_fast_path_validations_skipped_total", remaining_count, route="sample")
+        return passed_docs
+    metrics.inc("rag_fast_path_escalations_total")
+    update_status(get_text("fast_path_escalated").format(len(passed_docs), sample_size, remaining_count))
+    return passed_docs + await run_gpt4o_validation_filter_step(
+        docs_to_process[sample_size:], query, remaining_count, update_status, deadline
+    )
+
 @traceable(name="rag-step-openai-generate")
 async def run_openai_generation_step(
     history: List[Dict], context_documents: List[Dict],
     update_status: StatusCallback, stream_callback: Callable[[str], None],
-    dynamic_system_prompt: Optional[str] = None
+    dynamic_system_prompt: Optional[str] = None, deadline: Optional[Deadline] = None
 ) -> Tuple[str, Optional[str]]:
     generator_name = "OpenAI"
     if not context_documents:
@@ -104,17 +285,31 @@ async def run_openai_generation_step(
             messages=history, context_documents=context_documents, 
             dynamic_system_prompt=dynamic_system_prompt
         )
-        async for chunk in generator:
-            if isinstance(chunk, str) and chunk.strip().startswith("--- Error:"):
-                if not error_msg:
-                    error_msg = chunk.strip()
-                print(f"OpenAI stream yielded error: {chunk.strip()}")
-                break
-            if isinstance(chunk, str):
-                full_response.append(chunk)
-                stream_callback(chunk)
+
+        async def consume_stream():
+            nonlocal error_msg
+            async for chunk in generator:
+                if isinstance(chunk, str) and chunk.strip().startswith("--- Error:"):
+                    if not error_msg:
+                        error_msg = chunk.strip()
+                    print(f"OpenAI stream yielded error: {chunk.strip()}")
+                    break
+                if isinstance(chunk, str):
+                    full_response.append(chunk)
+                    stream_callback(chunk)
+
+        try:
+            await asyncio.wait_for(consume_stream(), deadline.stage_timeout("generation") if deadline else None)
+        except asyncio.TimeoutError:
+            # Keep what was streamed so far as a partial answer
+            deadline.mark_exceeded("generation")
+            update_status(get_text("generation_budget_exhausted").format(f"{time.time() - start_gen_time:.2f}"))
+        finally:
+            # Closes the underlying API stream so an abandoned answer stops being generated
+            await generator.aclose()
         final_response_text = "".join(full_response)
         gen_time = time.time() - start_gen_time
+        metrics.observe("rag_stage_seconds", gen_time, stage="generation")
         if error_msg:
             update_status(get_text("generation_error").format(generator_name, f"{gen_time:.2f}"))
             return final_response_text, error_msg
@@ -128,11 +323,85 @@ async def run_openai_generation_step(
         traceback.print_exc()
         return "", error_msg_critical
 
+def serve_cached_answer(hit: Dict[str, Any], status_callback: StatusCallback,
+                        stream_callback: Callable[[str], None]) -> Dict[str, Any]:
+    """
+    Build the pipeline result for an answer found in the answer cache.
+
+    Args:
+        hit (Dict[str, Any]): Result of services.answer_cache.lookup, or a warm entry
+            matched as "warm"
+        status_callback (StatusCallback): Status update callback function
+        stream_callback (Callable[[str], None]): Receives the whole answer as one chunk
+
+    Returns:
+        Dict[str, Any]: The cached result, with `cached` describing the match
+    """
+    entry = hit["entry"]
+    age_minutes = (time.time() - entry["created_at"]) / 60
+    if hit["match"] == "warm":
+        message = get_text("warm_answer_hit").format(f"{age_minutes:.0f}")
+    else:
+        message = get_text("answer_cache_hit").format(f"{hit['similarity']:.3f}", f"{age_minutes:.0f}")
+    print(f"Status Update: {message}")
+    status_callback(message)
+    result: Dict[str, Any] = {**entry["result"], "status_log": [message], "error": None, "deadline_exceeded": []}
+    result["cached"] = {"match": hit["match"], "similarity": round(hit["similarity"], 4),
+                        "query": entry["query"], "age_seconds": round(age_minutes * 60)}
+    stream_callback(result["final_response"])
+    return result
+
 @traceable(name="rag-execute-validate-generate-gpt4o-pipeline")
 async def execute_validate_generate_pipeline(
     history: List[Dict], params: Dict[str, Any],
     status_callback: StatusCallback, stream_callback: Callable[[str], None],
-    dynamic_system_prompt: Optional[str] = None
+    dynamic_system_prompt: Optional[str] = None, deadline: Optional[Deadline] = None,
+    prefetched_documents: Optional[List[Dict]] = None
+) -> Dict[str, Any]:
+    """
+    Answer the latest user message: from a warm entry of an example question or from
+    the answer cache when a near-identical first question was answered recently,
+    otherwise by retrieval, validation and generation. `prefetched_documents` (already
+    validated) skip retrieval and validation.
+    """
+    deadline = deadline or Deadline.from_config(params)
+    start_time = time.perf_counter()
+    warm = warmup.lookup(history, params, dynamic_system_prompt)
+    if warm is not None:
+        if warm["result"] is not None:
+            result = serve_cached_answer({"entry": warm, "similarity": 1.0, "match": "warm"},
+                                         status_callback, stream_callback)
+            metrics.observe("rag_request_seconds", time.perf_counter() - start_time, pipeline="Warm answer", outcome="ok")
+            return result
+        prefetched_documents = warm["validated_documents"]
+    cache_key = answer_cache.request_key(history, params, dynamic_system_prompt)
+    if cache_key is not None and prefetched_documents is None:
+        hit = await answer_cache.lookup(cache_key, deadline)
+        if hit is not None:
+            result = serve_cached_answer(hit, status_callback, stream_callback)
+            elapsed = time.perf_counter() - start_time
+            answer_cache.record_hit(hit, elapsed)
+            metrics.observe("rag_request_seconds", elapsed, pipeline="Answer cache", outcome="ok")
+            return result
+
+    with metrics.request_scope() as observations:
+        result = await _run_validate_generate_pipeline(
+            history, params, status_callback, stream_callback, dynamic_system_prompt, deadline,
+            query_embedding=cache_key["embedding"] if cache_key else None,
+            prefetched_documents=prefetched_documents
+        )
+        # Cited passages and their justifications are cached with the answer, so hits need no model call
+        await annotate_sources(result, history[-1].get("content", "") if history else "")
+    if cache_key is not None:
+        answer_cache.store(cache_key, result, time.perf_counter() - start_time, metrics.scope_cost(observations))
+    return result
+
+async def _run_validate_generate_pipeline(
+    history: List[Dict], params: Dict[str, Any],
+    status_callback: StatusCallback, stream_callback: Callable[[str], None],
+    dynamic_system_prompt: Optional[str], deadline: Deadline,
+    query_embedding: Optional[List[float]] = None,
+    prefetched_documents: Optional[List[Dict]] = None
 ) -> Dict[str, Any]:
     result: Dict[str, Any] = {
         "final_response": "",
@@ -143,12 +412,25 @@ async def execute_validate_generate_pipeline(
         "pipeline_used": PIPELINE_VALIDATE_GENERATE_GPT4O
     }
     status_log_internal: List[str] = []
+    pipeline_start_time = time.time()
 
     def update_status_and_log(message: str):
         print(f"Status Update: {message}")
         status_log_internal.append(message)
         status_callback(message)
 
+    def finish() -> Dict[str, Any]:
+        result["status_log"] = status_log_internal
+        result["deadline_exceeded"] = list(deadline.exceeded)
+        elapsed = time.time() - pipeline_start_time
+        metrics.observe("rag_request_seconds", elapsed,
+                        pipeline=result["pipeline_used"], outcome="error" if result["error"] else "ok")
+        if result.get("fast_path"):
+            metrics.observe("rag_fast_path_request_seconds", elapsed,
+                            route=result["fast_path"]["route"], mode=result["fast_path"]["mode"])
+        cassette.record_request(current_query_text, params, elapsed, result["error"])
+        return result
+
     current_query_text = ""
     if history and isinstance(history, list):
         for msg_ in reversed(history):
@@ -158,33 +440,48 @@ async def execute_validate_generate_pipeline(
     if not current_query_text:
         result["error"] = get_text("error")
         result["final_response"] = f"<div class='rtl-text'>{result['error']}</div>"
-        result["status_log"] = status_log_internal
-        return result
+        return finish()
 
     try:
         # Extract original query for search if present
         original_query = params.get('original_query')
         
-        # 1. Retrieval
-        retrieved_docs = await run_retrieval_step(
-            current_query_text, params['n_retrieve'], update_status_and_log, original_query
-        )
-        if not retrieved_docs:
-            result["error"] = get_text("no_docs_found")
-            result["final_response"] = f"<div class='rtl-text'>{result['error']}</div>"
-            result["status_log"] = status_log_internal
-            return result
+        if prefetched_documents is not None:
+            # 1.-2. Documents retrieved and validated ahead of time (warm example questions)
+            update_status_and_log(get_text("warm_documents_used").format(len(prefetched_documents)))
+            validated_docs_full = [dict(doc) for doc in prefetched_documents]
+        else:
+            # 1. Retrieval
+            retrieved_docs = await run_retrieval_step(
+                current_query_text, params['n_retrieve'], update_status_and_log, original_query, deadline,
+                query_embedding=query_embedding, sources=params.get('sources')
+            )
+            if not retrieved_docs:
+                result["error"] = get_text("no_docs_found")
+                result["final_response"] = f"<div class='rtl-text'>{result['error']}</div>"
+                return finish()
 
-        # 2. Validation
-        validated_docs_full = await run_gpt4o_validation_filter_step(
-            retrieved_docs, current_query_text, params['n_validate'], update_status_and_log
-        )
+            # 2. Validation, as much of it as the fast path judges the query to need
+            fast_path_decision = fast_path.decide(retrieved_docs, original_query or current_query_text,
+                                                  params['n_validate'])
+            if fast_path_decision is not None:
+                result["fast_path"] = fast_path_decision
+                if fast_path_decision["mode"] == "on" and fast_path_decision["route"] == "direct":
+                    result["pipeline_used"] = PIPELINE_FAST_PATH_DIRECT
+            with metrics.request_scope() as validation_observations:
+                validated_docs_full = await run_fast_path_validation_step(
+                    retrieved_docs, current_query_text, params['n_validate'], fast_path_decision,
+                    update_status_and_log, deadline
+                )
+            metrics.observe("rag_validations_per_request",
+                            sum(1 for name, _labels, _value in validation_observations if name == "rag_validation_seconds"),
+                            buckets=metrics.RATE_BUCKETS, filtered=facets.filter_label(params.get('sources')))
         result["validated_documents_full"] = validated_docs_full
         if not validated_docs_full:
             result["error"] = get_text("no_relevant_passages")
             result["final_response"] = f"<div class='rtl-text'>{result['error']}</div>"
             update_status_and_log(f"4. {result['error']} {get_text('generation_critical_error')}")
-            return result
+            return finish()
 
         # --- Simplify Docs for Generation ---
         simplified_docs_for_generation: List[Dict[str, Any]] = []
@@ -202,9 +499,22 @@ async def execute_validate_generate_pipeline(
                         simplified_doc['source_name'] = doc.get('source_name')
                     if validation is not None:
                         simplified_doc['validation_result'] = validation  # include judgment
+                    if doc.get('quote_match') is not None:
+                        simplified_doc['quote_match'] = doc['quote_match']
+                    if doc.get('expanded_from') is not None:
+                        simplified_doc['expanded_from'] = doc['expanded_from']
                     simplified_docs_for_generation.append(simplified_doc)
             else:
                 print(f"Warn: Skipping non-dict item: {doc}")
+        context_count, remaining_budget = cost_accounting.plan_generation(
+            simplified_docs_for_generation, history, dynamic_system_prompt or config.OPENAI_SYSTEM_PROMPT
+        )
+        if context_count < len(simplified_docs_for_generation):
+            metrics.inc("rag_budget_reductions_total", stage="generation")
+            update_status_and_log(get_text("budget_context_reduced").format(
+                context_count, len(simplified_docs_for_generation), f"{remaining_budget:.4f}"
+            ))
+            simplified_docs_for_generation = simplified_docs_for_generation[:context_count]
         result["generator_input_documents"] = simplified_docs_for_generation
         print(f"Processor: Created {len(simplified_docs_for_generation)} simplified docs with validation results.")
 
@@ -214,10 +524,17 @@ async def execute_validate_generate_pipeline(
             context_documents=simplified_docs_for_generation,
             update_status=update_status_and_log,
             stream_callback=stream_callback,
-            dynamic_system_prompt=dynamic_system_prompt
+            dynamic_system_prompt=dynamic_system_prompt,
+            deadline=deadline
         )
         result["final_response"] = final_response_text
         result["error"] = generation_error
+        if "generation" in deadline.exceeded:
+            if final_response_text.strip():
+                result["final_response"] += f"\n\n*{get_text('answer_incomplete')}*"
+            else:
+                result["error"] = get_text("request_timeout")
+                result["final_response"] = f"<div class='rtl-text'>{result['error']}</div>"
 
         if generation_error and not result["final_response"].strip().startswith(("<div", get_text("no_sources_for_response"))):
             result["final_response"] = (
@@ -239,5 +556,65 @@ async def execute_validate_generate_pipeline(
         )
         update_status_and_log(f"{get_text('critical_error')}: {error_type}")
 
-    result["status_log"] = status_log_internal
+    return finish()
+
+@traceable(name="rag-execute-retrieval-only-pipeline")
+async def execute_retrieval_only_pipeline(
+    history: List[Dict], params: Dict[str, Any],
+    status_callback: StatusCallback, stream_callback: Optional[Callable[[str], None]] = None,
+    deadline: Optional[Deadline] = None
+) -> Dict[str, Any]:
+    """
+    Find passages for the latest user message without any LLM call: embedding and
+    retrieval of config.SEARCH_CANDIDATES paragraphs, local re-ranking, and the top
+    `params["n_results"]` returned as `generator_input_documents` with the query terms
+    to highlight under `search_terms`.
+    """
+    from services.retriever import get_retriever_status
+
+    deadline = deadline or Deadline.from_config(params)
+    start_time = time.perf_counter()
+    status_log: List[str] = []
+    result: Dict[str, Any] = {
+        "final_response": "",
+        "validated_documents_full": [],
+        "generator_input_documents": [],
+        "search_terms": [],
+        "status_log": status_log,
+        "error": None,
+        "pipeline_used": PIPELINE_RETRIEVAL_ONLY
+    }
+
+    def update_status_and_log(message: str):
+        status_log.append(message)
+        status_callback(message)
+
+    query = next((str(m.get("content") or "") for m in reversed(history or [])
+                  if isinstance(m, dict) and m.get("role") == "user"), "")
+    search_query = params.get("original_query") or query
+    retriever_ready, _ = get_retriever_status()
+    openai_ready, _ = openai_service.get_openai_status()
+    if not query:
+        result["error"] = get_text("error")
+    elif not (retriever_ready and openai_ready):
+        result["error"] = get_text("retriever_error" if not retriever_ready else "openai_error")
+    if result["error"]:
+        result["final_response"] = f"<div class='rtl-text'>{result['error']}</div>"
+        metrics.observe("rag_request_seconds", time.perf_counter() - start_time, pipeline=PIPELINE_RETRIEVAL_ONLY,
+                        outcome="error")
+        return result
+
+    n_results = int(params.get("n_results") or config.SEARCH_RESULTS)
+    docs = await run_retrieval_step(query, max(n_results, config.SEARCH_CANDIDATES), update_status_and_log,
+                                    search_query, deadline, sources=params.get("sources"))
+    # Quoted paragraphs stay first; only what the cards and the API show is kept (the results go into the session history)
+    quoted = [doc for doc in docs if doc.get("quote_match") is not None]
+    ordered = quoted + search.rerank_documents([doc for doc in docs if doc.get("quote_match") is None], search_query)
+    ranked = [{key: doc[key] for key in search.RESULT_FIELDS if key in doc} for doc in ordered[:n_results]]
+    result["generator_input_documents"] = ranked
+    result["search_terms"] = search.query_terms(search_query)
+    elapsed = time.perf_counter() - start_time
+    update_status_and_log(get_text("search_complete").format(len(ranked), f"{elapsed:.2f}"))
+    result["final_response"] = f"<div class='rtl-text'>{get_text('search_results_found').format(len(ranked), f'{elapsed:.2f}')}</div>"
+    metrics.observe("rag_request_seconds", elapsed, pipeline=PIPELINE_RETRIEVAL_ONLY, outcome="ok")
     return result
@@ -0,0 +1,298 @@
+# services/answer_cache.py
+"""
+Semantic cache of final answers for near-duplicate questions.
+
+An entry stores a first-turn question's answer and sources, keyed by a fingerprint
+of everything else that shapes the answer (prompts, models, retrieval and
+validation counts, language, template) plus the question itself. A new question
+with the same fingerprint is served from the cache when its normalized text
+matches a cached question exactly (no API call at all) or when the cosine
+similarity of its embedding to a cached question's reaches
+`config.ANSWER_CACHE_SIMILARITY`. Entries expire after `ANSWER_CACHE_TTL_SECONDS`
+and the least recently used ones are evicted beyond `ANSWER_CACHE_MAX_ENTRIES`.
+
+Follow-up questions are never cached: their answers depend on the conversation.
+"""
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import config
+from utils import get_embedding, metrics
+from utils.hebrew_normalize import normalize_hebrew
+
+# Result fields kept in an entry; the rest (status log, deadline info) belongs to the original run
+# Cited ids (and the justifications filled into the documents) come along, so a hit makes no model call
+CACHED_FIELDS = ("final_response", "validated_documents_full", "generator_input_documents", "pipeline_used", "cited_ids")
+
+
+class AnswerCache:
+    """Bounded, expiring map from (fingerprint, question) to a pipeline result."""
+
+    def __init__(self, max_entries: int = 500, ttl_seconds: float = 86400.0, similarity: float = 0.95):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity = similarity
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()  # Least recently used first
+        self._lock = threading.Lock()
+
+    def _alive(self, entry: Dict[str, Any], now: float) -> bool:
+        return now - entry["created_at"] <= self.ttl_seconds
+
+    def _touch(self, entry_id: str) -> Dict[str, Any]:
+        self._entries.move_to_end(entry_id)
+        entry = self._entries[entry_id]
+        entry["hits"] += 1
+        return entry
+
+    def lookup_text(self, fingerprint: str, normalized_query: str) -> Optional[Dict[str, Any]]:
+        """Returns the live entry for exactly this normalized question, if any."""
+        entry_id = _entry_id(fingerprint, normalized_query)
+        with self._lock:
+            entry = self._entries.get(entry_id)
+            if entry is None:
+                return None
+            if not self._alive(entry, time.time()):
+                del self._entries[entry_id]
+                return None
+            return self._touch(entry_id)
+
+    def lookup_embedding(self, fingerprint: str, embedding: List[float]) -> Optional[Tuple[Dict[str, Any], float]]:
+        """Returns the most similar live entry and its cosine similarity, if it reaches the threshold."""
+        import numpy as np
+
+        query = _unit(embedding)
+        now = time.time()
+        with self._lock:
+            candidates = [(entry_id, entry) for entry_id, entry in self._entries.items()
+                          if entry["fingerprint"] == fingerprint and entry["embedding"] is not None
+                          and self._alive(entry, now)]
+            if not candidates:
+                return None
+            similarities = np.stack([entry["embedding"] for _, entry in candidates]) @ query
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            if similarity < self.similarity:
+                return None
+            return self._touch(candidates[best][0]), similarity
+
+    def store(self, fingerprint: str, query: str, normalized_query: str, embedding: Optional[List[float]],
+              result: Dict[str, Any], latency: float, cost: float) -> None:
+        """Adds (or replaces) the entry of a question, evicting expired and least recently used entries."""
+        entry_id = _entry_id(fingerprint, normalized_query)
+        entry = {
+            "fingerprint": fingerprint,
+            "query": query,
+            "embedding": _unit(embedding) if embedding else None,
+            "result": {field: result.get(field) for field in CACHED_FIELDS},
+            "created_at": time.time(),
+            "latency": latency,
+            "cost": cost,
+            "hits": 0,
+        }
+        with self._lock:
+            self._entries.pop(entry_id, None)
+            self._entries[entry_id] = entry
+            now = time.time()
+            for stale_id in [i for i, e in self._entries.items() if not self._alive(e, now)]:
+                del self._entries[stale_id]
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def purge(self) -> int:
+        """Drops every entry. Returns how many there were."""
+        with self._lock:
+            count = len(self._entries)
+            self._entries.clear()
+        print(f"Answer Cache: Purged {count} entries.")
+        return count
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def _unit(embedding: List[float]):
+    import numpy as np
+
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm else vector
+
+
+def _entry_id(fingerprint: str, normalized_query: str) -> str:
+    return hashlib.sha256(f"{fingerprint}\n{normalized_query}".encode("utf-8")).hexdigest()
+
+
+_cache: Optional[AnswerCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> AnswerCache:
+    """Returns the process-wide answer cache, configured from config.ANSWER_CACHE_*."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = AnswerCache(
+                max_entries=config.ANSWER_CACHE_MAX_ENTRIES,
+                ttl_seconds=config.ANSWER_CACHE_TTL_SECONDS,
+                similarity=config.ANSWER_CACHE_SIMILARITY,
+            )
+        return _cache
+
+
+def request_key(history: List[Dict], params: Dict[str, Any],
+                dynamic_system_prompt: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Builds the cache key of a pipeline request, or None when it must not be cached.
+
+    Args:
+        history: Message history of the request
+        params: RAG parameters (`original_query` is the question without its template;
+            `bypass_answer_cache` skips the cache)
+        dynamic_system_prompt: System prompt override of the request, if any
+
+    Returns:
+        Optional[Dict[str, Any]]: fingerprint, query (the text that is searched for),
+            normalized_query and embedding (filled in by `lookup`)
+    """
+    if not config.ANSWER_CACHE_ENABLED or params.get("bypass_answer_cache"):
+        return None
+    return build_key(history, params, dynamic_system_prompt)
+
+
+def build_key(history: List[Dict], params: Dict[str, Any],
+              dynamic_system_prompt: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Like `request_key`, regardless of the cache settings (also used for warm answers)."""
+    from i18n import get_current_language
+
+    turns = [m for m in history or [] if isinstance(m, dict)]
+    if len(turns) != 1 or turns[0].get("role") != "user":
+        return None
+    full_query = str(turns[0].get("content") or "")
+    query = params.get("original_query") or full_query
+    if not query.strip():
+        return None
+    shaping = {
+        "template": full_query.replace(query, "", 1) if params.get("original_query") else "",
+        "system_prompt": dynamic_system_prompt or config.OPENAI_SYSTEM_PROMPT,
+        "validation_prompt": config.VALIDATION_PROMPT_TEMPLATE,
+        "validation_mode": [config.VALIDATION_MODE, config.VALIDATION_LOGPROB_THRESHOLD, config.VALIDATION_CALIBRATION],
+        "validation_strategy": [config.VALIDATION_STRATEGY, config.CASCADE_SCREEN_MODEL, config.CASCADE_ACCEPT_SCORE,
+                                config.CASCADE_REJECT_SCORE],
+        "score_cutoff": [config.SCORE_CUTOFF_METHOD, config.SCORE_CUTOFF_MIN, config.SCORE_CUTOFF_MAX,
+                         config.SCORE_CUTOFF_FLOOR, config.SCORE_CUTOFF_GAP_RATIO, config.SCORE_CUTOFF_ELBOW_MIN,
+                         config.SCORE_CUTOFF_ZSCORE],
+        "fast_path": [config.FAST_PATH_MODE, config.FAST_PATH_TOP_K, config.FAST_PATH_MAX_TERMS,
+                      config.FAST_PATH_DIRECT_SCORE, config.FAST_PATH_DIRECT_MARGIN, config.FAST_PATH_DIRECT_COVERAGE,
+                      config.FAST_PATH_SAMPLE_SCORE, config.FAST_PATH_SAMPLE_SIZE, config.FAST_PATH_SAMPLE_MIN_PASS],
+        "quotes": [config.QUOTE_LOOKUP, config.QUOTE_MIN_WORDS, config.QUOTE_MIN_SHINGLES, config.QUOTE_MAX_PINNED],
+        "neighbors": [config.NEIGHBOR_EXPANSION_HITS, config.NEIGHBOR_EXPANSION_K, config.NEIGHBOR_MIN_SIMILARITY],
+        "hybrid": [config.HYBRID_RETRIEVAL, config.HYBRID_SPARSE_RESULTS, config.HYBRID_RRF_K, config.HYBRID_SPARSE_WEIGHT],
+        "models": [config.EMBEDDING_MODEL, config.OPENAI_VALIDATION_MODEL, config.OPENAI_GENERATION_MODEL],
+        "index": config.PINECONE_INDEX_NAME,
+        "shards": [config.PINECONE_NAMESPACE, config.RETRIEVAL_SHARDS, config.RETRIEVAL_MAIN_QUOTA,
+                   config.RETRIEVAL_SCORE_NORMALIZATION],
+        "n_retrieve": params.get("n_retrieve"),
+        "n_validate": params.get("n_validate"),
+        "sources": sorted(params.get("sources") or []),
+        "language": get_current_language(),
+    }
+    fingerprint = hashlib.sha256(json.dumps(shaping, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+    return {"fingerprint": fingerprint, "query": query, "normalized_query": normalize_hebrew(query), "embedding": None}
+
+
+async def lookup(key: Dict[str, Any], deadline=None) -> Optional[Dict[str, Any]]:
+    """
+    Finds a cached answer for a request: exact normalized text first, then embedding similarity.
+
+    The query embedding computed here is kept in `key["embedding"]` so retrieval can reuse it.
+
+    Args:
+        key: Result of `request_key`
+        deadline: Optional pipeline.deadline.Deadline bounding the embedding call
+
+    Returns:
+        Optional[Dict[str, Any]]: entry, similarity and match ("exact" or "semantic"), or None
+    """
+    cache = get_cache()
+    entry = cache.lookup_text(key["fingerprint"], key["normalized_query"])
+    if entry is not None:
+        metrics.inc("rag_answer_cache_lookups_total", outcome="exact")
+        return {"entry": entry, "similarity": 1.0, "match": "exact"}
+    # Needed for retrieval (and for storing the answer) anyway, so never an extra call
+    try:
+        key["embedding"] = await asyncio.wait_for(get_embedding(key["query"]),
+                                                  deadline.stage_timeout("embedding") if deadline else None)
+    except asyncio.TimeoutError:
+        key["embedding"] = None
+    if key["embedding"]:
+        found = cache.lookup_embedding(key["fingerprint"], key["embedding"])
+        if found is not None:
+            metrics.inc("rag_answer_cache_lookups_total", outcome="semantic")
+            return {"entry": found[0], "similarity": found[1], "match": "semantic"}
+    metrics.inc("rag_answer_cache_lookups_total", outcome="miss")
+    return None
+
+
+def record_hit(hit: Dict[str, Any], latency: float) -> None:
+    """Counts the time and API cost a cache hit saved compared to the run that produced the entry."""
+    entry = hit["entry"]
+    metrics.inc("rag_answer_cache_saved_seconds_total", max(0.0, entry["latency"] - latency))
+    if entry["cost"]:
+        metrics.inc("rag_answer_cache_saved_usd_total", entry["cost"])
+
+
+def store(key: Dict[str, Any], result: Dict[str, Any], latency: float, cost: float) -> bool:
+    """
+    Caches a pipeline result if it is a complete answer.
+
+    Returns:
+        bool: Whether the result was stored
+    """
+    if result.get("error") or result.get("deadline_exceeded") or not (result.get("final_response") or "").strip():
+        return False
+    get_cache().store(key["fingerprint"], key["query"], key["normalized_query"], key["embedding"],
+                      result, latency, cost)
+    return True
+
+
+def purge() -> int:
+    return get_cache().purge()
+
+
+def stats() -> Dict[str, Any]:
+    """Entry count and the hit, latency and cost counters since start."""
+    lookups = {outcome: metrics.registry.counter_value("rag_answer_cache_lookups_total", outcome=outcome)
+               for outcome in ("exact", "semantic", "miss")}
+    total = sum(lookups.values())
+    return {
+        "entries": len(get_cache()),
+        "lookups": lookups,
+        "hit_rate": round((lookups["exact"] + lookups["semantic"]) / total, 4) if total else 0.0,
+        "saved_seconds": round(metrics.registry.counter_value("rag_answer_cache_saved_seconds_total"), 3),
+        "saved_usd": round(metrics.registry.counter_value("rag_answer_cache_saved_usd_total"), 6),
+    }
+
+
+def _route(_query: Dict[str, List[str]]) -> Tuple[int, str, str]:
+    # GET /answer-cache reports stats
+    return 200, "application/json", json.dumps(stats(), ensure_ascii=False)
+
+
+def _purge_route(_query: Dict[str, List[str]]) -> Tuple[int, str, str]:
+    # POST /answer-cache/purge empties the cache and reports the stats after it
+    purge()
+    return 200, "application/json", json.dumps(stats(), ensure_ascii=False)
+
+
+metrics.register_route("/answer-cache", _route)
+metrics.register_route("/answer-cache/purge", _purge_route, method="POST")
+metrics.register_gauge_callback(lambda: {"rag_answer_cache_entries": len(get_cache())})
+metrics.registry.describe("rag_answer_cache_lookups_total", "Answer cache lookups by outcome (exact, semantic or miss).")
+metrics.registry.describe("rag_answer_cache_saved_seconds_total", "Pipeline time saved by answers served from the cache.")
+metrics.registry.describe("rag_answer_cache_saved_usd_total", "Estimated API cost saved by answers served from the cache.")
+metrics.registry.describe("rag_answer_cache_entries", "Answers currently cached.")
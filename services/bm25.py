@@ -0,0 +1,443 @@
+# services/bm25.py
+"""
+Local BM25 index over the whole corpus, for hybrid dense + sparse retrieval.
+
+Dense search misses passages that share only rare terms or names with a question.
+This index finds them: every paragraph's Hebrew and English text is split into
+`utils.hebrew_normalize.index_terms` (no niqqud, cantillation or gershayim, final
+letters folded, attached prefixes stripped) and scored with BM25.
+
+Layout (a directory at `config.BM25_INDEX_PATH`, arrays memory-mapped on load):
+
+- Documents are numbered in blocks of BLOCK_SIZE. A term's postings are grouped
+  by block and stored as two uint8 arrays: the document's offset inside its block
+  and its BM25 weight quantized to 1-255 (2 bytes a posting instead of 8).
+- Per term and block the directory keeps the block number, where its postings
+  start and the block's largest weight.
+- Per document the number of its `source_name` (uint32; the names in
+  `sources.json`), for source filters: a query restricted to some sources scores
+  only their documents and skips blocks holding none of them.
+
+Queries use block-max pruning: the blocks are visited in order of the sum of the
+query terms' block maxima, an upper bound of any score inside the block, and the
+search stops once no remaining block can beat the current k-th best score.
+
+Build the index from a JSON-lines export of the corpus or from the Pinecone index:
+
+    python -m services.bm25 build --corpus corpus.jsonl
+    python -m services.bm25 build --from-pinecone
+    python -m services.bm25 search "הלכות שבת"
+"""
+import os
+import json
+import math
+import time
+import shutil
+import argparse
+import threading
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import config
+from utils import metrics
+from utils.hebrew_normalize import index_terms
+from services import registry
+
+FORMAT_NAME = "rag-bm25"
+FORMAT_VERSION = 1
+BLOCK_SIZE = 256  # Documents per block; offsets inside a block fit in a uint8
+_BATCH_BLOCKS = 8  # Blocks scored together between threshold checks
+_MAX_SOURCE_MASKS = 64  # Source-filter bitmaps kept per loaded index
+_ARRAYS = ("term_blocks", "block_ids", "block_max", "block_starts", "postings_doc", "postings_weight")
+
+# --- Globals ---
+bm25_index: Optional["BM25Index"] = None
+is_bm25_ready: bool = False
+bm25_status_message: str = "BM25 index not loaded."
+
+
+class BM25Index:
+    """A BM25 index loaded from disk (see the module docstring for the layout)."""
+
+    def __init__(self, path: str):
+        import numpy as np
+
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta.get("format") != FORMAT_NAME or self.meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Not a {FORMAT_NAME} v{FORMAT_VERSION} index: {path}")
+        with open(os.path.join(path, "terms.json"), encoding="utf-8") as f:
+            self.term_ids: Dict[str, int] = json.load(f)
+        with open(os.path.join(path, "documents.json"), encoding="utf-8") as f:
+            self.doc_ids: List[str] = json.load(f)
+        for name in _ARRAYS:
+            setattr(self, name, np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r"))
+        self.path = path
+        self.version = self.meta["built_at"]
+        self.block_count = (len(self.doc_ids) + BLOCK_SIZE - 1) // BLOCK_SIZE
+        # Indexes built before source filters have no per-document sources
+        self.doc_sources = None
+        self.source_codes: Dict[str, int] = {}
+        if os.path.exists(os.path.join(path, "doc_sources.npy")):
+            self.doc_sources = np.load(os.path.join(path, "doc_sources.npy"), mmap_mode="r")
+            with open(os.path.join(path, "sources.json"), encoding="utf-8") as f:
+                self.source_codes = {name: code for code, name in enumerate(json.load(f))}
+        self._source_masks: Dict[Tuple[str, ...], Any] = {}
+
+    def source_mask(self, sources: List[str]):
+        """
+        The bitmap of the documents from `sources`, one row of BLOCK_SIZE per block.
+
+        Returns:
+            Optional[np.ndarray]: Boolean array (blocks x BLOCK_SIZE), or None if the index has no sources
+        """
+        import numpy as np
+
+        if self.doc_sources is None:
+            return None
+        key = tuple(sorted(sources))
+        mask = self._source_masks.get(key)
+        if mask is None:
+            codes = [self.source_codes[name] for name in key if name in self.source_codes]
+            mask = np.zeros(self.block_count * BLOCK_SIZE, dtype=bool)
+            mask[:len(self.doc_ids)] = np.isin(self.doc_sources, codes)
+            mask = mask.reshape(self.block_count, BLOCK_SIZE)
+            if len(self._source_masks) >= _MAX_SOURCE_MASKS:
+                self._source_masks.clear()
+            self._source_masks[key] = mask
+        return mask
+
+    def search(self, query: str, k: int, sources: Optional[List[str]] = None) -> List[Tuple[str, float]]:
+        """
+        The top `k` documents for a query by BM25 (with quantized weights).
+
+        Args:
+            query (str): Query text
+            k (int): Number of results
+            sources (List[str], optional): Only documents from these sources
+
+        Returns:
+            List[Tuple[str, float]]: (document id, score) pairs, best first
+        """
+        import numpy as np
+
+        counts = Counter(term for term in index_terms(query) if term in self.term_ids)
+        if not counts or k <= 0:
+            return []
+        mask = self.source_mask(sources) if sources else None
+        if sources and mask is None:
+            print("BM25: Index has no document sources (rebuild it); skipping the source-filtered search.")
+            return []
+        # Upper bound of every block: the sum of the query terms' largest weights in it
+        bounds = np.zeros(self.block_count, dtype=np.int64)
+        term_lists = []
+        for term, query_tf in counts.items():
+            term_id = self.term_ids[term]
+            low, high = int(self.term_blocks[term_id]), int(self.term_blocks[term_id + 1])
+            blocks = np.asarray(self.block_ids[low:high], dtype=np.int64)
+            bounds[blocks] += np.asarray(self.block_max[low:high], dtype=np.int64) * query_tf
+            term_lists.append((low, blocks, query_tf))
+        if mask is not None:
+            bounds[~mask.any(axis=1)] = 0
+        order = np.argsort(-bounds, kind="stable")
+        order = order[bounds[order] > 0]
+
+        best_docs = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.int64)
+        threshold = 0
+        blocks_scored = 0
+        for start in range(0, len(order), _BATCH_BLOCKS):
+            batch = order[start:start + _BATCH_BLOCKS]
+            if len(best_docs) >= k:
+                # No remaining block can beat the k-th best score
+                batch = batch[bounds[batch] > threshold]
+                if not len(batch):
+                    break
+            batch = np.sort(batch)
+            scores = np.zeros((len(batch), BLOCK_SIZE), dtype=np.int64)
+            for low, blocks, query_tf in term_lists:
+                found = np.flatnonzero(np.isin(blocks, batch))
+                if not len(found):
+                    continue
+                starts = np.asarray(self.block_starts[low + found], dtype=np.int64)
+                ends = np.asarray(self.block_starts[low + found + 1], dtype=np.int64)
+                positions = _concat_ranges(starts, ends)
+                rows = np.repeat(np.searchsorted(batch, blocks[found]), ends - starts)
+                weights = np.asarray(self.postings_weight[positions], dtype=np.int64) * query_tf
+                np.add.at(scores, (rows, np.asarray(self.postings_doc[positions], dtype=np.int64)), weights)
+            if mask is not None:
+                scores *= mask[batch]
+            blocks_scored += len(batch)
+            flat = scores.ravel()
+            hits = np.flatnonzero(flat)
+            docs = batch[hits // BLOCK_SIZE] * BLOCK_SIZE + hits % BLOCK_SIZE
+            best_docs = np.concatenate([best_docs, docs])
+            best_scores = np.concatenate([best_scores, flat[hits]])
+            if len(best_docs) > k:
+                keep = np.argpartition(-best_scores, k - 1)[:k]
+                best_docs, best_scores = best_docs[keep], best_scores[keep]
+            if len(best_docs) >= k:
+                threshold = int(best_scores.min())
+        metrics.observe("rag_bm25_blocks_scored_ratio", blocks_scored / len(order) if len(order) else 0.0,
+                        buckets=metrics.RATIO_BUCKETS)
+        ranked = np.lexsort((best_docs, -best_scores))
+        scale = self.meta["weight_scale"]
+        return [(self.doc_ids[int(best_docs[i])], round(float(best_scores[i]) * scale, 4)) for i in ranked]
+
+
+def _concat_ranges(starts, ends):
+    """The concatenation of range(start, end) for each pair, as one array."""
+    import numpy as np
+
+    lengths = ends - starts
+    total = int(lengths.sum())
+    if not total:
+        return np.empty(0, dtype=np.int64)
+    # Each position is its range's start plus its offset within the range
+    offsets = np.arange(total, dtype=np.int64) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(starts, lengths) + offsets
+
+
+# --- Building ---
+def build_index(documents: Iterable[Dict[str, Any]], path: str, k1: float = None, b: float = None) -> Dict[str, Any]:
+    """
+    Builds the index for a corpus and writes it to `path`, replacing any index there.
+
+    Args:
+        documents (Iterable[Dict[str, Any]]): Paragraphs with `original_id` (or `id`),
+            `hebrew_text` and optionally `english_text` and `source_name`
+        path (str): Index directory
+        k1 (float, optional): BM25 term frequency saturation; defaults to config.BM25_K1
+        b (float, optional): BM25 length normalization; defaults to config.BM25_B
+
+    Returns:
+        Dict[str, Any]: The index metadata
+    """
+    import numpy as np
+
+    k1 = config.BM25_K1 if k1 is None else k1
+    b = config.BM25_B if b is None else b
+    start = time.perf_counter()
+    doc_ids: List[str] = []
+    doc_sources: List[int] = []
+    source_codes: Dict[str, int] = {}
+    lengths: List[int] = []
+    postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+    for doc in documents:
+        doc_id = str(doc.get("original_id") or doc.get("id") or "")
+        if not doc_id:
+            continue
+        terms = Counter(index_terms(f"{doc.get('hebrew_text') or ''} {doc.get('english_text') or ''}"))
+        number = len(doc_ids)
+        doc_ids.append(doc_id)
+        doc_sources.append(source_codes.setdefault(str(doc.get("source_name") or ""), len(source_codes)))
+        lengths.append(sum(terms.values()))
+        for term, tf in terms.items():
+            postings[term].append((number, tf))
+    if not doc_ids:
+        raise ValueError("No documents to index")
+
+    doc_lengths = np.asarray(lengths, dtype=np.float64)
+    average_length = float(doc_lengths.mean()) or 1.0
+    length_norm = k1 * (1 - b + b * doc_lengths / average_length)
+    vocabulary = sorted(postings)
+    weights_by_term = []
+    for term in vocabulary:
+        entries = np.asarray(postings[term], dtype=np.int64)
+        df = len(entries)
+        idf = math.log(1 + (len(doc_ids) - df + 0.5) / (df + 0.5))
+        tf = entries[:, 1].astype(np.float64)
+        weights_by_term.append((entries[:, 0], idf * tf * (k1 + 1) / (tf + length_norm[entries[:, 0]])))
+    max_weight = max(float(weights.max()) for _docs, weights in weights_by_term)
+    weight_scale = max_weight / 255
+
+    term_blocks, block_ids, block_max, block_starts = [0], [], [], [0]
+    postings_doc, postings_weight = [], []
+    for docs, weights in weights_by_term:
+        quantized = np.clip(np.rint(weights / weight_scale), 1, 255).astype(np.uint8)
+        blocks = docs // BLOCK_SIZE
+        # Postings are in document order, so each block's postings are contiguous
+        boundaries = np.flatnonzero(np.diff(blocks)) + 1
+        for block_docs, block_weights in zip(np.split(docs, boundaries), np.split(quantized, boundaries)):
+            block_ids.append(int(block_docs[0]) // BLOCK_SIZE)
+            block_max.append(int(block_weights.max()))
+            block_starts.append(block_starts[-1] + len(block_docs))
+        postings_doc.append((docs % BLOCK_SIZE).astype(np.uint8))
+        postings_weight.append(quantized)
+        term_blocks.append(len(block_ids))
+
+    meta = {
+        "format": FORMAT_NAME, "version": FORMAT_VERSION, "built_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "documents": len(doc_ids), "terms": len(vocabulary), "postings": int(sum(len(d) for d in postings_doc)),
+        "average_length": round(average_length, 3), "k1": k1, "b": b, "block_size": BLOCK_SIZE,
+        "weight_scale": weight_scale,
+    }
+    arrays = {
+        "term_blocks": np.asarray(term_blocks, dtype=np.int64),
+        "block_ids": np.asarray(block_ids, dtype=np.uint32),
+        "block_max": np.asarray(block_max, dtype=np.uint8),
+        "block_starts": np.asarray(block_starts, dtype=np.int64),
+        "postings_doc": np.concatenate(postings_doc),
+        "postings_weight": np.concatenate(postings_weight),
+        "doc_sources": np.asarray(doc_sources, dtype=np.uint32),
+    }
+    # Written next to the index and swapped in, so a running app never reads half an index
+    staging = f"{path.rstrip(os.sep)}.building"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    for name, array in arrays.items():
+        np.save(os.path.join(staging, f"{name}.npy"), array)
+    with open(os.path.join(staging, "terms.json"), "w", encoding="utf-8") as f:
+        json.dump({term: i for i, term in enumerate(vocabulary)}, f, ensure_ascii=False)
+    with open(os.path.join(staging, "documents.json"), "w", encoding="utf-8") as f:
+        json.dump(doc_ids, f, ensure_ascii=False)
+    with open(os.path.join(staging, "sources.json"), "w", encoding="utf-8") as f:
+        json.dump(list(source_codes), f, ensure_ascii=False)
+    with open(os.path.join(staging, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    previous = f"{path.rstrip(os.sep)}.previous"
+    shutil.rmtree(previous, ignore_errors=True)
+    if os.path.exists(path):
+        os.replace(path, previous)
+    os.replace(staging, path)
+    shutil.rmtree(previous, ignore_errors=True)
+    meta["build_seconds"] = round(time.perf_counter() - start, 2)
+    return meta
+
+
+def read_corpus(path: str) -> Iterator[Dict[str, Any]]:
+    """Paragraphs from a JSON-lines file (one object per line) or a JSON array."""
+    with open(path, encoding="utf-8") as f:
+        if f.read(1) == "[":
+            f.seek(0)
+            yield from json.load(f)
+            return
+        f.seek(0)
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def export_pinecone(index, batch_size: int = 100) -> Iterator[Dict[str, Any]]:
+    """Paragraphs read from a Pinecone index by listing its vector ids and fetching their metadata."""
+    for ids in index.list():
+        for start in range(0, len(ids), batch_size):
+            response = index.fetch(ids=list(ids[start:start + batch_size]))
+            for vector_id, vector in response.vectors.items():
+                metadata = dict(vector.metadata or {})
+                yield {"original_id": metadata.get("original_id", vector_id), **metadata}
+
+
+# --- Loading ---
+def index_version() -> Optional[str]:
+    """When the index on disk was built, or None if there is none."""
+    try:
+        with open(os.path.join(config.BM25_INDEX_PATH, "meta.json"), encoding="utf-8") as f:
+            return json.load(f).get("built_at")
+    except (OSError, ValueError):
+        return None
+
+
+@registry.init_once("bm25")
+def init_bm25() -> Tuple[bool, str]:
+    """
+    Loads (memory-maps) the index at config.BM25_INDEX_PATH, or reloads it after a
+    rebuild. Without an index, hybrid retrieval is off and retrieval is dense only.
+    """
+    global bm25_index, is_bm25_ready, bm25_status_message
+    version = index_version()
+    if is_bm25_ready and bm25_index is not None and bm25_index.version == version:
+        return True, bm25_status_message
+    if version is None:
+        bm25_index, is_bm25_ready = None, False
+        bm25_status_message = f"No BM25 index at '{config.BM25_INDEX_PATH}'; retrieval is dense only."
+        return False, bm25_status_message
+    try:
+        start = time.perf_counter()
+        bm25_index = BM25Index(config.BM25_INDEX_PATH)
+        is_bm25_ready = True
+        bm25_status_message = (f"BM25 index loaded ({bm25_index.meta['documents']} paragraphs, "
+                               f"{bm25_index.meta['terms']} terms, built {version}).")
+        print(f"BM25: {bm25_status_message} ({time.perf_counter() - start:.2f}s)")
+    except Exception as e:
+        bm25_index, is_bm25_ready = None, False
+        bm25_status_message = f"Error loading BM25 index: {type(e).__name__} - {e}"
+        print(f"BM25: {bm25_status_message}")
+    return is_bm25_ready, bm25_status_message
+
+
+_check_lock = threading.Lock()
+_last_check = float("-inf")
+_RECHECK_SECONDS = 5.0
+
+
+def get_index() -> Optional[BM25Index]:
+    """The loaded index, checking the disk for a rebuilt one at most every few seconds. Blocking."""
+    global _last_check
+    if not config.HYBRID_RETRIEVAL:
+        return None
+    now = time.monotonic()
+    with _check_lock:
+        due = now - _last_check >= _RECHECK_SECONDS
+        if due:
+            _last_check = now
+    if due:
+        init_bm25()
+    return bm25_index
+
+
+def search(query: str, k: int, sources: Optional[List[str]] = None) -> List[Tuple[str, float]]:
+    """
+    BM25 search over the local index. Blocking.
+
+    Args:
+        query (str): Query text
+        k (int): Number of results
+        sources (List[str], optional): Only documents from these sources
+
+    Returns:
+        List[Tuple[str, float]]: (original id, score) pairs, best first; empty without an index
+    """
+    index = get_index()
+    if index is None:
+        return []
+    start = time.perf_counter()
+    results = index.search(query, k, sources)
+    metrics.observe("rag_bm25_query_seconds", time.perf_counter() - start)
+    return results
+
+
+metrics.registry.describe("rag_bm25_query_seconds", "Time of one BM25 query over the local index.")
+metrics.registry.describe("rag_bm25_blocks_scored_ratio", "Share of the candidate blocks a BM25 query scored before block-max pruning stopped it.")
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description="Build or query the local BM25 index.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="Build the index")
+    source = build.add_mutually_exclusive_group(required=True)
+    source.add_argument("--corpus", help="JSON-lines (or JSON array) file of paragraphs")
+    source.add_argument("--from-pinecone", action="store_true", help="Read the paragraphs from the Pinecone index")
+    build.add_argument("--output", default=None, help="Index directory (default: config.BM25_INDEX_PATH)")
+    query = commands.add_parser("search", help="Query the index")
+    query.add_argument("query")
+    query.add_argument("-k", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        if args.from_pinecone:
+            from pinecone import Pinecone
+            from utils import clean_api_key
+            index = Pinecone(api_key=clean_api_key(config.PINECONE_API_KEY)).Index(config.PINECONE_INDEX_NAME)
+            documents = export_pinecone(index)
+        else:
+            documents = read_corpus(args.corpus)
+        meta = build_index(documents, args.output or config.BM25_INDEX_PATH)
+        print(json.dumps(meta, indent=2))
+    else:
+        for rank, (doc_id, score) in enumerate(search(args.query, args.k), start=1):
+            print(f"{rank:3d}. {doc_id}  {score:.3f}")
+
+
+if __name__ == "__main__":
+    main()
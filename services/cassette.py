@@ -0,0 +1,467 @@
+# services/cassette.py
+"""
+Record-and-replay transport for OpenAI and Pinecone traffic.
+
+In `record` mode the OpenAI clients and the Pinecone index are wrapped so every
+call is appended to a cassette (gzip-compressed JSON lines) together with its
+observed latency; streamed generations keep the arrival offset of every chunk.
+In `replay` mode no network client is created at all: calls are answered from
+the cassette, sleeping for the recorded latency multiplied by
+`config.CASSETTE_REPLAY_SPEED` (0 replays instantly).
+
+Calls are matched on a hash of the full request. When the pipeline under test
+sends a request that was never recorded (e.g. a changed prompt), the
+`CASSETTE_REPLAY_MISS` policy decides: "error" raises, "nearest" serves the
+next recorded response of the same kind and model so latency and cost can
+still be compared.
+"""
+import os
+import gzip
+import atexit
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from collections import deque
+from types import SimpleNamespace
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+import config
+
+FORMAT_NAME = "rag-cassette"
+FORMAT_VERSION = 1
+
+
+class CassetteMissError(LookupError):
+    """A replayed call has no matching recording."""
+
+
+class CassetteReplayError(Exception):
+    """Re-raises an API error that was observed while recording."""
+
+    def __init__(self, error: Dict[str, Any]):
+        super().__init__(f"{error.get('type', 'Error')}: {error.get('message', '')}")
+        self.status_code = error.get("status_code")
+        self.recorded_type = error.get("type")
+
+
+# --- Helpers ---
+def _sha1(value: Any) -> str:
+    payload = json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def _to_plain(obj: Any) -> Any:
+    """Converts SDK response objects to JSON-compatible data."""
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump(mode="json", exclude_none=True)
+    if hasattr(obj, "to_dict"):
+        return obj.to_dict()
+    if isinstance(obj, SimpleNamespace):
+        return {k: _to_plain(v) for k, v in vars(obj).items()}
+    if isinstance(obj, dict):
+        return {k: _to_plain(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_to_plain(v) for v in obj]
+    return obj
+
+
+def _to_namespace(data: Any) -> Any:
+    """Turns recorded JSON back into attribute-accessible objects like the SDK responses."""
+    if isinstance(data, dict):
+        return SimpleNamespace(**{k: _to_namespace(v) for k, v in data.items()})
+    if isinstance(data, list):
+        return [_to_namespace(v) for v in data]
+    return data
+
+
+def classify_chat_request(kwargs: Dict[str, Any]) -> str:
+    """Maps a chat completion request to the pipeline call that issued it."""
+    if kwargs.get("logprobs"):
+        return "validation"  # Single-token yes/no validation
+    if not kwargs.get("response_format"):
+        return "generation"
+    text = " ".join(str(m.get("content", "")) for m in kwargs.get("messages", []))
+    return "validation" if "contains_relevant_info" in text else "citations"
+
+
+def _chat_key(kwargs: Dict[str, Any]) -> str:
+    request = {k: v for k, v in kwargs.items() if k not in ("stream", "stream_options")}
+    return _sha1(request)
+
+
+def _vector_digest(vector: List[float]) -> str:
+    # Rounded so float noise between runs of the same embedding does not change the key
+    return _sha1([round(v, 5) for v in vector])
+
+
+def _pinecone_key(kwargs: Dict[str, Any], index_name: Optional[str] = None) -> str:
+    request = {k: v for k, v in kwargs.items() if k != "vector"}
+    request["vector"] = _vector_digest(kwargs.get("vector") or [])
+    # Queries to the main index keep the keys they were recorded with before federated retrieval
+    if index_name:
+        request["index"] = index_name
+    return _sha1(request)
+
+
+def _error_record(e: Exception) -> Dict[str, Any]:
+    return {"type": type(e).__name__, "message": str(e)[:500], "status_code": getattr(e, "status_code", None)}
+
+
+# --- Cassette file ---
+class Cassette:
+    """An append-only, gzip-compressed JSON-lines file of recorded calls."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._writer = None
+        self._entries: Dict[str, Deque[Dict[str, Any]]] = {}
+        self._by_kind: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        self._kind_cursor: Dict[Tuple[str, str], int] = {}
+        self.misses = 0
+
+    # Recording
+    def append(self, entry: Dict[str, Any]) -> None:
+        line = (json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+        with self._lock:
+            if self._writer is None:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                self._writer = gzip.open(self.path, "ab")
+                # Without the gzip trailer the whole session would be unreadable in replay
+                atexit.register(self.close)
+                self._writer.write((json.dumps({"format": FORMAT_NAME, "version": FORMAT_VERSION,
+                                                "started": time.time()}) + "\n").encode("utf-8"))
+            self._writer.write(line)
+            self._writer.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+    # Replay
+    def load(self) -> int:
+        """
+        Reads all recorded entries into memory. Returns the number of entries.
+
+        A recording that was cut off (the process was killed before the cassette was
+        closed) keeps every entry read before the truncated part.
+        """
+        count = 0
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            try:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # Last line of a cut-off recording
+                    if entry.get("format") == FORMAT_NAME:
+                        continue  # Header of a recording session
+                    self._entries.setdefault(entry["key"], deque()).append(entry)
+                    self._by_kind.setdefault((entry["kind"], entry.get("model", "")), []).append(entry)
+                    count += 1
+            except (EOFError, gzip.BadGzipFile) as e:
+                print(f"Cassette: {self.path} is truncated after {count} entries ({type(e).__name__}); "
+                      f"using the entries read so far")
+        return count
+
+    def entries(self, kind: Optional[str] = None) -> List[Dict[str, Any]]:
+        """All loaded entries (optionally of one kind), in recorded order."""
+        found = [e for (k, _model), entries in self._by_kind.items() if kind in (None, k) for e in entries]
+        return sorted(found, key=lambda e: e.get("ts", 0))
+
+    def lookup(self, kind: str, model: str, key: str) -> Dict[str, Any]:
+        with self._lock:
+            matches = self._entries.get(key)
+            if matches:
+                entry = matches.popleft()
+                matches.append(entry)  # Identical repeated calls cycle through their recordings
+                return entry
+            self.misses += 1
+            candidates = self._by_kind.get((kind, model))
+            if config.CASSETTE_REPLAY_MISS != "nearest" or not candidates:
+                raise CassetteMissError(f"No recorded {kind} call for model '{model}' (key {key[:12]})")
+            cursor = self._kind_cursor.get((kind, model), 0)
+            self._kind_cursor[(kind, model)] = cursor + 1
+            return candidates[cursor % len(candidates)]
+
+
+async def _replay_delay(seconds: float) -> None:
+    if seconds > 0 and config.CASSETTE_REPLAY_SPEED > 0:
+        await asyncio.sleep(seconds * config.CASSETTE_REPLAY_SPEED)
+
+
+def _replay_result(entry: Dict[str, Any]) -> Any:
+    if entry.get("error"):
+        raise CassetteReplayError(entry["error"])
+    return _to_namespace(entry["response"])
+
+
+# --- Recording wrappers ---
+class _RecordingStream:
+    """Passes stream chunks through while recording their arrival offsets."""
+
+    def __init__(self, stream, cassette: Cassette, entry: Dict[str, Any], start: float):
+        self._stream = stream
+        self._cassette = cassette
+        self._entry = entry
+        self._start = start
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        chunks = []
+        try:
+            async for chunk in self._stream:
+                chunks.append([round(time.perf_counter() - self._start, 4), _to_plain(chunk)])
+                yield chunk
+        except Exception as e:
+            self._entry["error"] = _error_record(e)
+            raise
+        finally:
+            self._entry["latency"] = round(time.perf_counter() - self._start, 4)
+            self._entry["chunks"] = chunks
+            self._cassette.append(self._entry)
+
+
+class _RecordingChatCompletions:
+    def __init__(self, inner, cassette: Cassette):
+        self._inner = inner
+        self._cassette = cassette
+
+    async def create(self, **kwargs):
+        kind = classify_chat_request(kwargs)
+        entry: Dict[str, Any] = {"kind": kind, "model": kwargs.get("model", ""), "key": _chat_key(kwargs),
+                                 "ts": time.time(), "stream": bool(kwargs.get("stream"))}
+        if kind == "generation":
+            # Kept so a day's traffic can be re-run; other prompts are identified by hash only
+            entry["query"] = next((m.get("content") for m in reversed(kwargs.get("messages", []))
+                                   if m.get("role") == "user"), "")
+        start = time.perf_counter()
+        try:
+            response = await self._inner.create(**kwargs)
+        except Exception as e:
+            entry.update(latency=round(time.perf_counter() - start, 4), error=_error_record(e))
+            self._cassette.append(entry)
+            raise
+        if kwargs.get("stream"):
+            entry["first_byte"] = round(time.perf_counter() - start, 4)
+            return _RecordingStream(response, self._cassette, entry, start)
+        entry.update(latency=round(time.perf_counter() - start, 4), response=_to_plain(response))
+        self._cassette.append(entry)
+        return response
+
+
+class _RecordingEmbeddings:
+    def __init__(self, inner, cassette: Cassette):
+        self._inner = inner
+        self._cassette = cassette
+
+    async def create(self, **kwargs):
+        entry: Dict[str, Any] = {"kind": "embedding", "model": kwargs.get("model", ""), "key": _sha1(kwargs),
+                                 "ts": time.time(), "query": kwargs.get("input")}
+        start = time.perf_counter()
+        try:
+            response = await self._inner.create(**kwargs)
+        except Exception as e:
+            entry.update(latency=round(time.perf_counter() - start, 4), error=_error_record(e))
+            self._cassette.append(entry)
+            raise
+        entry.update(latency=round(time.perf_counter() - start, 4), response=_to_plain(response))
+        self._cassette.append(entry)
+        return response
+
+
+class RecordingOpenAIClient:
+    """Wraps an `openai.AsyncOpenAI` client and records chat and embedding calls."""
+
+    def __init__(self, inner, cassette: Cassette):
+        self._inner = inner
+        self.chat = SimpleNamespace(completions=_RecordingChatCompletions(inner.chat.completions, cassette))
+        self.embeddings = _RecordingEmbeddings(inner.embeddings, cassette)
+
+    def __getattr__(self, name):
+        return getattr(self._inner, name)
+
+
+class RecordingIndex:
+    """Wraps a `pinecone.Index` and records `query` calls."""
+
+    def __init__(self, inner, cassette: Cassette, index_name: Optional[str] = None):
+        self._inner = inner
+        self._cassette = cassette
+        self._index_name = index_name
+
+    def query(self, **kwargs):
+        entry: Dict[str, Any] = {"kind": "pinecone_query", "model": "", "key": _pinecone_key(kwargs, self._index_name),
+                                 "ts": time.time(), "top_k": kwargs.get("top_k")}
+        start = time.perf_counter()
+        try:
+            response = self._inner.query(**kwargs)
+        except Exception as e:
+            entry.update(latency=round(time.perf_counter() - start, 4), error=_error_record(e))
+            self._cassette.append(entry)
+            raise
+        matches = [{"id": m.id, "score": m.score, "metadata": dict(m.metadata or {})}
+                   for m in (response.matches or [])]
+        entry.update(latency=round(time.perf_counter() - start, 4), response={"matches": matches})
+        self._cassette.append(entry)
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self._inner, name)
+
+
+# --- Replay transport ---
+class _ReplayStream:
+    def __init__(self, entry: Dict[str, Any]):
+        self._entry = entry
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        elapsed = self._entry.get("first_byte", 0.0)
+        for offset, chunk in self._entry.get("chunks", []):
+            await _replay_delay(offset - elapsed)
+            elapsed = offset
+            yield _to_namespace(chunk)
+        if self._entry.get("error"):
+            raise CassetteReplayError(self._entry["error"])
+
+
+class _ReplayChatCompletions:
+    def __init__(self, cassette: Cassette):
+        self._cassette = cassette
+
+    async def create(self, **kwargs):
+        kind = classify_chat_request(kwargs)
+        entry = self._cassette.lookup(kind, kwargs.get("model", ""), _chat_key(kwargs))
+        if entry.get("stream") and kwargs.get("stream"):
+            await _replay_delay(entry.get("first_byte", 0.0))
+            return _ReplayStream(entry)
+        await _replay_delay(entry.get("latency", 0.0))
+        if entry.get("stream"):
+            # Recorded as a stream but requested without: join the streamed content
+            text = "".join((c.get("choices") or [{}])[0].get("delta", {}).get("content") or ""
+                           for _offset, c in entry.get("chunks", []))
+            usage = next((c["usage"] for _offset, c in entry.get("chunks", []) if c.get("usage")), None)
+            return _to_namespace({"choices": [{"message": {"content": text}}], "usage": usage})
+        return _replay_result(entry)
+
+
+class _ReplayEmbeddings:
+    def __init__(self, cassette: Cassette):
+        self._cassette = cassette
+
+    async def create(self, **kwargs):
+        entry = self._cassette.lookup("embedding", kwargs.get("model", ""), _sha1(kwargs))
+        await _replay_delay(entry.get("latency", 0.0))
+        return _replay_result(entry)
+
+
+class ReplayOpenAIClient:
+    """Serves chat and embedding calls from a cassette."""
+
+    def __init__(self, cassette: Cassette):
+        self.chat = SimpleNamespace(completions=_ReplayChatCompletions(cassette))
+        self.embeddings = _ReplayEmbeddings(cassette)
+
+
+class ReplayIndex:
+    """Serves Pinecone `query` calls from a cassette (blocking, like the real client)."""
+
+    def __init__(self, cassette: Cassette, index_name: Optional[str] = None):
+        self._cassette = cassette
+        self._index_name = index_name
+
+    def query(self, **kwargs):
+        entry = self._cassette.lookup("pinecone_query", "", _pinecone_key(kwargs, self._index_name))
+        if config.CASSETTE_REPLAY_SPEED > 0:
+            time.sleep(entry.get("latency", 0.0) * config.CASSETTE_REPLAY_SPEED)
+        if entry.get("error"):
+            raise CassetteReplayError(entry["error"])
+        # Match metadata stays a dict, as the retriever reads it with `.get`
+        matches = [SimpleNamespace(id=m["id"], score=m["score"], metadata=dict(m.get("metadata") or {}))
+                   for m in entry["response"]["matches"]]
+        return SimpleNamespace(matches=matches)
+
+    def describe_index_stats(self, **kwargs):
+        return SimpleNamespace(total_vector_count=len(self._cassette.entries("pinecone_query")))
+
+
+# --- Process-wide cassette ---
+_active_cassette: Optional[Cassette] = None
+_active_lock = threading.Lock()
+
+
+def get_mode() -> str:
+    return (config.CASSETTE_MODE or "off").lower()
+
+
+def get_cassette() -> Optional[Cassette]:
+    """Returns the process-wide cassette for the configured mode, opening it on first use."""
+    global _active_cassette
+    if get_mode() not in ("record", "replay"):
+        return None
+    with _active_lock:
+        if _active_cassette is None:
+            cassette = Cassette(config.CASSETTE_PATH)
+            if get_mode() == "replay":
+                try:
+                    print(f"Cassette: Loaded {cassette.load()} recorded calls from {config.CASSETTE_PATH}")
+                except (OSError, ValueError, EOFError) as e:
+                    # Every call will miss, which surfaces as an API error in the pipeline
+                    print(f"Cassette: Failed to load {config.CASSETTE_PATH}: {type(e).__name__} - {e}")
+            else:
+                print(f"Cassette: Recording API traffic to {config.CASSETTE_PATH}")
+            _active_cassette = cassette
+        return _active_cassette
+
+
+def replay_enabled() -> bool:
+    return get_mode() == "replay"
+
+
+def wrap_openai_client(create: Callable[[], Any]):
+    """
+    Returns the client to use for OpenAI calls under the configured cassette mode.
+
+    Args:
+        create: Builds the real `AsyncOpenAI` client; not called when replaying.
+    """
+    cassette = get_cassette()
+    if cassette is None:
+        return create()
+    if replay_enabled():
+        return ReplayOpenAIClient(cassette)
+    return RecordingOpenAIClient(create(), cassette)
+
+
+def wrap_pinecone_index(index, index_name: Optional[str] = None):
+    """
+    Returns the index to use for Pinecone queries under the configured cassette mode (`index` may be None when
+    replaying). `index_name` keeps the recorded queries of other indexes (federated shards) apart from the main one's.
+    """
+    cassette = get_cassette()
+    if cassette is None:
+        return index
+    if replay_enabled():
+        return ReplayIndex(cassette, index_name)
+    return RecordingIndex(index, cassette, index_name)
+
+
+def record_request(query: str, params: Dict[str, Any], latency: float, error: Optional[str]) -> None:
+    """Records one end-to-end pipeline run so the traffic can be re-run later."""
+    cassette = get_cassette()
+    if cassette is None or get_mode() != "record":
+        return
+    cassette.append({
+        "kind": "request", "model": "", "key": _sha1([query, time.time()]), "ts": time.time(),
+        "query": query, "latency": round(latency, 4), "error": error,
+        "params": {k: v for k, v in params.items() if isinstance(v, (str, int, float, bool, type(None)))},
+    })
@@ -0,0 +1,261 @@
+# services/circuit_breaker.py
+"""
+Per-endpoint circuit breakers for the OpenAI and Pinecone calls.
+
+Each breaker keeps a sliding time window of call outcomes. It opens when the
+share of failed (or slow) calls in the window crosses its threshold, rejects
+calls immediately while open, and after `open_seconds` lets a few probe calls
+through (half-open) to decide whether to close again. Breakers are keyed by
+endpoint and model, so callers can route to a configured fallback model while
+the primary's breaker is open.
+"""
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+import config
+from utils import metrics
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an endpoint whose breaker is open."""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Circuit '{name}' is open; retry in {retry_after:.0f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+def counts_as_failure(error: BaseException) -> bool:
+    """
+    Whether an error says something about the provider's health.
+
+    Rate limits (429), timeouts and server errors count; other client errors
+    (bad request, auth) would fail the same way on every call and do not.
+    """
+    status = getattr(error, "status_code", None)
+    if status is None:
+        return True
+    return status in (408, 409, 429) or status >= 500
+
+
+class CircuitBreaker:
+    """Error-rate and slow-call-rate breaker over a sliding time window."""
+
+    def __init__(
+        self,
+        name: str,
+        window_seconds: float = 60.0,
+        min_calls: int = 10,
+        error_rate: float = 0.5,
+        slow_call_seconds: Optional[float] = None,
+        slow_call_rate: float = 0.8,
+        open_seconds: float = 30.0,
+        half_open_probes: int = 2,
+    ):
+        self.name = name
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self._outcomes: deque = deque()  # (timestamp, failed, slow)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self._lock = threading.Lock()
+        metrics.set_gauge("rag_circuit_state", _STATE_VALUES[CLOSED], breaker=name)
+
+    # --- State ---
+    def _transition(self, state: str) -> None:
+        if state == self._state:
+            return
+        print(f"Circuit Breaker: '{self.name}' {self._state} -> {state}")
+        self._state = state
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+        if state in (HALF_OPEN, CLOSED):
+            self._probes_in_flight = self._probe_successes = 0
+        if state == CLOSED:
+            self._outcomes.clear()
+        metrics.set_gauge("rag_circuit_state", _STATE_VALUES[state], breaker=self.name)
+        metrics.inc("rag_circuit_transitions_total", breaker=self.name, state=state)
+
+    def _refresh(self) -> None:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._transition(HALF_OPEN)
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._refresh()
+            return self._state
+
+    def retry_after(self) -> float:
+        with self._lock:
+            return max(0.0, self.open_seconds - (time.monotonic() - self._opened_at)) if self._state == OPEN else 0.0
+
+    # --- Calls ---
+    def allow(self) -> bool:
+        """
+        Whether a call may go ahead now. A True answer must be followed by
+        `record_success` or `record_failure` (or `release` if the call was never made).
+        """
+        if not config.CIRCUIT_BREAKER_ENABLED:
+            return True
+        with self._lock:
+            self._refresh()
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and self._probes_in_flight < self.half_open_probes:
+                self._probes_in_flight += 1
+                return True
+        metrics.inc("rag_circuit_rejected_total", breaker=self.name)
+        return False
+
+    def release(self) -> None:
+        """Returns a half-open probe slot for a call that was not made (e.g. cancelled)."""
+        with self._lock:
+            if self._state == HALF_OPEN and self._probes_in_flight:
+                self._probes_in_flight -= 1
+
+    def record_success(self, latency: float) -> None:
+        if not config.CIRCUIT_BREAKER_ENABLED:
+            return
+        slow = self.slow_call_seconds is not None and latency >= self.slow_call_seconds
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                if slow:
+                    self._transition(OPEN)
+                    return
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_probes:
+                    self._transition(CLOSED)
+                return
+            self._add_outcome(failed=False, slow=slow)
+
+    def record_failure(self, error: BaseException) -> None:
+        if not config.CIRCUIT_BREAKER_ENABLED:
+            return
+        if not counts_as_failure(error):
+            self.release()
+            return
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._transition(OPEN)
+                return
+            self._add_outcome(failed=True, slow=False)
+
+    def _add_outcome(self, failed: bool, slow: bool) -> None:
+        now = time.monotonic()
+        self._outcomes.append((now, failed, slow))
+        while self._outcomes and now - self._outcomes[0][0] > self.window_seconds:
+            self._outcomes.popleft()
+        total = len(self._outcomes)
+        if self._state != CLOSED or total < self.min_calls:
+            return
+        failures = sum(1 for _, f, _ in self._outcomes if f)
+        slow_calls = sum(1 for _, _, s in self._outcomes if s)
+        if failures / total >= self.error_rate or slow_calls / total >= self.slow_call_rate:
+            self._transition(OPEN)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            self._refresh()
+            total = len(self._outcomes)
+            return {
+                "name": self.name,
+                "state": self._state,
+                "calls": total,
+                "error_rate": round(sum(1 for _, f, _ in self._outcomes if f) / total, 3) if total else 0.0,
+                "retry_after": round(max(0.0, self.open_seconds - (time.monotonic() - self._opened_at)), 1)
+                if self._state == OPEN else 0.0,
+            }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(endpoint: str, model: str = "") -> CircuitBreaker:
+    """Returns the breaker for an endpoint (and model), configured from config.CIRCUIT_*."""
+    name = f"{endpoint}:{model}" if model else endpoint
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(
+                name,
+                window_seconds=config.CIRCUIT_WINDOW_SECONDS,
+                min_calls=config.CIRCUIT_MIN_CALLS,
+                error_rate=config.CIRCUIT_ERROR_RATE,
+                slow_call_seconds=config.CIRCUIT_SLOW_CALL_SECONDS.get(endpoint),
+                slow_call_rate=config.CIRCUIT_SLOW_CALL_RATE,
+                open_seconds=config.CIRCUIT_OPEN_SECONDS,
+                half_open_probes=config.CIRCUIT_HALF_OPEN_PROBES,
+            )
+        return _breakers[name]
+
+
+def acquire(endpoint: str, models: List[str]) -> Tuple[str, CircuitBreaker]:
+    """
+    Picks the first model (primary, then fallbacks) whose breaker admits a call.
+
+    Args:
+        endpoint: Endpoint name, e.g. "validation"
+        models: Candidate models in order of preference (empty strings are skipped)
+
+    Returns:
+        Tuple[str, CircuitBreaker]: The model to call and its breaker (already acquired)
+
+    Raises:
+        CircuitOpenError: When every candidate's breaker is open
+    """
+    candidates = [m for m in dict.fromkeys(models) if m] or [""]
+    for index, model in enumerate(candidates):
+        breaker = get_breaker(endpoint, model)
+        if breaker.allow():
+            if index:
+                metrics.inc("rag_model_fallbacks_total", endpoint=endpoint, model=model)
+            return model, breaker
+    primary = get_breaker(endpoint, candidates[0])
+    raise CircuitOpenError(primary.name, primary.retry_after())
+
+
+@contextmanager
+def track(breaker: CircuitBreaker):
+    """Records the outcome and latency of the call made inside the block on `breaker`."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        breaker.record_failure(e)
+        raise
+    except BaseException:
+        # Cancelled: says nothing about the provider
+        breaker.release()
+        raise
+    else:
+        breaker.record_success(time.perf_counter() - start)
+
+
+def get_states() -> List[Dict[str, Any]]:
+    """Snapshots of all breakers created so far."""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return [b.snapshot() for b in breakers]
+
+
+metrics.registry.describe("rag_circuit_state", "Circuit breaker state (0 closed, 1 half-open, 2 open).")
+metrics.registry.describe("rag_circuit_transitions_total", "Circuit breaker state changes.")
+metrics.registry.describe("rag_circuit_rejected_total", "Calls rejected without contacting the provider.")
+metrics.registry.describe("rag_model_fallbacks_total", "Calls routed to a fallback model because the primary's circuit was open.")
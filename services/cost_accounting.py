@@ -0,0 +1,316 @@
+# services/cost_accounting.py
+"""
+Per-request token and cost accounting, cost budgets and daily aggregates.
+
+`track_request` opens a ledger for one pipeline request; every API usage recorded
+through `utils.metrics.record_usage` while it is open (including in the tasks the
+request spawns) is added to it by stage and model, priced with
+`config.MODEL_PRICES`. Before validation and generation the pipeline asks how much
+budget is left (`config.COST_BUDGET_REQUEST_USD`, and
+`config.COST_BUDGET_SESSION_USD` across a session's requests) and validates fewer
+paragraphs or generates from fewer passages when the estimate would not fit.
+
+Finished ledgers are added to per-day, per-model, per-stage totals in a local
+SQLite database (`config.COST_DB_PATH`).
+"""
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import threading
+import contextvars
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import config
+from utils import metrics
+
+# Hebrew averages roughly 2.5 characters per token with the GPT-4o tokenizer
+CHARS_PER_TOKEN = 2.5
+# Typical validation verdict length (the call allows up to 150 tokens)
+VALIDATION_COMPLETION_TOKENS = 60
+# Answer length assumed when budgeting generation (its max_tokens)
+GENERATION_COMPLETION_TOKENS = 3000
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, int(len(text or "") / CHARS_PER_TOKEN))
+
+
+class RequestLedger:
+    """Tokens, calls and estimated cost of one request, by (stage, model)."""
+
+    def __init__(self, session_id: Optional[str] = None):
+        self.session_id = session_id
+        self.started_at = time.time()
+        self._lines: Dict[Tuple[str, str], Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, model: str, counts: Dict[str, int], cost: float) -> None:
+        with self._lock:
+            line = self._lines.setdefault((stage, model), {"calls": 0, "prompt": 0, "completion": 0, "cached": 0,
+                                                           "cost": 0.0})
+            line["calls"] += 1
+            for kind in ("prompt", "completion", "cached"):
+                line[kind] += counts.get(kind, 0)
+            line["cost"] += cost
+
+    @property
+    def cost(self) -> float:
+        with self._lock:
+            return sum(line["cost"] for line in self._lines.values())
+
+    def lines(self) -> Dict[Tuple[str, str], Dict[str, float]]:
+        with self._lock:
+            return {key: dict(line) for key, line in self._lines.items()}
+
+    def summary(self) -> Dict[str, Any]:
+        """JSON-friendly totals and the per-stage, per-model breakdown."""
+        lines = self.lines()
+        return {
+            "cost_usd": round(sum(line["cost"] for line in lines.values()), 6),
+            "tokens": {kind: int(sum(line[kind] for line in lines.values())) for kind in ("prompt", "completion", "cached")},
+            "by_stage": [{"stage": stage, "model": model, **{k: round(v, 6) if k == "cost" else int(v)
+                                                             for k, v in line.items()}}
+                         for (stage, model), line in sorted(lines.items())],
+        }
+
+
+_current_ledger: contextvars.ContextVar[Optional[RequestLedger]] = contextvars.ContextVar("cost_ledger", default=None)
+_session_spent: Dict[str, float] = {}
+_session_lock = threading.Lock()
+
+
+def current_ledger() -> Optional[RequestLedger]:
+    return _current_ledger.get()
+
+
+def _on_usage(stage: str, model: str, counts: Dict[str, int], cost: float) -> None:
+    ledger = _current_ledger.get()
+    if ledger is not None:
+        ledger.add(stage, model, counts, cost)
+
+
+metrics.register_usage_listener(_on_usage)
+
+
+@asynccontextmanager
+async def track_request(session_id: Optional[str] = None) -> AsyncIterator[RequestLedger]:
+    """
+    Accounts the API usage of the enclosed request.
+
+    On exit the request's cost is added to its session's total and the ledger to the
+    daily aggregates.
+
+    Args:
+        session_id (Optional[str]): Session whose budget the request draws on
+
+    Yields:
+        RequestLedger: The request's ledger, filled in as it runs
+    """
+    ledger = RequestLedger(session_id)
+    token = _current_ledger.set(ledger)
+    try:
+        yield ledger
+    finally:
+        _current_ledger.reset(token)
+        cost = ledger.cost
+        if session_id:
+            with _session_lock:
+                _session_spent[session_id] = _session_spent.get(session_id, 0.0) + cost
+        metrics.observe("rag_request_cost_usd", cost, buckets=metrics.COST_BUCKETS)
+        if ledger.lines():
+            try:
+                await asyncio.to_thread(get_store().add, ledger)
+            except Exception as e:
+                print(f"Cost Accounting: Could not store the request's usage: {type(e).__name__} - {e}")
+
+
+def session_spent(session_id: Optional[str]) -> float:
+    with _session_lock:
+        return _session_spent.get(session_id, 0.0) if session_id else 0.0
+
+
+def forget_session(session_id: str) -> None:
+    """Drops a session's running total once the session is gone (its chat history is finalized)."""
+    with _session_lock:
+        _session_spent.pop(session_id, None)
+
+
+def remaining_budget() -> Optional[float]:
+    """
+    USD the current request may still spend, or None when no budget applies (no
+    ledger open, or both budgets disabled with 0).
+    """
+    ledger = _current_ledger.get()
+    if ledger is None:
+        return None
+    limits = []
+    if config.COST_BUDGET_REQUEST_USD > 0:
+        limits.append(config.COST_BUDGET_REQUEST_USD - ledger.cost)
+    if config.COST_BUDGET_SESSION_USD > 0 and ledger.session_id:
+        limits.append(config.COST_BUDGET_SESSION_USD - session_spent(ledger.session_id) - ledger.cost)
+    return max(0.0, min(limits)) if limits else None
+
+
+def _model_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    return metrics.estimate_cost(model, prompt_tokens, completion_tokens)
+
+
+def plan_validation(docs: List[Dict], prompt_prefix: str, n_validate: int) -> Tuple[int, Optional[float]]:
+    """
+    How many of the top `n_validate` paragraphs fit the budget, keeping
+    `config.COST_BUDGET_GENERATION_SHARE` of it for generation.
+
+    Args:
+        docs (List[Dict]): Retrieved paragraphs, best first
+        prompt_prefix (str): The validation prompt shared by all paragraphs
+        n_validate (int): Requested number of validations
+
+    Returns:
+        Tuple[int, Optional[float]]: The number to validate (never below
+            `config.COST_BUDGET_MIN_VALIDATE`) and the remaining budget (None if unlimited)
+    """
+    count = min(len(docs), n_validate)
+    remaining = remaining_budget()
+    if remaining is None:
+        return count, None
+    allowance = remaining * (1.0 - config.COST_BUDGET_GENERATION_SHARE)
+    prefix_tokens = estimate_tokens(prompt_prefix)
+    spent = 0.0
+    for i, doc in enumerate(docs[:count]):
+        paragraph_tokens = estimate_tokens(doc.get("hebrew_text", "")) + estimate_tokens(doc.get("english_text", ""))
+        spent += _model_cost(config.OPENAI_VALIDATION_MODEL, prefix_tokens + paragraph_tokens,
+                             VALIDATION_COMPLETION_TOKENS)
+        if spent > allowance:
+            return min(count, max(i, config.COST_BUDGET_MIN_VALIDATE)), remaining
+    return count, remaining
+
+
+def plan_generation(docs: List[Dict], history: List[Dict], system_prompt: str) -> Tuple[int, Optional[float]]:
+    """
+    How many of the validated passages (in order) the generation prompt can include
+    within the remaining budget. At least one passage is always kept.
+
+    Args:
+        docs (List[Dict]): Passages for the generation context, in prompt order
+        history (List[Dict]): Message history (the last user message is sent)
+        system_prompt (str): System prompt of the generation call
+
+    Returns:
+        Tuple[int, Optional[float]]: The number of passages to use and the remaining
+            budget (None if unlimited)
+    """
+    from utils import format_context_for_openai
+
+    remaining = remaining_budget()
+    if remaining is None or not docs:
+        return len(docs), remaining
+    question = next((str(m.get("content") or "") for m in reversed(history or []) if m.get("role") == "user"), "")
+    base_tokens = estimate_tokens(system_prompt) + estimate_tokens(question)
+    count = len(docs)
+    while count > 1:
+        prompt_tokens = base_tokens + estimate_tokens(format_context_for_openai(docs[:count]))
+        if _model_cost(config.OPENAI_GENERATION_MODEL, prompt_tokens, GENERATION_COMPLETION_TOKENS) <= remaining:
+            break
+        # Drop the passages at the end of the context first
+        count = max(1, int(count * 0.8)) if count > 10 else count - 1
+    return count, remaining
+
+
+# --- Daily aggregates ---
+class CostStore:
+    """SQLite table of tokens, calls and cost per day, model and stage."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS daily_usage ("
+                " day TEXT NOT NULL, model TEXT NOT NULL, stage TEXT NOT NULL,"
+                " calls INTEGER NOT NULL DEFAULT 0, prompt_tokens INTEGER NOT NULL DEFAULT 0,"
+                " completion_tokens INTEGER NOT NULL DEFAULT 0, cached_tokens INTEGER NOT NULL DEFAULT 0,"
+                " cost_usd REAL NOT NULL DEFAULT 0, PRIMARY KEY (day, model, stage))"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS daily_requests ("
+                " day TEXT PRIMARY KEY, requests INTEGER NOT NULL DEFAULT 0, cost_usd REAL NOT NULL DEFAULT 0)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=5)
+
+    def add(self, ledger: RequestLedger) -> None:
+        """Adds a finished request's usage to the totals of the day it started (UTC)."""
+        day = time.strftime("%Y-%m-%d", time.gmtime(ledger.started_at))
+        lines = ledger.lines()
+        with self._lock, self._connect() as db:
+            db.executemany(
+                "INSERT INTO daily_usage VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (day, model, stage) DO UPDATE SET calls = calls + excluded.calls,"
+                " prompt_tokens = prompt_tokens + excluded.prompt_tokens,"
+                " completion_tokens = completion_tokens + excluded.completion_tokens,"
+                " cached_tokens = cached_tokens + excluded.cached_tokens, cost_usd = cost_usd + excluded.cost_usd",
+                [(day, model, stage, int(line["calls"]), int(line["prompt"]), int(line["completion"]),
+                  int(line["cached"]), line["cost"]) for (stage, model), line in lines.items()]
+            )
+            db.execute(
+                "INSERT INTO daily_requests VALUES (?, 1, ?) ON CONFLICT (day) DO UPDATE SET"
+                " requests = requests + 1, cost_usd = cost_usd + excluded.cost_usd",
+                (day, sum(line["cost"] for line in lines.values()))
+            )
+
+    def daily(self, days: int = 7) -> List[Dict[str, Any]]:
+        """Totals of the last `days` days, newest first, with a per-model breakdown."""
+        with self._lock, self._connect() as db:
+            requests = db.execute("SELECT day, requests, cost_usd FROM daily_requests ORDER BY day DESC LIMIT ?",
+                                  (days,)).fetchall()
+            rows = db.execute(
+                "SELECT day, model, SUM(calls), SUM(prompt_tokens), SUM(completion_tokens), SUM(cached_tokens),"
+                " SUM(cost_usd) FROM daily_usage WHERE day >= ? GROUP BY day, model ORDER BY day DESC, model",
+                (requests[-1][0] if requests else "",)
+            ).fetchall()
+        by_day: Dict[str, List[Dict[str, Any]]] = {}
+        for day, model, calls, prompt, completion, cached, cost in rows:
+            by_day.setdefault(day, []).append({"model": model, "calls": calls, "prompt_tokens": prompt,
+                                               "completion_tokens": completion, "cached_tokens": cached,
+                                               "cost_usd": round(cost, 6)})
+        return [{"day": day, "requests": count, "cost_usd": round(cost, 6), "models": by_day.get(day, [])}
+                for day, count, cost in requests]
+
+
+_store: Optional[CostStore] = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> CostStore:
+    """Returns the process-wide cost store at config.COST_DB_PATH."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = CostStore(config.COST_DB_PATH)
+        return _store
+
+
+def _route(query: Dict[str, List[str]]) -> Tuple[int, str, str]:
+    # GET /costs?days=N reports the daily totals per model
+    try:
+        days = int(query.get("days", ["7"])[0] or 7)
+    except ValueError:
+        return 400, "application/json", json.dumps({"error": "Parameter 'days' must be an integer"})
+    if days < 1:
+        return 400, "application/json", json.dumps({"error": "Parameter 'days' must be at least 1"})
+    with _session_lock:
+        sessions = len(_session_spent)
+        session_total = sum(_session_spent.values())
+    body = {"daily": get_store().daily(days), "sessions": sessions, "session_cost_usd": round(session_total, 6),
+            "budgets": {"request_usd": config.COST_BUDGET_REQUEST_USD, "session_usd": config.COST_BUDGET_SESSION_USD}}
+    return 200, "application/json", json.dumps(body, ensure_ascii=False)
+
+
+metrics.register_route("/costs", _route)
+metrics.registry.describe("rag_request_cost_usd", "Estimated API cost of one pipeline request.")
+metrics.registry.describe("rag_budget_reductions_total", "Requests whose validation count or generation context was cut to fit the cost budget.")
@@ -0,0 +1,139 @@
+# services/facets.py
+"""
+Source facets: the `source_name` values of the corpus with their paragraph counts.
+
+Built offline into one JSON file (config.SOURCE_FACETS_PATH) and offered in the
+sidebar as a filter. The chosen sources are pushed down into retrieval: as a
+Pinecone metadata filter on the dense query, and as a bitmap of allowed
+paragraphs in the local BM25 index, so `n_retrieve` and `n_validate` are spent
+only on paragraphs from those sources.
+
+    python -m services.facets build --corpus corpus.jsonl
+    python -m services.facets build --from-pinecone
+    python -m services.facets list
+"""
+import os
+import json
+import time
+import argparse
+import threading
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional
+
+import config
+from utils import metrics
+
+FORMAT_NAME = "rag-source-facets"
+FORMAT_VERSION = 1
+
+# --- Globals ---
+_facets: List[Dict[str, Any]] = []
+_facets_version: Optional[str] = None
+_check_lock = threading.Lock()
+_last_check = float("-inf")
+_RECHECK_SECONDS = 30.0
+
+
+def build_facets(documents: Iterable[Dict[str, Any]], path: str) -> Dict[str, Any]:
+    """
+    Counts the paragraphs of every source and writes the facets to `path`, replacing any there.
+
+    Args:
+        documents (Iterable[Dict[str, Any]]): Paragraphs with `source_name`
+        path (str): Facet file
+
+    Returns:
+        Dict[str, Any]: The facet file's metadata (without the sources)
+    """
+    counts = Counter(str(doc.get("source_name") or "").strip() for doc in documents)
+    counts.pop("", None)
+    if not counts:
+        raise ValueError("No documents with a source name")
+    data = {
+        "format": FORMAT_NAME, "version": FORMAT_VERSION, "built_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "documents": sum(counts.values()),
+        "sources": [{"name": name, "count": count} for name, count in sorted(counts.items(), key=lambda item: (-item[1], item[0]))],
+    }
+    # Written next to the file and swapped in, so a running app never reads half of it
+    staging = f"{path}.building"
+    with open(staging, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+    os.replace(staging, path)
+    return {key: value for key, value in data.items() if key != "sources"} | {"source_count": len(counts)}
+
+
+def get_facets() -> List[Dict[str, Any]]:
+    """
+    The sources with their paragraph counts, most paragraphs first; empty without a facet file.
+    Rereads the file at most every half minute.
+    """
+    global _facets, _facets_version, _last_check
+    now = time.monotonic()
+    with _check_lock:
+        if now - _last_check < _RECHECK_SECONDS:
+            return _facets
+        _last_check = now
+        try:
+            with open(config.SOURCE_FACETS_PATH, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("format") != FORMAT_NAME or data.get("version") != FORMAT_VERSION:
+                raise ValueError(f"Not a {FORMAT_NAME} v{FORMAT_VERSION} file")
+            if data["built_at"] != _facets_version:
+                _facets, _facets_version = data["sources"], data["built_at"]
+                print(f"Facets: Loaded {len(_facets)} sources (built {_facets_version}).")
+        except FileNotFoundError:
+            _facets, _facets_version = [], None
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Facets: Error loading '{config.SOURCE_FACETS_PATH}': {type(e).__name__} - {e}")
+            _facets, _facets_version = [], None
+        return _facets
+
+
+def normalize_sources(sources: Optional[Iterable[str]]) -> List[str]:
+    """The distinct, non-empty source names of a filter, sorted; empty means no filter."""
+    return sorted({str(source).strip() for source in sources or [] if str(source).strip()})
+
+
+def pinecone_filter(sources: List[str]) -> Optional[Dict[str, Any]]:
+    """The Pinecone metadata filter restricting a query to `sources`, or None for no filter."""
+    return {"source_name": {"$in": list(sources)}} if sources else None
+
+
+def filter_label(sources: Optional[List[str]]) -> str:
+    """The `filtered` metric label of a request: "yes" with a source filter, otherwise "no"."""
+    return "yes" if sources else "no"
+
+
+metrics.registry.describe("rag_retrieval_seconds", "Wall time of the retrieval stage, by whether a source filter was applied.")
+metrics.registry.describe("rag_validations_per_request", "Validation calls made by one request, by whether a source filter was applied.")
+
+
+def main(argv: List[str] = None) -> None:
+    from services.bm25 import read_corpus, export_pinecone
+
+    parser = argparse.ArgumentParser(description="Build or list the source facets.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="Count the paragraphs of every source")
+    source = build.add_mutually_exclusive_group(required=True)
+    source.add_argument("--corpus", help="JSON-lines (or JSON array) file of paragraphs")
+    source.add_argument("--from-pinecone", action="store_true", help="Read the paragraphs from the Pinecone index")
+    build.add_argument("--output", default=None, help="Facet file (default: config.SOURCE_FACETS_PATH)")
+    commands.add_parser("list", help="List the sources")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        if args.from_pinecone:
+            from pinecone import Pinecone
+            from utils import clean_api_key
+            index = Pinecone(api_key=clean_api_key(config.PINECONE_API_KEY)).Index(config.PINECONE_INDEX_NAME)
+            documents = export_pinecone(index)
+        else:
+            documents = read_corpus(args.corpus)
+        print(json.dumps(build_facets(documents, args.output or config.SOURCE_FACETS_PATH), indent=2, ensure_ascii=False))
+    else:
+        for facet in get_facets():
+            print(f"{facet['count']:8d}  {facet['name']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+# services/hedging.py
+"""
+Hedged requests for long-tailed API calls.
+
+A call that has not answered by the rolling latency quantile of its endpoint
+(e.g. p95 of the last few hundred calls) gets one duplicate request; whichever
+answers first wins and the other is cancelled. Hedges are paid from a token
+bucket that earns `budget_ratio` tokens per call, which caps the extra requests
+at roughly that share of traffic.
+
+The cancelled attempt is still billed by the provider, so callers pass
+`on_abandoned` to account for it (see `hedged_call`).
+"""
+import time
+import asyncio
+import threading
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import config
+from utils import metrics
+
+
+class HedgePolicy:
+    """Rolling latency quantile and hedge budget for one endpoint."""
+
+    def __init__(
+        self,
+        endpoint: str,
+        quantile: float = 0.95,
+        window: int = 500,
+        min_samples: int = 50,
+        budget_ratio: float = 0.05,
+        max_burst: float = 10.0,
+        min_delay: float = 0.0,
+    ):
+        self.endpoint = endpoint
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.budget_ratio = budget_ratio
+        self.max_burst = max_burst
+        self.min_delay = min_delay
+        self._latencies = deque(maxlen=window)
+        self._threshold: Optional[float] = None
+        self._since_refresh = 0
+        self._credits = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, latency: float) -> None:
+        """Adds the latency of a completed attempt to the rolling window."""
+        with self._lock:
+            self._latencies.append(latency)
+            self._since_refresh += 1
+            # Re-sorting the window on every call is wasted work at ~100 calls per question
+            if self._threshold is None or self._since_refresh >= 10:
+                self._refresh_threshold()
+
+    def _refresh_threshold(self) -> None:
+        self._since_refresh = 0
+        if len(self._latencies) < self.min_samples:
+            self._threshold = None
+            return
+        ordered = sorted(self._latencies)
+        index = min(len(ordered) - 1, int(self.quantile * len(ordered)))
+        self._threshold = max(self.min_delay, ordered[index])
+
+    def threshold(self) -> Optional[float]:
+        """Seconds to wait before hedging, or None while there is too little history."""
+        with self._lock:
+            return self._threshold
+
+    def earn(self) -> None:
+        """Credits the budget for one primary call."""
+        with self._lock:
+            self._credits = min(self.max_burst, self._credits + self.budget_ratio)
+
+    def try_spend(self) -> bool:
+        """Takes one hedge from the budget; False when the budget is exhausted."""
+        with self._lock:
+            if self._credits < 1.0:
+                return False
+            self._credits -= 1.0
+            return True
+
+
+_policies: Dict[str, HedgePolicy] = {}
+_policies_lock = threading.Lock()
+
+
+def get_policy(endpoint: str) -> HedgePolicy:
+    """Returns the process-wide policy of an endpoint, configured from config.HEDGE_*."""
+    with _policies_lock:
+        if endpoint not in _policies:
+            _policies[endpoint] = HedgePolicy(
+                endpoint,
+                quantile=config.HEDGE_QUANTILE,
+                window=config.HEDGE_WINDOW,
+                min_samples=config.HEDGE_MIN_SAMPLES,
+                budget_ratio=config.HEDGE_BUDGET_RATIO,
+                max_burst=config.HEDGE_MAX_BURST,
+                min_delay=config.HEDGE_MIN_DELAY,
+            )
+        return _policies[endpoint]
+
+
+async def _timed(call: Callable[[], Awaitable[Any]]) -> Any:
+    start = time.perf_counter()
+    result = await call()
+    return result, time.perf_counter() - start
+
+
+async def hedged_call(call: Callable[[], Awaitable[Any]], policy: HedgePolicy,
+                      on_abandoned: Optional[Callable[[Any], None]] = None) -> Any:
+    """
+    Runs `call`, firing one duplicate if it is slower than the policy's threshold.
+
+    Only completed attempts have a latency, so the rolling window is biased towards
+    fast calls; when the hedge wins, the primary's elapsed time (a lower bound of its
+    latency) is recorded for it to soften that bias.
+
+    Args:
+        call: Zero-argument function returning a new awaitable for each attempt
+        policy: Latency history and budget of the endpoint
+        on_abandoned: Called with the winning result once for the attempt that was
+            cancelled after a hedge fired; the provider bills it anyway, so callers
+            record its usage, estimated from the winner's
+
+    Returns:
+        Any: The result of the first attempt to succeed (or the primary's error if both fail)
+    """
+    policy.earn()
+    started = time.perf_counter()
+    primary = asyncio.ensure_future(_timed(call))
+    attempts: List[asyncio.Future] = [primary]
+    try:
+        delay = policy.threshold()
+        if delay is not None:
+            await asyncio.wait([primary], timeout=delay)
+        if delay is not None and not primary.done():
+            if policy.try_spend():
+                metrics.inc("rag_hedges_total", endpoint=policy.endpoint, outcome="fired")
+                attempts.append(asyncio.ensure_future(_timed(call)))
+            else:
+                metrics.inc("rag_hedges_total", endpoint=policy.endpoint, outcome="over_budget")
+
+        pending = set(attempts)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for attempt in done:
+                if attempt.exception() is None:
+                    result, latency = attempt.result()
+                    policy.record(latency)
+                    if len(attempts) > 1:
+                        outcome = "primary_won" if attempt is primary else "hedge_won"
+                        metrics.inc("rag_hedges_total", endpoint=policy.endpoint, outcome=outcome)
+                        if attempt is not primary and not primary.done():
+                            policy.record(time.perf_counter() - started)
+                        if on_abandoned is not None and any(not other.done() for other in attempts if other is not attempt):
+                            on_abandoned(result)
+                    return result
+        # Every attempt failed: surface the primary's error like an unhedged call would
+        return primary.result()
+    finally:
+        for attempt in attempts:
+            if not attempt.done():
+                attempt.cancel()
+
+
+metrics.registry.describe("rag_hedges_total", "Hedged request decisions and which attempt answered first.")
@@ -0,0 +1,301 @@
+# services/history_store.py
+"""
+Bounded chat history storage for Streamlit sessions.
+
+Assistant turns keep their source paragraphs as `original_id` references into a
+process-wide, reference-counted text cache instead of holding full copies. Each
+session retains only the newest `config.HISTORY_MAX_MESSAGES` messages in memory;
+older ones are spilled to a compact per-session log on disk and rehydrated a page
+at a time when the user asks to see earlier messages.
+"""
+import os
+import sys
+import json
+import zlib
+import struct
+import hashlib
+import threading
+import weakref
+import uuid
+from collections import Counter
+from typing import Dict, List, Any, Optional
+
+import config
+from utils import metrics
+
+_RECORD_HEADER = struct.Struct("<I")
+
+
+def _text_size(value: Any) -> int:
+    """Approximate in-memory size of a string (or list of strings) in bytes."""
+    if isinstance(value, str):
+        return sys.getsizeof(value)
+    if isinstance(value, (list, tuple)):
+        return sum(_text_size(v) for v in value)
+    return 0
+
+
+def _doc_key(doc: Dict[str, Any]) -> str:
+    """Returns the cache key for a document, falling back to a content hash."""
+    original_id = doc.get('original_id')
+    if original_id and original_id != 'unknown':
+        return str(original_id)
+    text = doc.get('hebrew_text', '') or doc.get('english_text', '')
+    return "sha1:" + hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class DocumentTextCache:
+    """Process-wide store of paragraph texts shared by all sessions, keyed by `original_id`."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._texts: Dict[str, Dict[str, str]] = {}
+        self._refs: Dict[str, int] = {}
+        self._bytes = 0
+
+    def acquire(self, doc: Dict[str, Any]) -> str:
+        """Stores the document texts (if not cached yet) and takes a reference. Returns the key."""
+        key = _doc_key(doc)
+        with self._lock:
+            if key not in self._texts:
+                texts = {field: doc[field] for field in ('hebrew_text', 'english_text') if doc.get(field)}
+                self._texts[key] = texts
+                self._bytes += _text_size(list(texts.values()))
+            self._refs[key] = self._refs.get(key, 0) + 1
+        return key
+
+    def release(self, key: str) -> None:
+        """Drops a reference; the texts are evicted once no session refers to them."""
+        with self._lock:
+            count = self._refs.get(key, 0) - 1
+            if count > 0:
+                self._refs[key] = count
+                return
+            self._refs.pop(key, None)
+            texts = self._texts.pop(key, None)
+            if texts:
+                self._bytes -= _text_size(list(texts.values()))
+
+    def get(self, key: str) -> Dict[str, str]:
+        with self._lock:
+            return dict(self._texts.get(key, {}))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._texts),
+                "references": sum(self._refs.values()),
+                "bytes": self._bytes,
+            }
+
+
+# Shared by every session in this process
+document_text_cache = DocumentTextCache()
+_live_sessions: "weakref.WeakSet[SessionHistory]" = weakref.WeakSet()
+
+
+def _finalize_session(cache: DocumentTextCache, held: Counter, spill_path: str, session_id: str) -> None:
+    """
+    Releases all cache references of a discarded session, removes its spill log and,
+    unless another live history has the same session id, forgets its spend.
+    """
+    for key, count in held.items():
+        for _ in range(count):
+            cache.release(key)
+    held.clear()
+    cost_accounting = sys.modules.get("services.cost_accounting")
+    # A tab that reattached to this session's job carries the session on
+    if cost_accounting is not None and not any(s.session_id == session_id for s in list(_live_sessions)):
+        cost_accounting.forget_session(session_id)
+    try:
+        if os.path.exists(spill_path):
+            os.remove(spill_path)
+    except OSError as e:
+        print(f"History: Failed to remove spill log {spill_path}: {e}")
+
+
+class SessionHistory:
+    """
+    Chat history for a single session.
+
+    Messages are appended in the same dict shape `process_prompt` has always used
+    (`role`, `content`, `final_docs`, `pipeline_used`, `status_log`, `error`) and are
+    returned in that shape by `messages()`, with `final_docs` resolved from the
+    shared text cache.
+    """
+
+    def __init__(
+        self,
+        session_id: str,
+        max_messages: Optional[int] = None,
+        spill_dir: Optional[str] = None,
+        cache: Optional[DocumentTextCache] = None,
+    ):
+        self.session_id = session_id
+        self.max_messages = max(2, max_messages or config.HISTORY_MAX_MESSAGES)
+        self._cache = cache or document_text_cache
+        # A reattached tab can share its session id with the tab it replaces, so every store has its own log
+        self._spill_path = os.path.join(spill_dir or config.HISTORY_SPILL_DIR,
+                                        f"{session_id}-{uuid.uuid4().hex[:8]}.log")
+        self._recent: List[Dict[str, Any]] = []     # newest messages, compact form
+        self._restored: List[Dict[str, Any]] = []   # rehydrated older messages, compact form
+        self._restored_from: Optional[int] = None   # first spilled record covered by _restored
+        self._spill_offsets: List[int] = []         # byte offset of every spilled record
+        self._held: Counter = Counter()             # cache references owned by this session
+        self._bytes = 0
+        self._lock = threading.RLock()
+        weakref.finalize(self, _finalize_session, self._cache, self._held, self._spill_path, session_id)
+        _live_sessions.add(self)
+
+    # --- Compaction ---
+    def _compact(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        compact = {k: v for k, v in message.items() if k != 'final_docs'}
+        doc_refs = []
+        for doc in message.get('final_docs') or []:
+            if not isinstance(doc, dict):
+                continue
+            key = self._cache.acquire(doc)
+            self._held[key] += 1
+            doc_refs.append({'key': key, 'original_id': doc.get('original_id', key),
+                             'source_name': doc.get('source_name', '')})
+        if doc_refs:
+            compact['doc_refs'] = doc_refs
+        compact['_size'] = _text_size(compact.get('content')) + _text_size(compact.get('status_log') or [])
+        return compact
+
+    def _release(self, compact: Dict[str, Any]) -> None:
+        for ref in compact.get('doc_refs', []):
+            key = ref['key']
+            if self._held[key] > 0:
+                self._held[key] -= 1
+                if not self._held[key]:
+                    del self._held[key]
+                self._cache.release(key)
+
+    def _materialize(self, compact: Dict[str, Any]) -> Dict[str, Any]:
+        message = {k: v for k, v in compact.items() if k not in ('doc_refs', '_size')}
+        if 'doc_refs' in compact:
+            message['final_docs'] = [
+                {'original_id': ref['original_id'], 'source_name': ref['source_name'],
+                 **self._cache.get(ref['key'])}
+                for ref in compact['doc_refs']
+            ]
+        elif message.get('role') == 'assistant':
+            message['final_docs'] = []
+        return message
+
+    # --- Spill log ---
+    def _spill(self, compact: Dict[str, Any]) -> None:
+        """Appends the oldest in-memory message to the on-disk log and frees its memory."""
+        record = {k: v for k, v in compact.items() if k not in ('doc_refs', '_size')}
+        if 'doc_refs' in compact:
+            # Texts travel with the record so it can be restored after the cache has evicted them
+            record['docs'] = [{**ref, **self._cache.get(ref['key'])} for ref in compact['doc_refs']]
+        payload = zlib.compress(json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode("utf-8"))
+        os.makedirs(os.path.dirname(self._spill_path) or ".", exist_ok=True)
+        with open(self._spill_path, "ab") as f:
+            offset = f.tell()
+            f.write(_RECORD_HEADER.pack(len(payload)))
+            f.write(payload)
+        self._spill_offsets.append(offset)
+        self._release(compact)
+        self._bytes -= compact['_size']
+
+    def _read_spilled(self, index: int) -> Dict[str, Any]:
+        with open(self._spill_path, "rb") as f:
+            f.seek(self._spill_offsets[index])
+            (length,) = _RECORD_HEADER.unpack(f.read(_RECORD_HEADER.size))
+            record = json.loads(zlib.decompress(f.read(length)).decode("utf-8"))
+        docs = record.pop('docs', None)
+        if docs is not None:
+            record['final_docs'] = docs
+        return record
+
+    # --- Public API ---
+    def append(self, message: Dict[str, Any]) -> None:
+        """Adds a message, spilling the oldest in-memory messages beyond the cap."""
+        with self._lock:
+            compact = self._compact(message)
+            self._recent.append(compact)
+            self._bytes += compact['_size']
+            if len(self._recent) > self.max_messages and self._restored:
+                # Restored pages must stay contiguous with the in-memory tail
+                self.collapse_earlier()
+            while len(self._recent) > self.max_messages:
+                try:
+                    self._spill(self._recent.pop(0))
+                except OSError as e:
+                    # Without a writable log the oldest message is simply dropped
+                    print(f"History: Failed to spill message for session {self.session_id}: {e}")
+
+    def messages(self) -> List[Dict[str, Any]]:
+        """Returns restored and recent messages, oldest first, in display form."""
+        with self._lock:
+            return [self._materialize(m) for m in self._restored + self._recent]
+
+    def as_pipeline_history(self) -> List[Dict[str, str]]:
+        """Role/content pairs of the in-memory messages, without any source documents."""
+        with self._lock:
+            return [{'role': m.get('role'), 'content': m.get('content')} for m in self._recent]
+
+    def earlier_count(self) -> int:
+        """Number of spilled messages not yet rehydrated."""
+        with self._lock:
+            if self._restored_from is None:
+                return len(self._spill_offsets)
+            return self._restored_from
+
+    def load_earlier(self, count: Optional[int] = None) -> int:
+        """Rehydrates up to `count` older messages from the spill log. Returns how many were loaded."""
+        with self._lock:
+            remaining = self.earlier_count()
+            count = min(remaining, count or config.HISTORY_PAGE_SIZE)
+            loaded = []
+            for index in range(remaining - count, remaining):
+                try:
+                    loaded.append(self._compact(self._read_spilled(index)))
+                except (OSError, ValueError, zlib.error) as e:
+                    print(f"History: Failed to read spilled message {index} for session {self.session_id}: {e}")
+            for compact in loaded:
+                self._bytes += compact['_size']
+            self._restored = loaded + self._restored
+            # Counted by position, so an unreadable record is skipped rather than read again
+            self._restored_from = remaining - count
+            return len(loaded)
+
+    def collapse_earlier(self) -> None:
+        """Drops rehydrated messages from memory again (they stay on disk)."""
+        with self._lock:
+            for compact in self._restored:
+                self._release(compact)
+                self._bytes -= compact['_size']
+            self._restored = []
+            self._restored_from = None
+
+    def memory_bytes(self) -> int:
+        """Approximate memory held by this session, excluding the shared text cache."""
+        with self._lock:
+            return self._bytes
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._spill_offsets) + len(self._recent)
+
+
+def get_memory_gauges() -> Dict[str, int]:
+    """Returns process-wide gauges for history memory usage."""
+    sessions = list(_live_sessions)
+    cache_stats = document_text_cache.stats()
+    session_bytes = sum(s.memory_bytes() for s in sessions)
+    return {
+        "history_sessions": len(sessions),
+        "history_session_bytes_total": session_bytes,
+        "history_session_bytes_max": max((s.memory_bytes() for s in sessions), default=0),
+        "history_text_cache_entries": cache_stats["entries"],
+        "history_text_cache_references": cache_stats["references"],
+        "history_text_cache_bytes": cache_stats["bytes"],
+        "history_process_bytes": session_bytes + cache_stats["bytes"],
+    }
+
+
+metrics.register_gauge_callback(get_memory_gauges)
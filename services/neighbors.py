@@ -0,0 +1,378 @@
+# services/neighbors.py
+"""
+Precomputed paragraph neighbour graph, for related passages without network calls.
+
+An offline job reads every paragraph's stored embedding, finds its
+`config.NEIGHBOR_K` nearest neighbours by cosine similarity and writes:
+
+- a CSR graph: `indptr` (int64, one row per paragraph), `indices` (uint32
+  neighbour rows) and `weights` (float16 cosine similarities), best first;
+- the paragraphs themselves (id, source and text) as JSON records in `texts.bin`
+  with their byte offsets in `text_offsets.npy`, so neighbours can be shown
+  without asking Pinecone for them.
+
+The neighbours are found with blocked matrix products (a block of rows against
+all embeddings at a time, on `--workers` threads; numpy releases the GIL in the
+products and selections).
+
+At runtime the arrays are memory-mapped: `related_passages` returns a paragraph's
+neighbours, `GET /api/related?id=...&k=5` serves them as JSON on the metrics
+server, and `expand_with_neighbors` adds the neighbours of the top retrieved
+paragraphs to the retrieved list.
+
+    python -m services.neighbors build --from-pinecone
+    python -m services.neighbors build --embeddings vectors.npy --corpus corpus.jsonl
+    python -m services.neighbors related doc-123
+"""
+import os
+import json
+import time
+import shutil
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import config
+from utils import metrics
+from services import registry
+
+FORMAT_NAME = "rag-neighbor-graph"
+FORMAT_VERSION = 1
+DOCUMENT_FIELDS = ("original_id", "source_name", "hebrew_text", "english_text")
+
+# --- Globals ---
+neighbor_graph: Optional["NeighborGraph"] = None
+is_neighbor_graph_ready: bool = False
+neighbor_graph_status_message: str = "Neighbour graph not loaded."
+
+
+class NeighborGraph:
+    """A neighbour graph loaded from disk (see the module docstring for the layout)."""
+
+    def __init__(self, path: str):
+        import numpy as np
+
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta.get("format") != FORMAT_NAME or self.meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Not a {FORMAT_NAME} v{FORMAT_VERSION} graph: {path}")
+        with open(os.path.join(path, "documents.json"), encoding="utf-8") as f:
+            self.rows: Dict[str, int] = {doc_id: row for row, doc_id in enumerate(json.load(f))}
+        self.indptr = np.load(os.path.join(path, "indptr.npy"), mmap_mode="r")
+        self.indices = np.load(os.path.join(path, "indices.npy"), mmap_mode="r")
+        self.weights = np.load(os.path.join(path, "weights.npy"), mmap_mode="r")
+        self.text_offsets = np.load(os.path.join(path, "text_offsets.npy"), mmap_mode="r")
+        self.texts = np.memmap(os.path.join(path, "texts.bin"), dtype=np.uint8, mode="r")
+        self.version = self.meta["built_at"]
+
+    def document(self, row: int) -> Dict[str, Any]:
+        """The stored paragraph in a row."""
+        start, end = int(self.text_offsets[row]), int(self.text_offsets[row + 1])
+        return json.loads(self.texts[start:end].tobytes().decode("utf-8"))
+
+    def neighbors(self, original_id: str, k: int, min_similarity: float = 0.0) -> List[Tuple[int, float]]:
+        """(row, cosine similarity) of a paragraph's nearest neighbours, best first; empty if it is unknown."""
+        row = self.rows.get(str(original_id))
+        if row is None:
+            return []
+        start, end = int(self.indptr[row]), int(self.indptr[row + 1])
+        pairs = zip(self.indices[start:end].tolist(), self.weights[start:end].tolist())
+        return [(int(neighbor), round(float(weight), 4)) for neighbor, weight in pairs if weight >= min_similarity][:k]
+
+
+# --- Building ---
+def nearest_neighbors(embeddings, k: int, workers: int = None, block_mb: int = 512):
+    """
+    The `k` most cosine-similar other rows of every row.
+
+    Args:
+        embeddings (np.ndarray): One embedding per row
+        k (int): Neighbours per row
+        workers (int, optional): Threads computing blocks; defaults to the CPU count
+        block_mb (int): Memory for the similarity blocks of all threads together
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Neighbour rows (uint32) and similarities (float32), each N x k, best first
+    """
+    import numpy as np
+
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    count = len(vectors)
+    k = min(k, count - 1)
+    workers = workers or os.cpu_count() or 1
+    block_rows = max(16, block_mb * 2 ** 20 // (4 * count * workers))
+    indices = np.empty((count, k), dtype=np.uint32)
+    similarities = np.empty((count, k), dtype=np.float32)
+
+    def run_block(start: int) -> None:
+        end = min(start + block_rows, count)
+        scores = vectors[start:end] @ vectors.T
+        scores[np.arange(end - start), np.arange(start, end)] = -np.inf  # Not its own neighbour
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        indices[start:end] = np.take_along_axis(top, order, axis=1)
+        similarities[start:end] = np.take_along_axis(top_scores, order, axis=1)
+
+    if k > 0:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(run_block, range(0, count, block_rows)))
+    return indices, similarities
+
+
+def build_graph(documents: List[Dict[str, Any]], embeddings, path: str, k: int = None,
+                min_similarity: float = 0.0, workers: int = None) -> Dict[str, Any]:
+    """
+    Builds the neighbour graph and writes it to `path`, replacing any graph there.
+
+    Args:
+        documents (List[Dict[str, Any]]): Paragraphs (with `original_id`), aligned with `embeddings`
+        embeddings (np.ndarray): One embedding per paragraph
+        path (str): Graph directory
+        k (int, optional): Neighbours per paragraph; defaults to config.NEIGHBOR_K
+        min_similarity (float): Neighbours less similar than this are not stored
+        workers (int, optional): Threads computing the neighbours
+
+    Returns:
+        Dict[str, Any]: The graph metadata
+    """
+    import numpy as np
+
+    k = k or config.NEIGHBOR_K
+    if len(documents) != len(embeddings) or len(documents) < 2:
+        raise ValueError(f"Need at least two paragraphs with one embedding each ({len(documents)} paragraphs, "
+                         f"{len(embeddings)} embeddings)")
+    start = time.perf_counter()
+    indices, similarities = nearest_neighbors(embeddings, k, workers)
+    keep = similarities >= min_similarity
+    indptr = np.concatenate([[0], np.cumsum(keep.sum(axis=1))]).astype(np.int64)
+
+    records = [json.dumps({field: doc.get(field, "") for field in DOCUMENT_FIELDS}, ensure_ascii=False).encode("utf-8")
+               for doc in documents]
+    text_offsets = np.concatenate([[0], np.cumsum([len(record) for record in records])]).astype(np.int64)
+    meta = {
+        "format": FORMAT_NAME, "version": FORMAT_VERSION, "built_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "documents": len(documents), "k": int(indices.shape[1]), "edges": int(indptr[-1]),
+        "min_similarity": min_similarity, "dimension": int(np.asarray(embeddings).shape[1]),
+        "build_seconds": round(time.perf_counter() - start, 2),
+    }
+    # Written next to the graph and swapped in, so a running app never reads half a graph
+    staging = f"{path.rstrip(os.sep)}.building"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    np.save(os.path.join(staging, "indptr.npy"), indptr)
+    np.save(os.path.join(staging, "indices.npy"), indices[keep])
+    np.save(os.path.join(staging, "weights.npy"), similarities[keep].astype(np.float16))
+    np.save(os.path.join(staging, "text_offsets.npy"), text_offsets)
+    with open(os.path.join(staging, "texts.bin"), "wb") as f:
+        for record in records:
+            f.write(record)
+    with open(os.path.join(staging, "documents.json"), "w", encoding="utf-8") as f:
+        json.dump([str(doc["original_id"]) for doc in documents], f, ensure_ascii=False)
+    with open(os.path.join(staging, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    previous = f"{path.rstrip(os.sep)}.previous"
+    shutil.rmtree(previous, ignore_errors=True)
+    if os.path.exists(path):
+        os.replace(path, previous)
+    os.replace(staging, path)
+    shutil.rmtree(previous, ignore_errors=True)
+    return meta
+
+
+def export_pinecone_vectors(index, batch_size: int = 100) -> Iterable[Tuple[Dict[str, Any], List[float]]]:
+    """(paragraph, embedding) pairs read from a Pinecone index by listing its ids and fetching the vectors."""
+    for ids in index.list():
+        for start in range(0, len(ids), batch_size):
+            response = index.fetch(ids=list(ids[start:start + batch_size]))
+            for vector_id, vector in response.vectors.items():
+                metadata = dict(vector.metadata or {})
+                yield {**metadata, "original_id": metadata.get("original_id", vector_id)}, list(vector.values)
+
+
+# --- Loading ---
+def graph_version() -> Optional[str]:
+    """When the graph on disk was built, or None if there is none."""
+    try:
+        with open(os.path.join(config.NEIGHBOR_GRAPH_PATH, "meta.json"), encoding="utf-8") as f:
+            return json.load(f).get("built_at")
+    except (OSError, ValueError):
+        return None
+
+
+@registry.init_once("neighbor_graph")
+def init_neighbor_graph() -> Tuple[bool, str]:
+    """Loads (memory-maps) the graph at config.NEIGHBOR_GRAPH_PATH, or reloads it after a rebuild."""
+    global neighbor_graph, is_neighbor_graph_ready, neighbor_graph_status_message
+    version = graph_version()
+    if is_neighbor_graph_ready and neighbor_graph is not None and neighbor_graph.version == version:
+        return True, neighbor_graph_status_message
+    if version is None:
+        neighbor_graph, is_neighbor_graph_ready = None, False
+        neighbor_graph_status_message = f"No neighbour graph at '{config.NEIGHBOR_GRAPH_PATH}'; related passages are off."
+        return False, neighbor_graph_status_message
+    try:
+        start = time.perf_counter()
+        neighbor_graph = NeighborGraph(config.NEIGHBOR_GRAPH_PATH)
+        is_neighbor_graph_ready = True
+        neighbor_graph_status_message = (f"Neighbour graph loaded ({neighbor_graph.meta['documents']} paragraphs, "
+                                         f"{neighbor_graph.meta['edges']} edges, built {version}).")
+        print(f"Neighbors: {neighbor_graph_status_message} ({time.perf_counter() - start:.2f}s)")
+    except Exception as e:
+        neighbor_graph, is_neighbor_graph_ready = None, False
+        neighbor_graph_status_message = f"Error loading neighbour graph: {type(e).__name__} - {e}"
+        print(f"Neighbors: {neighbor_graph_status_message}")
+    return is_neighbor_graph_ready, neighbor_graph_status_message
+
+
+_check_lock = threading.Lock()
+_last_check = float("-inf")
+_RECHECK_SECONDS = 5.0
+
+
+def get_graph() -> Optional[NeighborGraph]:
+    """The loaded graph, checking the disk for a rebuilt one at most every few seconds. Blocking."""
+    global _last_check
+    now = time.monotonic()
+    with _check_lock:
+        due = now - _last_check >= _RECHECK_SECONDS
+        if due:
+            _last_check = now
+    if due:
+        init_neighbor_graph()
+    return neighbor_graph
+
+
+def related_passages(original_id: str, k: int = None) -> List[Dict[str, Any]]:
+    """
+    A paragraph's most similar paragraphs, from the local graph (no network calls).
+
+    Args:
+        original_id (str): The paragraph's original id
+        k (int, optional): Number of passages; defaults to config.RELATED_PASSAGES_SHOWN
+
+    Returns:
+        List[Dict[str, Any]]: The passages (original_id, source_name, hebrew_text,
+        english_text) with their cosine similarity to the paragraph under `similarity`,
+        best first; empty without a graph or for an unknown paragraph
+    """
+    graph = get_graph()
+    k = config.RELATED_PASSAGES_SHOWN if k is None else k
+    if graph is None or k <= 0:
+        return []
+    return [{**graph.document(row), "similarity": similarity}
+            for row, similarity in graph.neighbors(original_id, k, config.NEIGHBOR_MIN_SIMILARITY)]
+
+
+def expand_with_neighbors(docs: List[Dict], sources: Optional[List[str]] = None) -> List[Dict]:
+    """
+    Adds the nearest neighbours of the top config.NEIGHBOR_EXPANSION_HITS retrieved
+    paragraphs (config.NEIGHBOR_EXPANSION_K each, if not retrieved already), each right
+    after the paragraph it was found from. Their `similarity_score` is an estimate: the
+    hit's score times the neighbour's similarity to the hit.
+
+    Args:
+        docs (List[Dict]): Retrieved documents, best first
+        sources (List[str], optional): Only add neighbours from these sources
+
+    Returns:
+        List[Dict]: The documents with the neighbours added, marked with `expanded_from`
+    """
+    graph = get_graph() if config.NEIGHBOR_EXPANSION_HITS > 0 else None
+    if graph is None or not docs:
+        return docs
+    seen = {str(doc.get("original_id")) for doc in docs}
+    expanded: List[Dict] = []
+    added = 0
+    for position, doc in enumerate(docs):
+        expanded.append(doc)
+        if position >= config.NEIGHBOR_EXPANSION_HITS:
+            continue
+        for row, similarity in graph.neighbors(doc.get("original_id"), config.NEIGHBOR_EXPANSION_K,
+                                               config.NEIGHBOR_MIN_SIMILARITY):
+            neighbor = graph.document(row)
+            if str(neighbor["original_id"]) in seen or (sources and neighbor.get("source_name") not in sources):
+                continue
+            seen.add(str(neighbor["original_id"]))
+            score = doc.get("similarity_score")
+            expanded.append({
+                **neighbor, "vector_id": None,
+                "similarity_score": round(score * similarity, 4) if isinstance(score, (int, float)) else None,
+                "expanded_from": doc.get("original_id"), "retrieved_by": ["neighbor"],
+            })
+            added += 1
+    metrics.inc("rag_neighbor_expansions_total", added)
+    return expanded
+
+
+# --- API ---
+def _route(query: Dict[str, List[str]]) -> Tuple[int, str, str]:
+    # GET /api/related?id=<original_id>&k=5 returns a paragraph's neighbours from the graph
+    doc_id = (query.get("id") or [""])[0].strip()
+    if not doc_id:
+        return 400, "application/json", json.dumps({"error": "Missing query parameter 'id'"})
+    try:
+        k = max(1, min(int((query.get("k") or [5])[0]), 100))
+    except ValueError:
+        return 400, "application/json", json.dumps({"error": "Parameter 'k' must be an integer"})
+    graph = get_graph()
+    if graph is None:
+        return 503, "application/json", json.dumps({"error": neighbor_graph_status_message})
+    if doc_id not in graph.rows:
+        return 404, "application/json", json.dumps({"error": f"Unknown paragraph '{doc_id}'"})
+    body = {"id": doc_id, "related": related_passages(doc_id, k)}
+    return 200, "application/json", json.dumps(body, ensure_ascii=False)
+
+
+metrics.register_route("/api/related", _route)
+metrics.registry.describe("rag_neighbor_expansions_total", "Paragraphs added to retrieval results as neighbours of the top hits.")
+
+
+def main(argv: List[str] = None) -> None:
+    import numpy as np
+
+    parser = argparse.ArgumentParser(description="Build or query the paragraph neighbour graph.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="Build the graph")
+    source = build.add_mutually_exclusive_group(required=True)
+    source.add_argument("--from-pinecone", action="store_true", help="Read paragraphs and embeddings from Pinecone")
+    source.add_argument("--embeddings", help=".npy file of embeddings, one row per paragraph of --corpus")
+    build.add_argument("--corpus", help="JSON-lines (or JSON array) file of paragraphs, aligned with --embeddings")
+    build.add_argument("-k", type=int, default=None, help="Neighbours per paragraph (default: config.NEIGHBOR_K)")
+    build.add_argument("--min-similarity", type=float, default=0.0, help="Do not store less similar neighbours")
+    build.add_argument("--workers", type=int, default=None, help="Threads (default: CPU count)")
+    build.add_argument("--output", default=None, help="Graph directory (default: config.NEIGHBOR_GRAPH_PATH)")
+    related = commands.add_parser("related", help="Show a paragraph's neighbours")
+    related.add_argument("id")
+    related.add_argument("-k", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        if args.from_pinecone:
+            from pinecone import Pinecone
+            from utils import clean_api_key
+            index = Pinecone(api_key=clean_api_key(config.PINECONE_API_KEY)).Index(config.PINECONE_INDEX_NAME)
+            pairs = list(export_pinecone_vectors(index))
+            documents = [doc for doc, _vector in pairs]
+            embeddings = np.asarray([vector for _doc, vector in pairs], dtype=np.float32)
+        else:
+            if not args.corpus:
+                parser.error("--embeddings needs --corpus")
+            from services.bm25 import read_corpus
+            documents = list(read_corpus(args.corpus))
+            embeddings = np.load(args.embeddings, mmap_mode="r")
+        meta = build_graph(documents, embeddings, args.output or config.NEIGHBOR_GRAPH_PATH, args.k,
+                           args.min_similarity, args.workers)
+        print(json.dumps(meta, indent=2))
+    else:
+        passages = related_passages(args.id, args.k)
+        if not passages:
+            print(neighbor_graph_status_message if get_graph() is None else f"No neighbours for '{args.id}'")
+        for rank, passage in enumerate(passages, start=1):
+            print(f"{rank:3d}. {passage['original_id']}  {passage['similarity']:.3f}  {passage['source_name']}")
+
+
+if __name__ == "__main__":
+    main()
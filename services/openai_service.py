@@ -1,13 +1,16 @@
-import openai
 import traceback
 import json
+import time
 import asyncio
-from typing import Dict, Optional, Tuple, List, AsyncGenerator, Set
-from langsmith import traceable
+import hashlib
+import math
+from typing import Dict, Optional, Tuple, List, AsyncGenerator, Set, TYPE_CHECKING
+from utils.tracing import traceable
 
 try:
     import config
-    from utils import format_context_for_openai
+    from utils import format_context_for_openai, metrics
+    from services import cassette, hedging, circuit_breaker, registry
 except ImportError:
     # More detailed error handling for better debugging
     print("Error: Failed to import config or utils in openai_service.py")
@@ -15,23 +18,31 @@ except ImportError:
     print("Current directory:", __file__)
     raise SystemExit("Failed imports in openai_service.py")
 
+if TYPE_CHECKING:
+    # The OpenAI SDK takes most of the app's import time; it is imported when the client is created
+    import openai
+
 # --- Globals ---
-openai_async_client: Optional[openai.AsyncOpenAI] = None
+openai_async_client: Optional["openai.AsyncOpenAI"] = None
 is_openai_ready: bool = False
 openai_status_message: str = "OpenAI service not initialized."
 
 # --- Initialization ---
+@registry.init_once("openai")
 def init_openai_client() -> Tuple[bool, str]:
     """Initializes the OpenAI async client."""
     global openai_async_client, is_openai_ready, openai_status_message
     if is_openai_ready:
         return True, openai_status_message
-    if not config.OPENAI_API_KEY:
+    if not config.OPENAI_API_KEY and not cassette.replay_enabled():
         openai_status_message = "Error: OPENAI_API_KEY not found in Secrets."
         is_openai_ready = False
         return False, openai_status_message
     try:
-        openai_async_client = openai.AsyncOpenAI(api_key=config.OPENAI_API_KEY)
+        import openai
+        openai_async_client = cassette.wrap_openai_client(
+            lambda: openai.AsyncOpenAI(api_key=config.OPENAI_API_KEY)
+        )
         openai_status_message = (
             f"OpenAI service ready (Validate: {config.OPENAI_VALIDATION_MODEL}, "
             f"Generate: {config.OPENAI_GENERATION_MODEL})."
@@ -55,11 +66,102 @@ def get_openai_status() -> Tuple[bool, str]:
         init_openai_client()
     return is_openai_ready, openai_status_message
 
+# --- Prompt Layout ---
+_PARAGRAPH_FIELDS = ("{paragraph_index}", "{hebrew_text}", "{english_text}")
+
+def _prompt_cache_kwargs(prefix: str) -> Dict:
+    """Request arguments routing calls that share `prefix` to the same provider prompt cache."""
+    if not config.OPENAI_PROMPT_CACHE_KEY or not prefix:
+        return {}
+    return {"extra_body": {"prompt_cache_key": hashlib.sha256(prefix.encode("utf-8")).hexdigest()[:32]}}
+
+class ValidationPrompt:
+    """
+    The validation prompt of one query, split at the line of the template's first
+    per-paragraph placeholder: the instructions and question before it become a system
+    message shared by every paragraph, the rest the per-paragraph user message.
+
+    Built once per query (from a snapshot of config.VALIDATION_MODE and its template), so
+    all validation calls of the query send a byte-identical prefix for prompt caching
+    even if the template is edited meanwhile.
+    """
+
+    def __init__(self, user_question: str, template: Optional[str] = None, mode: Optional[str] = None):
+        self.mode = mode or config.VALIDATION_MODE
+        if template is None:
+            template = config.VALIDATION_LOGPROB_PROMPT_TEMPLATE if self.mode == "logprob" else config.VALIDATION_PROMPT_TEMPLATE
+        positions = [template.find(field) for field in _PARAGRAPH_FIELDS if field in template]
+        split = template.rfind("\n", 0, min(positions)) + 1 if positions else len(template)
+        self.user_question = user_question
+        self.prefix = template[:split].format(user_question=user_question).strip()
+        self._paragraph_template = template[split:]
+        self.request_kwargs = _prompt_cache_kwargs(self.prefix)
+
+    def messages(self, paragraph_index: int, hebrew_text: str, english_text: str) -> List[Dict[str, str]]:
+        paragraph = self._paragraph_template.format(
+            user_question=self.user_question,
+            paragraph_index=paragraph_index,
+            hebrew_text=hebrew_text,
+            english_text=english_text
+        ).strip()
+        if not self.prefix:
+            return [{"role": "user", "content": paragraph}]
+        return [{"role": "system", "content": self.prefix}, {"role": "user", "content": paragraph}]
+
+_YES_TOKENS = {"yes", "y", "כן"}
+_NO_TOKENS = {"no", "n", "לא"}
+
+def calibrate_relevance(p_yes: float) -> float:
+    """Maps the model's yes-probability to a relevance score with config.VALIDATION_CALIBRATION (Platt scaling)."""
+    p_yes = min(max(p_yes, 1e-6), 1 - 1e-6)
+    z = config.VALIDATION_CALIBRATION.get("a", 1.0) * math.log(p_yes / (1 - p_yes)) + config.VALIDATION_CALIBRATION.get("b", 0.0)
+    return 1 / (1 + math.exp(-z))
+
+def relevance_from_logprobs(response) -> Dict:
+    """
+    Turns a single-token yes/no validation response into a verdict with a relevance score.
+
+    The yes-probability is the probability mass of the "yes" spellings among the top
+    alternatives, normalized against the "no" spellings; without logprobs the answer
+    token itself decides.
+    """
+    choice = response.choices[0]
+    p_yes = p_no = 0.0
+    content = getattr(getattr(choice, "logprobs", None), "content", None) or []
+    for candidate in (getattr(content[0], "top_logprobs", None) or []) if content else []:
+        token = str(candidate.token).strip().lower()
+        if token in _YES_TOKENS:
+            p_yes += math.exp(candidate.logprob)
+        elif token in _NO_TOKENS:
+            p_no += math.exp(candidate.logprob)
+    if p_yes + p_no > 0:
+        probability = p_yes / (p_yes + p_no)
+    else:
+        probability = 1.0 if (choice.message.content or "").strip().lower() in _YES_TOKENS else 0.0
+    score = calibrate_relevance(probability)
+    return {"contains_relevant_info": score >= config.VALIDATION_LOGPROB_THRESHOLD,
+            "relevance_score": round(score, 4), "justification": ""}
+
 # --- Validation Function (uses template) ---
-@traceable(name="openai-validate-paragraph")
+@traceable(name="openai-validate-paragraph", sample_rate=config.TRACING_VALIDATION_SAMPLE_RATE)
 async def validate_relevance_openai(
-    paragraph_data: Dict, user_question: str, paragraph_index: int
+    paragraph_data: Dict, user_question: str, paragraph_index: int,
+    prompt: Optional[ValidationPrompt] = None, model: Optional[str] = None, stage: str = "validation"
 ) -> Optional[Dict]:
+    """
+    Asks the validation model whether a paragraph helps answer the question.
+
+    Args:
+        paragraph_data (Dict): The retrieved paragraph
+        user_question (str): The user's question
+        paragraph_index (int): Zero-based position of the paragraph in the retrieval results
+        prompt (Optional[ValidationPrompt]): The query's prompt, shared by all its paragraphs
+        model (Optional[str]): Model to ask instead of the configured validation model (no fallback)
+        stage (str): Stage the call's usage is accounted under
+
+    Returns:
+        Optional[Dict]: The verdict under "validation" and the paragraph under "paragraph_data"
+    """
     global openai_async_client
     ready, msg = get_openai_status()
     if not ready or openai_async_client is None:
@@ -75,25 +177,63 @@ async def validate_relevance_openai(
             "paragraph_data": safe_paragraph_data
         }
 
-    validation_model = config.OPENAI_VALIDATION_MODEL
-    prompt_content = config.VALIDATION_PROMPT_TEMPLATE.format(
-        user_question=user_question,
-        paragraph_index=paragraph_index+1,
-        hebrew_text=hebrew_text or "(No Hebrew)",
-        english_text=english_text or "(No English)"
-    )
-
     try:
-        response = await openai_async_client.chat.completions.create(
+        validation_model, breaker = circuit_breaker.acquire(
+            "validation", [model] if model else [config.OPENAI_VALIDATION_MODEL, config.OPENAI_VALIDATION_FALLBACK_MODEL]
+        )
+    except circuit_breaker.CircuitOpenError as e:
+        print(f"OpenAI validation skipped (Para {paragraph_index+1}): {e}")
+        return {
+            "validation": {"contains_relevant_info": False, "justification": "Validation service unavailable."},
+            "paragraph_data": safe_paragraph_data
+        }
+    prompt = prompt or ValidationPrompt(user_question)
+    messages = prompt.messages(paragraph_index + 1, hebrew_text or "(No Hebrew)", english_text or "(No English)")
+
+    def request():
+        if prompt.mode == "logprob":
+            return openai_async_client.chat.completions.create(
+                model=validation_model,
+                messages=messages,
+                temperature=0.0,
+                max_tokens=1,
+                logprobs=True,
+                top_logprobs=config.VALIDATION_TOP_LOGPROBS,
+                **prompt.request_kwargs
+            )
+        return openai_async_client.chat.completions.create(
             model=validation_model,
-            messages=[{"role": "user", "content": prompt_content}],
+            messages=messages,
             temperature=0.1,
             max_tokens=150,
-            response_format={"type": "json_object"}
+            response_format={"type": "json_object"},
+            **prompt.request_kwargs
         )
-        validation_result = json.loads(response.choices[0].message.content)
+
+    start_time = time.perf_counter()
+    try:
+        with circuit_breaker.track(breaker):
+            if config.HEDGE_VALIDATION:
+                # The cancelled attempt is billed too; its usage is assumed equal to the winner's
+                response = await hedging.hedged_call(
+                    request, hedging.get_policy("validation"),
+                    on_abandoned=lambda winner: metrics.record_usage(stage, validation_model,
+                                                                     getattr(winner, "usage", None))
+                )
+            else:
+                response = await request()
+        metrics.observe("rag_validation_seconds", time.perf_counter() - start_time, model=validation_model,
+                        mode=prompt.mode)
+        metrics.record_usage(stage, validation_model, getattr(response, "usage", None))
+        if prompt.mode == "logprob":
+            validation_result = relevance_from_logprobs(response)
+            metrics.observe("rag_validation_relevance_score", validation_result["relevance_score"],
+                            buckets=metrics.RATIO_BUCKETS)
+        else:
+            validation_result = json.loads(response.choices[0].message.content)
         return {"validation": validation_result, "paragraph_data": safe_paragraph_data}
     except Exception as e:
+        metrics.inc("rag_api_errors_total", endpoint="validation", error=type(e).__name__)
         print(f"Error (OpenAI Validate {paragraph_index+1}): {e}")
         traceback.print_exc()
         return {
@@ -101,6 +241,78 @@ async def validate_relevance_openai(
             "paragraph_data": safe_paragraph_data
         }
 
+async def validate_relevance_cascade(
+    paragraph_data: Dict, user_question: str, paragraph_index: int,
+    screen_prompt: ValidationPrompt, prompt: ValidationPrompt
+) -> Optional[Dict]:
+    """
+    Screens a paragraph with config.CASCADE_SCREEN_MODEL and escalates it to the validation
+    model only when the screen is unsure.
+
+    The screen answers in logprob mode; a relevance score at or above
+    config.CASCADE_ACCEPT_SCORE passes the paragraph, one at or below
+    config.CASCADE_REJECT_SCORE drops it, and anything in between (or a failed screen)
+    is validated again with `prompt`.
+
+    Args:
+        paragraph_data (Dict): The retrieved paragraph
+        user_question (str): The user's question
+        paragraph_index (int): Zero-based position of the paragraph in the retrieval results
+        screen_prompt (ValidationPrompt): The query's logprob-mode prompt for the screen
+        prompt (ValidationPrompt): The query's prompt for the validation model
+
+    Returns:
+        Optional[Dict]: As validate_relevance_openai, with the decision under validation["cascade"]
+    """
+    screened = await validate_relevance_openai(paragraph_data, user_question, paragraph_index, screen_prompt,
+                                               model=config.CASCADE_SCREEN_MODEL, stage="screening")
+    score = (screened or {}).get("validation", {}).get("relevance_score")
+    if score is not None and score >= config.CASCADE_ACCEPT_SCORE:
+        decision, result = "accepted", screened
+    elif score is not None and score <= config.CASCADE_REJECT_SCORE:
+        decision, result = "rejected", screened
+    else:
+        decision = "escalated"
+        result = await validate_relevance_openai(paragraph_data, user_question, paragraph_index, prompt)
+    metrics.inc("rag_cascade_decisions_total", decision=decision)
+    if result and isinstance(result.get("validation"), dict):
+        result["validation"]["cascade"] = decision
+    return result
+
+@traceable(name="openai-explain-relevance")
+async def explain_relevance(paragraph_data: Dict, user_question: str, paragraph_index: int) -> str:
+    """
+    Writes the Hebrew justification of a paragraph's relevance, for paragraphs validated
+    in logprob mode that are shown to the user.
+
+    Returns:
+        str: The justification, or "" if it could not be generated
+    """
+    ready, msg = get_openai_status()
+    if not ready or openai_async_client is None:
+        return ""
+    try:
+        model, breaker = circuit_breaker.acquire(
+            "validation", [config.OPENAI_VALIDATION_MODEL, config.OPENAI_VALIDATION_FALLBACK_MODEL]
+        )
+    except circuit_breaker.CircuitOpenError:
+        return ""
+    prompt = ValidationPrompt(user_question, mode="json")
+    messages = prompt.messages(paragraph_index + 1, (paragraph_data.get('hebrew_text') or '').strip() or "(No Hebrew)",
+                               (paragraph_data.get('english_text') or '').strip() or "(No English)")
+    try:
+        with circuit_breaker.track(breaker):
+            response = await openai_async_client.chat.completions.create(
+                model=model, messages=messages, temperature=0.1, max_tokens=150,
+                response_format={"type": "json_object"}, **prompt.request_kwargs
+            )
+        metrics.record_usage("explanation", model, getattr(response, "usage", None))
+        return str(json.loads(response.choices[0].message.content).get("justification") or "")
+    except Exception as e:
+        metrics.inc("rag_api_errors_total", endpoint="explanation", error=type(e).__name__)
+        print(f"Error (OpenAI Explain {paragraph_index+1}): {e}")
+        return ""
+
 # --- Generation Function (unchanged) ---
 @traceable(name="openai-generate-stream")
 async def generate_openai_stream(
@@ -131,9 +343,10 @@ async def generate_openai_stream(
         return
 
     last_user = next((m['content'] for m in reversed(messages) if m.get('role')=='user'), "")
+    # Stable parts first (system prompt, then the question) so the provider can cache the prefix
     user_prompt = (
-        f"Source Texts:\n{formatted_context}\n\n"
         f"User Question:\n{last_user}\n\n"
+        f"Source Texts:\n{formatted_context}\n\n"
         "Answer (in Hebrew, based ONLY on the Source Texts provided):"
     )
     
@@ -148,38 +361,75 @@ async def generate_openai_stream(
         
     api_messages = [{"role":"system","content":sys_msg},{"role":"user","content":user_prompt}]
 
-    model = config.OPENAI_GENERATION_MODEL
+    try:
+        model, breaker = circuit_breaker.acquire(
+            "generation", [config.OPENAI_GENERATION_MODEL, config.OPENAI_GENERATION_FALLBACK_MODEL]
+        )
+    except circuit_breaker.CircuitOpenError as e:
+        yield f"--- Error: {e} ---"
+        return
     print(f"Using generation model: {model}")
 
     # Determine token parameter
     token_key = "max_completion_tokens" if model.startswith(("o1","o3","o4")) else "max_tokens"
-    kwargs = {"model":model, "messages":api_messages, token_key:3000}
+    kwargs = {"model":model, "messages":api_messages, token_key:3000, **_prompt_cache_kwargs(sys_msg)}
 
     # Attempt streaming for non-o-series
     if not model.startswith(("o1","o3","o4")):
-        kwargs.update({"stream":True, "temperature":0.5})
+        stream_kwargs = dict(kwargs, stream=True, temperature=0.5, stream_options={"include_usage": True})
+        start_time = time.perf_counter()
+        first_token_time = None
+        usage = None
         try:
-            stream = await openai_async_client.chat.completions.create(**kwargs)
-            async for chunk in stream:
-                c = chunk.choices[0].delta.content
-                if c:
-                    yield c
+            with circuit_breaker.track(breaker):
+                stream = await openai_async_client.chat.completions.create(**stream_kwargs)
+                async for chunk in stream:
+                    if getattr(chunk, "usage", None):
+                        usage = chunk.usage
+                    if not chunk.choices:
+                        continue  # The final usage chunk carries no choices
+                    c = chunk.choices[0].delta.content
+                    if c:
+                        if first_token_time is None:
+                            first_token_time = time.perf_counter()
+                            metrics.observe("rag_generation_ttft_seconds", first_token_time - start_time, model=model)
+                        yield c
+            _record_generation_usage(model, usage, first_token_time or start_time)
             return
         except Exception as e:
+            metrics.inc("rag_api_errors_total", endpoint="generation_stream", error=type(e).__name__)
             print(f"Streaming failed for model {model}: {e}")
             traceback.print_exc()
+            # The non-streaming retry needs the breaker's permission again
+            if not breaker.allow():
+                yield f"--- Error: {circuit_breaker.CircuitOpenError(breaker.name, breaker.retry_after())} ---"
+                return
 
     # Fallback or direct call (o-series or streaming error)
+    start_time = time.perf_counter()
     try:
-        resp = await openai_async_client.chat.completions.create(**kwargs)
+        with circuit_breaker.track(breaker):
+            resp = await openai_async_client.chat.completions.create(**kwargs)
+        # Without streaming the whole answer arrives at once
+        metrics.observe("rag_generation_ttft_seconds", time.perf_counter() - start_time, model=model)
+        _record_generation_usage(model, getattr(resp, "usage", None), start_time)
         text = resp.choices[0].message.content
         yield text
     except Exception as e:
+        metrics.inc("rag_api_errors_total", endpoint="generation", error=type(e).__name__)
         err = f"--- Error generating response: {e} ---"
         print(err)
         traceback.print_exc()
         yield err
 
+def _record_generation_usage(model: str, usage, decode_start: float) -> None:
+    """Records generation token usage and decode throughput (completion tokens per second)."""
+    counts = metrics.record_usage("generation", model, usage)
+    decode_time = time.perf_counter() - decode_start
+    if counts["completion"] and decode_time > 0:
+        metrics.observe("rag_generation_tokens_per_second", counts["completion"] / decode_time,
+                        buckets=metrics.RATE_BUCKETS, model=model)
+
 # --- Citation Extraction Function ---
 @traceable(name="openai-extract-citations")
 async def extract_citations_with_openai(text: str) -> Set[str]:
@@ -195,22 +445,36 @@ async def extract_citations_with_openai(text: str) -> Set[str]:
         return set()
     
     try:
-        response = await openai_async_client.chat.completions.create(
-            model=config.OPENAI_VALIDATION_MODEL,
-            messages=[
-                {"role": "system", "content": "Extract all source citation numbers mentioned in the Hebrew text. Citations may appear in various formats like 'מקור X', 'מקורות X, Y, Z', 'מקור X, ראה Y', or similar patterns where X, Y, Z are numbers. Return only a JSON object with 'citations' containing an array of strings representing all the numbers found."},
-                {"role": "user", "content": f"Text: {text}\n\nExtract all source citation numbers and return as JSON."}
-            ],
-            response_format={"type": "json_object"},
-            temperature=0.1,
-            max_tokens=150
+        citation_model, breaker = circuit_breaker.acquire(
+            "citations", [config.OPENAI_VALIDATION_MODEL, config.OPENAI_VALIDATION_FALLBACK_MODEL]
         )
+    except circuit_breaker.CircuitOpenError as e:
+        print(f"OpenAI citation extraction skipped: {e}")
+        return set()
+
+    start_time = time.perf_counter()
+    try:
+        with circuit_breaker.track(breaker):
+            response = await openai_async_client.chat.completions.create(
+                model=citation_model,
+                messages=[
+                    {"role": "system", "content": "Extract all source citation numbers mentioned in the Hebrew text. Citations may appear in various formats like 'מקור X', 'מקורות X, Y, Z', 'מקור X, ראה Y', or similar patterns where X, Y, Z are numbers. Return only a JSON object with 'citations' containing an array of strings representing all the numbers found."},
+                    {"role": "user", "content": f"Text: {text}\n\nExtract all source citation numbers and return as JSON."}
+                ],
+                response_format={"type": "json_object"},
+                temperature=0.1,
+                max_tokens=150
+            )
+        metrics.observe("rag_citation_extraction_seconds", time.perf_counter() - start_time,
+                        model=citation_model)
+        metrics.record_usage("citations", citation_model, getattr(response, "usage", None))
         
         result = json.loads(response.choices[0].message.content)
         citations = result.get("citations", [])
         print(f"OpenAI citation extraction found: {citations}")
         return set(str(c) for c in citations)
     except Exception as e:
+        metrics.inc("rag_api_errors_total", endpoint="citations", error=type(e).__name__)
         print(f"Error during OpenAI citation extraction: {e}")
         traceback.print_exc()
         return set()
@@ -0,0 +1,303 @@
+# services/quote_index.py
+"""
+Exact-quote lookup: finds the paragraphs a pasted line of text comes from.
+
+Every paragraph is cut into overlapping shingles of `shingle_words` consecutive
+words. The words are normalized to tolerate the usual differences between
+editions: no niqqud, cantillation or gershayim, final letters folded, attached
+prefixes stripped, and the letters ו and י dropped inside words (full and
+defective spelling, כתיב מלא/חסר). Each distinct shingle of a paragraph is stored
+as a 64-bit hash next to the paragraph's number, in two arrays sorted by hash and
+memory-mapped on load.
+
+A query is cut into shingles the same way and looked up with one vectorized
+binary search; a paragraph's match is the number of the query's shingles it
+contains. A changed or missing word only loses the few shingles that span it, so
+near-exact quotes still match.
+
+    python -m services.quote_index build --corpus corpus.jsonl
+    python -m services.quote_index build --from-pinecone
+    python -m services.quote_index search "ויאמר משה אל העם אל תיראו"
+"""
+import os
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import config
+from utils import metrics
+from utils.hebrew_normalize import index_terms
+from services import registry
+
+FORMAT_NAME = "rag-quote-index"
+FORMAT_VERSION = 1
+
+# --- Globals ---
+quote_index: Optional["QuoteIndex"] = None
+is_quote_index_ready: bool = False
+quote_index_status_message: str = "Quote index not loaded."
+
+
+def quote_words(text: str) -> List[str]:
+    """
+    The words of a text as the quote index compares them (see the module docstring).
+
+    Args:
+        text (str): Text to split
+
+    Returns:
+        List[str]: Normalized words in order
+    """
+    words = []
+    for term in index_terms(text):
+        # Full and defective spellings differ in a ו or י inside the word
+        skeleton = term[:1] + term[1:].replace("ו", "").replace("י", "")
+        words.append(skeleton if len(skeleton) >= 2 else term)
+    return words
+
+
+def shingle_hashes(text: str, shingle_words: int) -> List[int]:
+    """The distinct 64-bit hashes of a text's word shingles (the whole text if it is shorter)."""
+    words = quote_words(text)
+    if not words:
+        return []
+    count = max(1, len(words) - shingle_words + 1)
+    shingles = {" ".join(words[i:i + shingle_words]) for i in range(count)}
+    return [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little") for s in shingles]
+
+
+class QuoteIndex:
+    """A quote index loaded from disk (see the module docstring for the layout)."""
+
+    def __init__(self, path: str):
+        import numpy as np
+
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta.get("format") != FORMAT_NAME or self.meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Not a {FORMAT_NAME} v{FORMAT_VERSION} index: {path}")
+        with open(os.path.join(path, "documents.json"), encoding="utf-8") as f:
+            self.doc_ids: List[str] = json.load(f)
+        self.hashes = np.load(os.path.join(path, "hashes.npy"), mmap_mode="r")
+        self.docs = np.load(os.path.join(path, "docs.npy"), mmap_mode="r")
+        self.shingle_words = int(self.meta["shingle_words"])
+        self.version = self.meta["built_at"]
+
+    def search(self, text: str, k: int) -> Tuple[int, List[Tuple[str, int]]]:
+        """
+        The paragraphs containing the most shingles of `text`.
+
+        Args:
+            text (str): The pasted text (or a question quoting it)
+            k (int): Number of paragraphs
+
+        Returns:
+            Tuple[int, List[Tuple[str, int]]]: The number of distinct shingles in `text`, and
+            (original id, shingles matched) pairs, most matched first
+        """
+        import numpy as np
+
+        query = np.unique(np.asarray(shingle_hashes(text, self.shingle_words), dtype=np.uint64))
+        if not len(query) or k <= 0:
+            return len(query), []
+        starts = np.searchsorted(self.hashes, query, side="left")
+        ends = np.searchsorted(self.hashes, query, side="right")
+        lengths = ends - starts
+        if not lengths.sum():
+            return len(query), []
+        # Every posting of every query shingle (each paragraph holds a shingle at most once)
+        positions = np.repeat(starts, lengths) + (
+            np.arange(int(lengths.sum())) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        )
+        docs, counts = np.unique(np.asarray(self.docs[positions]), return_counts=True)
+        top = np.lexsort((docs, -counts))[:k]
+        return len(query), [(self.doc_ids[int(docs[i])], int(counts[i])) for i in top]
+
+
+# --- Building ---
+def build_index(documents: Iterable[Dict[str, Any]], path: str, shingle_words: int = None) -> Dict[str, Any]:
+    """
+    Builds the quote index for a corpus and writes it to `path`, replacing any index there.
+
+    Args:
+        documents (Iterable[Dict[str, Any]]): Paragraphs with `original_id` (or `id`) and `hebrew_text`
+        path (str): Index directory
+        shingle_words (int, optional): Words per shingle; defaults to config.QUOTE_SHINGLE_WORDS
+
+    Returns:
+        Dict[str, Any]: The index metadata
+    """
+    import numpy as np
+
+    shingle_words = shingle_words or config.QUOTE_SHINGLE_WORDS
+    start = time.perf_counter()
+    doc_ids: List[str] = []
+    hash_chunks, doc_chunks = [], []
+    for doc in documents:
+        doc_id = str(doc.get("original_id") or doc.get("id") or "")
+        hashes = shingle_hashes(doc.get("hebrew_text") or "", shingle_words) if doc_id else []
+        if not hashes:
+            continue
+        hash_chunks.append(np.asarray(hashes, dtype=np.uint64))
+        doc_chunks.append(np.full(len(hashes), len(doc_ids), dtype=np.uint32))
+        doc_ids.append(doc_id)
+    if not doc_ids:
+        raise ValueError("No documents to index")
+    hashes = np.concatenate(hash_chunks)
+    docs = np.concatenate(doc_chunks)
+    order = np.argsort(hashes, kind="stable")
+
+    meta = {
+        "format": FORMAT_NAME, "version": FORMAT_VERSION, "built_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "documents": len(doc_ids), "shingles": int(len(hashes)), "shingle_words": shingle_words,
+    }
+    # Written next to the index and swapped in, so a running app never reads half an index
+    staging = f"{path.rstrip(os.sep)}.building"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    np.save(os.path.join(staging, "hashes.npy"), hashes[order])
+    np.save(os.path.join(staging, "docs.npy"), docs[order])
+    with open(os.path.join(staging, "documents.json"), "w", encoding="utf-8") as f:
+        json.dump(doc_ids, f, ensure_ascii=False)
+    with open(os.path.join(staging, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    previous = f"{path.rstrip(os.sep)}.previous"
+    shutil.rmtree(previous, ignore_errors=True)
+    if os.path.exists(path):
+        os.replace(path, previous)
+    os.replace(staging, path)
+    shutil.rmtree(previous, ignore_errors=True)
+    meta["build_seconds"] = round(time.perf_counter() - start, 2)
+    return meta
+
+
+# --- Loading ---
+def index_version() -> Optional[str]:
+    """When the index on disk was built, or None if there is none."""
+    try:
+        with open(os.path.join(config.QUOTE_INDEX_PATH, "meta.json"), encoding="utf-8") as f:
+            return json.load(f).get("built_at")
+    except (OSError, ValueError):
+        return None
+
+
+@registry.init_once("quote_index")
+def init_quote_index() -> Tuple[bool, str]:
+    """Loads (memory-maps) the index at config.QUOTE_INDEX_PATH, or reloads it after a rebuild."""
+    global quote_index, is_quote_index_ready, quote_index_status_message
+    version = index_version()
+    if is_quote_index_ready and quote_index is not None and quote_index.version == version:
+        return True, quote_index_status_message
+    if version is None:
+        quote_index, is_quote_index_ready = None, False
+        quote_index_status_message = f"No quote index at '{config.QUOTE_INDEX_PATH}'; quote lookup is off."
+        return False, quote_index_status_message
+    try:
+        start = time.perf_counter()
+        quote_index = QuoteIndex(config.QUOTE_INDEX_PATH)
+        is_quote_index_ready = True
+        quote_index_status_message = (f"Quote index loaded ({quote_index.meta['documents']} paragraphs, "
+                                      f"{quote_index.meta['shingles']} shingles, built {version}).")
+        print(f"Quotes: {quote_index_status_message} ({time.perf_counter() - start:.2f}s)")
+    except Exception as e:
+        quote_index, is_quote_index_ready = None, False
+        quote_index_status_message = f"Error loading quote index: {type(e).__name__} - {e}"
+        print(f"Quotes: {quote_index_status_message}")
+    return is_quote_index_ready, quote_index_status_message
+
+
+_check_lock = threading.Lock()
+_last_check = float("-inf")
+_RECHECK_SECONDS = 5.0
+
+
+def get_index() -> Optional[QuoteIndex]:
+    """The loaded index, checking the disk for a rebuilt one at most every few seconds. Blocking."""
+    global _last_check
+    if not config.QUOTE_LOOKUP:
+        return None
+    now = time.monotonic()
+    with _check_lock:
+        due = now - _last_check >= _RECHECK_SECONDS
+        if due:
+            _last_check = now
+    if due:
+        init_quote_index()
+    return quote_index
+
+
+def find_quotes(text: str) -> List[Tuple[str, float]]:
+    """
+    The paragraphs a question quotes. Blocking.
+
+    Only questions of at least config.QUOTE_MIN_WORDS words are looked up. A paragraph
+    matches when it contains at least config.QUOTE_MIN_SHINGLES of the question's
+    shingles and at least half as many as the best match; at most
+    config.QUOTE_MAX_PINNED are returned.
+
+    Args:
+        text (str): The user's question (without template)
+
+    Returns:
+        List[Tuple[str, float]]: (original id, share of the question's shingles matched) pairs, best first
+    """
+    index = get_index()
+    if index is None or len(quote_words(text)) < config.QUOTE_MIN_WORDS:
+        return []
+    start = time.perf_counter()
+    total, hits = index.search(text, config.QUOTE_MAX_PINNED)
+    metrics.observe("rag_quote_lookup_seconds", time.perf_counter() - start)
+    if not hits:
+        return []
+    best = hits[0][1]
+    matches = [(doc_id, round(count / total, 4)) for doc_id, count in hits
+               if count >= config.QUOTE_MIN_SHINGLES and count * 2 >= best]
+    metrics.inc("rag_quote_lookups_total", result="match" if matches else "none")
+    return matches
+
+
+metrics.registry.describe("rag_quote_lookup_seconds", "Time of one exact-quote lookup in the local quote index.")
+metrics.registry.describe("rag_quote_lookups_total", "Exact-quote lookups, by result (match, none).")
+
+
+def main(argv: List[str] = None) -> None:
+    from services.bm25 import read_corpus, export_pinecone
+
+    parser = argparse.ArgumentParser(description="Build or query the exact-quote index.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="Build the index")
+    source = build.add_mutually_exclusive_group(required=True)
+    source.add_argument("--corpus", help="JSON-lines (or JSON array) file of paragraphs")
+    source.add_argument("--from-pinecone", action="store_true", help="Read the paragraphs from the Pinecone index")
+    build.add_argument("--output", default=None, help="Index directory (default: config.QUOTE_INDEX_PATH)")
+    query = commands.add_parser("search", help="Query the index")
+    query.add_argument("text")
+    query.add_argument("-k", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        if args.from_pinecone:
+            from pinecone import Pinecone
+            from utils import clean_api_key
+            index = Pinecone(api_key=clean_api_key(config.PINECONE_API_KEY)).Index(config.PINECONE_INDEX_NAME)
+            documents = export_pinecone(index)
+        else:
+            documents = read_corpus(args.corpus)
+        meta = build_index(documents, args.output or config.QUOTE_INDEX_PATH)
+        print(json.dumps(meta, indent=2))
+    else:
+        index = get_index()
+        if index is None:
+            print(quote_index_status_message)
+            return
+        total, hits = index.search(args.text, args.k)
+        for rank, (doc_id, count) in enumerate(hits, start=1):
+            print(f"{rank:3d}. {doc_id}  {count}/{total} shingles")
+
+
+if __name__ == "__main__":
+    main()
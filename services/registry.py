@@ -0,0 +1,68 @@
+# services/registry.py
+"""
+Init-once registry for the process-wide service clients.
+
+Streamlit runs every browser session's script in its own thread, so the first
+sessions after a cold start can all reach a service's initializer at the same
+time. `init_once` serializes each initializer under its own lock: the first
+caller does the work, later callers find the service ready and return its
+cached status. A failed initialization is not cached, so the next caller
+retries it.
+"""
+import time
+import functools
+import threading
+from typing import Any, Callable, Dict, Tuple
+
+from utils import metrics
+
+_locks: Dict[str, threading.RLock] = {}
+_locks_lock = threading.Lock()
+_statuses: Dict[str, Dict[str, Any]] = {}
+
+
+def _lock_for(name: str) -> threading.RLock:
+    with _locks_lock:
+        if name not in _locks:
+            # Re-entrant so an initializer can call its own status getter
+            _locks[name] = threading.RLock()
+        return _locks[name]
+
+
+def init_once(name: str) -> Callable[[Callable[[], Tuple[bool, str]]], Callable[[], Tuple[bool, str]]]:
+    """
+    Serializes a service initializer that returns `(ready, message)`.
+
+    The initializer is expected to return early when its service is already
+    ready; the registry guarantees only one thread runs it at a time and records
+    how long each initialization took.
+
+    Args:
+        name: Service name used in logs, metrics and `get_statuses`
+
+    Returns:
+        Callable: The decorator
+    """
+    def decorator(init: Callable[[], Tuple[bool, str]]) -> Callable[[], Tuple[bool, str]]:
+        @functools.wraps(init)
+        def wrapper() -> Tuple[bool, str]:
+            with _lock_for(name):
+                start = time.perf_counter()
+                ready, message = init()
+                elapsed = time.perf_counter() - start
+                status = _statuses.setdefault(name, {"initialized": False})
+                if ready and not status["initialized"]:
+                    status.update(initialized=True, init_seconds=round(elapsed, 4))
+                    metrics.observe("rag_service_init_seconds", elapsed, service=name)
+                status.update(ready=ready, message=message)
+                return ready, message
+        return wrapper
+    return decorator
+
+
+def get_statuses() -> Dict[str, Dict[str, Any]]:
+    """Result and first-initialization time of each service's most recent initialization call."""
+    return {name: dict(status) for name, status in _statuses.items()}
+
+
+metrics.registry.describe("rag_service_init_seconds", "Time spent initializing each service client.")
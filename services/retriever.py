@@ -5,9 +5,11 @@ import time
 import traceback
 import os
 import asyncio
-from typing import List, Dict, Optional, Tuple
-from pinecone import Pinecone, Index
-from langsmith import traceable
+import threading
+import statistics
+from collections import Counter
+from typing import Any, List, Dict, Optional, Tuple, TYPE_CHECKING
+from utils.tracing import traceable
 
 # Change relative imports to absolute imports
 import config
@@ -17,85 +19,450 @@ from config import (
     PINECONE_INDEX_NAME,
     EMBEDDING_MODEL
 )
-from utils import clean_source_text, get_embedding, clean_api_key
+from utils import clean_source_text, get_embedding, clean_api_key, metrics
+from services import bm25, cassette, circuit_breaker, facets, neighbors, quote_index, registry
+
+if TYPE_CHECKING:
+    # The Pinecone SDK is imported when the retriever connects, not when the app starts
+    from pinecone import Pinecone, Index
 
 # --- Globals ---
-pinecone_client: Optional[Pinecone] = None
-pinecone_index: Optional[Index] = None
+pinecone_client: Optional["Pinecone"] = None
+pinecone_index: Optional["Index"] = None
 is_retriever_ready: bool = False
 retriever_status_message: str = "Retriever not initialized."
+# Background thread validating and connecting the index (None once it has finished)
+connect_thread: Optional[threading.Thread] = None
+# Connected federated shards (config.RETRIEVAL_SHARDS) by name; the main index is shard MAIN_SHARD
+shard_indexes: Dict[str, "Index"] = {}
+MAIN_SHARD = "main"
 
 # --- Initialization ---
+@registry.init_once("retriever")
 def init_retriever() -> Tuple[bool, str]:
-    """Initializes the Pinecone client and index connection."""
-    global pinecone_client, pinecone_index, is_retriever_ready, retriever_status_message
+    """
+    Initializes the retriever without blocking the first page render.
+
+    The API keys are checked here; listing the indexes, connecting to the index and
+    reading its stats happen on a background thread. The retriever reports ready while
+    that runs, `retrieve_documents` waits for the connection, and a failed check marks
+    the retriever not ready.
+    """
+    global pinecone_index, is_retriever_ready, retriever_status_message, connect_thread
     if is_retriever_ready: return True, retriever_status_message
+    if cassette.replay_enabled():
+        # Recorded queries are served without contacting Pinecone
+        pinecone_index = cassette.wrap_pinecone_index(None)
+        _connect_shards(None, [])
+        retriever_status_message = f"Retriever replaying recorded traffic ({config.CASSETTE_PATH})."
+        is_retriever_ready = True; return True, retriever_status_message
     if not PINECONE_API_KEY:
         retriever_status_message = "Error: PINECONE_API_KEY not found in Secrets."
         is_retriever_ready = False; return False, retriever_status_message
     if not OPENAI_API_KEY:
         retriever_status_message = "Error: OPENAI_API_KEY not found (needed for query embeddings)."
         is_retriever_ready = False; return False, retriever_status_message
+    retriever_status_message = f"Retriever connecting to index '{PINECONE_INDEX_NAME}'..."
+    is_retriever_ready = True
+    connect_thread = threading.Thread(target=_connect_index, name="pinecone-connect", daemon=True)
+    connect_thread.start()
+    return True, retriever_status_message
+
+def _connect_index() -> None:
+    """Validates the configured index and connects to it (runs on `connect_thread`)."""
+    global pinecone_client, pinecone_index, is_retriever_ready, retriever_status_message, connect_thread
+    start = time.perf_counter()
     try:
+        from pinecone import Pinecone
         print("Retriever: Initializing Pinecone client...")
         # Clean the API key before using it
         cleaned_pinecone_key = clean_api_key(PINECONE_API_KEY)
-        pinecone_client = Pinecone(api_key=cleaned_pinecone_key)
+        client = Pinecone(api_key=cleaned_pinecone_key)
         index_name = PINECONE_INDEX_NAME
         print(f"Retriever: Checking for Pinecone index '{index_name}'...")
-        available_indexes = [idx.name for idx in pinecone_client.list_indexes().indexes]
+        available_indexes = [idx.name for idx in client.list_indexes().indexes]
         if index_name not in available_indexes:
             retriever_status_message = f"Error: Pinecone index '{index_name}' does not exist."
-            is_retriever_ready = False; pinecone_client = None; return False, retriever_status_message
+            is_retriever_ready = False; return
         print(f"Retriever: Connecting to Pinecone index '{index_name}'...")
-        pinecone_index = pinecone_client.Index(index_name)
-        stats = pinecone_index.describe_index_stats()
+        index = cassette.wrap_pinecone_index(client.Index(index_name))
+        stats = index.describe_index_stats()
         print(f"Retriever: Pinecone index stats: {stats}")
+        pinecone_client, pinecone_index = client, index
+        shard_problems = _connect_shards(client, available_indexes)
         if stats.total_vector_count == 0:
             retriever_status_message = f"Retriever connected, but index '{index_name}' is empty."
         else:
             retriever_status_message = f"Retriever ready (Index: {index_name}, Embed Model: {EMBEDDING_MODEL})."
-        is_retriever_ready = True
-        return True, retriever_status_message
+        if shard_indexes:
+            retriever_status_message += f" Federated over {len(shard_indexes) + 1} shards."
+        if shard_problems:
+            retriever_status_message += f" Shards left out: {'; '.join(shard_problems)}."
+        print(f"Retriever: Connected in {time.perf_counter() - start:.2f}s.")
     except Exception as e:
         error_msg = f"Error initializing Pinecone: {type(e).__name__} - {e}"; print(error_msg); traceback.print_exc()
         retriever_status_message = error_msg; is_retriever_ready = False; pinecone_client = None; pinecone_index = None
-        return False, retriever_status_message
+    finally:
+        metrics.observe("rag_pinecone_connect_seconds", time.perf_counter() - start)
+        connect_thread = None
+
+def _connect_shards(client: Optional["Pinecone"], available_indexes: List[str]) -> List[str]:
+    """
+    Connects the federated shards of config.RETRIEVAL_SHARDS (`client` is None when replaying).
+    Shards of the main index share its connection.
+
+    Returns:
+        List[str]: Why shards were left out
+    """
+    global shard_indexes
+    connected: Dict[str, "Index"] = {}
+    problems: List[str] = []
+    for shard in config.RETRIEVAL_SHARDS:
+        name = shard.get("name") if isinstance(shard, dict) else None
+        index_name = (shard.get("index") or PINECONE_INDEX_NAME) if name else None
+        if not name or name == MAIN_SHARD or name in connected:
+            problems.append(f"shard without a unique name ({shard!r})")
+        elif index_name == PINECONE_INDEX_NAME:
+            connected[name] = pinecone_index
+        elif client is None:
+            connected[name] = cassette.wrap_pinecone_index(None, index_name)
+        elif index_name not in available_indexes:
+            problems.append(f"index '{index_name}' of shard '{name}' does not exist")
+        else:
+            connected[name] = cassette.wrap_pinecone_index(client.Index(index_name), index_name)
+    for problem in problems:
+        print(f"Retriever: Shard left out: {problem}")
+    shard_indexes = connected
+    return problems
+
+def get_shards() -> List[Dict[str, Any]]:
+    """The shards retrieval queries: the main index, then the connected shards of config.RETRIEVAL_SHARDS."""
+    main = {"name": MAIN_SHARD, "index": PINECONE_INDEX_NAME, "namespace": config.PINECONE_NAMESPACE,
+            "quota": config.RETRIEVAL_MAIN_QUOTA or None}
+    return [main] + [{**shard, "index": shard.get("index") or PINECONE_INDEX_NAME}
+                     for shard in config.RETRIEVAL_SHARDS if isinstance(shard, dict) and shard.get("name") in shard_indexes]
+
+async def wait_until_connected(timeout: Optional[float] = None) -> bool:
+    """
+    Waits for a background index connection still in progress.
+
+    Args:
+        timeout (Optional[float]): Seconds to wait at most
+
+    Returns:
+        bool: False if the connection was still running when the timeout expired
+    """
+    thread = connect_thread
+    if thread is None:
+        return True
+    await asyncio.to_thread(thread.join, timeout)
+    return not thread.is_alive()
+
+def get_index_version() -> Optional[str]:
+    """
+    Identifies the contents of the connected index (its name and vector count), so
+    results derived from it can be recomputed after it is re-ingested. Blocking.
+
+    Returns:
+        Optional[str]: The version, or None if the index is not connected or has no stats
+    """
+    if pinecone_index is None:
+        return None
+    try:
+        stats = pinecone_index.describe_index_stats()
+    except Exception as e:
+        print(f"Retriever: Could not read index stats: {type(e).__name__} - {e}")
+        return None
+    version = f"{PINECONE_INDEX_NAME}:{stats.total_vector_count}"
+    for shard in get_shards()[1:]:
+        try:
+            version += f":{shard['name']}-{shard_indexes[shard['name']].describe_index_stats().total_vector_count}"
+        except Exception as e:
+            print(f"Retriever: Could not read stats of shard '{shard['name']}': {type(e).__name__} - {e}")
+            return None
+    # Retrieval also changes when the BM25 index, quote index or neighbour graph is rebuilt
+    bm25_version = bm25.index_version() if config.HYBRID_RETRIEVAL else None
+    if bm25_version:
+        version += f":bm25-{bm25_version}"
+    quote_version = quote_index.index_version() if config.QUOTE_LOOKUP else None
+    if quote_version:
+        version += f":quotes-{quote_version}"
+    graph_version = neighbors.graph_version() if config.NEIGHBOR_EXPANSION_HITS > 0 else None
+    return f"{version}:neighbors-{graph_version}" if graph_version else version
 
 def get_retriever_status() -> Tuple[bool, str]:
     if not is_retriever_ready: init_retriever()
     return is_retriever_ready, retriever_status_message
 
 # --- Core Function ---
+def _format_match(match) -> Dict:
+    metadata = match.metadata if match.metadata else {}
+    return {
+        "vector_id": match.id, "original_id": metadata.get('original_id', match.id),
+        "source_name": metadata.get('source_name', 'Unknown Source'),
+        "hebrew_text": metadata.get('hebrew_text', ''), "english_text": metadata.get('english_text', ''),
+        "similarity_score": match.score, 'metadata_raw': metadata
+    }
+
+def fuse_results(dense_docs: List[Dict], sparse_docs: List[Dict], sparse_hits: List[Tuple[str, float]],
+                 n_results: int) -> List[Dict]:
+    """
+    Reciprocal rank fusion of the dense matches and the BM25 hits.
+
+    Args:
+        dense_docs (List[Dict]): Dense matches, best first
+        sparse_docs (List[Dict]): The BM25 hits as returned by Pinecone (for their text and similarity score)
+        sparse_hits (List[Tuple[str, float]]): BM25 (original id, score) pairs, best first
+        n_results (int): Number of documents to return
+
+    Returns:
+        List[Dict]: The best `n_results` documents by fused rank, with `fusion_score`,
+        `retrieved_by` ("dense", "bm25") and, for BM25 hits, `bm25_score`
+    """
+    fused: Dict[str, Dict] = {}
+    for rank, doc in enumerate(dense_docs, start=1):
+        doc["retrieved_by"] = ["dense"]
+        doc["fusion_score"] = 1.0 / (config.HYBRID_RRF_K + rank)
+        fused[str(doc["original_id"])] = doc
+    fetched = {str(doc["original_id"]): doc for doc in sparse_docs}
+    for rank, (doc_id, score) in enumerate(sparse_hits, start=1):
+        doc = fused.get(doc_id) or fetched.get(doc_id)
+        if doc is None:
+            continue  # In the BM25 index but no longer in Pinecone
+        if doc_id not in fused:
+            doc.update(retrieved_by=[], fusion_score=0.0)
+            fused[doc_id] = doc
+        doc["retrieved_by"].append("bm25")
+        doc["bm25_score"] = score
+        doc["fusion_score"] += config.HYBRID_SPARSE_WEIGHT / (config.HYBRID_RRF_K + rank)
+    ranked = sorted(fused.values(), key=lambda doc: -doc["fusion_score"])[:n_results]
+    for doc in ranked:
+        doc["fusion_score"] = round(doc["fusion_score"], 6)
+    return ranked
+
+def pin_results(docs: List[Dict], extra_docs: List[Dict], pinned: List[Tuple[str, float]], n_results: int) -> List[Dict]:
+    """
+    Moves the paragraphs a question quotes (services.quote_index) to the top.
+
+    Args:
+        docs (List[Dict]): Retrieved documents, best first
+        extra_docs (List[Dict]): Documents fetched by id, for pinned paragraphs not among `docs`
+        pinned (List[Tuple[str, float]]): (original id, share of the question matched) pairs, best first
+        n_results (int): Number of documents to return
+
+    Returns:
+        List[Dict]: The pinned documents, marked with `quote_match`, then the others
+    """
+    by_id = {str(doc["original_id"]): doc for doc in extra_docs}
+    by_id.update((str(doc["original_id"]), doc) for doc in docs)
+    top = []
+    for doc_id, share in pinned:
+        doc = by_id.get(doc_id)
+        if doc is not None and doc not in top:
+            doc["quote_match"] = share
+            doc.setdefault("retrieved_by", ["dense"] if any(doc is d for d in docs) else []).append("quote")
+            top.append(doc)
+    return (top + [doc for doc in docs if doc not in top])[:n_results]
+
+def _shard_breaker(shard: Dict[str, Any]) -> circuit_breaker.CircuitBreaker:
+    return circuit_breaker.get_breaker("pinecone", "" if shard["name"] == MAIN_SHARD else shard["name"])
+
+def _query_kwargs(shard: Dict[str, Any], vector: List[float], top_k: int, query_filter: Optional[Dict]) -> Dict[str, Any]:
+    kwargs: Dict[str, Any] = {"vector": vector, "top_k": top_k, "include_metadata": True, "filter": query_filter}
+    if shard.get("namespace"):
+        kwargs["namespace"] = shard["namespace"]
+    return kwargs
+
+async def _query_shard(shard: Dict[str, Any], breaker: circuit_breaker.CircuitBreaker, queries: List[Dict[str, Any]],
+                       timeout: Optional[float]) -> Dict[str, Any]:
+    """
+    Runs one shard's queries concurrently, within `timeout`.
+
+    Returns:
+        Dict[str, Any]: The shard, its `responses` (None if it failed or timed out),
+        the `outcome` ("ok", "timeout", "error") and the `seconds` it took
+    """
+    index = pinecone_index if shard["name"] == MAIN_SHARD else shard_indexes[shard["name"]]
+    start = time.perf_counter()
+    responses, outcome = None, "ok"
+    try:
+        with circuit_breaker.track(breaker):
+            responses = await asyncio.wait_for(
+                asyncio.gather(*(asyncio.to_thread(index.query, **kwargs) for kwargs in queries)), timeout
+            )
+    except asyncio.TimeoutError:
+        outcome = "timeout"; print(f"Retriever: Shard '{shard['name']}' exceeded its time budget ({timeout:.2f}s).")
+    except Exception as e:
+        outcome = "error"; metrics.inc("rag_api_errors_total", endpoint="pinecone", error=type(e).__name__)
+        print(f"Retriever: Shard '{shard['name']}' query failed: {type(e).__name__} - {e}")
+    seconds = time.perf_counter() - start
+    if outcome == "ok":
+        metrics.observe("rag_pinecone_query_seconds", seconds, index=shard["index"])
+    metrics.observe("rag_shard_query_seconds", seconds, shard=shard["name"], outcome=outcome)
+    return {"shard": shard, "responses": responses, "outcome": outcome, "seconds": round(seconds, 4)}
+
+def normalize_shard_scores(results: List[Tuple[Dict[str, Any], List[Dict]]], method: Optional[str] = None) -> None:
+    """
+    Maps every shard's similarity scores onto the scale of the main index's (or, when it
+    did not answer, the first shard's), so shards whose scores are distributed differently
+    rank fairly and thresholds tuned on the main index keep their meaning. "zscore" matches
+    the mean and standard deviation, "minmax" the range. The raw score is kept under
+    `raw_similarity_score`; a shard with fewer than two distinct scores keeps its own.
+
+    Args:
+        results (List[Tuple[Dict[str, Any], List[Dict]]]): (shard, documents) pairs, main index first
+        method (Optional[str]): "zscore", "minmax" or "none"; defaults to config.RETRIEVAL_SCORE_NORMALIZATION
+    """
+    method = (method or config.RETRIEVAL_SCORE_NORMALIZATION or "none").lower()
+    if method not in ("zscore", "minmax", "none"):
+        print(f"Retriever: Unknown score normalization '{method}'; keeping raw scores."); method = "none"
+    for shard, docs in results:
+        for doc in docs:
+            doc["shard"] = shard["name"]
+    scored = [(shard, docs, [doc["similarity_score"] for doc in docs]) for shard, docs in results]
+    reference = next((scores for _shard, _docs, scores in scored if len(set(scores)) > 1), None)
+    if method == "none" or reference is None:
+        return
+    ref_low, ref_high = min(reference), max(reference)
+    ref_mean, ref_std = statistics.fmean(reference), statistics.pstdev(reference)
+    for _shard, docs, scores in scored:
+        if scores is reference or len(set(scores)) < 2:
+            continue
+        low, high = min(scores), max(scores)
+        mean, std = statistics.fmean(scores), statistics.pstdev(scores)
+        for doc, raw in zip(docs, scores):
+            doc["raw_similarity_score"] = raw
+            if method == "minmax":
+                doc["similarity_score"] = round(ref_low + (raw - low) / (high - low) * (ref_high - ref_low), 4)
+            else:
+                doc["similarity_score"] = round(ref_mean + (raw - mean) / std * ref_std, 4)
+
+def merge_shard_results(results: List[Tuple[Dict[str, Any], List[Dict]]], n_results: int) -> List[Dict]:
+    """
+    Merges the shards' matches into one list, best normalized score first (see
+    normalize_shard_scores). A paragraph found in several shards is kept once, and at
+    most a shard's `quota` of its paragraphs are taken.
+
+    Args:
+        results (List[Tuple[Dict[str, Any], List[Dict]]]): (shard, documents) pairs, main index first
+        n_results (int): Number of documents to return
+
+    Returns:
+        List[Dict]: The merged documents, each marked with its `shard`
+    """
+    normalize_shard_scores(results)
+    quotas = {shard["name"]: shard.get("quota") for shard, _docs in results}
+    candidates = sorted((doc for _shard, docs in results for doc in docs), key=lambda doc: -doc["similarity_score"])
+    merged, seen, taken = [], set(), Counter()
+    for doc in candidates:
+        quota = quotas[doc["shard"]]
+        if str(doc["original_id"]) in seen or (quota and taken[doc["shard"]] >= quota):
+            continue
+        seen.add(str(doc["original_id"]))
+        taken[doc["shard"]] += 1
+        merged.append(doc)
+        if len(merged) >= n_results:
+            break
+    return merged
+
+async def _sparse_search(query_text: str, sources: List[str]) -> List[Tuple[str, float]]:
+    try:
+        return await asyncio.to_thread(bm25.search, query_text, config.HYBRID_SPARSE_RESULTS, sources)
+    except Exception as e:
+        print(f"Retriever: BM25 search failed: {type(e).__name__} - {e}"); return []
+
 @traceable(name="pinecone-retrieve-documents")
-async def retrieve_documents(query_text: str, n_results: int) -> List[Dict]:
+async def retrieve_documents(query_text: str, n_results: int, deadline=None,
+                             query_embedding: Optional[List[float]] = None,
+                             pinned: Optional[List[Tuple[str, float]]] = None,
+                             sources: Optional[List[str]] = None) -> List[Dict]:
+    """
+    Embeds the query (unless `query_embedding` is given) and returns the top matches;
+    `deadline` (a pipeline.deadline.Deadline) bounds both calls. With a BM25 index
+    (services.bm25) its hits are fused with the dense matches (see fuse_results), and
+    `pinned` paragraphs (exact-quote matches) are put first (see pin_results). Those
+    not among the dense matches are read, with their similarity scores, by a Pinecone
+    query restricted to their ids, sent alongside the dense query. With
+    config.NEIGHBOR_EXPANSION_HITS set, the top matches' neighbours from the local
+    neighbour graph are added after them (see services.neighbors.expand_with_neighbors).
+    `sources` restricts every part of it to paragraphs of those sources: a metadata
+    filter on both Pinecone queries and a source bitmap in the BM25 index. With
+    federated shards (config.RETRIEVAL_SHARDS) every shard is queried concurrently
+    within its own timeout and the answers are merged (see merge_shard_results).
+    """
     global pinecone_index
+    if not await wait_until_connected(deadline.stage_timeout("retrieval") if deadline else None):
+        deadline.mark_exceeded("retrieval"); print("Retriever: Still connecting to Pinecone."); return []
     ready, message = get_retriever_status()
     if not ready or pinecone_index is None:
         print(f"Retriever not ready: {message}"); return []
     print(f"Retriever: Retrieving top {n_results} docs for query: '{query_text[:100]}...'"); start_time = time.time()
+    # The local BM25 search runs while the query is embedded
+    sources = facets.normalize_sources(sources)
+    source_filter = facets.pinecone_filter(sources)
+    sparse_task = asyncio.ensure_future(_sparse_search(query_text, sources)) if config.HYBRID_RETRIEVAL else None
     try:
-        query_embedding = await get_embedding(query_text, model=EMBEDDING_MODEL)
+        if query_embedding is None:
+            try:
+                query_embedding = await asyncio.wait_for(get_embedding(query_text, model=EMBEDDING_MODEL),
+                                                         deadline.stage_timeout("embedding") if deadline else None)
+            except asyncio.TimeoutError:
+                deadline.mark_exceeded("embedding"); print("Retriever: Query embedding exceeded its time budget."); return []
         if query_embedding is None: print("Retriever: Failed query embedding."); return []
-        # Run Pinecone query in a thread to avoid blocking
-        response = await asyncio.to_thread(
-            pinecone_index.query,
-            vector=query_embedding,
-            top_k=n_results,
-            include_metadata=True
-        )
-        formatted_results = []
-        if not response or not response.matches: print("Retriever: No results found."); return []
-        for match in response.matches:
-            metadata = match.metadata if match.metadata else {}
-            doc_data = {
-                "vector_id": match.id, "original_id": metadata.get('original_id', match.id),
-                "source_name": metadata.get('source_name', 'Unknown Source'),
-                "hebrew_text": metadata.get('hebrew_text', ''), "english_text": metadata.get('english_text', ''),
-                "similarity_score": match.score, 'metadata_raw': metadata
-            }
-            formatted_results.append(doc_data)
+        sparse_hits = await sparse_task if sparse_task else []
+        pinned = pinned or []
+        extra_ids = list(dict.fromkeys([doc_id for doc_id, _share in pinned] + [doc_id for doc_id, _score in sparse_hits]))
+        # Every shard is queried on its own threads; a slow or failing shard only loses its own matches
+        stage_timeout = deadline.stage_timeout("retrieval") if deadline else None
+        shards = get_shards()
+        federated = len(shards) > 1
+        shard_tasks = []
+        for shard in shards:
+            breaker = _shard_breaker(shard)
+            if not breaker.allow():
+                print(f"Retriever: Circuit '{breaker.name}' is open; {'skipping the shard' if federated else 'failing fast'}.")
+                continue
+            queries = [_query_kwargs(shard, query_embedding, min(shard.get("top_k") or n_results, n_results), source_filter)]
+            if extra_ids and shard["name"] == MAIN_SHARD:
+                # BM25 and quote hits come from the main index's corpus
+                queries.append(_query_kwargs(shard, query_embedding, len(extra_ids),
+                                             {"original_id": {"$in": extra_ids}, **(source_filter or {})}))
+            timeout = stage_timeout
+            if federated:
+                shard_timeout = float(shard.get("timeout") or config.RETRIEVAL_SHARD_TIMEOUT_SECONDS)
+                timeout = shard_timeout if stage_timeout is None else min(shard_timeout, stage_timeout)
+            shard_tasks.append(_query_shard(shard, breaker, queries, timeout))
+        if not shard_tasks:
+            return []
+        query_start = time.perf_counter()
+        reports = [report for report in await asyncio.gather(*shard_tasks) if report["responses"] is not None]
+        if not reports:
+            # The worker threads finish on their own; their results are discarded
+            if deadline and stage_timeout is not None and time.perf_counter() - query_start >= stage_timeout:
+                deadline.mark_exceeded("retrieval"); print("Retriever: Pinecone query exceeded its time budget.")
+            return []
+        results = [(report["shard"], [_format_match(match) for match in (report["responses"][0].matches
+                                                                         if report["responses"][0] else None) or []])
+                   for report in reports]
+        formatted_results = merge_shard_results(results, n_results) if federated else results[0][1]
+        extra_docs = next(([_format_match(match) for match in report["responses"][1].matches or []]
+                           for report in reports if len(report["responses"]) > 1), [])
+        if sparse_hits:
+            formatted_results = fuse_results(formatted_results, extra_docs, sparse_hits, n_results)
+            metrics.inc("rag_hybrid_bm25_only_total", sum(1 for doc in formatted_results if doc["retrieved_by"] == ["bm25"]))
+        if pinned:
+            formatted_results = pin_results(formatted_results, extra_docs, pinned, n_results)
+        if config.NEIGHBOR_EXPANSION_HITS > 0 and formatted_results:
+            formatted_results = await asyncio.to_thread(neighbors.expand_with_neighbors, formatted_results, sources)
+        if not formatted_results: print("Retriever: No results found."); return []
         total_time = time.time() - start_time; print(f"Retriever: Retrieved {len(formatted_results)} docs in {total_time:.2f}s.")
         return formatted_results
     except Exception as e:
-        print(f"Retriever: Error during query/processing: {type(e).__name__}"); traceback.print_exc(); return []
\ No newline at end of file
+        print(f"Retriever: Error during query/processing: {type(e).__name__}"); traceback.print_exc(); return []
+    finally:
+        if sparse_task and not sparse_task.done():
+            sparse_task.cancel()
+
+metrics.registry.describe("rag_pinecone_connect_seconds", "Time to validate and connect the Pinecone index in the background.")
+metrics.registry.describe("rag_shard_query_seconds", "Latency of one retrieval shard's queries, by shard and outcome (ok, timeout, error).")
+metrics.registry.describe("rag_hybrid_bm25_only_total", "Retrieved paragraphs found by the BM25 index but not by the dense search.")
@@ -0,0 +1,84 @@
+# tests/test_bm25.py
+"""Building, loading and block-max pruned search of the local BM25 index (services.bm25)."""
+import pytest
+
+from benchmarks.quote_bench import synthetic_corpus
+from services.bm25 import BLOCK_SIZE, BM25Index, build_index
+
+SOURCES = ("א", "ב", "ג")
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    # Several blocks' worth, so pruning has blocks to skip
+    docs = synthetic_corpus(BLOCK_SIZE * 4 + 17, seed=7)
+    for i, doc in enumerate(docs):
+        doc["source_name"] = SOURCES[i % len(SOURCES)]
+    docs[700]["hebrew_text"] += " בְּשַׁבָּת"
+    docs[900]["english_text"] = "Sabbath candles"
+    return docs
+
+
+@pytest.fixture(scope="module")
+def index(corpus, tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("bm25") / "index")
+    meta = build_index(corpus, path)
+    assert meta["documents"] == len(corpus)
+    return BM25Index(path)
+
+
+def _query(doc, words=6):
+    return " ".join(doc["hebrew_text"].split()[:words])
+
+
+def _assert_same_top(results, expected):
+    # Documents tied with the k-th score may be swapped for one another
+    assert [score for _doc_id, score in results] == [score for _doc_id, score in expected]
+    cut = expected[-1][1] if expected else None
+    assert [hit for hit in results if hit[1] != cut] == [hit for hit in expected if hit[1] != cut]
+
+
+def test_pruned_top_k_matches_the_exhaustive_ranking(corpus, index):
+    for doc in corpus[::97]:
+        query = _query(doc)
+        exhaustive = index.search(query, len(corpus))
+        for k in (1, 5, 20):
+            _assert_same_top(index.search(query, k), exhaustive[:k])
+
+
+def test_paragraph_ranks_first_for_its_own_rare_words(corpus, index):
+    doc = corpus[123]
+    rare = " ".join(sorted(set(doc["hebrew_text"].split()), key=len)[-4:])
+    assert index.search(rare, 3)[0][0] == doc["original_id"]
+
+
+def test_normalized_terms_match_across_niqqud_prefixes_and_case(index):
+    assert "p-700" in [doc_id for doc_id, _score in index.search("שבת", 10)]
+    assert index.search("sabbath CANDLES", 1)[0][0] == "p-900"
+
+
+def test_source_filter_keeps_only_those_sources(corpus, index):
+    sources = {doc["original_id"]: doc["source_name"] for doc in corpus}
+    query = _query(corpus[50])
+    filtered = index.search(query, 20, sources=["ב"])
+    assert filtered
+    assert all(sources[doc_id] == "ב" for doc_id, _score in filtered)
+    expected = [hit for hit in index.search(query, len(corpus)) if sources[hit[0]] == "ב"][:20]
+    _assert_same_top(filtered, expected)
+    assert index.search(query, 5, sources=["unknown"]) == []
+
+
+def test_unknown_terms_or_no_results_requested(index):
+    assert index.search("zzzzqqq", 5) == []
+    assert index.search(_query({"hebrew_text": "שבת"}), 0) == []
+
+
+def test_rebuild_replaces_the_index(tmp_path):
+    path = str(tmp_path / "index")
+    build_index([{"original_id": "a", "hebrew_text": "alpha"}], path)
+    build_index([{"original_id": "b", "hebrew_text": "beta"}], path)
+    index = BM25Index(path)
+    assert index.doc_ids == ["b"]
+    assert index.search("beta", 1)[0][0] == "b"
+    with pytest.raises(ValueError):
+        build_index([{"hebrew_text": "no id"}], str(tmp_path / "empty"))
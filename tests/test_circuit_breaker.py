@@ -0,0 +1,137 @@
+# tests/test_circuit_breaker.py
+"""State machine, failure classification and model fallback of services.circuit_breaker."""
+import pytest
+
+import config
+from services import circuit_breaker
+from services.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+@pytest.fixture(autouse=True)
+def enabled(monkeypatch):
+    monkeypatch.setattr(config, "CIRCUIT_BREAKER_ENABLED", True)
+    monkeypatch.setattr(circuit_breaker, "_breakers", {})
+
+
+def _fail(breaker, count, error=None):
+    for _ in range(count):
+        assert breaker.allow()
+        breaker.record_failure(error or StatusError(503))
+
+
+def test_counts_as_failure():
+    assert circuit_breaker.counts_as_failure(TimeoutError())
+    for status in (408, 409, 429, 500, 503):
+        assert circuit_breaker.counts_as_failure(StatusError(status))
+    for status in (400, 401, 404):
+        assert not circuit_breaker.counts_as_failure(StatusError(status))
+
+
+def test_opens_at_the_error_rate_once_enough_calls_are_seen():
+    breaker = CircuitBreaker("test", min_calls=4, error_rate=0.5)
+    _fail(breaker, 3)
+    assert breaker.state == CLOSED
+    _fail(breaker, 1)
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.retry_after() > 0
+
+
+def test_successes_keep_the_rate_below_the_threshold():
+    breaker = CircuitBreaker("test", min_calls=4, error_rate=0.5)
+    for _ in range(3):
+        breaker.record_success(0.01)
+    _fail(breaker, 2)
+    assert breaker.state == CLOSED
+
+
+def test_client_errors_are_not_counted():
+    breaker = CircuitBreaker("test", min_calls=2, error_rate=0.5)
+    _fail(breaker, 5, StatusError(400))
+    assert breaker.state == CLOSED
+    assert breaker.snapshot()["calls"] == 0
+
+
+def test_slow_calls_open_the_breaker():
+    breaker = CircuitBreaker("test", min_calls=3, slow_call_seconds=1.0, slow_call_rate=0.6)
+    breaker.record_success(0.1)
+    breaker.record_success(2.0)
+    assert breaker.state == CLOSED
+    breaker.record_success(2.0)
+    assert breaker.state == OPEN
+
+
+def test_half_open_probes_close_the_breaker():
+    breaker = CircuitBreaker("test", min_calls=1, open_seconds=0, half_open_probes=2)
+    _fail(breaker, 1)
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow() and breaker.allow()
+    # Only as many probes as configured are let through
+    assert not breaker.allow()
+    breaker.record_success(0.01)
+    assert breaker.state == HALF_OPEN
+    breaker.record_success(0.01)
+    assert breaker.state == CLOSED
+
+
+def test_failed_probe_reopens_the_breaker():
+    breaker = CircuitBreaker("test", min_calls=1, open_seconds=60, half_open_probes=1)
+    _fail(breaker, 1)
+    breaker.open_seconds = 0
+    assert breaker.allow()
+    breaker.record_failure(StatusError(500))
+    breaker.open_seconds = 60
+    assert breaker.state == OPEN
+
+
+def test_release_returns_a_probe_slot():
+    breaker = CircuitBreaker("test", min_calls=1, open_seconds=0, half_open_probes=1)
+    _fail(breaker, 1)
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+
+
+def test_disabled_breaker_always_allows(monkeypatch):
+    monkeypatch.setattr(config, "CIRCUIT_BREAKER_ENABLED", False)
+    breaker = CircuitBreaker("test", min_calls=1)
+    _fail(breaker, 5)
+    assert breaker.state == CLOSED
+
+
+def _open(endpoint, model):
+    breaker = circuit_breaker.get_breaker(endpoint, model)
+    breaker.open_seconds = 60
+    breaker.min_calls = 1
+    _fail(breaker, 1)
+    return breaker
+
+
+def test_acquire_falls_back_to_the_next_model():
+    _open("validation", "primary")
+    model, breaker = circuit_breaker.acquire("validation", ["primary", "", "fallback"])
+    assert model == "fallback"
+    assert breaker.name == "validation:fallback"
+
+
+def test_acquire_raises_when_every_model_is_open():
+    _open("validation", "primary")
+    _open("validation", "fallback")
+    with pytest.raises(CircuitOpenError) as excinfo:
+        circuit_breaker.acquire("validation", ["primary", "fallback"])
+    assert excinfo.value.name == "validation:primary"
+
+
+def test_track_records_the_outcome():
+    breaker = CircuitBreaker("test", min_calls=1)
+    with pytest.raises(StatusError):
+        with circuit_breaker.track(breaker):
+            raise StatusError(502)
+    assert breaker.state == OPEN
@@ -0,0 +1,112 @@
+# tests/test_cost_accounting.py
+"""Budgets, validation and generation planning, and session totals of services.cost_accounting."""
+import asyncio
+
+import pytest
+
+import config
+from services import cost_accounting
+from services.cost_accounting import CostStore, RequestLedger
+
+
+def _docs(count, chars=250):
+    # 250 characters are 100 estimated tokens
+    return [{"hebrew_text": "א" * chars, "english_text": "", "original_id": str(i)} for i in range(count)]
+
+
+@pytest.fixture(autouse=True)
+def budgets(monkeypatch, tmp_path):
+    monkeypatch.setattr(config, "COST_BUDGET_REQUEST_USD", 1.0)
+    monkeypatch.setattr(config, "COST_BUDGET_SESSION_USD", 0.0)
+    monkeypatch.setattr(config, "COST_BUDGET_GENERATION_SHARE", 0.3)
+    monkeypatch.setattr(config, "COST_BUDGET_MIN_VALIDATE", 2)
+    # A thousandth of a dollar per prompt token, completions free
+    monkeypatch.setattr(cost_accounting, "_model_cost", lambda model, prompt, completion: prompt * 0.001)
+    monkeypatch.setattr(cost_accounting, "_session_spent", {})
+    monkeypatch.setattr(cost_accounting, "_store", CostStore(str(tmp_path / "costs.sqlite3")))
+
+
+@pytest.fixture
+def ledger():
+    ledger = RequestLedger("session")
+    token = cost_accounting._current_ledger.set(ledger)
+    yield ledger
+    cost_accounting._current_ledger.reset(token)
+
+
+def test_no_ledger_means_no_budget():
+    assert cost_accounting.remaining_budget() is None
+    assert cost_accounting.plan_validation(_docs(50), "", 30) == (30, None)
+    assert cost_accounting.plan_generation(_docs(50), [], "") == (50, None)
+
+
+def test_remaining_budget_takes_the_tighter_limit(monkeypatch, ledger):
+    ledger.add("validation", "gpt-4o", {"prompt": 10}, 0.25)
+    assert cost_accounting.remaining_budget() == pytest.approx(0.75)
+
+    monkeypatch.setattr(config, "COST_BUDGET_SESSION_USD", 2.0)
+    cost_accounting._session_spent["session"] = 1.5
+    assert cost_accounting.remaining_budget() == pytest.approx(0.25)
+
+    cost_accounting._session_spent["session"] = 5.0
+    assert cost_accounting.remaining_budget() == 0.0
+
+
+def test_unlimited_budgets(monkeypatch, ledger):
+    monkeypatch.setattr(config, "COST_BUDGET_REQUEST_USD", 0.0)
+    assert cost_accounting.remaining_budget() is None
+
+
+def test_validation_keeps_the_generation_share(ledger):
+    # 0.102 per paragraph against 0.7 of the 1.0 budget: six fit
+    count, remaining = cost_accounting.plan_validation(_docs(10), "", 10)
+    assert count == 6
+    assert remaining == pytest.approx(1.0)
+
+
+def test_validation_within_budget_is_unchanged(ledger):
+    assert cost_accounting.plan_validation(_docs(10), "", 4)[0] == 4
+    assert cost_accounting.plan_validation(_docs(3), "", 10)[0] == 3
+
+
+def test_validation_never_drops_below_the_minimum(ledger):
+    ledger.add("generation", "o3", {}, 1.0)
+    assert cost_accounting.plan_validation(_docs(10), "", 10)[0] == 2
+    assert cost_accounting.plan_validation(_docs(1), "", 10)[0] == 1
+
+
+def test_generation_trims_passages_from_the_end(ledger):
+    everything = cost_accounting.plan_generation(_docs(3), [{"role": "user", "content": "?"}], "")[0]
+    assert everything == 3
+
+    ledger.add("validation", "gpt-4o", {}, 0.8)
+    count, remaining = cost_accounting.plan_generation(_docs(20), [{"role": "user", "content": "?"}], "")
+    assert 1 <= count < 20
+    assert remaining == pytest.approx(0.2)
+
+
+def test_generation_keeps_one_passage_when_the_budget_is_spent(ledger):
+    ledger.add("validation", "gpt-4o", {}, 5.0)
+    assert cost_accounting.plan_generation(_docs(30), [], "")[0] == 1
+    assert cost_accounting.plan_generation([], [], "") == (0, 0.0)
+
+
+def test_track_request_adds_to_the_session_and_the_daily_totals():
+    async def request(cost):
+        async with cost_accounting.track_request("session") as ledger:
+            cost_accounting._on_usage("validation", "gpt-4o", {"prompt": 100, "completion": 10}, cost)
+        return ledger
+
+    ledger = asyncio.run(request(0.25))
+    asyncio.run(request(0.5))
+    assert ledger.summary()["tokens"] == {"prompt": 100, "completion": 10, "cached": 0}
+    assert cost_accounting.session_spent("session") == pytest.approx(0.75)
+    assert cost_accounting.current_ledger() is None
+
+    (today,) = cost_accounting.get_store().daily()
+    assert today["requests"] == 2
+    assert today["cost_usd"] == pytest.approx(0.75)
+    assert today["models"][0]["calls"] == 2
+
+    cost_accounting.forget_session("session")
+    assert cost_accounting.session_spent("session") == 0.0
@@ -0,0 +1,92 @@
+# tests/test_fast_path.py
+"""Routing of queries between direct, sampled and full validation by pipeline.fast_path."""
+import pytest
+
+import config
+from pipeline import fast_path
+
+QUERY = "sabbath candles lighting"
+
+
+def _docs(scores, text="lighting the sabbath candles"):
+    return [{"original_id": str(i), "similarity_score": score, "hebrew_text": "", "english_text": text}
+            for i, score in enumerate(scores)]
+
+
+# Four strong matches well clear of the rest
+CONFIDENT = [0.9, 0.89, 0.88, 0.87] + [0.6] * 20
+# Good but not outstanding matches
+PLAUSIBLE = [0.75] * 24
+WEAK = [0.5] * 24
+
+
+@pytest.fixture(autouse=True)
+def thresholds(monkeypatch):
+    monkeypatch.setattr(config, "FAST_PATH_MODE", "on")
+    monkeypatch.setattr(config, "FAST_PATH_TOP_K", 4)
+    monkeypatch.setattr(config, "FAST_PATH_MAX_TERMS", 6)
+    monkeypatch.setattr(config, "FAST_PATH_DIRECT_SCORE", 0.8)
+    monkeypatch.setattr(config, "FAST_PATH_DIRECT_MARGIN", 0.05)
+    monkeypatch.setattr(config, "FAST_PATH_DIRECT_COVERAGE", 0.6)
+    monkeypatch.setattr(config, "FAST_PATH_SAMPLE_SCORE", 0.7)
+    monkeypatch.setattr(config, "FAST_PATH_SAMPLE_SIZE", 10)
+
+
+def test_query_features():
+    features = fast_path.query_features(_docs(CONFIDENT), QUERY)
+    assert features == {"top_k": 4, "terms": 3, "min_score": 0.87, "mean_score": 0.885,
+                        "margin": 0.285, "coverage": 1.0}
+
+
+def test_confident_short_query_goes_direct():
+    decision = fast_path.decide(_docs(CONFIDENT), QUERY, 24)
+    assert decision["route"] == "direct"
+    assert decision["validate"] == 0
+    assert len(decision["reasons"]) == 4
+    assert [doc["original_id"] for doc in fast_path.direct_documents(_docs(CONFIDENT), decision)] == ["0", "1", "2", "3"]
+
+
+def test_low_term_coverage_is_sampled():
+    decision = fast_path.decide(_docs(CONFIDENT, text="unrelated paragraph"), QUERY, 24)
+    assert decision["route"] == "sample"
+    assert decision["validate"] == 10
+    assert any(reason.startswith("term coverage") for reason in decision["reasons"])
+
+
+def test_long_query_is_never_direct():
+    query = "when are the sabbath candles lit before sunset on friday evening in winter"
+    assert fast_path.decide(_docs(CONFIDENT, text=query), query, 24)["route"] == "sample"
+
+
+def test_flat_scores_are_sampled():
+    decision = fast_path.decide(_docs(PLAUSIBLE), QUERY, 24)
+    assert decision["route"] == "sample"
+    assert any(reason.startswith("score margin") for reason in decision["reasons"])
+
+
+def test_weak_scores_are_fully_validated():
+    decision = fast_path.decide(_docs(WEAK), QUERY, 24)
+    assert (decision["route"], decision["validate"]) == ("full", 24)
+
+
+def test_sample_no_smaller_than_the_request_is_full():
+    assert fast_path.decide(_docs(PLAUSIBLE), QUERY, 8)["route"] == "full"
+
+
+def test_off_unknown_or_unscored_decides_nothing():
+    assert fast_path.decide(_docs(CONFIDENT), QUERY, 24, mode="off") is None
+    assert fast_path.decide(_docs(CONFIDENT), QUERY, 24, mode="bogus") is None
+    assert fast_path.decide([], QUERY, 24) is None
+    docs = _docs(CONFIDENT)
+    docs[0]["similarity_score"] = None
+    assert fast_path.decide(docs, QUERY, 24) is None
+
+
+def test_shadow_report_compares_with_full_validation():
+    docs = _docs(CONFIDENT)
+    decision = fast_path.decide(docs, QUERY, 24, mode="shadow")
+    report = fast_path.shadow_report(decision, docs, [docs[0], docs[2], docs[15]])
+    assert report["top_k_passed"] == 2
+    assert report["top_k_precision"] == 0.5
+    assert report["sample_passed"] == 2
+    assert report["sample_recall"] == pytest.approx(0.6667)
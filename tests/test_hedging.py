@@ -0,0 +1,108 @@
+# tests/test_hedging.py
+"""Latency quantile, hedge budget and attempt racing of services.hedging."""
+import asyncio
+
+from services.hedging import HedgePolicy, hedged_call
+
+
+def _policy(**kwargs):
+    defaults = dict(quantile=0.9, window=100, min_samples=10, budget_ratio=1.0, max_burst=2.0)
+    return HedgePolicy("test", **{**defaults, **kwargs})
+
+
+def test_no_threshold_until_enough_samples():
+    policy = _policy()
+    for _ in range(9):
+        policy.record(0.1)
+    assert policy.threshold() is None
+    policy.record(0.1)
+    assert policy.threshold() == 0.1
+
+
+def test_threshold_follows_the_quantile_and_minimum_delay():
+    policy = _policy(min_delay=0.05)
+    for i in range(1, 101):
+        policy.record(i / 1000)
+    # Refreshed every ten samples; 100 samples -> index 90
+    assert policy.threshold() == 0.091
+
+    low = _policy(min_delay=0.5)
+    for _ in range(10):
+        low.record(0.01)
+    assert low.threshold() == 0.5
+
+
+def test_budget_earns_a_share_of_calls_and_caps_bursts():
+    policy = _policy(budget_ratio=0.5, max_burst=1.0)
+    assert not policy.try_spend()
+    policy.earn()
+    assert not policy.try_spend()
+    for _ in range(10):
+        policy.earn()
+    assert policy.try_spend()
+    assert not policy.try_spend()
+
+
+def _warm(policy, latency=0.01):
+    for _ in range(policy.min_samples):
+        policy.record(latency)
+
+
+def test_fast_primary_fires_no_hedge():
+    policy = _policy()
+    _warm(policy, 0.05)
+    calls = []
+
+    async def call():
+        calls.append(1)
+        return "primary"
+
+    assert asyncio.run(hedged_call(call, policy)) == "primary"
+    assert len(calls) == 1
+
+
+def test_slow_primary_is_hedged_and_the_abandoned_attempt_is_reported():
+    policy = _policy()
+    _warm(policy)
+    attempts, abandoned = [], []
+
+    async def call():
+        attempts.append(len(attempts))
+        if len(attempts) == 1:
+            await asyncio.sleep(1.0)
+            return "primary"
+        return "hedge"
+
+    result = asyncio.run(hedged_call(call, policy, on_abandoned=abandoned.append))
+    assert result == "hedge"
+    assert abandoned == ["hedge"]
+    # The hedge's latency and a lower bound of the cancelled primary's
+    assert len(policy._latencies) == policy.min_samples + 2
+
+
+def test_over_budget_waits_for_the_primary():
+    policy = _policy(budget_ratio=0.0)
+    _warm(policy)
+    attempts = []
+
+    async def call():
+        attempts.append(1)
+        await asyncio.sleep(0.05)
+        return "primary"
+
+    assert asyncio.run(hedged_call(call, policy)) == "primary"
+    assert len(attempts) == 1
+
+
+def test_primary_error_surfaces_when_every_attempt_fails():
+    policy = _policy()
+
+    async def call():
+        raise ValueError("boom")
+
+    try:
+        asyncio.run(hedged_call(call, policy))
+    except ValueError as e:
+        assert str(e) == "boom"
+    else:
+        raise AssertionError("expected the primary's error")
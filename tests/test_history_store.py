@@ -0,0 +1,118 @@
+# tests/test_history_store.py
+"""Compaction, spilling and restoring of services.history_store.SessionHistory."""
+import pytest
+
+from services.history_store import DocumentTextCache, SessionHistory
+
+
+@pytest.fixture
+def cache():
+    return DocumentTextCache()
+
+
+@pytest.fixture
+def make_history(tmp_path, cache):
+    def make(max_messages=4, session_id="session"):
+        return SessionHistory(session_id, max_messages=max_messages, spill_dir=str(tmp_path), cache=cache)
+    return make
+
+
+def _answer(i, doc_ids):
+    return {
+        "role": "assistant",
+        "content": f"answer {i}",
+        "final_docs": [{"original_id": doc_id, "source_name": "ספר", "hebrew_text": f"טקסט {doc_id}",
+                        "english_text": f"text {doc_id}"} for doc_id in doc_ids],
+    }
+
+
+def test_documents_are_shared_through_the_text_cache(make_history, cache):
+    first, second = make_history(session_id="a"), make_history(session_id="b")
+    first.append(_answer(1, ["p1", "p2"]))
+    second.append(_answer(2, ["p1"]))
+
+    assert cache.stats()["entries"] == 2
+    assert cache.stats()["references"] == 3
+    message = first.messages()[0]
+    assert [doc["original_id"] for doc in message["final_docs"]] == ["p1", "p2"]
+    assert message["final_docs"][0]["hebrew_text"] == "טקסט p1"
+
+
+def test_texts_are_evicted_once_no_session_refers_to_them(make_history, cache):
+    history = make_history(max_messages=2)
+    for i in range(5):
+        history.append(_answer(i, [f"p{i}"]))
+
+    # Only the two messages still in memory hold references
+    assert cache.stats()["entries"] == 2
+    assert cache.stats()["references"] == 2
+
+
+def test_old_messages_spill_to_disk_and_come_back_in_order(make_history):
+    history = make_history(max_messages=2)
+    for i in range(7):
+        history.append({"role": "user", "content": f"m{i}"})
+
+    assert len(history) == 7
+    assert [m["content"] for m in history.messages()] == ["m5", "m6"]
+    assert history.earlier_count() == 5
+
+    assert history.load_earlier(3) == 3
+    assert [m["content"] for m in history.messages()] == ["m2", "m3", "m4", "m5", "m6"]
+    assert history.earlier_count() == 2
+    assert history.load_earlier(10) == 2
+    assert history.earlier_count() == 0
+    assert [m["content"] for m in history.messages()] == [f"m{i}" for i in range(7)]
+
+
+def test_spilled_answers_keep_their_documents(make_history, cache):
+    history = make_history(max_messages=2)
+    history.append(_answer(0, ["p0"]))
+    for i in range(1, 4):
+        history.append({"role": "user", "content": f"m{i}"})
+    assert cache.stats()["entries"] == 0
+
+    history.load_earlier()
+    restored = history.messages()[0]
+    assert restored["content"] == "answer 0"
+    assert restored["final_docs"][0]["english_text"] == "text p0"
+
+
+def test_pipeline_history_has_no_documents(make_history):
+    history = make_history()
+    history.append({"role": "user", "content": "question"})
+    history.append(_answer(1, ["p1"]))
+    assert history.as_pipeline_history() == [{"role": "user", "content": "question"},
+                                             {"role": "assistant", "content": "answer 1"}]
+
+
+def test_an_unreadable_spilled_record_is_skipped_not_read_again(make_history):
+    history = make_history(max_messages=2)
+    for i in range(10):
+        history.append({"role": "user", "content": f"m{i}"})
+    read_spilled = history._read_spilled
+
+    def failing(index):
+        if index == 5:
+            raise ValueError("corrupt record")
+        return read_spilled(index)
+
+    history._read_spilled = failing
+    assert history.load_earlier(3) == 2
+    assert history.earlier_count() == 5
+    assert history.load_earlier(3) == 3
+    assert history.load_earlier(10) == 2
+    assert history.earlier_count() == 0
+    contents = [m["content"] for m in history.messages()]
+    assert contents == ["m0", "m1", "m2", "m3", "m4", "m6", "m7", "m8", "m9"]
+
+
+def test_a_new_message_collapses_restored_pages(make_history):
+    history = make_history(max_messages=2)
+    for i in range(5):
+        history.append({"role": "user", "content": f"m{i}"})
+    history.load_earlier()
+    history.append({"role": "user", "content": "m5"})
+
+    assert [m["content"] for m in history.messages()] == ["m4", "m5"]
+    assert history.earlier_count() == 4
@@ -0,0 +1,127 @@
+# tests/test_retriever.py
+"""Result fusion, quote pinning and shard merging of services.retriever."""
+import pytest
+
+import config
+from services.retriever import fuse_results, merge_shard_results, normalize_shard_scores, pin_results
+
+
+def _doc(doc_id, score=0.5, **fields):
+    return {"original_id": doc_id, "similarity_score": score, "hebrew_text": "", **fields}
+
+
+@pytest.fixture
+def rrf(monkeypatch):
+    monkeypatch.setattr(config, "HYBRID_RRF_K", 60)
+    monkeypatch.setattr(config, "HYBRID_SPARSE_WEIGHT", 1.0)
+
+
+def test_fusion_rewards_documents_found_both_ways(rrf):
+    dense = [_doc("a", 0.9), _doc("b", 0.8), _doc("c", 0.7)]
+    sparse = [_doc("d", 0.4)]
+    fused = fuse_results(dense, sparse, [("c", 12.0), ("d", 9.0)], 10)
+    # b and d tie at rank two of their lists; the dense match comes first
+    assert [doc["original_id"] for doc in fused] == ["c", "a", "b", "d"]
+    assert fused[0]["retrieved_by"] == ["dense", "bm25"]
+    assert fused[0]["bm25_score"] == 12.0
+    assert fused[0]["fusion_score"] == round(1 / 63 + 1 / 61, 6)
+    assert fused[3]["retrieved_by"] == ["bm25"]
+    assert "bm25_score" not in fused[2]
+
+
+def test_fusion_skips_hits_missing_from_the_index_and_truncates(rrf):
+    dense = [_doc("a"), _doc("b")]
+    fused = fuse_results(dense, [], [("gone", 5.0), ("b", 4.0)], 1)
+    assert [doc["original_id"] for doc in fused] == ["b"]
+
+
+def test_sparse_weight_scales_bm25_ranks(monkeypatch, rrf):
+    monkeypatch.setattr(config, "HYBRID_SPARSE_WEIGHT", 2.0)
+    fused = fuse_results([_doc("a")], [_doc("z")], [("z", 1.0)], 10)
+    assert [doc["original_id"] for doc in fused] == ["z", "a"]
+
+
+def test_ids_match_across_types(rrf):
+    # Pinecone metadata may hold numeric ids; the BM25 index stores strings
+    fused = fuse_results([_doc(7)], [], [("7", 3.0)], 10)
+    assert len(fused) == 1
+    assert fused[0]["retrieved_by"] == ["dense", "bm25"]
+
+
+def test_quoted_paragraphs_move_to_the_top():
+    docs = [_doc("a"), _doc("b", retrieved_by=["dense", "bm25"]), _doc("c")]
+    pinned = pin_results(docs, [_doc("q")], [("q", 0.9), ("b", 0.6)], 3)
+    assert [doc["original_id"] for doc in pinned] == ["q", "b", "a"]
+    assert pinned[0]["quote_match"] == 0.9
+    assert pinned[0]["retrieved_by"] == ["quote"]
+    assert pinned[1]["retrieved_by"] == ["dense", "bm25", "quote"]
+
+
+def test_pinning_a_retrieved_document_without_fusion_marks_it_dense():
+    docs = [_doc("a"), _doc("b")]
+    pinned = pin_results(docs, [], [("b", 1.0)], 10)
+    assert [doc["original_id"] for doc in pinned] == ["b", "a"]
+    assert pinned[0]["retrieved_by"] == ["dense", "quote"]
+
+
+def test_unknown_or_repeated_pins_are_ignored():
+    docs = [_doc("a"), _doc("b")]
+    pinned = pin_results(docs, [], [("missing", 1.0), ("b", 0.8), ("b", 0.5)], 10)
+    assert [doc["original_id"] for doc in pinned] == ["b", "a"]
+    assert pinned[0]["quote_match"] == 0.8
+
+
+def _shard(name, quota=None):
+    return {"name": name, "index": name, "quota": quota}
+
+
+def _scored(prefix, scores):
+    return [_doc(f"{prefix}{i}", score) for i, score in enumerate(scores)]
+
+
+def test_minmax_maps_onto_the_main_range():
+    main, other = _scored("m", [0.9, 0.5]), _scored("o", [0.3, 0.2, 0.1])
+    normalize_shard_scores([(_shard("main"), main), (_shard("other"), other)], "minmax")
+    assert [doc["similarity_score"] for doc in other] == [0.9, 0.7, 0.5]
+    assert [doc["raw_similarity_score"] for doc in other] == [0.3, 0.2, 0.1]
+    assert [doc["similarity_score"] for doc in main] == [0.9, 0.5]
+    assert "raw_similarity_score" not in main[0]
+    assert {doc["shard"] for doc in other} == {"other"}
+
+
+def test_zscore_matches_mean_and_spread():
+    main, other = _scored("m", [0.8, 0.6, 0.4]), _scored("o", [0.35, 0.3, 0.25])
+    normalize_shard_scores([(_shard("main"), main), (_shard("other"), other)], "zscore")
+    assert [doc["similarity_score"] for doc in other] == pytest.approx([0.8, 0.6, 0.4])
+
+
+def test_reference_falls_back_to_the_first_shard_with_a_spread():
+    flat_main, first, second = _scored("m", [0.5]), _scored("a", [0.9, 0.7]), _scored("b", [0.2, 0.1])
+    normalize_shard_scores([(_shard("main"), flat_main), (_shard("a"), first), (_shard("b"), second)], "minmax")
+    assert flat_main[0]["similarity_score"] == 0.5
+    assert [doc["similarity_score"] for doc in second] == [0.9, 0.7]
+
+
+def test_none_or_unknown_method_keeps_raw_scores():
+    for method in ("none", "bogus"):
+        other = _scored("o", [0.3, 0.1])
+        normalize_shard_scores([(_shard("main"), _scored("m", [0.9, 0.5])), (_shard("other"), other)], method)
+        assert [doc["similarity_score"] for doc in other] == [0.3, 0.1]
+        assert other[0]["shard"] == "other"
+
+
+def test_merge_interleaves_deduplicates_and_respects_quotas(monkeypatch):
+    monkeypatch.setattr(config, "RETRIEVAL_SCORE_NORMALIZATION", "none")
+    main = _scored("m", [0.9, 0.6, 0.3])
+    other = _scored("o", [0.8, 0.7, 0.5, 0.4]) + [_doc("m0", 0.95)]
+    merged = merge_shard_results([(_shard("main"), main), (_shard("other", quota=2), other)], 10)
+    assert [(doc["original_id"], doc["shard"]) for doc in merged] == [
+        ("m0", "other"), ("o0", "other"), ("m1", "main"), ("m2", "main")]
+
+
+def test_merge_stops_at_the_requested_count(monkeypatch):
+    monkeypatch.setattr(config, "RETRIEVAL_SCORE_NORMALIZATION", "minmax")
+    main, other = _scored("m", [0.9, 0.5]), _scored("o", [0.3, 0.1])
+    merged = merge_shard_results([(_shard("main"), main), (_shard("other"), other)], 2)
+    # Both shards' best are 0.9 once normalized
+    assert [doc["original_id"] for doc in merged] == ["m0", "o0"]
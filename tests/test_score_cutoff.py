@@ -0,0 +1,92 @@
+# tests/test_score_cutoff.py
+"""Validation counts chosen from the retrieval score curve by pipeline.score_cutoff."""
+import pytest
+
+import config
+from pipeline.score_cutoff import choose_validation_count, dense_scores
+
+
+def _docs(scores, retrieved_by=None):
+    docs = [{"original_id": str(i), "similarity_score": score} for i, score in enumerate(scores)]
+    if retrieved_by:
+        for doc in docs:
+            doc["retrieved_by"] = list(retrieved_by)
+    return docs
+
+
+# Ten close matches, then a cliff and ten weak ones
+STEP = [0.9 - i * 0.005 for i in range(10)] + [0.6 - i * 0.005 for i in range(10)]
+# A steep fall over the first ranks that flattens out
+KNEE = [0.9, 0.85, 0.8, 0.5] + [0.5 - i * 0.00625 for i in range(1, 17)]
+
+
+@pytest.fixture(autouse=True)
+def bounds(monkeypatch):
+    monkeypatch.setattr(config, "SCORE_CUTOFF_MIN", 3)
+    monkeypatch.setattr(config, "SCORE_CUTOFF_MAX", 0)
+    monkeypatch.setattr(config, "SCORE_CUTOFF_FLOOR", 0.0)
+    monkeypatch.setattr(config, "SCORE_CUTOFF_GAP_RATIO", 4.0)
+    monkeypatch.setattr(config, "SCORE_CUTOFF_ELBOW_MIN", 0.1)
+    monkeypatch.setattr(config, "SCORE_CUTOFF_ZSCORE", 0.5)
+
+
+def test_off_validates_the_requested_count():
+    assert choose_validation_count(_docs(STEP), 12, "off") == (12, "off")
+    assert choose_validation_count(_docs(STEP), 50, "off") == (20, "off")
+
+
+def test_gap_cuts_at_the_cliff():
+    assert choose_validation_count(_docs(STEP), 20, "gap") == (10, "gap")
+
+
+def test_gap_keeps_everything_without_a_standout_drop():
+    smooth = [0.9 - i * 0.01 for i in range(20)]
+    assert choose_validation_count(_docs(smooth), 20, "gap") == (20, "gap")
+
+
+def test_elbow_cuts_at_the_knee():
+    assert choose_validation_count(_docs(KNEE), 20, "elbow") == (4, "elbow")
+
+
+def test_zscore_keeps_the_outstanding_scores():
+    assert choose_validation_count(_docs(STEP), 20, "zscore") == (10, "zscore")
+
+
+def test_floor_applies_to_every_method(monkeypatch):
+    monkeypatch.setattr(config, "SCORE_CUTOFF_FLOOR", 0.88)
+    assert choose_validation_count(_docs(STEP), 20, "floor") == (5, "floor")
+    assert choose_validation_count(_docs(STEP), 20, "gap") == (5, "floor")
+
+
+def test_count_is_clamped_to_the_bounds(monkeypatch):
+    monkeypatch.setattr(config, "SCORE_CUTOFF_MIN", 12)
+    assert choose_validation_count(_docs(STEP), 20, "zscore") == (12, "zscore")
+    # Gap looks for the drop past the minimum only
+    assert choose_validation_count(_docs(STEP), 20, "gap") == (20, "gap")
+    monkeypatch.setattr(config, "SCORE_CUTOFF_MIN", 3)
+    monkeypatch.setattr(config, "SCORE_CUTOFF_MAX", 8)
+    assert choose_validation_count(_docs(STEP), 20, "off") == (8, "off")
+    assert choose_validation_count(_docs(STEP), 6, "gap") == (6, "gap")
+
+
+def test_missing_scores_or_unknown_method_skip_the_cutoff():
+    docs = _docs(STEP)
+    docs[4]["similarity_score"] = None
+    assert dense_scores(docs) is None
+    assert choose_validation_count(docs, 20, "gap") == (20, "off")
+    assert choose_validation_count(_docs(STEP), 20, "bogus") == (20, "off")
+
+
+def test_cut_covers_sparse_documents_ranked_among_the_kept_ones():
+    # Fusion placed a BM25-only match with no dense score at rank two
+    docs = _docs(STEP, retrieved_by=["dense"])
+    docs.insert(1, {"original_id": "bm25", "similarity_score": 0.1, "retrieved_by": ["sparse"]})
+    assert dense_scores(docs) == sorted(STEP, reverse=True)
+    assert choose_validation_count(docs, 21, "gap") == (11, "gap")
+
+
+def test_cut_follows_fused_order_not_score_order():
+    # Rank fusion can order dense documents away from their similarity scores
+    docs = _docs(STEP, retrieved_by=["dense", "sparse"])
+    docs[9], docs[12] = docs[12], docs[9]
+    assert choose_validation_count(docs, 20, "gap") == (10, "gap")
@@ -1,12 +1,14 @@
 import streamlit as st
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 import logging
+import config
 from utils.sanitization import escape_html, sanitize_html
 
 # Setup logger
 logger = logging.getLogger(__name__)
 
-def format_source_html(doc: Dict[str, Any], i: int, hebrew_font: str, get_text: callable) -> tuple:
+def format_source_html(doc: Dict[str, Any], i: int, hebrew_font: str, get_text: callable,
+                       highlight: Optional[List[str]] = None) -> tuple:
     """
     Format a single source document as HTML with proper RTL styling.
 
@@ -15,6 +17,7 @@ def format_source_html(doc: Dict[str, Any], i: int, hebrew_font: str, get_text:
         i (int): Source index
         hebrew_font (str): Hebrew font to use
         get_text (callable): Function to get translated text
+        highlight (Optional[List[str]]): Search terms to mark in the text (retrieval-only results)
 
     Returns:
         tuple: (source_html, text_html) formatted HTML strings
@@ -30,6 +33,9 @@ def format_source_html(doc: Dict[str, Any], i: int, hebrew_font: str, get_text:
     if text is None:
         text = get_text('no_text_available')
     text = clean_source_text(text)
+    if highlight is not None:
+        from pipeline.search import highlight_terms
+        text = highlight_terms(text, highlight)
     text = sanitize_html(text)
 
     # Force RTL and David Libre font styling for sources
@@ -45,6 +51,62 @@ def format_source_html(doc: Dict[str, Any], i: int, hebrew_font: str, get_text:
     </div>
     """
 
+    # Why the validator kept the paragraph (and its relevance score in logprob mode)
+    validation = doc.get('validation_result') or {}
+    justification = sanitize_html(str(validation.get('justification') or ''))
+    score = validation.get('relevance_score')
+    if justification or score is not None:
+        score_text = f" ({score:.2f})" if isinstance(score, (int, float)) else ""
+        text_html += f"""
+    <div class='source-relevance rtl-text hebrew-font' dir='rtl' lang="he">
+        <em>{get_text('relevance_label')}{score_text}:</em> {justification}
+    </div>
+    """
+
+    # Paragraphs the question quotes
+    quote_match = doc.get('quote_match')
+    if isinstance(quote_match, (int, float)):
+        text_html += f"""
+    <div class='source-relevance rtl-text hebrew-font' dir='rtl' lang="he">
+        <em>{get_text('quote_match_label').format(f"{quote_match:.0%}")}</em>
+    </div>
+    """
+
+    # Paragraphs added as neighbours of a retrieved one
+    if doc.get('expanded_from'):
+        text_html += f"""
+    <div class='source-relevance rtl-text hebrew-font' dir='rtl' lang="he">
+        <em>{get_text('neighbor_expanded_label').format(escape_html(str(doc['expanded_from'])))}</em>
+    </div>
+    """
+
+    # The paragraph's nearest neighbours, read from the local neighbour graph
+    related = []
+    if config.RELATED_PASSAGES_SHOWN > 0 and doc.get('original_id'):
+        from services import neighbors
+        related = neighbors.related_passages(doc['original_id'])
+    if related:
+        items = "".join(
+            f"<li><strong>{escape_html(passage.get('source_name') or get_text('unknown_source'))}</strong> "
+            f"({passage['similarity']:.2f}): {sanitize_html(clean_source_text(passage.get('hebrew_text') or '')[:300])}</li>"
+            for passage in related
+        )
+        text_html += f"""
+    <details class='related-passages rtl-text hebrew-font' dir='rtl' lang="he">
+        <summary>{get_text('related_passages_label').format(len(related))}</summary>
+        <ul>{items}</ul>
+    </details>
+    """
+
+    # Search results: how well the passage matched
+    search_score = doc.get('search_score')
+    if highlight is not None and isinstance(search_score, (int, float)):
+        text_html += f"""
+    <div class='source-relevance rtl-text hebrew-font' dir='rtl' lang="he">
+        <em>{get_text('search_score_label')}:</em> {search_score:.2f}
+    </div>
+    """
+
     return source_html, text_html
 
 def display_chat_message(message: Dict[str, Any]) -> None:
@@ -98,12 +160,15 @@ def display_chat_message(message: Dict[str, Any]) -> None:
 
         if role == "assistant" and message.get("final_docs"):
             docs = message["final_docs"]
+            # Search results are the answer itself: shown open, with the query terms marked
+            search_terms = message.get("search_terms")
+            sources_text = get_text('search_sources_text' if search_terms is not None else 'sources_text')
             # Use a simple text title for the expander
-            with st.expander(f"{get_text('sources_title')} ({len(docs)})", expanded=False):
+            with st.expander(f"{get_text('sources_title')} ({len(docs)})", expanded=search_terms is not None):
                 # Add the rich HTML content inside the expander (static HTML is safe)
                 expander_title = f"""
                 <div class='expander-title rtl-text hebrew-font' dir="rtl" lang="he">
-                    {get_text('sources_text').format(len(docs))}
+                    {sources_text.format(len(docs))}
                 </div>
                 """
                 st.markdown(expander_title, unsafe_allow_html=True)
@@ -112,7 +177,7 @@ def display_chat_message(message: Dict[str, Any]) -> None:
                 """, unsafe_allow_html=True)
 
                 for i, doc in enumerate(docs, start=1):
-                    source_html, text_html = format_source_html(doc, i, hebrew_font, get_text)
+                    source_html, text_html = format_source_html(doc, i, hebrew_font, get_text, search_terms)
                     st.markdown(source_html, unsafe_allow_html=True)
                     st.markdown(text_html, unsafe_allow_html=True)
 
@@ -1,13 +1,18 @@
 from .sanitization import sanitize_html
 import re
 import os
+import time
 import asyncio
-from typing import List, Dict, Optional
-from openai import AsyncOpenAI
+from typing import List, Dict, Optional, TYPE_CHECKING
 
 # Change relative imports to absolute imports
 import config
 from config import OPENAI_API_KEY, EMBEDDING_MODEL
+from . import metrics
+
+if TYPE_CHECKING:
+    # Imported on first use: the OpenAI SDK dominates the app's import time
+    from openai import AsyncOpenAI
 
 def clean_source_text(text: str) -> str:
     """
@@ -42,6 +47,27 @@ def clean_api_key(api_key: str) -> str:
         return api_key.replace("Bearer ", "").strip()
     return api_key.strip()
 
+# Shared by all embedding calls so connections are pooled across queries
+embedding_client: Optional["AsyncOpenAI"] = None
+
+def get_embedding_client() -> "AsyncOpenAI":
+    """
+    Get the shared async OpenAI client used for embeddings, creating it on first use.
+    
+    Returns:
+        AsyncOpenAI: The embedding client
+    """
+    global embedding_client
+    if embedding_client is None:
+        # Imported here because the services package imports utils while loading
+        from services import cassette
+        from openai import AsyncOpenAI
+        # Clean the API key before using it
+        embedding_client = cassette.wrap_openai_client(
+            lambda: AsyncOpenAI(api_key=clean_api_key(OPENAI_API_KEY))
+        )
+    return embedding_client
+
 async def get_embedding(text: str, model: str = None, max_retries: int = 3) -> Optional[List[float]]:
     """
     Get embedding for text using OpenAI's API asynchronously
@@ -57,10 +83,7 @@ async def get_embedding(text: str, model: str = None, max_retries: int = 3) -> O
     if model is None:
         model = EMBEDDING_MODEL
     
-    # Clean the API key before using it
-    cleaned_api_key = clean_api_key(OPENAI_API_KEY)
-    
-    openai_client = AsyncOpenAI(api_key=cleaned_api_key)
+    openai_client = get_embedding_client()
     
     if not text or not isinstance(text, str):
         print("Error: Invalid input text for embedding.")
@@ -71,12 +94,25 @@ async def get_embedding(text: str, model: str = None, max_retries: int = 3) -> O
         print("Warning: Text is empty after cleaning, cannot get embedding.")
         return None
         
+    # Imported here because the services package imports utils while loading
+    from services import circuit_breaker
+    breaker = circuit_breaker.get_breaker("embedding", model)
+
     attempt = 0
     while attempt < max_retries:
+        if not breaker.allow():
+            # The provider is failing for everyone; skip the rest of the retry ladder
+            print(f"Embedding circuit '{breaker.name}' is open; failing fast.")
+            return None
+        start_time = time.perf_counter()
         try:
-            response = await openai_client.embeddings.create(input=[cleaned_text], model=model)
+            with circuit_breaker.track(breaker):
+                response = await openai_client.embeddings.create(input=[cleaned_text], model=model)
+            metrics.observe("rag_embedding_seconds", time.perf_counter() - start_time, model=model)
+            metrics.record_usage("embedding", model, getattr(response, "usage", None))
             return response.data[0].embedding
         except Exception as e:
+            metrics.inc("rag_api_errors_total", endpoint="embedding", error=type(e).__name__)
             print(f"Error generating embedding (Attempt {attempt + 1}/{max_retries}): {type(e).__name__} - {str(e)}")
             wait_time = (2 ** attempt)
             print(f"Retrying in {wait_time}s...")
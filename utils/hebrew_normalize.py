@@ -0,0 +1,123 @@
+# utils/hebrew_normalize.py
+"""
+Normalization of Hebrew text for matching questions and words that differ only in
+niqqud, punctuation or the way abbreviations are written.
+"""
+import re
+import unicodedata
+from typing import List, Set
+
+# Cantillation marks, vowel points and other combining marks of the Hebrew block
+# (U+0591-U+05C7, except the maqaf, paseq and sof pasuq punctuation marks)
+_HEBREW_MARKS = re.compile(r"[\u0591-\u05BD\u05BF\u05C1\u05C2\u05C4\u05C5\u05C7]")
+# Geresh/gershayim and the ASCII quotes typed in their place ("הקב״ה", 'הקב"ה', "ר'")
+_ABBREVIATION_MARKS = re.compile(r"[\u05F3\u05F4\"'`\u2018\u2019\u201C\u201D]")
+_NON_WORD = re.compile(r"[^\w]+")
+_FINAL_LETTERS = str.maketrans("\u05DA\u05DD\u05DF\u05E3\u05E5", "\u05DB\u05DE\u05E0\u05E4\u05E6")
+
+
+def strip_niqqud(text: str) -> str:
+    """
+    Remove niqqud and cantillation marks from Hebrew text.
+
+    Args:
+        text (str): Hebrew text, possibly pointed
+
+    Returns:
+        str: The text with only its letters (presentation forms are decomposed first)
+    """
+    if not text:
+        return ""
+    return _HEBREW_MARKS.sub("", unicodedata.normalize("NFKD", text))
+
+
+def normalize_hebrew(text: str, fold_final_letters: bool = False) -> str:
+    """
+    Normalize a question for comparison: no niqqud, no abbreviation marks, other
+    punctuation (including the maqaf) turned into spaces, Latin text lower-cased and
+    whitespace collapsed.
+
+    Args:
+        text (str): Text to normalize
+        fold_final_letters (bool): Also map final letter forms (ך ם ן ף ץ) to their
+            regular forms, for matching word fragments
+
+    Returns:
+        str: Normalized text
+    """
+    text = strip_niqqud(text)
+    text = _ABBREVIATION_MARKS.sub("", text)
+    text = _NON_WORD.sub(" ", text.replace("_", " ")).strip().lower()
+    if fold_final_letters:
+        text = text.translate(_FINAL_LETTERS)
+    return text
+
+
+# One-letter prefixes (conjunction, article, prepositions) that attach to Hebrew words
+_PREFIX_LETTERS = "והבלמשכ"
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into normalized words (see normalize_hebrew, with final letters folded).
+
+    Args:
+        text (str): Text to split
+
+    Returns:
+        List[str]: The words in order
+    """
+    return normalize_hebrew(text, fold_final_letters=True).split()
+
+
+def word_forms(word: str, max_prefixes: int = 2) -> Set[str]:
+    """
+    The forms a normalized word may be matched under: itself and the word without up
+    to `max_prefixes` attached prefix letters (ו ה ב ל מ ש כ), as long as three letters
+    remain ("ובשבת" -> {"ובשבת", "בשבת", "שבת"}).
+
+    Args:
+        word (str): A word as returned by tokenize
+        max_prefixes (int): Prefix letters that may be stripped
+
+    Returns:
+        Set[str]: The word's forms
+    """
+    forms = {word}
+    for _ in range(max_prefixes):
+        if len(word) > 3 and word[0] in _PREFIX_LETTERS:
+            word = word[1:]
+            forms.add(word)
+        else:
+            break
+    return forms
+
+
+def strip_prefixes(word: str, max_prefixes: int = 2) -> str:
+    """
+    The shortest form of a normalized word under word_forms: up to `max_prefixes`
+    attached prefix letters removed, as long as three letters remain. Used as the
+    single form a word is indexed and searched under.
+
+    Args:
+        word (str): A word as returned by tokenize
+        max_prefixes (int): Prefix letters that may be stripped
+
+    Returns:
+        str: The word without its prefixes
+    """
+    return min(word_forms(word, max_prefixes), key=len)
+
+
+def index_terms(text: str) -> List[str]:
+    """
+    Split text into the terms of the full-text index: normalized words (no niqqud,
+    cantillation or gershayim, final letters folded) without their attached prefixes.
+
+    Args:
+        text (str): Text to split
+
+    Returns:
+        List[str]: The terms in order
+    """
+    return [strip_prefixes(word) for word in tokenize(text)]
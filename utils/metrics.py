@@ -0,0 +1,417 @@
+# utils/metrics.py
+"""
+In-process metrics for the RAG pipeline.
+
+Counters, gauges and histograms are aggregated in a single process-wide registry
+and exported as Prometheus text (`/metrics`) or a JSON snapshot (`/metrics.json`)
+by a small background HTTP server. Histograms keep fixed buckets for Prometheus
+plus a bounded reservoir of recent samples so the JSON snapshot can report p50/p95/p99.
+"""
+import hmac
+import json
+import time
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse, parse_qs
+
+import config
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+RATE_BUCKETS = (1, 5, 10, 20, 40, 60, 80, 100, 150, 200, 400)
+UI_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+COST_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+RATIO_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape_label_value(v)}"' for k, v in pairs) + "}"
+
+
+def _quantile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+class _Histogram:
+    def __init__(self, buckets: Tuple[float, ...], reservoir_size: int):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.recent: Deque[float] = deque(maxlen=reservoir_size)
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.bucket_counts[i] += 1
+
+    def summary(self) -> Dict[str, float]:
+        values = sorted(self.recent)
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "mean": round(self.sum / self.count, 6) if self.count else 0.0,
+            "p50": _quantile(values, 0.50),
+            "p95": _quantile(values, 0.95),
+            "p99": _quantile(values, 0.99),
+            "max": values[-1] if values else 0.0,
+        }
+
+
+class MetricsRegistry:
+    """Thread-safe store of counters, gauges and histograms keyed by name and labels."""
+
+    def __init__(self, reservoir_size: int = 1024):
+        self._lock = threading.Lock()
+        self._reservoir_size = reservoir_size
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, _Histogram]] = {}
+        self._help: Dict[str, str] = {}
+        self._gauge_callbacks: List[Callable[[], Dict[str, float]]] = []
+
+    def describe(self, name: str, help_text: str) -> None:
+        self._help[name] = help_text
+
+    def inc(self, name: str, value: float = 1.0, **labels: Any) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def set_gauge(self, name: str, value: float, **labels: Any) -> None:
+        with self._lock:
+            self._gauges.setdefault(name, {})[_label_key(labels)] = float(value)
+
+    def observe(self, name: str, value: float, buckets: Tuple[float, ...] = LATENCY_BUCKETS, **labels: Any) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = _Histogram(buckets, self._reservoir_size)
+            histogram.observe(float(value))
+
+    def register_gauge_callback(self, callback: Callable[[], Dict[str, float]]) -> None:
+        """Registers a function returning {gauge_name: value}, evaluated at export time."""
+        with self._lock:
+            self._gauge_callbacks.append(callback)
+
+    def _collect_gauges(self) -> Dict[str, Dict[LabelKey, float]]:
+        with self._lock:
+            gauges = {name: dict(series) for name, series in self._gauges.items()}
+            callbacks = list(self._gauge_callbacks)
+        for callback in callbacks:
+            try:
+                for name, value in callback().items():
+                    gauges.setdefault(name, {})[()] = float(value)
+            except Exception as e:
+                print(f"Metrics: Gauge callback {getattr(callback, '__name__', callback)} failed: {e}")
+        return gauges
+
+    def counter_value(self, name: str, **labels: Any) -> float:
+        with self._lock:
+            return self._counters.get(name, {}).get(_label_key(labels), 0.0)
+
+    def render_prometheus(self) -> str:
+        """Renders all metrics in the Prometheus text exposition format."""
+        gauges = self._collect_gauges()
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in series.items():
+                    lines.append(f"{name}{_format_labels(key)} {value:g}")
+            for name, series in sorted(self._histograms.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in series.items():
+                    for bound, count in zip(histogram.buckets, histogram.bucket_counts):
+                        lines.append(f"{name}_bucket{_format_labels(key, ('le', f'{bound:g}'))} {count}")
+                    lines.append(f"{name}_bucket{_format_labels(key, ('le', '+Inf'))} {histogram.count}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {histogram.sum:g}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+        for name, series in sorted(gauges.items()):
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} gauge")
+            for key, value in series.items():
+                lines.append(f"{name}{_format_labels(key)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Returns all metrics as a JSON-serializable dict, with percentiles for histograms."""
+        def by_labels(series: Dict[LabelKey, Any], render: Callable[[Any], Any]) -> List[Dict[str, Any]]:
+            return [{"labels": dict(key), "value": render(value)} for key, value in series.items()]
+
+        gauges = self._collect_gauges()
+        with self._lock:
+            return {
+                "timestamp": time.time(),
+                "counters": {n: by_labels(s, lambda v: v) for n, s in self._counters.items()},
+                "gauges": {n: by_labels(s, lambda v: v) for n, s in gauges.items()},
+                "histograms": {n: by_labels(s, lambda h: h.summary()) for n, s in self._histograms.items()},
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+
+registry = MetricsRegistry(reservoir_size=config.METRICS_RESERVOIR_SIZE)
+
+registry.describe("rag_stage_seconds", "Wall time of each RAG pipeline stage.")
+registry.describe("rag_request_seconds", "End-to-end wall time of a RAG pipeline run.")
+registry.describe("rag_embedding_seconds", "Latency of query embedding API calls.")
+registry.describe("rag_pinecone_query_seconds", "Latency of Pinecone index queries.")
+registry.describe("rag_validation_seconds", "Latency of a single paragraph validation call.")
+registry.describe("rag_validation_results_total", "Paragraph validation outcomes.")
+registry.describe("rag_validation_relevance_score", "Calibrated relevance scores of logprob-mode validations.")
+registry.describe("rag_cascade_decisions_total", "Cascade validation decisions: accepted or rejected by the screen, or escalated.")
+registry.describe("rag_score_cutoff_saved_total", "Validations skipped because the similarity scores fell off, by cutoff method.")
+registry.describe("rag_validation_pass_ratio", "Share of validated paragraphs that passed, per request.")
+registry.describe("rag_generation_ttft_seconds", "Time from generation request to first content token.")
+registry.describe("rag_generation_tokens_per_second", "Completion tokens per second during generation.")
+registry.describe("rag_citation_extraction_seconds", "Latency of citation extraction calls.")
+registry.describe("rag_tokens_total", "Tokens reported in API usage fields.")
+registry.describe("rag_cost_usd_total", "Estimated API cost from usage fields and config.MODEL_PRICES.")
+registry.describe("rag_call_cost_usd", "Estimated cost of a single API call.")
+registry.describe("rag_prompt_cache_hit_ratio", "Share of a call's prompt tokens served from the provider's prompt cache.")
+registry.describe("rag_prompt_cache_saved_usd_total", "Estimated cost saved by prompt tokens billed at the cached-input price.")
+registry.describe("rag_api_errors_total", "Failed API calls by endpoint.")
+registry.describe("rag_deadline_exceeded_total", "Pipeline stages cut short by their time budget.")
+registry.describe("rag_requests_superseded_total", "Requests cancelled because a newer one from the same session started.")
+registry.describe("rag_ui_run_seconds", "Wall time of Streamlit script runs, by scope (whole app or a single fragment).")
+
+
+# Observations made while a request scope is active are also collected per request
+_request_observations: contextvars.ContextVar[Optional[List[Tuple[str, Dict[str, Any], float]]]] = \
+    contextvars.ContextVar("request_observations", default=None)
+
+
+@contextmanager
+def request_scope() -> Iterator[List[Tuple[str, Dict[str, Any], float]]]:
+    """
+    Collects every histogram observation made in the enclosed block (including tasks it spawns).
+
+    Yields the list of (name, labels, value) tuples, which is filled in as the block runs.
+    """
+    observations: List[Tuple[str, Dict[str, Any], float]] = []
+    parent = _request_observations.get()
+    token = _request_observations.set(observations)
+    try:
+        yield observations
+    finally:
+        _request_observations.reset(token)
+        # Nested scopes also report to the enclosing one
+        if parent is not None:
+            parent.extend(observations)
+
+
+# --- Module-level helpers ---
+def inc(name: str, value: float = 1.0, **labels: Any) -> None:
+    registry.inc(name, value, **labels)
+
+
+def set_gauge(name: str, value: float, **labels: Any) -> None:
+    registry.set_gauge(name, value, **labels)
+
+
+def observe(name: str, value: float, buckets: Tuple[float, ...] = LATENCY_BUCKETS, **labels: Any) -> None:
+    registry.observe(name, value, buckets, **labels)
+    observations = _request_observations.get()
+    if observations is not None:
+        observations.append((name, labels, value))
+
+
+def register_gauge_callback(callback: Callable[[], Dict[str, float]]) -> None:
+    registry.register_gauge_callback(callback)
+
+
+@contextmanager
+def timed(name: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS, **labels: Any) -> Iterator[None]:
+    """Observes the wall time of the enclosed block into histogram `name`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, buckets=buckets, **labels)
+
+
+def estimate_cost(model: str, prompt_tokens: int = 0, completion_tokens: int = 0, cached_tokens: int = 0) -> float:
+    """
+    Estimates the USD cost of a call from the per-million-token prices in config.MODEL_PRICES.
+
+    Cached prompt tokens are billed at the model's `cached_input` price when one is configured.
+    """
+    prices = config.MODEL_PRICES.get(model)
+    if prices is None:
+        # Dated snapshots (e.g. gpt-4o-2024-08-06) are priced like their base model
+        prices = next((p for name, p in config.MODEL_PRICES.items() if model.startswith(name + "-")), None)
+    if not prices:
+        return 0.0
+    cached_tokens = min(cached_tokens, prompt_tokens)
+    uncached = prompt_tokens - cached_tokens
+    cached_price = prices.get("cached_input", prices.get("input", 0.0))
+    return (uncached * prices.get("input", 0.0)
+            + cached_tokens * cached_price
+            + completion_tokens * prices.get("output", 0.0)) / 1_000_000
+
+
+def usage_counts(usage: Any) -> Dict[str, int]:
+    """Extracts token counts from an OpenAI `usage` object (or dict); missing fields count as 0."""
+    if usage is None:
+        return {"prompt": 0, "completion": 0, "cached": 0}
+
+    def field(obj: Any, name: str) -> Any:
+        return obj.get(name) if isinstance(obj, dict) else getattr(obj, name, None)
+
+    details = field(usage, "prompt_tokens_details")
+    return {
+        "prompt": int(field(usage, "prompt_tokens") or 0),
+        "completion": int(field(usage, "completion_tokens") or 0),
+        "cached": int((field(details, "cached_tokens") if details is not None else 0) or 0),
+    }
+
+
+UsageListener = Callable[[str, str, Dict[str, int], float], None]
+_usage_listeners: List[UsageListener] = []
+
+
+def register_usage_listener(listener: UsageListener) -> None:
+    """Calls `listener(stage, model, counts, cost)` for every API usage recorded."""
+    _usage_listeners.append(listener)
+
+
+def record_usage(stage: str, model: str, usage: Any) -> Dict[str, int]:
+    """Records token counts and estimated cost from an API `usage` field. Returns the counts."""
+    counts = usage_counts(usage)
+    if usage is None:
+        return counts
+    for kind, value in counts.items():
+        if value:
+            inc("rag_tokens_total", value, stage=stage, model=model, kind=kind)
+    cost = estimate_cost(model, counts["prompt"], counts["completion"], counts["cached"])
+    if cost:
+        inc("rag_cost_usd_total", cost, stage=stage, model=model)
+        observe("rag_call_cost_usd", cost, buckets=COST_BUCKETS, stage=stage)
+    if counts["prompt"] and counts["completion"]:  # Chat calls only; embeddings have no prompt cache
+        observe("rag_prompt_cache_hit_ratio", counts["cached"] / counts["prompt"], buckets=RATIO_BUCKETS, stage=stage)
+    if counts["cached"]:
+        saved = estimate_cost(model, counts["prompt"], counts["completion"]) - cost
+        if saved > 0:
+            inc("rag_prompt_cache_saved_usd_total", saved, stage=stage, model=model)
+    for listener in _usage_listeners:
+        listener(stage, model, counts, cost)
+    return counts
+
+
+def scope_cost(observations: List[Tuple[str, Dict[str, Any], float]]) -> float:
+    """Estimated API cost of the calls recorded in a `request_scope`."""
+    return sum(value for name, _labels, value in observations if name == "rag_call_cost_usd")
+
+
+# --- HTTP endpoint ---
+RouteHandler = Callable[[Dict[str, List[str]]], Tuple[int, str, str]]
+_routes: Dict[Tuple[str, str], RouteHandler] = {}
+_server: Optional[ThreadingHTTPServer] = None
+_server_lock = threading.Lock()
+
+
+def register_route(path: str, handler: RouteHandler, method: str = "GET") -> None:
+    """
+    Adds a route to the metrics server. Handlers get parsed query params and return (status, content_type, body).
+    Actions that change state are registered for POST, so a crawler or a prefetching browser cannot trigger them.
+    """
+    _routes[(method, path)] = handler
+
+
+register_route("/metrics", lambda _q: (200, "text/plain; version=0.0.4; charset=utf-8", registry.render_prometheus()))
+register_route("/metrics.json", lambda _q: (200, "application/json", json.dumps(registry.snapshot(), ensure_ascii=False)))
+
+
+def _authorized(header: Optional[str]) -> bool:
+    if not config.METRICS_TOKEN:
+        return True
+    return hmac.compare_digest((header or "").encode("utf-8"), f"Bearer {config.METRICS_TOKEN}".encode("utf-8"))
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def _handle(self, method: str):
+        parsed = urlparse(self.path)
+        handler = _routes.get((method, parsed.path))
+        if not _authorized(self.headers.get("Authorization")):
+            status, content_type, body = 401, "text/plain", "Unauthorized\n"
+        elif handler is None:
+            if any(path == parsed.path for _method, path in _routes):
+                status, content_type, body = 405, "text/plain", "Method not allowed\n"
+            else:
+                status, content_type, body = 404, "text/plain", "Not found\n"
+        else:
+            try:
+                status, content_type, body = handler(parse_qs(parsed.query))
+            except Exception as e:
+                status, content_type, body = 500, "text/plain", f"Error: {type(e).__name__}: {e}\n"
+        payload = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes every few seconds would flood the app log
+
+
+def start_metrics_server(port: Optional[int] = None) -> bool:
+    """Starts the metrics HTTP server once per process. Returns True if it is running."""
+    global _server
+    port = config.METRICS_PORT if port is None else port
+    if not port:
+        return False
+    with _server_lock:
+        if _server is not None:
+            return True
+        try:
+            _server = ThreadingHTTPServer((config.METRICS_HOST, port), _MetricsRequestHandler)
+        except OSError as e:
+            print(f"Metrics: Could not bind {config.METRICS_HOST}:{port}: {e}")
+            return False
+        threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+        print(f"Metrics: Serving /metrics and /metrics.json on {config.METRICS_HOST}:{port}")
+        if config.METRICS_HOST not in ("127.0.0.1", "localhost", "::1") and not config.METRICS_TOKEN:
+            print("Metrics: Warning - the server is reachable from other hosts without METRICS_TOKEN")
+        return True
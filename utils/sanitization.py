@@ -1,5 +1,3 @@
-import bleach  # For HTML sanitization
-from bleach.css_sanitizer import CSSSanitizer
 import re
 
 def sanitize_html(html_content: str) -> str:
@@ -8,6 +6,10 @@ def sanitize_html(html_content: str) -> str:
     """
     if not isinstance(html_content, str):
         return str(html_content)
+
+    # Imported on first use so bleach (and html5lib) stay off the startup path
+    import bleach
+    from bleach.css_sanitizer import CSSSanitizer
     
     # Check if this is raw HTML that might be showing up as code
     # Look for unescaped HTML tags that might be part of UI display issues
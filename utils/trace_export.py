@@ -0,0 +1,79 @@
+# utils/trace_export.py
+"""
+Background export of LangSmith runs for `utils.tracing`.
+
+Kept apart from `utils.tracing` because importing the LangSmith client is slow;
+this module is only loaded once a request is actually traced.
+"""
+import time
+import queue
+import threading
+from typing import Any, Dict, Tuple
+
+from langsmith import Client
+
+from . import metrics
+
+
+class QueuedTraceClient(Client):
+    """LangSmith client whose run create/update calls return immediately and are exported in the background."""
+
+    def __init__(self, max_queue: int, batch_size: int, flush_interval: float, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._pending: "queue.Queue[Tuple[str, tuple, Dict[str, Any]]]" = queue.Queue(maxsize=max(1, max_queue))
+        self._batch_size = max(1, batch_size)
+        self._flush_interval = flush_interval
+        self._worker = threading.Thread(target=self._export_loop, name="trace-export", daemon=True)
+        self._worker.start()
+
+    def _enqueue(self, op: str, args: tuple, kwargs: Dict[str, Any]) -> None:
+        try:
+            self._pending.put_nowait((op, args, kwargs))
+        except queue.Full:
+            metrics.inc("rag_trace_runs_dropped_total", op=op)
+
+    def create_run(self, *args: Any, **kwargs: Any) -> None:
+        self._enqueue("create", args, kwargs)
+
+    def update_run(self, *args: Any, **kwargs: Any) -> None:
+        self._enqueue("update", args, kwargs)
+
+    def _export_loop(self) -> None:
+        while True:
+            batch = [self._pending.get()]
+            deadline = time.monotonic() + self._flush_interval
+            while len(batch) < self._batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._export(batch)
+
+    def _export(self, batch) -> None:
+        for op, args, kwargs in batch:
+            try:
+                if op == "create":
+                    super().create_run(*args, **kwargs)
+                else:
+                    super().update_run(*args, **kwargs)
+            except Exception as e:
+                metrics.inc("rag_trace_export_errors_total", error=type(e).__name__)
+            finally:
+                self._pending.task_done()
+        metrics.inc("rag_trace_runs_exported_total", len(batch))
+
+    def queue_depth(self) -> int:
+        return self._pending.qsize()
+
+    def drain(self, timeout: float = 5.0) -> None:
+        """Waits (up to `timeout` seconds) for queued runs to be handed over, then flushes the client."""
+        deadline = time.monotonic() + timeout
+        while self._pending.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+        try:
+            self.flush(timeout=max(0.1, deadline - time.monotonic()))
+        except Exception as e:
+            print(f"Tracing: Failed to flush LangSmith client: {type(e).__name__} - {e}")
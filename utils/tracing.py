@@ -0,0 +1,138 @@
+# utils/tracing.py
+"""
+LangSmith tracing with head sampling, span sampling and a bounded export queue.
+
+`traceable` is a drop-in for `langsmith.traceable` used throughout the pipeline:
+
+- With `LANGSMITH_TRACING` off the decorator returns the function unchanged, so
+  untraced deployments pay nothing per call.
+- The outermost traced call of a request decides once whether the whole request is
+  traced (`config.TRACING_SAMPLE_RATE`); every nested span follows that decision.
+- Spans declared with a `sample_rate` (the per-paragraph validation) are sampled
+  again inside traced requests.
+- Runs go to a bounded queue and are forwarded to the LangSmith client's batched
+  ingestion by a background thread. When the queue is full runs are dropped and
+  counted rather than slowing down the request.
+"""
+import atexit
+import random
+import inspect
+import functools
+import threading
+import contextvars
+from typing import Any, Callable, Optional, Tuple, TYPE_CHECKING
+
+import config
+from . import metrics
+
+if TYPE_CHECKING:
+    from .trace_export import QueuedTraceClient
+
+# Head sampling decision of the current request (None until the outermost span decides)
+_request_sampled: contextvars.ContextVar[Optional[bool]] = contextvars.ContextVar(
+    "trace_request_sampled", default=None
+)
+
+
+def tracing_enabled() -> bool:
+    return str(config.LANGSMITH_TRACING).lower() == "true"
+
+
+_client: Optional["QueuedTraceClient"] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> "QueuedTraceClient":
+    """Returns the process-wide trace client, creating it on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            # The LangSmith client pulls in most of the OpenAI SDK; only traced processes pay for it
+            from .trace_export import QueuedTraceClient
+            _client = QueuedTraceClient(
+                max_queue=config.TRACING_QUEUE_SIZE,
+                batch_size=config.TRACING_BATCH_SIZE,
+                flush_interval=config.TRACING_FLUSH_INTERVAL,
+            )
+            atexit.register(_client.drain)
+            metrics.register_gauge_callback(lambda: {"rag_trace_queue_depth": _client.queue_depth()})
+        return _client
+
+
+def _decide(sample_rate: Optional[float]) -> Tuple[bool, Optional[contextvars.Token]]:
+    """Returns whether this span is traced, and the token to reset if it made the head decision."""
+    sampled = _request_sampled.get()
+    token = None
+    if sampled is None:
+        sampled = random.random() < config.TRACING_SAMPLE_RATE
+        token = _request_sampled.set(sampled)
+    if sampled and sample_rate is not None:
+        sampled = random.random() < sample_rate
+    return sampled, token
+
+
+def traceable(name: str, sample_rate: Optional[float] = None, **kwargs: Any) -> Callable[[Callable], Callable]:
+    """
+    Traces a function with LangSmith, subject to request and span sampling.
+
+    Args:
+        name: Run name shown in LangSmith
+        sample_rate: Optional share of this span's calls to keep within a traced request
+        **kwargs: Passed on to `langsmith.traceable`
+
+    Returns:
+        Callable: The decorator
+    """
+    def decorator(func: Callable) -> Callable:
+        if not tracing_enabled():
+            return func
+        traced_func: Optional[Callable] = None
+
+        def traced(*args, **kw):
+            # Built on first sampled call so the client (and its /info request) is never created
+            # for spans that are not traced
+            nonlocal traced_func
+            if traced_func is None:
+                from langsmith import traceable as langsmith_traceable
+                traced_func = langsmith_traceable(name=name, client=get_client(), **kwargs)(func)
+            return traced_func(*args, **kw)
+
+        if inspect.isasyncgenfunction(func):
+            @functools.wraps(func)
+            async def asyncgen_wrapper(*args, **kw):
+                sampled, token = _decide(sample_rate)
+                try:
+                    async for item in (traced if sampled else func)(*args, **kw):
+                        yield item
+                finally:
+                    if token is not None:
+                        _request_sampled.reset(token)
+            return asyncgen_wrapper
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kw):
+                sampled, token = _decide(sample_rate)
+                try:
+                    return await (traced if sampled else func)(*args, **kw)
+                finally:
+                    if token is not None:
+                        _request_sampled.reset(token)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kw):
+            sampled, token = _decide(sample_rate)
+            try:
+                return (traced if sampled else func)(*args, **kw)
+            finally:
+                if token is not None:
+                    _request_sampled.reset(token)
+        return wrapper
+
+    return decorator
+
+
+metrics.registry.describe("rag_trace_runs_exported_total", "Trace run updates handed to the LangSmith client.")
+metrics.registry.describe("rag_trace_runs_dropped_total", "Trace run updates dropped because the export queue was full.")
+metrics.registry.describe("rag_trace_export_errors_total", "Trace run updates the LangSmith client rejected.")